@@ -1,6 +1,20 @@
+import json
+import os
+import tempfile
+import uuid
+
 import streamlit as st
 import pandas as pd
-from io import BytesIO
+
+# Processing engines are imported inside the pages that use them, so a run only
+# loads what the open tab needs
+from ecommsolutions.export import download_payload, expected_format, zip_directory
+from ecommsolutions.file_probe import content_hash
+from ecommsolutions.instrumentation import (
+    PROFILE_ENABLED, PROFILE_MEMORY, bind, clear_records, recent_records, set_enabled, stage, timed,
+)
+from ecommsolutions.jobs import ACTIVE_STATES, FAILED, QUEUED, job_status, queue_depth, submit
+from ecommsolutions.report_cache import cache_stats, clear_cache
 
 # --- PAGE CONFIGURATION ---
 st.set_page_config(
@@ -65,19 +79,97 @@ CARD_STYLE = """
 """
 st.markdown(CARD_STYLE, unsafe_allow_html=True)
 
+# Maximum number of rows rendered in result tables (full results can have millions of rows)
+MAX_PREVIEW_ROWS = 1000
+
+
+# --- Background jobs ---
+# Heavy GST and reconciliation runs go to the shared job runner, so widget
+# interactions no longer cancel them; the page polls until they finish.
+def job_session():
+    """Key for this browser session's jobs."""
+    if 'job_session' not in st.session_state:
+        st.session_state['job_session'] = uuid.uuid4().hex
+    return st.session_state['job_session']
+
+
+def start_job(name, func, *args, **kwargs):
+    return submit(job_session(), name, func, *args, **kwargs)
+
+
+@st.fragment(run_every=1.0)
+def job_progress(name, label):
+    """Polls a queued/running job once a second and re-runs the page once it has finished."""
+    job = job_status(job_session(), name)
+    if job is None or job['status'] not in ACTIVE_STATES:
+        st.rerun()
+    if job['status'] == QUEUED:
+        running, queued = queue_depth()
+        st.info(f"⏳ {label}: waiting for a free worker ({running} running, {queued} queued).")
+        return
+    text = f"{label}: {job['message'] or 'working'}... ({job['elapsed']:.0f}s)"
+    if job['fraction'] is None:
+        st.info(f"⏳ {text}")
+    else:
+        st.progress(job['fraction'], text=text)
+
+
+def finished_job(name, label):
+    """
+    The finished (done or failed) snapshot of a job, or None if it was never
+    started. While it is queued or running, shows its progress and returns None.
+    """
+    job = job_status(job_session(), name)
+    if job is not None and job['status'] in ACTIVE_STATES:
+        job_progress(name, label)
+        return None
+    return job
+
+
+# --- Instrumentation ---
+# Stage timings are recorded for this session while the sidebar's Performance
+# panel has them switched on (or ECOMM_PROFILE is set for every session).
+if 'perf_enabled' not in st.session_state:
+    st.session_state['perf_enabled'] = PROFILE_ENABLED
+    st.session_state['perf_memory'] = PROFILE_MEMORY
+set_enabled(st.session_state['perf_enabled'], memory=st.session_state['perf_memory'])
+bind(session=job_session(), run=uuid.uuid4().hex[:8])
+
 
 # --- TABS CONFIGURATION ---
+# Tabs are lazy: switching tabs re-runs the script and only the open tab's
+# page function executes, except for the pages whose uploads are the input of
+# a run (see the bottom of the pages section).
 tab1, tab2, tab3, tab4, tab5, tab6 = st.tabs([
-    "📑 GST Filing", 
-    "📈 Sales Analysis", 
-    "↩️ Return Analysis", 
-    "🤝 Reconciliation", 
-    "✍️ Listing Optimization", 
+    "📑 GST Filing",
+    "📈 Sales Analysis",
+    "↩️ Return Analysis",
+    "🤝 Reconciliation",
+    "✍️ Listing Optimization",
     "📢 Ads Manager"
-])
+], key="main_tab", on_change="rerun")
+
+# Streamlit forgets the values of widgets that were not drawn in the last run,
+# which with lazy tabs means every setting on a tab that is not open.
+# Re-assigning them here keeps firm details and filters across tab switches.
+# (Uploaded files cannot be set this way, hence the always-drawn pages.)
+KEPT_WIDGETS = [
+    'firm_gstin', 'filing_period', 'gst_strict_validation', 'meesho_eco_gstin', 'amazon_eco_gstin', 'custom_eco_gstin',
+    'sales_platform', 'sales_platforms', 'sales_states', 'sales_freq', 'sales_split', 'sales_top_n', 'sales_drill_sku',
+    'returns_months', 'returns_min_sold',
+    'listing_keyword_source', 'listing_keyword_text', 'listing_max_length', 'listing_title_template',
+    'listing_custom_template', 'listing_description_template', 'listing_rewrite_count',
+    'ads_platform', 'ads_platforms', 'ads_campaigns', 'ads_level', 'ads_target_acos', 'ads_min_clicks', 'ads_min_spend',
+    'ads_min_impressions', 'ads_min_ctr', 'ads_waste_level', 'ads_freq', 'ads_tacos_by', 'ads_tacos_freq',
+]
+for widget_key in KEPT_WIDGETS:
+    if widget_key in st.session_state:
+        st.session_state[widget_key] = st.session_state[widget_key]
 
 # --- Helper function to define Meesho upload flow ---
 def meesho_upload_form(firm_gstin, filing_period):
+    from ecommsolutions.meesho_gstr1 import process_meesho_reports
+
     st.header(f"Meesho GSTR-1 Upload for {filing_period}")
     st.info(f"Using Firm GSTIN: **{firm_gstin}**")
 
@@ -99,27 +191,312 @@ def meesho_upload_form(firm_gstin, filing_period):
     
     st.markdown("---")
     
+    # Meesho's own GSTIN is reported against each B2CS row (supplies through an e-commerce operator)
+    meesho_gstin = st.text_input("Meesho GSTIN (E-Commerce Operator, optional)", key="meesho_eco_gstin", placeholder="15-digit GSTIN shown on your TCS certificate")
+
     # Process button
     if st.button("Process Meesho GSTR-1 Report", type="primary"):
         # Check if all 3 files are uploaded
         if st.session_state.get('meesho_tcs_sales') and st.session_state.get('meesho_tcs_returns') and st.session_state.get('meesho_tax_invoice'):
             st.success(f"Processing GSTR-1 for {filing_period} using {firm_gstin}...")
-            # Mock processing and download
-            gstr_output = pd.DataFrame({
-                'GSTIN': [firm_gstin], 
-                'Month': [filing_period], 
-                'Status': ['Ready for JSON Conversion'], 
-                'B2C': ['Calculated'],
-                'Tax': ['Calculated']
-            })
-            st.dataframe(gstr_output)
-            st.download_button("📥 Download GSTR-1 Ready Excel", data="mock_excel_data", file_name="Meesho_GSTR1_Output.xlsx")
+            st.session_state['meesho_gstr1_context'] = (firm_gstin, filing_period)
+            start_job(
+                'meesho_gstr1', process_meesho_reports,
+                st.session_state['meesho_tcs_sales'],
+                st.session_state['meesho_tcs_returns'],
+                st.session_state['meesho_tax_invoice'],
+                firm_gstin,
+                meesho_gstin.strip() or None,
+                strict=st.session_state['gst_strict_validation'],
+            )
         else:
             st.error("Please upload all three required files to run the processing.")
 
+    job = finished_job('meesho_gstr1', "Aggregating sales, returns and invoices")
+    if job is None:
+        return
+    if job['status'] == FAILED:
+        render_job_error(job, "Error processing Meesho reports")
+        return
+    render_gstr1_result(job['result'], "Meesho_GSTR1_Output", *st.session_state['meesho_gstr1_context'])
+
+
+# --- Helper function to define Amazon MTR upload flow ---
+# The B2C, B2B and B2B bulk cards share one form: every card accepts any mix of MTRs
+AMAZON_FORMS = {
+    'Amazon_B2C': ("Amazon B2C GSTR-1 Upload", "MTR B2C"),
+    'Amazon_B2B': ("Amazon B2B GSTR-1 Upload", "MTR B2B"),
+    'Amazon_B2B_Bulk': ("Amazon Bulk GSTR-1 Upload", "MTR B2C and B2B, one file per month or marketplace"),
+}
+
+
+def amazon_mtr_upload_form(firm_gstin, filing_period, selected):
+    from ecommsolutions.amazon_gstr1 import process_amazon_mtr_reports
+
+    title, reports = AMAZON_FORMS[selected]
+    st.header(f"{title} for {filing_period}")
+    st.info(f"Using Seller's GSTIN: **{firm_gstin}**")
+
+    st.subheader("Download Path")
+    st.markdown("`Seller Central → Reports → Tax Document Library → Merchant Tax Report (MTR)`")
+    st.caption(f"Upload {reports}. Several files can be selected at once; they are parsed in parallel and rows "
+               "repeated across files are counted once.")
+    st.file_uploader("Merchant Tax Reports", type=['xlsx', 'csv'], accept_multiple_files=True,
+                     key=f"amazon_mtr_{selected}", label_visibility="collapsed")
+
+    st.markdown("---")
+
+    amazon_gstin = st.text_input("Amazon GSTIN (E-Commerce Operator, optional)", key="amazon_eco_gstin",
+                                 placeholder="15-digit GSTIN shown on your TCS certificate")
+
+    if st.button("Process Amazon GSTR-1 Report", type="primary"):
+        files = st.session_state.get(f"amazon_mtr_{selected}")
+        if files:
+            st.success(f"Processing GSTR-1 for {filing_period} from {len(files)} report(s)...")
+            st.session_state['amazon_gstr1_context'] = (firm_gstin, filing_period)
+            start_job('amazon_gstr1', process_amazon_mtr_reports, list(files), firm_gstin,
+                      amazon_gstin.strip() or None, strict=st.session_state['gst_strict_validation'])
+        else:
+            st.error("Please upload at least one Merchant Tax Report.")
+
+    job = finished_job('amazon_gstr1', "Parsing MTRs and building GSTR-1 sections")
+    if job is None:
+        return
+    if job['status'] == FAILED:
+        render_job_error(job, "Error processing Amazon MTRs")
+        return
+
+    gstr1 = job['result']
+    summary = gstr1['summary']
+    st.caption(f"{summary['files']:,} file(s) · {summary['duplicate_lines']:,} duplicate rows skipped · "
+               f"{summary['b2b_invoices']:,} B2B invoices and {summary['credit_notes']:,} credit notes to registered buyers.")
+    render_gstr1_result(gstr1, "Amazon_GSTR1_Output", *st.session_state['amazon_gstr1_context'])
+
+
+# --- Helper function to define the custom Excel mapping flow ---
+# Myntra and any other channel without its own engine go through a saved column mapping
+CUSTOM_FORMS = {
+    'Myntra': "Myntra / Custom GSTR-1 Upload",
+    'Custom_Excel': "Custom Excel GSTR-1 Upload",
+}
+NOT_MAPPED = "(Not in report)"
+SOURCE_OPTIONS = {'expr': "= Expression", 'value': "= Fixed value", 'lookup': "= Lookup table"}
+
+
+def _lookup_text(table):
+    return "\n".join(f"{key} = {value}" for key, value in table.items())
+
+
+def _lookup_table(text):
+    """'Apparel = 5' (or 'Apparel: 5') per line → {'Apparel': '5'}."""
+    table = {}
+    for line in text.splitlines():
+        key, separator, value = line.partition('=') if '=' in line else line.partition(':')
+        if separator and key.strip():
+            table[key.strip()] = value.strip()
+    return table
+
+
+def custom_field_source(field, label, columns, source, prefix):
+    """Widgets for one GSTR-1 field; returns its mapping source ({'column'|'expr'|'value'|'lookup': ...}) or None."""
+    options = [NOT_MAPPED] + columns + list(SOURCE_OPTIONS.values())
+    current = next((kind for kind in ('column', *SOURCE_OPTIONS) if kind in (source or {})), None)
+    if current == 'column' and source['column'] in columns:
+        default = options.index(source['column'])
+    elif current in SOURCE_OPTIONS:
+        default = options.index(SOURCE_OPTIONS[current])
+    else:
+        default = 0
+    choice = st.selectbox(label, options, index=default, key=f"{prefix}_{field}")
+    if choice == NOT_MAPPED:
+        return None
+    if choice in columns:
+        return {'column': choice}
+    if choice == SOURCE_OPTIONS['expr']:
+        expr = st.text_input(f"{label} expression", value=(source or {}).get('expr', ''), key=f"{prefix}_{field}_expr",
+                             placeholder="`Gross Amount` - `Discount`")
+        return {'expr': expr} if expr.strip() else None
+    if choice == SOURCE_OPTIONS['value']:
+        value = st.text_input(f"{label} value", value=str((source or {}).get('value', '')), key=f"{prefix}_{field}_value")
+        return {'value': value.strip()} if value.strip() else None
+    lookup = (source or {}).get('lookup', {})
+    key_column = st.selectbox(f"{label} looked up by", columns,
+                              index=columns.index(lookup['column']) if lookup.get('column') in columns else 0,
+                              key=f"{prefix}_{field}_lookup_column")
+    table = st.text_area(f"{label} per value (one 'value = {label.lower()}' per line)", value=_lookup_text(lookup.get('table', {})),
+                         key=f"{prefix}_{field}_lookup_table")
+    fallback = st.text_input(f"{label} for other values (optional)", value=str(lookup.get('default') or ''),
+                             key=f"{prefix}_{field}_lookup_default")
+    return {'lookup': {'column': key_column, 'table': _lookup_table(table), 'default': fallback.strip() or None}}
+
+
+def custom_excel_upload_form(firm_gstin, filing_period, selected):
+    from ecommsolutions.custom_mapping import (
+        CUSTOM_FIELDS, CUSTOM_REQUIRED, compile_plan, process_custom_report, save_plan, saved_plans, suggest_plan,
+    )
+
+    st.header(f"{CUSTOM_FORMS[selected]} for {filing_period}")
+    st.info(f"Using Seller's GSTIN: **{firm_gstin}**")
+    st.markdown("Map the columns of your sales/return report to GSTR-1 fields once. The mapping is saved and "
+                "applied automatically to every later file with the same columns.")
+
+    uploaded = st.file_uploader("Sales / Return Report", type=['xlsx', 'csv'], key=f"custom_report_{selected}")
+    if uploaded is not None:
+        metadata = get_file_metadata(uploaded, f"custom_report_{selected}")
+        if not metadata['valid']:
+            st.error("Could not read the report's columns.")
+            return
+        sheet = None
+        columns = metadata['columns'][1:]
+        if uploaded.name.endswith('.xlsx'):
+            sheets = metadata['sheets']
+            default_sheet = metadata.get('default_sheet', sheets[0])
+            sheet = st.selectbox("Sheet", sheets, index=sheets.index(default_sheet), key=f"custom_sheet_{selected}")
+            if sheet != default_sheet:
+                columns = _probe_sheet_columns(content_hash(uploaded.getvalue()), sheet, uploaded)[1:]
+
+        plans = saved_plans()
+        suggested = suggest_plan(columns)
+        names = ["(New mapping)"] + sorted(plans)
+        plan_name = st.selectbox("Saved mapping", names, index=names.index(suggested['name']) if suggested else 0,
+                                 key=f"custom_plan_{selected}")
+        if suggested and plan_name == suggested['name']:
+            st.success(f"Recognised this layout: using the saved mapping **{plan_name}**.")
+        base = plans.get(plan_name, {})
+        prefix = f"custom_{selected}_{plan_name}"
+
+        st.subheader("Column Mapping")
+        fields = {}
+        col_left, col_right = st.columns(2)
+        for position, (field, label) in enumerate(CUSTOM_FIELDS.items()):
+            with (col_left if position % 2 == 0 else col_right):
+                required = " *" if field in CUSTOM_REQUIRED else ""
+                source = custom_field_source(field, label + required, columns, base.get('fields', {}).get(field), prefix)
+            if source:
+                fields[field] = source
+
+        st.markdown("#### Returns")
+        returns = base.get('returns') or {}
+        returns_options = ["(No returns column: negative amounts are returns)"] + columns
+        returns_column = st.selectbox("Column marking return rows", returns_options,
+                                      index=returns_options.index(returns['column']) if returns.get('column') in columns else 0,
+                                      key=f"{prefix}_returns_column")
+        returns_values = st.text_input("Values of that column meaning a return (comma-separated)",
+                                       value=", ".join(returns.get('values', [])), key=f"{prefix}_returns_values")
+
+        st.markdown("---")
+        mapping_name = st.text_input("Mapping name", value=base.get('name', selected), key=f"{prefix}_name")
+        remember = st.checkbox("Save this mapping for future files", value=True, key=f"{prefix}_save")
+        custom_gstin = st.text_input("E-Commerce Operator GSTIN (optional)", key="custom_eco_gstin",
+                                     placeholder="15-digit GSTIN of the marketplace, if any")
+
+        if st.button("Process Custom Report", type="primary"):
+            spec = {
+                'name': mapping_name.strip() or selected,
+                'sheet': sheet,
+                'fields': fields,
+                'returns': ({'column': returns_column,
+                             'values': [value.strip() for value in returns_values.split(',') if value.strip()]}
+                            if returns_column in columns else None),
+            }
+            try:
+                compile_plan(spec, columns)
+            except ValueError as e:
+                st.error(f"Mapping is incomplete: {e}")
+            else:
+                if remember:
+                    save_plan(spec, columns)
+                st.success(f"Processing GSTR-1 for {filing_period} with mapping '{spec['name']}'...")
+                st.session_state['custom_gstr1_context'] = (firm_gstin, filing_period)
+                start_job('custom_gstr1', process_custom_report, uploaded, spec, firm_gstin,
+                          custom_gstin.strip() or None, strict=st.session_state['gst_strict_validation'])
+
+    job = finished_job('custom_gstr1', "Applying the mapping and building GSTR-1 sections")
+    if job is None:
+        return
+    if job['status'] == FAILED:
+        render_job_error(job, "Error processing the custom report")
+        return
+
+    gstr1 = job['result']
+    summary = gstr1['summary']
+    st.caption(f"Mapping '{summary['mapping']}' · {summary['lines']:,} lines ({summary['return_lines']:,} returns) · "
+               f"{summary['b2b_invoices']:,} B2B invoices and {summary['credit_notes']:,} credit notes to registered buyers.")
+    render_gstr1_result(gstr1, "Custom_GSTR1_Output", *st.session_state['custom_gstr1_context'])
+
+
+# --- Helper functions to display validation results ---
+def render_validation(issues, samples):
+    """The validation summary (one row per check and column) and the sampled offending rows."""
+    st.dataframe(issues, hide_index=True)
+    if len(samples):
+        with st.expander(f"Sample rows ({len(samples):,}, a few per problem)"):
+            st.dataframe(samples, hide_index=True)
+
+
+def render_job_error(job, label):
+    """A failed GSTR-1 job: the validation summary when the reports failed validation, else the error message."""
+    result = getattr(job['exception'], 'result', None)
+    if result is None:
+        st.error(f"{label}: {job['error']}")
+        return
+    st.error(f"{label}: the reports failed validation, so nothing was aggregated. Correct the rows below "
+             "(row numbers count the header as row 1) and upload again.")
+    render_validation(result['issues'], result['samples'])
+
+
+# --- Helper function to display computed GSTR-1 tables ---
+GSTR1_SECTIONS = [('b2b', "B2B"), ('cdnr', "CDNR"), ('b2cs', "B2CS"), ('hsn', "HSN Summary"), ('docs', "Documents")]
+
+
+@timed('gstr1.render')
+def render_gstr1_result(gstr1, file_stem, firm_gstin, filing_period):
+    from ecommsolutions.gstr1_json import gstr1_json_bytes, return_period
+
+    summary = gstr1['summary']
+    col1, col2, col3, col4 = st.columns(4)
+    col1.metric("Net Taxable Value", f"₹{summary['net_taxable_value']:,.2f}")
+    col2.metric("IGST", f"₹{summary['igst']:,.2f}")
+    col3.metric("CGST", f"₹{summary['cgst']:,.2f}")
+    col4.metric("SGST", f"₹{summary['sgst']:,.2f}")
+    if summary.get('unmapped_state_taxable_value'):
+        st.warning(f"₹{summary['unmapped_state_taxable_value']:,.2f} of taxable value has an unrecognised customer state and was left out of B2CS.")
+    validation = gstr1.get('validation')
+    if validation is not None and len(validation):
+        with st.expander(f"⚠️ Validation: {int(validation['Rows'].sum()):,} flagged rows ({len(validation)} checks)"):
+            render_validation(validation, gstr1['validation_samples'])
+
+    # Only the sections this platform produces (Meesho has no B2B/CDNR, Flipkart has no document list)
+    sections = [(key, label) for key, label in GSTR1_SECTIONS if key in gstr1]
+    for tab, (key, _) in zip(st.tabs([label for _, label in sections]), sections):
+        with tab:
+            st.dataframe(gstr1[key], hide_index=True)
+
+    # Workbook is only written when the button is clicked; 'ignore' keeps these results on screen
+    workbook = download_payload({key: gstr1[key] for key, _ in sections}, file_stem)
+
+    # Portal JSON, streamed section by section and checked against the tables above; built once per result
+    cached = st.session_state.setdefault('gstr1_json', {}).get(file_stem)
+    if cached is not None and cached[0] is gstr1 and cached[1] == (firm_gstin, filing_period):
+        json_data, json_problems = cached[2:]
+    else:
+        json_data, json_problems = gstr1_json_bytes(gstr1, firm_gstin, return_period(filing_period))
+        st.session_state['gstr1_json'][file_stem] = (gstr1, (firm_gstin, filing_period), json_data, json_problems)
+    if json_problems:
+        st.error("GSTR-1 JSON totals do not match the Excel tables: " + "; ".join(json_problems))
+
+    col_xlsx, col_json = st.columns(2)
+    with col_xlsx:
+        st.download_button("📥 Download GSTR-1 Ready Excel", **workbook, on_click="ignore")
+    with col_json:
+        st.download_button("📥 Download GSTR-1 JSON", data=json_data, file_name=f"{file_stem}.json",
+                           mime="application/json", disabled=bool(json_problems), on_click="ignore")
+
 
 # --- Helper function to define Flipkart GST upload flow (based on user request) ---
 def flipkart_gst_upload_form(firm_gstin, filing_period):
+    from ecommsolutions.flipkart_gstr1 import FLIPKART_GSTIN, process_flipkart_sales_report
+
     st.header(f"Flipkart GSTR-1 Upload for {filing_period}")
     st.info(f"Using Seller's GSTIN: **{firm_gstin}**")
 
@@ -133,7 +510,7 @@ def flipkart_gst_upload_form(firm_gstin, filing_period):
         st.markdown("GSTIN of Flipkart:")
     with col_gstin_input:
         # This is a constant value for Flipkart's GSTIN (used for B2C/TCS transactions)
-        flipkart_gstin_value = "07AACCF0683K1CU"
+        flipkart_gstin_value = FLIPKART_GSTIN
         st.text_input("GSTIN of Flipkart", value=flipkart_gstin_value, disabled=True, label_visibility="collapsed")
         
     st.subheader(f"Upload Files: ({filing_period})")
@@ -146,25 +523,71 @@ def flipkart_gst_upload_form(firm_gstin, filing_period):
     # Process button
     if st.button("Upload", type="primary"):
         if st.session_state.get('flipkart_sales_report'):
-            st.success(f"File uploaded and ready for processing against Flipkart GSTIN: {flipkart_gstin_value}.")
-            # Mock processing and download
-            gstr_output = pd.DataFrame({
-                'GSTIN': [firm_gstin], 
-                'Month': [filing_period], 
-                'Platform': ['Flipkart'], 
-                'Status': ['Ready for JSON Conversion']
-            })
-            st.dataframe(gstr_output)
-            st.download_button("📥 Download GSTR-1 Ready Excel", data="mock_excel_data", file_name="Flipkart_GSTR1_Output.xlsx")
+            st.success(f"Processing GSTR-1 for {filing_period} against Flipkart GSTIN: {flipkart_gstin_value}...")
+            st.session_state['flipkart_gstr1_context'] = (firm_gstin, filing_period)
+            start_job('flipkart_gstr1', process_flipkart_sales_report, st.session_state['flipkart_sales_report'],
+                      firm_gstin, flipkart_gstin_value, strict=st.session_state['gst_strict_validation'])
         else:
             st.error("Please upload the Sales Report file.")
 
+    job = finished_job('flipkart_gstr1', "Aggregating sales, returns and cancellations")
+    if job is None:
+        return
+    if job['status'] == FAILED:
+        render_job_error(job, "Error processing Flipkart Sales Report")
+        return
+
+    gstr1 = job['result']
+    if gstr1['summary']['b2b_invoices']:
+        st.caption(f"{gstr1['summary']['b2b_invoices']:,} B2B invoices and {gstr1['summary']['credit_notes']:,} credit notes to registered buyers.")
+    render_gstr1_result(gstr1, "Flipkart_GSTR1_Output", *st.session_state['flipkart_gstr1_context'])
+
+
+# --- Batch run, executed as a background job ---
+def batch_job(zip_bytes, progress):
+    """
+    Runs the batch in a scratch directory that is removed once the job ends;
+    the outputs come back already zipped for the download button.
+    """
+    from ecommsolutions.batch import run_batch
+
+    def report(done, total, row):
+        progress(done, total, f"{done}/{total} done · {row['gstin']} {row['period']}: {row['status']}")
+
+    progress(0, None, "detecting reports")
+    with tempfile.TemporaryDirectory(prefix="gstr1_batch_") as batch_dir:
+        zip_path = os.path.join(batch_dir, "reports.zip")
+        with open(zip_path, 'wb') as handle:
+            handle.write(zip_bytes)
+        output_dir = os.path.join(batch_dir, "output")
+        status = run_batch(zip_path, output_dir, progress=report)
+        return {'status': status, 'archive': zip_directory(output_dir)}
+
 
 # ====================================================================
 # --- TAB 1: GST FILING SERVICES (NEW CARD LAYOUT & LOGIC) ---
 # ====================================================================
-with tab1:
+@timed('page.gst_filing')
+def gst_filing_page():
+    from ecommsolutions.validation import gstin_problem
+
     st.header("GSTR1 Data Preparation")
+
+    # --- Batch mode: many GSTINs / periods from one ZIP ---
+    with st.expander("🗂️ Batch Mode (multiple GSTINs)", expanded=False):
+        st.markdown("Upload a ZIP laid out as `<GSTIN>/<period>/<reports>` (e.g. `09ABCDE1234F1ZY/2025-04/tcs_sales.xlsx`). "
+                    "The platform of each file is detected from its columns.")
+        batch_zip = st.file_uploader("Reports ZIP", type=['zip'], key="gst_batch_zip", label_visibility="collapsed")
+        if batch_zip and st.button("Run Batch", key="gst_batch_run"):
+            start_job('gst_batch', batch_job, batch_zip.getvalue())
+
+        job = finished_job('gst_batch', "Running batch")
+        if job is not None and job['status'] == FAILED:
+            st.error(f"Error running batch: {job['error']}")
+        elif job is not None:
+            st.dataframe(job['result']['status'], hide_index=True)
+            st.download_button("📥 Download All GSTR-1 Outputs (ZIP)", data=job['result']['archive'],
+                               file_name="GSTR1_Batch_Output.zip", mime="application/zip", on_click="ignore")
     
     # --- 1. Mandatory GST Inputs ---
     st.subheader("Firm Details and Filing Period")
@@ -180,15 +603,23 @@ with tab1:
     with col_g2:
         period = st.selectbox("Filing Month & Year", [f"{m} - {y}" for y in years for m in months], key="filing_period")
 
+    # Reports are validated before aggregation; errors stop the run unless this is switched off
+    st.session_state.setdefault('gst_strict_validation', True)
+    st.checkbox("Stop when reports fail validation (invalid GSTIN, HSN code, GST rate or amount)",
+                key="gst_strict_validation")
+
     # Initialize session state for platform selection
     if 'selected_platform' not in st.session_state:
         st.session_state['selected_platform'] = 'None'
     
     # Check for mandatory inputs and stop rendering if missing
-    if not gstin or len(gstin) != 15: # Basic GSTIN length check
+    gstin = (gstin or '').strip().upper()
+    if not gstin or gstin_problem(gstin): # Format and check character
         st.warning("Please enter a valid 15-digit GSTIN and select the Filing Period to proceed with data upload.")
+        if gstin:
+            st.caption(gstin_problem(gstin))
         st.session_state['selected_platform'] = 'None' # Reset platform selection if GSTIN is cleared
-        st.stop() # Stop rendering the rest of the tab until inputs are provided
+        return # Skip the rest of the tab until inputs are provided (other tabs and the sidebar still render)
 
     st.markdown("---") # Separator after mandatory inputs
 
@@ -205,6 +636,10 @@ with tab1:
             meesho_upload_form(gstin, period)
         elif st.session_state['selected_platform'] == 'Flipkart_GST':
             flipkart_gst_upload_form(gstin, period) # Added the new form here
+        elif st.session_state['selected_platform'] in AMAZON_FORMS:
+            amazon_mtr_upload_form(gstin, period, st.session_state['selected_platform'])
+        elif st.session_state['selected_platform'] in CUSTOM_FORMS:
+            custom_excel_upload_form(gstin, period, st.session_state['selected_platform'])
 
     # B. Show card grid and general uploader if no platform is selected
     else:
@@ -236,7 +671,7 @@ with tab1:
             """, unsafe_allow_html=True)
             if st.button("Import Data", key="amazon_b2c_btn"):
                 st.session_state['selected_platform'] = 'Amazon_B2C'
-                st.info("Amazon specific upload form will appear here soon.")
+                st.rerun()
         
         with col3:
             st.markdown("""
@@ -248,7 +683,7 @@ with tab1:
             """, unsafe_allow_html=True)
             if st.button("Import Data", key="amazon_b2b_btn"):
                 st.session_state['selected_platform'] = 'Amazon_B2B'
-                st.info("Amazon B2B specific upload form will appear here soon.")
+                st.rerun()
 
         with col4:
             st.markdown("""
@@ -260,7 +695,7 @@ with tab1:
             """, unsafe_allow_html=True)
             if st.button("Import Data", key="amazon_b2b_bulk_btn"):
                 st.session_state['selected_platform'] = 'Amazon_B2B_Bulk'
-                st.info("Amazon B2B Bulk specific upload form will appear here soon.")
+                st.rerun()
 
         # --- Combined Visual Card and Button Layout (Row 2) ---
         col5, col6, col7, col8 = st.columns(4)
@@ -274,8 +709,9 @@ with tab1:
             </div>
             """, unsafe_allow_html=True)
             if st.button("Import Data", key="flipkart_sales_btn"):
-                st.session_state['selected_platform'] = 'Flipkart_Sales'
-                st.info("Flipkart Sales specific upload form will appear here soon.")
+                # The Sales Report covers B2C and B2B, so both Flipkart cards open the same form
+                st.session_state['selected_platform'] = 'Flipkart_GST'
+                st.rerun()
         
         with col6:
             st.markdown("""
@@ -299,7 +735,7 @@ with tab1:
             """, unsafe_allow_html=True)
             if st.button("Import Data", key="myntra_report_btn"):
                 st.session_state['selected_platform'] = 'Myntra'
-                st.info("Myntra specific upload form will appear here soon.")
+                st.rerun()
                 
         with col8:
             st.markdown("""
@@ -311,142 +747,348 @@ with tab1:
             """, unsafe_allow_html=True)
             if st.button("Import Data", key="custom_excel_btn"):
                 st.session_state['selected_platform'] = 'Custom_Excel'
-                st.info("Custom Excel mapping interface will appear here soon.")
+                st.rerun()
                 
         st.markdown("---")
 
         # --- General Uploader Section ---
         st.subheader("Alternatively, drag & drop any sales report file here")
-        
-        col_upload, col_download = st.columns([3, 1])
-
-        with col_upload:
-            uploaded_gst = st.file_uploader(
-                "Upload your sales report (Excel/CSV)", 
-                type=['xlsx', 'csv'], 
-                key="gst_general_file",
-                label_visibility="collapsed"
-            )
-        
-        with col_download:
-            st.markdown("<br>", unsafe_allow_html=True)
-            st.download_button("Download GSTR Ready File", data="mock_data", file_name="GSTR_Ready_File.csv", key="download_gst_mock")
+        general_gst_upload(gstin, period)
 
-        
-        # --- Processing Logic after General Upload ---
-        if uploaded_gst:
-            st.success("File uploaded successfully! Processing and mapping to GSTR-1 format...")
-            
-            try:
-                if uploaded_gst.name.endswith('.csv'):
-                    df = pd.read_csv(uploaded_gst)
+
+# --- General uploader: the report type is detected from its columns ---
+def general_gst_upload(firm_gstin, filing_period):
+    from ecommsolutions.amazon_gstr1 import process_amazon_mtr_reports
+    from ecommsolutions.batch import detect_report
+    from ecommsolutions.flipkart_gstr1 import FLIPKART_GSTIN, process_flipkart_sales_report
+
+    uploaded_gst = st.file_uploader(
+        "Upload your sales report (Excel/CSV)",
+        type=['xlsx', 'csv'],
+        key="gst_general_file",
+        label_visibility="collapsed"
+    )
+    if uploaded_gst:
+        try:
+            detected = detect_report(uploaded_gst, uploaded_gst.name)
+        except Exception as e:
+            st.error(f"Error reading file: {e}")
+            return
+        if detected is None:
+            st.warning("The columns match no marketplace report. Use the Myntra / Custom card to map them to GSTR-1 fields.")
+        elif detected['platform'] == 'Meesho':
+            st.info(f"Meesho {detected['report']} report recognised. Meesho GSTR-1 needs the TCS Sales, Sales Return "
+                    "and Tax Invoice Details files together: use the Meesho card.")
+        else:
+            st.caption(f"{detected['platform']} {detected['report'].replace('_', ' ')} report recognised.")
+            if st.button("Build GSTR-1", type="primary", key="gst_general_process"):
+                st.session_state['general_gstr1_context'] = (firm_gstin, filing_period, detected['platform'])
+                strict = st.session_state['gst_strict_validation']
+                if detected['platform'] == 'Flipkart':
+                    start_job('general_gstr1', process_flipkart_sales_report, uploaded_gst, firm_gstin,
+                              FLIPKART_GSTIN, strict=strict)
                 else:
-                    df = pd.read_excel(uploaded_gst)
-
-                # Mock GST processing
-                gstr_output = pd.DataFrame({
-                    'GSTIN': [gstin], 
-                    'Invoice No': ['INV001', 'INV002'], 
-                    'B2C_Sales': [2500, 0], 
-                    'B2B_Sales': [0, 5000],
-                    'Tax Rate': ['18%', '5%'],
-                    'HSN Code': ['8471', '8517']
-                })
-
-                st.markdown("### GSTR-1 Preview (B2C & B2B Summary)")
-                st.dataframe(gstr_output)
-                
-                def to_excel(df):
-                    output = BytesIO()
-                    with pd.ExcelWriter(output, engine='xlsxwriter') as writer:
-                        df.to_excel(writer, index=False, sheet_name='GSTR1_Output')
-                    processed_data = output.getvalue()
-                    return processed_data
-
-                excel_data = to_excel(gstr_output)
-
-                st.download_button(
-                    label="📥 Download GSTR-1 Ready Excel",
-                    data=excel_data,
-                    file_name="GSTR1_Ready_Output.xlsx",
-                    mime="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
-                )
+                    start_job('general_gstr1', process_amazon_mtr_reports, [uploaded_gst], firm_gstin,
+                              strict=strict)
 
-            except Exception as e:
-                st.error(f"Error reading file: {e}")
+    job = finished_job('general_gstr1', "Building GSTR-1 sections")
+    if job is None:
+        return
+    if job['status'] == FAILED:
+        render_job_error(job, "Error processing the report")
+        return
+    firm_gstin, filing_period, platform = st.session_state['general_gstr1_context']
+    render_gstr1_result(job['result'], f"{platform}_GSTR1_Output", firm_gstin, filing_period)
 
 
 # ====================================================================
-# --- TAB 2: SALES ANALYSIS (Logic omitted for brevity) ---
+# --- TAB 2: SALES ANALYSIS ---
 # ====================================================================
-with tab2:
+@st.cache_data(show_spinner=False, max_entries=64)
+def _sales_cube(file_hash, file_name, platform, _uploaded_file):
+    """
+    Day x SKU x state x platform rollup of one upload, built once per file
+    content (and platform label); every filter and chart below queries it.
+    """
+    from ecommsolutions.batch import detect_report
+    from ecommsolutions.sales_analysis import sales_cube
+
+    if platform == "Auto-detect":
+        detected = detect_report(_uploaded_file, file_name)
+        platform = detected['platform'] if detected else "Other"
+    return sales_cube(_uploaded_file, platform, file_name)
+
+
+@timed('page.sales_analysis')
+def sales_analysis_page():
+    from ecommsolutions.sales_analysis import (
+        combine_cubes, cube_totals, downsample, filter_cube, revenue_trend, top_members,
+    )
+
     st.header("📊 Sales Performance Analytics")
-    st.write("This tab will contain dynamic charts for Revenue Trend, SKU Performance, and Regional Sales using Plotly.")
+
+    col_sa_platform, col_sa_files = st.columns([1, 3])
+    with col_sa_platform:
+        sales_platform = st.selectbox("Platform", ["Auto-detect", "Flipkart", "Meesho", "Amazon", "Other"], key="sales_platform")
+    with col_sa_files:
+        sales_files = st.file_uploader("Upload sales / order reports (Excel/CSV)", type=['xlsx', 'csv'], accept_multiple_files=True, key="sales_analysis_files")
+
+    if not sales_files:
+        st.info("Upload one or more sales reports to see Revenue Trend, SKU Performance and Regional Sales.")
+    else:
+        try:
+            with st.spinner("Building sales rollups..."):
+                cube = combine_cubes([_sales_cube(content_hash(f.getvalue()), f.name, sales_platform, f) for f in sales_files])
+        except Exception as e:
+            st.error(f"Error reading sales reports: {e}")
+            cube = None
+
+        if cube is not None and cube.empty:
+            st.warning("No dated sales lines found in the uploaded reports.")
+        elif cube is not None:
+            import plotly.express as px
+
+            # Kept for the Ads Manager's TACOS join (uploads do not survive a tab switch)
+            st.session_state['sales_cube'] = cube
+
+            # Defaults live in the session state, which keeps them across tab switches (see KEPT_WIDGETS)
+            st.session_state.setdefault('sales_top_n', 10)
+
+            # --- Filters (applied to the cube, not the raw reports) ---
+            col_dates, col_platforms, col_states = st.columns([2, 2, 3])
+            with col_dates:
+                date_range = st.date_input("Date range", value=(cube['date'].min().date(), cube['date'].max().date()), key="sales_date_range")
+            with col_platforms:
+                chosen_platforms = st.multiselect("Platforms", sorted(cube['platform'].cat.categories), key="sales_platforms")
+            with col_states:
+                chosen_states = st.multiselect("States", sorted(cube['state'].cat.categories), key="sales_states")
+
+            start, end = (date_range[0], date_range[-1]) if isinstance(date_range, (list, tuple)) and date_range else (None, None)
+            view = filter_cube(cube, start, end, chosen_platforms, chosen_states)
+            overall = cube_totals(view)
+
+            col1, col2, col3, col4 = st.columns(4)
+            col1.metric("Net Revenue", f"₹{overall['revenue']:,.2f}")
+            col2.metric("Net Units", f"{overall['units']:,.0f}")
+            col3.metric("Net Order Lines", f"{overall['orders']:,}")
+            col4.metric("Active SKUs", f"{overall['skus']:,}")
+
+            # Only the open view builds its charts; switching views re-runs the page
+            tab_trend, tab_sku, tab_region = st.tabs(["Revenue Trend", "SKU Performance", "Regional Sales"],
+                                                     key="sales_view", on_change="rerun")
+
+            if tab_trend.open:
+                with tab_trend:
+                    col_freq, col_split = st.columns(2)
+                    with col_freq:
+                        freq_label = st.radio("Granularity", ["Daily", "Weekly", "Monthly"], horizontal=True, key="sales_freq")
+                    with col_split:
+                        split_label = st.radio("Split by", ["None", "Platform", "State"], horizontal=True, key="sales_split")
+                    freq = {"Daily": 'D', "Weekly": 'W', "Monthly": 'MS'}[freq_label]
+                    split = None if split_label == "None" else split_label.lower()
+                    trend = downsample(revenue_trend(view, freq, split), by=split)
+                    st.plotly_chart(px.line(trend, x='date', y='revenue', color=split, labels={'revenue': 'Revenue (₹)', 'date': ''}), use_container_width=True)
+
+            if tab_sku.open:
+                with tab_sku:
+                    top_n = st.slider("Top SKUs", 5, 50, key="sales_top_n")
+                    skus = top_members(view, 'sku', top_n)
+                    st.plotly_chart(px.bar(skus.iloc[::-1], x='revenue', y='sku', orientation='h', labels={'revenue': 'Revenue (₹)', 'sku': ''}), use_container_width=True)
+
+                    # Drill-down: one SKU's daily trend and state split, straight from the cube
+                    drill_sku = st.selectbox("Drill into SKU", skus['sku'].tolist(), key="sales_drill_sku")
+                    if drill_sku is not None:
+                        sku_view = filter_cube(view, skus=[drill_sku])
+                        sku_trend = downsample(revenue_trend(sku_view, 'D'))
+                        st.plotly_chart(px.line(sku_trend, x='date', y='revenue', labels={'revenue': 'Revenue (₹)', 'date': ''}), use_container_width=True)
+                        st.dataframe(top_members(sku_view, 'state', 40), hide_index=True)
+
+            if tab_region.open:
+                with tab_region:
+                    states = top_members(view, 'state', 40)
+                    st.plotly_chart(px.bar(states, x='state', y='revenue', labels={'revenue': 'Revenue (₹)', 'state': ''}), use_container_width=True)
 
 # ====================================================================
-# --- TAB 3: RETURN ANALYSIS (Logic omitted for brevity) ---
+# --- TAB 3: RETURN ANALYSIS ---
 # ====================================================================
-with tab3:
+@timed('page.return_analysis')
+def return_analysis_page():
+    from ecommsolutions.return_analysis import (
+        DEFAULT_MIN_SOLD, KIND_RETURNS, KIND_SALES, add_report, clear_history, history, load_partials, reason_breakdown, return_rates,
+        return_summary, top_rows,
+    )
+
     st.header("↩️ Return & Refund Analysis")
-    st.write("This tab will show key metrics on Return Percentage and Top 10 returned SKUs.")
+    st.caption("Sales and return reports are joined on order / sub-order ID. Each file is added to the history once; adding a new month only processes the new files.")
+
+    col_ret_sales, col_ret_returns = st.columns(2)
+    with col_ret_sales:
+        return_sales_files = st.file_uploader("Sales / order reports (Excel/CSV)", type=['xlsx', 'csv'], accept_multiple_files=True, key="returns_sales_files")
+    with col_ret_returns:
+        return_files = st.file_uploader("Return reports (Excel/CSV)", type=['xlsx', 'csv'], accept_multiple_files=True, key="returns_return_files")
+
+    col_add, col_clear = st.columns([1, 4])
+    with col_add:
+        add_clicked = st.button("➕ Add to History", disabled=not (return_sales_files or return_files), key="returns_add")
+    with col_clear:
+        if st.button("🗑️ Clear History", key="returns_clear"):
+            clear_history()
+            st.success("Return history cleared.")
+
+    if add_clicked:
+        # Sales first, so returns in the same batch find their orders directly
+        uploads = [(f, KIND_SALES) for f in return_sales_files or []] + [(f, KIND_RETURNS) for f in return_files or []]
+        with st.spinner("Adding reports..."):
+            for uploaded, kind in uploads:
+                try:
+                    added = add_report(uploaded, uploaded.name, kind, file_hash=content_hash(uploaded.getvalue()))
+                    repeated = added.get('repeated_orders', 0) + added.get('repeated_returns', 0)
+                    st.write(f"{uploaded.name}: {added['status']} ({added['sales_lines']:,} sale lines, {added['return_lines']:,} return lines"
+                             + (f", {repeated:,} orders/returns already added by an earlier file)" if repeated else ")"))
+                except Exception as e:
+                    st.error(f"Error reading {uploaded.name}: {e}")
+
+    sold, returned, unmatched_returns = load_partials()
+    if sold.empty:
+        st.info("Add at least one sales report (and its return reports) to see return rates.")
+    else:
+        months = sorted(sold['month'].astype('string').unique().tolist())
+        chosen_months = st.multiselect("Sale months", months, key="returns_months")
+        if chosen_months:
+            sold, returned, unmatched_returns = load_partials(months=chosen_months)
+        summary = return_summary(sold, returned, unmatched_returns)
+
+        col1, col2, col3, col4 = st.columns(4)
+        col1.metric("Units Sold", f"{summary['sold_units']:,.0f}")
+        col2.metric("Units Returned", f"{summary['returned_units']:,.0f}")
+        col3.metric("Return Rate", f"{summary['return_rate']:.2f}%")
+        col4.metric("Returns Awaiting Orders", f"{summary['unmatched_returns']:,}", help="Return lines whose order is not in any sales report added so far.")
+
+        st.session_state.setdefault('returns_min_sold', DEFAULT_MIN_SOLD)
+        min_sold = st.number_input("Minimum units sold for a SKU to be ranked", min_value=1, key="returns_min_sold")
+        sku_rates = return_rates(sold, returned, 'sku', min_sold)
+        col_top_returned, col_top_rate = st.columns(2)
+        with col_top_returned:
+            st.subheader("Top 10 Returned SKUs")
+            st.dataframe(top_rows(sku_rates, 'returned_units', 10), hide_index=True)
+        with col_top_rate:
+            st.subheader("Top 10 SKUs by Return Rate")
+            st.dataframe(top_rows(sku_rates, 'return_rate', 10), hide_index=True)
+
+        tab_reason, tab_state, tab_courier, tab_month, tab_files = st.tabs(["By Reason", "By State", "By Courier", "By Month", "History"])
+        with tab_reason:
+            st.dataframe(reason_breakdown(returned), hide_index=True)
+        with tab_state:
+            st.dataframe(return_rates(sold, returned, 'state').sort_values('return_rate', ascending=False), hide_index=True)
+        with tab_courier:
+            st.dataframe(return_rates(sold, returned, 'courier').sort_values('return_rate', ascending=False), hide_index=True)
+        with tab_month:
+            st.dataframe(return_rates(sold, returned, 'month'), hide_index=True)
+        with tab_files:
+            st.dataframe(history(), hide_index=True)
 
 # --- Helper function to read file metadata for dynamic dropdowns ---
-@st.cache_data(show_spinner=False)
 def get_file_metadata(uploaded_file, file_key):
     """
-    Reads file to get sheet names and columns of the first sheet.
-    Uses st.cache_data to speed up subsequent runs with the same file.
+    Returns sheet names and columns of the first sheet for an uploaded file.
+    The cache is keyed on a content hash of the upload, so re-uploading the
+    same report (or a rerun) never re-reads it.
     """
     if uploaded_file is None:
         # Return default placeholders when no file is uploaded
         return {'sheets': ['(No File Uploaded)'], 'columns': ['(No File Uploaded)'], 'valid': False}
-    
-    # Reset file pointer to the beginning for fresh reading
-    uploaded_file.seek(0)
-    
+
+    with stage('metadata.hash', file=uploaded_file.name):
+        file_hash = content_hash(uploaded_file.getvalue())
+    with stage('metadata.probe', file=uploaded_file.name):
+        return _probe_file_metadata(file_hash, uploaded_file.name, uploaded_file)
+
+
+@st.cache_data(show_spinner=False)
+def _probe_file_metadata(file_hash, file_name, _uploaded_file):
+    """
+    Header-only probe: reads the sheet list and the first few rows through a
+    read-only workbook (or `nrows` for CSV) instead of the full first sheet.
+    `_uploaded_file` is excluded from the cache key; `file_hash` identifies it.
+    Probes are also kept in the on-disk report cache for later sessions.
+    """
+    from ecommsolutions.file_probe import probe_csv, probe_excel, probe_excel_sheet
+    from ecommsolutions.fingerprint import identify_layout, layout_sheet
+    from ecommsolutions.report_cache import get_probe, store_probe
+
+    cached = get_probe(file_hash)
+    if cached is not None:
+        default_sheet = cached.get('default_sheet', cached['sheets'][0])
+        return {'sheets': cached['sheets'], 'columns': ['(Select Column)'] + cached['columns'], 'default_sheet': default_sheet, 'valid': True}
+
+    data = _uploaded_file.getvalue()
+
     # Check file type
-    if uploaded_file.name.endswith('.xlsx'):
+    if file_name.endswith('.xlsx'):
         try:
-            xls = pd.ExcelFile(uploaded_file)
-            sheet_names = xls.sheet_names
-            
-            # Read the first sheet to get column names
-            df = pd.read_excel(uploaded_file, sheet_name=sheet_names[0])
-            columns = ['(Select Column)'] + df.columns.astype(str).tolist() # Convert headers to string
-            
-            return {'sheets': sheet_names, 'columns': columns, 'default_sheet': sheet_names[0], 'valid': True}
+            probe = probe_excel(data)
+            sheet_names = probe['sheets']
+            default_sheet, columns = sheet_names[0], probe['columns']
+            # Known reports whose orders sit on a later sheet (e.g. Flipkart 'Orders', Meesho 'Order Payments')
+            if identify_layout(columns) is None:
+                found = layout_sheet(sheet_names, lambda sheet: probe_excel_sheet(data, sheet, 0)['columns'])
+                if found:
+                    default_sheet, columns = found
+            store_probe(file_hash, file_name, sheet_names, columns, default_sheet)
+            return {'sheets': sheet_names, 'columns': ['(Select Column)'] + columns, 'default_sheet': default_sheet, 'valid': True}
         except Exception as e:
-            st.error(f"Error reading Excel sheets for {uploaded_file.name}: {e}")
+            st.error(f"Error reading Excel sheets for {file_name}: {e}")
             return {'sheets': ['(Error Reading Sheets)'], 'columns': ['(Error Reading Sheets)'], 'valid': False}
-    
-    elif uploaded_file.name.endswith('.csv'):
+
+    elif file_name.endswith('.csv'):
         try:
-            df = pd.read_csv(uploaded_file)
-            columns = ['(Select Column)'] + df.columns.astype(str).tolist() # Convert headers to string
+            probe = probe_csv(data)
+            store_probe(file_hash, file_name, probe['sheets'], probe['columns'])
+            columns = ['(Select Column)'] + probe['columns']
             return {'sheets': ['Single Sheet'], 'columns': columns, 'default_sheet': 'Single Sheet', 'valid': True}
         except Exception as e:
-            st.error(f"Error reading CSV file {uploaded_file.name}: {e}")
+            st.error(f"Error reading CSV file {file_name}: {e}")
             return {'sheets': ['(Error Reading CSV)'], 'columns': ['(Error Reading CSV)'], 'valid': False}
 
     else:
         return {'sheets': ['Unsupported File'], 'columns': ['Unsupported File'], 'valid': False}
 
+@st.cache_data(show_spinner=False)
+def _probe_sheet_columns(file_hash, sheet, _uploaded_file):
+    """Header of a sheet other than the probed default one (picked in the sheet selectbox)."""
+    from ecommsolutions.file_probe import probe_excel_sheet
+
+    return ['(Select Column)'] + probe_excel_sheet(_uploaded_file.getvalue(), sheet, 0)['columns']
+
 # ====================================================================
 # --- TAB 4: PAYMENT RECONCILIATION ---
 # ====================================================================
-with tab4:
+@timed('page.reconciliation')
+def reconciliation_page():
+    from ecommsolutions.fingerprint import (
+        ROLE_PAYMENTS, ROLE_SALES, header_hash, remember_mapping, suggest_mapping,
+    )
+    from ecommsolutions.ledger import (
+        ORDER_COLUMNS, add_file as add_ledger_file, clear_ledger, ledger_files, ledger_orders, ledger_summary,
+        outstanding, remove_file as remove_ledger_file, unmatched_payments,
+    )
+    from ecommsolutions.reconciliation import STATUS_PAID, load_report, reconcile
+
     st.header("🤝 Payment Reconciliation")
     st.info("Match your sales data against marketplace payment reports to find missing settlements.")
     
+    # Eager, unlike the page tabs: a platform's uploads must survive a look at another platform
     tab_amz, tab_meesho, tab_flipkart = st.tabs(["Amazon", "Meesho", "Flipkart"])
     
-    def render_mapping_controls(platform, report_type, needs_payment_col=False, expanded=False):
+    def render_mapping_controls(platform, report_type, needs_payment_col=False, expanded=False,
+                                payment_label="Payment Received Column", multiple_files=False):
         
         # Determine keys for file uploader and state variables
         file_key = f"{platform}_{report_type.lower()}_file"
         sheet_key = f"{platform}_{report_type.lower()}_sheet"
         order_col_key = f"{platform}_{report_type.lower()}_order_col"
         payment_col_key = f"{platform}_{report_type.lower()}_payment_col"
+        header_key = f"{platform}_{report_type.lower()}_header"
         
         # Set up expander title
         title = f"{report_type} Report: Upload and Define Columns"
@@ -454,20 +1096,48 @@ with tab4:
         # Default hints for manual input
         sheet_hint = "Sheet1"
         order_hint = "Order ID"
-        payment_hint = "Payment Received"
+        payment_hint = "Payment Received" if payment_label == "Payment Received Column" else payment_label.replace(" Column", "")
         
         with st.expander(title, expanded=expanded):
             
-            # 1. File Uploader
-            uploaded_file = st.file_uploader(f"Upload {platform} **{report_type}** Report", key=file_key, type=['xlsx', 'csv'])
+            # 1. File Uploader (payment reports may be split over several settlement files)
+            uploaded = st.file_uploader(f"Upload {platform} **{report_type}** Report", key=file_key, type=['xlsx', 'csv'],
+                                        accept_multiple_files=multiple_files)
+
+            # With several files, the first one defines the sheet/column layout for all of them
+            uploaded_file = (uploaded[0] if uploaded else None) if multiple_files else uploaded
 
             metadata = get_file_metadata(uploaded_file, file_key)
+            st.session_state[header_key] = None
+
+            # --- Known layout / remembered mapping: no selection needed ---
+            suggestion = None
+            if metadata['valid']:
+                columns = metadata['columns'][1:]
+                role = ROLE_SALES if report_type == "Sales" else ROLE_PAYMENTS
+                suggestion = suggest_mapping(columns, role, metadata.get('default_sheet', metadata['sheets'][0]))
+                st.session_state[header_key] = (header_hash(columns), role)
+            complete = suggestion is not None and suggestion['order_col'] and (suggestion['amount_col'] or not needs_payment_col)
+            if complete:
+                source = "your saved mapping" if suggestion['source'] == 'remembered' else f"the **{suggestion['source']}** layout"
+                amount_text = f", {payment_label.replace(' Column', '')}: `{suggestion['amount_col']}`" if needs_payment_col else ""
+                st.success(f"Recognized {source}. Sheet: `{suggestion['sheet']}`, Order ID: `{suggestion['order_col']}`{amount_text}")
+                if not st.checkbox("Change mapping", key=f"{file_key}_edit"):
+                    st.session_state[sheet_key] = suggestion['sheet']
+                    st.session_state[order_col_key] = suggestion['order_col']
+                    st.session_state[payment_col_key] = suggestion['amount_col'] if needs_payment_col else "N/A"
+                    return
 
             # --- Sheet Selection/Manual Input ---
             if metadata['valid'] and uploaded_file.name.endswith('.xlsx'):
                 # Dynamic Selectbox (File uploaded and valid Excel)
-                default_index = metadata['sheets'].index(metadata['default_sheet']) if 'default_sheet' in metadata and metadata['default_sheet'] in metadata['sheets'] else 0
+                preferred_sheet = suggestion['sheet'] if suggestion else metadata.get('default_sheet')
+                default_index = metadata['sheets'].index(preferred_sheet) if preferred_sheet in metadata['sheets'] else 0
                 selected_sheet = st.selectbox("Select Excel Sheet Name", metadata['sheets'], key=f"{sheet_key}_select", index=default_index)
+                if selected_sheet != metadata.get('default_sheet'):
+                    # Columns of the sheet actually picked
+                    metadata = {**metadata, 'columns': _probe_sheet_columns(content_hash(uploaded_file.getvalue()), selected_sheet, uploaded_file)}
+                    st.session_state[header_key] = (header_hash(metadata['columns'][1:]), role)
             elif uploaded_file is None or not metadata['valid']:
                 # Manual Text Input (No file uploaded or error reading file)
                 selected_sheet = st.text_input("Manually Enter Sheet Name (e.g., 'Sheet1')", value=sheet_hint, key=f"{sheet_key}_manual")
@@ -492,8 +1162,8 @@ with tab4:
             with col_order:
                 if metadata['valid']:
                     # Dynamic Selectbox
-                    # We check the session state for a previous value to try and pre-select it
-                    previous_value = st.session_state.get(order_col_key, '(Select Column)')
+                    # Pre-select the recognized column, else a previous value from the session
+                    previous_value = (suggestion or {}).get('order_col') or st.session_state.get(order_col_key, '(Select Column)')
                     default_order_idx = metadata['columns'].index(previous_value) if previous_value in metadata['columns'] else 0
                     selected_order_col = st.selectbox("Order ID Column", metadata['columns'], key=f"{order_col_key}_select", index=default_order_idx)
                 else:
@@ -508,12 +1178,12 @@ with tab4:
                 with col_payment:
                     if metadata['valid']:
                         # Dynamic Selectbox
-                        previous_value = st.session_state.get(payment_col_key, '(Select Column)')
+                        previous_value = (suggestion or {}).get('amount_col') or st.session_state.get(payment_col_key, '(Select Column)')
                         default_payment_idx = metadata['columns'].index(previous_value) if previous_value in metadata['columns'] else 0
-                        selected_payment_col = st.selectbox("Payment Received Column", metadata['columns'], key=f"{payment_col_key}_select", index=default_payment_idx)
+                        selected_payment_col = st.selectbox(payment_label, metadata['columns'], key=f"{payment_col_key}_select", index=default_payment_idx)
                     else:
                         # Manual Text Input
-                        selected_payment_col = st.text_input("Manually Enter Payment Column", value=payment_hint, key=f"{payment_col_key}_manual")
+                        selected_payment_col = st.text_input(f"Manually Enter {payment_label}", value=payment_hint, key=f"{payment_col_key}_manual")
 
                 # Store the final selected payment column name
                 st.session_state[payment_col_key] = selected_payment_col
@@ -523,19 +1193,77 @@ with tab4:
 
             if not metadata['valid'] and uploaded_file is not None:
                 st.warning("Could not read file headers. Please manually enter the sheet/column names.")
+            elif metadata['valid']:
+                st.caption("The mapping is remembered for this report layout once a reconciliation or ledger update runs with it.")
+
+
+    def remember_mappings(platform):
+        """Saves the mappings a successful run used, keyed by each report's header hash."""
+        for report_type in ("Sales", "Prev_Payments", "Upcoming_Payments"):
+            prefix = f"{platform}_{report_type.lower()}"
+            header = st.session_state.get(f"{prefix}_header")
+            order_col = st.session_state.get(f"{prefix}_order_col")
+            amount_col = st.session_state.get(f"{prefix}_payment_col")
+            if header is None or order_col in [None, "(Select Column)"] or not mapped_uploads(platform, report_type):
+                continue
+            columns_hash, role = header
+            remember_mapping(columns_hash, role, st.session_state.get(f"{prefix}_sheet"), order_col,
+                             None if amount_col in [None, "N/A", "(Select Column)"] else amount_col)
+
+
+    def mapped_uploads(platform, report_type):
+        """The files uploaded for one report type, as a list (empty if none)."""
+        uploaded = st.session_state.get(f"{platform}_{report_type.lower()}_file")
+        if not uploaded:
+            return []
+        return uploaded if isinstance(uploaded, list) else [uploaded]
+
+
+    def mapped_report_spec(platform, report_type):
+        """(files, sheet, order column, amount column) of one report type, from the stored mapping."""
+        prefix = f"{platform}_{report_type.lower()}"
+        amount_col = st.session_state.get(f"{prefix}_payment_col")
+        if amount_col in [None, "N/A", "(Select Column)"]:
+            amount_col = None
+        return (mapped_uploads(platform, report_type), st.session_state.get(f"{prefix}_sheet"),
+                st.session_state.get(f"{prefix}_order_col"), amount_col)
+
+
+    def load_mapped_reports(platform, report_type):
+        """
+        Loads every file uploaded for one report type using the sheet and column
+        mapping stored by render_mapping_controls. Returns a list of frames with
+        'order_id' and 'amount' columns (empty if nothing was uploaded).
+        """
+        files, sheet, order_col, amount_col = mapped_report_spec(platform, report_type)
+        return [load_report(f, f.name, sheet, order_col, amount_col) for f in files]
+
+
+    def reconciliation_job(specs, progress):
+        """Background job: loads every mapped report (specs by report type) and runs the three-way match."""
+        total = sum(len(files) for files, *_ in specs.values()) + 1
+        frames = {}
+        for report_type, (files, sheet, order_col, amount_col) in specs.items():
+            frames[report_type] = []
+            for f in files:
+                progress(sum(map(len, frames.values())), total, f"reading {f.name}")
+                frames[report_type].append(load_report(f, f.name, sheet, order_col, amount_col))
+        progress(total - 1, total, "matching orders")
+        return reconcile(frames["Sales"], frames["Prev_Payments"], frames["Upcoming_Payments"])
 
 
     def reconciliation_uploader(platform):
         st.subheader(f"{platform} Reconciliation Files")
         
-        # 1. Sales Data (Needs Order ID column only)
-        render_mapping_controls(platform, "Sales", needs_payment_col=False, expanded=True)
+        with stage('reconciliation.mapping_controls', platform=platform):
+            # 1. Sales Data (Needs Order ID and Order Value columns)
+            render_mapping_controls(platform, "Sales", needs_payment_col=True, expanded=True, payment_label="Order Value Column")
 
-        # 2. Previous Payments (Needs Order ID and Payment Received columns)
-        render_mapping_controls(platform, "Prev_Payments", needs_payment_col=True, expanded=False)
+            # 2. Previous Payments (Needs Order ID and Payment Received columns, one or more files)
+            render_mapping_controls(platform, "Prev_Payments", needs_payment_col=True, expanded=False, multiple_files=True)
 
-        # 3. Upcoming Payments (Needs Order ID and Payment Received columns)
-        render_mapping_controls(platform, "Upcoming_Payments", needs_payment_col=True, expanded=False)
+            # 3. Upcoming Payments (Needs Order ID and Payment Received columns, one or more files)
+            render_mapping_controls(platform, "Upcoming_Payments", needs_payment_col=True, expanded=False, multiple_files=True)
         
         st.divider()
         
@@ -544,71 +1272,538 @@ with tab4:
         if st.button(f"Run {platform} Reconciliation", type="primary", key=f"{platform}_run"):
             
             sales_order_col = st.session_state.get(f'{platform}_sales_order_col')
-            
-            # Check for minimum required selection (Sales Order Col)
+            sales_value_col = st.session_state.get(f'{platform}_sales_payment_col')
+
+            # Check for minimum required selection (Sales Order and Value Cols)
             if not sales_order_col or sales_order_col in ['(Select Column)', '(No File Uploaded)']:
                 st.error("Please ensure you have provided a valid Order ID column name for the Sales Report.")
                 return # Stop processing
-            
+            if not sales_value_col or sales_value_col in ['(Select Column)', '(No File Uploaded)']:
+                st.error("Please ensure you have provided a valid Order Value column name for the Sales Report.")
+                return # Stop processing
+            if not st.session_state.get(f'{platform}_sales_file'):
+                st.error("Please upload the Sales Report.")
+                return # Stop processing
+
             st.success(f"Starting reconciliation for **{platform}**...")
-            
-            # --- MOCK DATA SIMULATION ---
-            # In a real application, you would load the DataFrames and merge/join them using the specified columns.
-            
-            # 1. Total Sales Value (based on Sales sheet orders)
-            total_sales_value = 100000.00 # Mock value in Rupees
-            
-            # 2. Payment Received (Matched Orders between Sales and Prev Payments)
-            received_payment = 95000.00 # Mock value in Rupees
-            
-            # 3. Upcoming Payment (Matched Orders between Sales and Upcoming Payments)
-            upcoming_payment = 4000.00 # Mock value in Rupees
-            
-            # 4. Variance Calculation
-            accounted_payment = received_payment + upcoming_payment
-            variance = total_sales_value - accounted_payment
-            
-            # --- DISPLAY RESULTS ---
-            
-            st.markdown("### Reconciliation Summary")
-            
-            # Displaying confirmation of parameters used in the mock calculation
-            with st.expander("Show Mappings Used for Calculation", expanded=False):
-                st.markdown(f"**Sales Data:** Sheet: `{st.session_state.get(f'{platform}_sales_sheet')}`, Order Col: `{sales_order_col}`")
-                st.markdown(f"**Prev Payment:** Sheet: `{st.session_state.get(f'{platform}_prev_payments_sheet')}`, Order Col: `{st.session_state.get(f'{platform}_prev_payments_order_col')}`, Payment Col: `{st.session_state.get(f'{platform}_prev_payments_payment_col')}`")
-                st.markdown(f"**Upcoming Payment:** Sheet: `{st.session_state.get(f'{platform}_upcoming_payments_sheet')}`, Order Col: `{st.session_state.get(f'{platform}_upcoming_payments_order_col')}`, Payment Col: `{st.session_state.get(f'{platform}_upcoming_payments_payment_col')}`")
+            start_job(f"{platform}_reconciliation", reconciliation_job,
+                      {report_type: mapped_report_spec(platform, report_type)
+                       for report_type in ("Sales", "Prev_Payments", "Upcoming_Payments")})
 
-            # Primary Metrics Display
-            col1, col2, col3, col4 = st.columns(4)
-            
-            col1.metric("Total Sales Value (Sales Sheet)", f"₹{total_sales_value:,.2f}")
-            col2.metric("Payment Received (Prev Payments)", f"₹{received_payment:,.2f}")
-            col3.metric("Payment Expected (Upcoming Payments)", f"₹{upcoming_payment:,.2f}")
+        job = finished_job(f"{platform}_reconciliation", "Loading reports and matching orders")
+        if job is None:
+            return
+        if job['status'] == FAILED:
+            st.error(f"Error reading reconciliation files: {job['error']}")
+            return
+        # Mappings are remembered once per successful run, not on every rerun showing its result
+        if st.session_state.get(f"{platform}_remembered_job") != job['id']:
+            remember_mappings(platform)
+            st.session_state[f"{platform}_remembered_job"] = job['id']
+        render_reconciliation_result(platform, job['result'])
+
+
+    @timed('reconciliation.render')
+    def render_reconciliation_result(platform, result):
+        sales_order_col = st.session_state.get(f'{platform}_sales_order_col')
+        sales_value_col = st.session_state.get(f'{platform}_sales_payment_col')
+
+        summary = result['summary']
+        total_sales_value = summary['total_sales_value']
+        received_payment = summary['received_payment']
+        upcoming_payment = summary['upcoming_payment']
+        variance = summary['variance']
+
+        # --- DISPLAY RESULTS ---
+
+        st.markdown("### Reconciliation Summary")
+
+        # Displaying confirmation of parameters used in the calculation
+        with st.expander("Show Mappings Used for Calculation", expanded=False):
+            st.markdown(f"**Sales Data:** Sheet: `{st.session_state.get(f'{platform}_sales_sheet')}`, Order Col: `{sales_order_col}`, Value Col: `{sales_value_col}`")
+            st.markdown(f"**Prev Payment:** Sheet: `{st.session_state.get(f'{platform}_prev_payments_sheet')}`, Order Col: `{st.session_state.get(f'{platform}_prev_payments_order_col')}`, Payment Col: `{st.session_state.get(f'{platform}_prev_payments_payment_col')}`")
+            st.markdown(f"**Upcoming Payment:** Sheet: `{st.session_state.get(f'{platform}_upcoming_payments_sheet')}`, Order Col: `{st.session_state.get(f'{platform}_upcoming_payments_order_col')}`, Payment Col: `{st.session_state.get(f'{platform}_upcoming_payments_payment_col')}`")
+
+        # Primary Metrics Display
+        col1, col2, col3, col4 = st.columns(4)
+
+        col1.metric("Total Sales Value (Sales Sheet)", f"₹{total_sales_value:,.2f}")
+        col2.metric("Payment Received (Prev Payments)", f"₹{received_payment:,.2f}")
+        col3.metric("Payment Expected (Upcoming Payments)", f"₹{upcoming_payment:,.2f}")
+
+        # Variance Metric
+        delta_color = "inverse" if variance > 0 else "normal" # Red if missing payment (positive variance), Green if over-accounted (negative variance)
+        col4.metric("Unaccounted Variance", f"₹{abs(variance):,.2f}", delta=f"{'Missing' if variance > 0 else 'Surplus'}", delta_color=delta_color)
+
+        # Order status breakdown
+        st.markdown("#### Order Status")
+        status_cols = st.columns(len(summary['status_counts']))
+        for status_col, (status, count) in zip(status_cols, summary['status_counts'].items()):
+            status_col.metric(status.replace('_', ' ').title(), f"{count:,}")
+
+        # Orders needing attention (display is capped; the full list can be large)
+        exceptions = result['orders'][result['orders']['status'] != STATUS_PAID]
+        if len(exceptions):
+            st.markdown(f"#### Orders Needing Attention ({len(exceptions):,})")
+            st.dataframe(exceptions.head(MAX_PREVIEW_ROWS), use_container_width=True)
+        if summary['unmatched_payment_count']:
+            st.warning(f"{summary['unmatched_payment_count']:,} payment(s) worth ₹{summary['unmatched_payment_value']:,.2f} could not be matched to any sales order.")
+            st.dataframe(result['unmatched_payments'].head(MAX_PREVIEW_ROWS), use_container_width=True)
+
+        # Full order list and unmatched payments, written only when requested
+        st.download_button(
+            "📥 Download Reconciliation Workbook",
+            **download_payload({'orders': result['orders'], 'unmatched_payments': result['unmatched_payments']},
+                               f"{platform}_Reconciliation"),
+            key=f"{platform}_recon_download", on_click="ignore",
+        )
+
+        st.markdown("---")
+        st.info(f"Reconciliation complete! This process involves a three-way match: Sales Orders vs. Previous Payments vs. Upcoming Payments.")
 
-            # Variance Metric
-            delta_color = "inverse" if variance > 0 else "normal" # Red if missing payment (positive variance), Green if over-accounted (negative variance)
-            col4.metric("Unaccounted Variance", f"₹{abs(variance):,.2f}", delta=f"{'Missing' if variance > 0 else 'Surplus'}", delta_color=delta_color)
 
-            st.markdown("---")
-            st.info(f"Reconciliation complete! This process involves a three-way match: Sales Orders vs. Previous Payments vs. Upcoming Payments.")
+    def ledger_section(platform):
+        """Rolling ledger: settlement state kept across sessions, updated file by file."""
+        st.divider()
+        st.markdown(f"### 📒 {platform} Rolling Ledger")
+        st.caption("Add each week's files once; the ledger keeps every order's settlement state across sessions and only recomputes the orders a new file mentions.")
+
+        col_add, col_clear = st.columns([1, 4])
+        with col_add:
+            add_clicked = st.button("➕ Add Uploaded Files", key=f"{platform}_ledger_add")
+        with col_clear:
+            if st.button("🗑️ Clear Ledger", key=f"{platform}_ledger_clear"):
+                clear_ledger(platform)
+                st.success(f"{platform} ledger cleared.")
+
+        if add_clicked:
+            with st.spinner("Updating the ledger..."):
+                for report_type in ("Sales", "Prev_Payments", "Upcoming_Payments"):
+                    files = mapped_uploads(platform, report_type)
+                    if not files:
+                        continue
+                    try:
+                        frames = load_mapped_reports(platform, report_type)
+                    except Exception as e:
+                        st.error(f"Error reading {report_type.replace('_', ' ')} files: {e}")
+                        continue
+                    for uploaded, frame in zip(files, frames):
+                        added = add_ledger_file(frame, platform, report_type.lower(), content_hash(uploaded.getvalue()), uploaded.name)
+                        st.write(f"{uploaded.name}: {added['status']} ({added['orders_updated']:,} orders updated)")
+                remember_mappings(platform)
+
+        # Removal messages are kept across the rerun that refreshes the file list
+        for message in st.session_state.pop(f"{platform}_ledger_removed", []):
+            st.write(message)
+
+        ledger = ledger_summary(platform)
+        if not ledger['order_count'] and not ledger['unmatched_payment_count']:
+            st.info("The ledger is empty. Map and upload this platform's files above, then add them.")
+            return
 
-    with tab_amz:
-        reconciliation_uploader("Amazon")
-    with tab_meesho:
-        reconciliation_uploader("Meesho")
-    with tab_flipkart:
-        reconciliation_uploader("Flipkart")
+        col1, col2, col3, col4 = st.columns(4)
+        col1.metric("Orders", f"{ledger['order_count']:,}")
+        col2.metric("Sales Value", f"₹{ledger['total_sales_value']:,.2f}")
+        col3.metric("Received", f"₹{ledger['received_payment']:,.2f}")
+        col4.metric("Outstanding", f"₹{ledger['variance']:,.2f}")
+        status_cols = st.columns(len(ledger['status_counts']))
+        for status_col, (status, count) in zip(status_cols, ledger['status_counts'].items()):
+            status_col.metric(status.replace('_', ' ').title(), f"{count:,}")
+
+        owed = outstanding(platform, limit=MAX_PREVIEW_ROWS)
+        if len(owed):
+            st.markdown("#### Largest Outstanding Balances")
+            st.dataframe(owed, use_container_width=True, hide_index=True)
+        if ledger['unmatched_payment_count']:
+            st.warning(f"{ledger['unmatched_payment_count']:,} payment(s) worth ₹{ledger['unmatched_payment_value']:,.2f} have no sales order in the ledger yet.")
+
+        st.download_button(
+            "📥 Download Ledger",
+            **download_payload(lambda: {'orders': ledger_orders(platform), 'unmatched_payments': unmatched_payments(platform)},
+                               f"{platform}_Ledger", fmt=expected_format(ledger['order_count'], len(ORDER_COLUMNS))),
+            key=f"{platform}_ledger_download", on_click="ignore",
+        )
+        with st.expander("Files in the ledger", expanded=False):
+            files = ledger_files(platform)
+            picked = st.dataframe(files.drop(columns=['platform', 'file_hash']), hide_index=True,
+                                  on_select="rerun", selection_mode="multi-row", key=f"{platform}_ledger_files")
+            rows = picked.selection.rows
+            # A superseded upcoming-payments list must go, or orders settled since show as duplicates
+            if st.button("🗑️ Remove Selected Files", key=f"{platform}_ledger_remove", disabled=not rows):
+                removed = []
+                for _, row in files.iloc[rows].iterrows():
+                    updated = remove_ledger_file(platform, row['kind'], row['file_hash'])
+                    removed.append(f"{row['file_name']}: removed ({updated:,} orders updated)")
+                st.session_state[f"{platform}_ledger_removed"] = removed
+                st.rerun()
+
+    for platform_tab, platform in ((tab_amz, "Amazon"), (tab_meesho, "Meesho"), (tab_flipkart, "Flipkart")):
+        with platform_tab:
+            reconciliation_uploader(platform)
+            ledger_section(platform)
 
 # ====================================================================
-# --- TAB 5: LISTING OPTIMIZATION (Logic omitted for brevity) ---
+# --- TAB 5: LISTING OPTIMIZATION ---
 # ====================================================================
-with tab5:
+@timed('page.listing_optimization')
+def listing_optimization_page():
+    from ecommsolutions.listing_optimization import (
+        DESCRIPTION_TEMPLATES, MAX_TITLE_LENGTH, TITLE_TEMPLATES, build_index, catalogue_keywords, parse_keywords,
+        read_catalogue, read_keywords, score_listings, suggest_rewrites,
+    )
     st.header("✍️ Listing Optimization Tool")
-    st.write("This tab helps generate SEO-friendly titles and descriptions using target keywords.")
+    st.caption("Scores every title of your catalogue against target keywords, flags missing terms and duplicate titles "
+               "and suggests rewrites from templates. Everything runs locally on an index of your catalogue.")
+
+    catalogue_file = st.file_uploader("Catalogue export (Excel/CSV with SKU and title columns)", type=['xlsx', 'csv'],
+                                      key="listing_catalogue")
+    # The index lives in the session (uploads do not survive a tab switch, the index does),
+    # so small catalogue changes update it instead of rebuilding it
+    if catalogue_file is not None:
+        file_hash = content_hash(catalogue_file.getvalue())
+        if st.session_state.get('listing_index_hash') != file_hash:
+            with st.spinner("Indexing catalogue titles..."):
+                try:
+                    st.session_state['listing_index'] = build_index(catalogue_file, catalogue_file.name)
+                except Exception as e:
+                    st.error(f"Error reading the catalogue: {e}")
+                    return
+            st.session_state['listing_index_hash'] = file_hash
+    elif 'listing_index' in st.session_state:
+        st.caption("Using the catalogue indexed earlier in this session.")
+    else:
+        st.info("Upload your catalogue export to start.")
+        return
+    index = st.session_state['listing_index']
+    file_hash = st.session_state['listing_index_hash']
+
+    with st.expander("🔄 Apply changed listings"):
+        st.caption("Upload only the listings that changed (same columns as the catalogue); the rest of the index is kept.")
+        changed_file = st.file_uploader("Changed listings", type=['xlsx', 'csv'], key="listing_changes",
+                                        label_visibility="collapsed")
+        if changed_file is not None and st.button("Apply Changes", key="listing_apply"):
+            try:
+                updated = index.update(read_catalogue(changed_file, changed_file.name))
+                st.success(f"Updated {updated:,} listings.")
+            except Exception as e:
+                st.error(f"Error reading {changed_file.name}: {e}")
+
+    # --- Target keywords ---
+    st.subheader("Target Keywords")
+    keyword_source = st.radio("Keyword source", ["Type keywords", "Upload keyword file", "Top terms of my catalogue"],
+                              horizontal=True, key="listing_keyword_source")
+    keywords = None
+    if keyword_source == "Type keywords":
+        keyword_text = st.text_area("One keyword per line, optionally with a weight and a category",
+                                    placeholder="cotton kurta: 50\n[Saree] banarasi silk saree: 40\nprinted",
+                                    key="listing_keyword_text")
+        if keyword_text.strip():
+            keywords = parse_keywords(keyword_text)
+    elif keyword_source == "Upload keyword file":
+        keyword_file = st.file_uploader("Keyword file (keyword, search volume / weight, category)", type=['xlsx', 'csv'],
+                                        key="listing_keyword_file")
+        if keyword_file is not None:
+            try:
+                keywords = read_keywords(keyword_file, keyword_file.name)
+            except Exception as e:
+                st.error(f"Error reading {keyword_file.name}: {e}")
+    else:
+        keywords = catalogue_keywords(index)
+        st.caption("The most used words and word pairs of each category, weighted by how many listings use them.")
+    if keywords is None or keywords.empty:
+        st.info("Add target keywords to score the catalogue.")
+        return
+
+    st.session_state.setdefault('listing_max_length', MAX_TITLE_LENGTH)
+    max_length = st.number_input("Maximum title length (characters)", min_value=40, max_value=500, key="listing_max_length")
+
+    # Scores are cached per index version and keyword set, so widget reruns do not rescore 200k listings
+    scores_key = (file_hash, index.version, pd.util.hash_pandas_object(keywords, index=False).sum(), max_length)
+    if st.session_state.get('listing_scores_key') != scores_key:
+        st.session_state['listing_scores'] = score_listings(index, keywords, max_length)
+        st.session_state['listing_scores_key'] = scores_key
+    scores = st.session_state['listing_scores']
+
+    col1, col2, col3, col4 = st.columns(4)
+    col1.metric("Listings", f"{len(scores):,}")
+    col2.metric("Average Keyword Score", f"{scores['score'].mean():.1f}%")
+    col3.metric("Duplicate Titles", f"{int((scores['duplicate_titles'] > 0).sum()):,}")
+    col4.metric("Titles Too Long", f"{int(scores['too_long'].sum()):,}")
+
+    tab_scores, tab_rewrites, tab_duplicates, tab_terms = st.tabs(["Lowest Scores", "Suggested Rewrites", "Duplicate Titles", "Top Terms"])
+    with tab_scores:
+        st.dataframe(scores.nsmallest(MAX_PREVIEW_ROWS, 'score'), hide_index=True)
+    with tab_rewrites:
+        col_title, col_description = st.columns(2)
+        with col_title:
+            title_template = st.selectbox("Title template", list(TITLE_TEMPLATES) + ["Custom"], key="listing_title_template")
+            if title_template == "Custom":
+                st.session_state.setdefault('listing_custom_template', TITLE_TEMPLATES["Brand first"])
+                title_template_text = st.text_input("Custom title template", key="listing_custom_template",
+                                                    help="Fields: {brand} {title} {missing} {keywords} {category} {color} {size} {material}")
+            else:
+                title_template_text = TITLE_TEMPLATES[title_template]
+        with col_description:
+            description_template = st.selectbox("Description template", ["None"] + list(DESCRIPTION_TEMPLATES), key="listing_description_template")
+        st.session_state.setdefault('listing_rewrite_count', 1000)
+        rewrite_count = st.slider("Listings to rewrite (lowest scores first)", 100, 10_000, step=100, key="listing_rewrite_count")
+        weakest = scores.nsmallest(rewrite_count, 'score')
+        try:
+            rewrites = suggest_rewrites(index, weakest, keywords, title_template_text, max_length,
+                                        DESCRIPTION_TEMPLATES.get(description_template))
+        except ValueError as e:
+            st.error(str(e))
+            rewrites = None
+        if rewrites is not None:
+            st.dataframe(rewrites.head(MAX_PREVIEW_ROWS), hide_index=True)
+            st.download_button("📥 Download Rewrites and Scores",
+                               **download_payload({'rewrites': rewrites, 'scores': scores}, "Listing_Optimization"),
+                               on_click="ignore")
+    with tab_duplicates:
+        duplicates = scores[scores['duplicate_titles'] > 0].sort_values(['title', 'sku'])
+        st.caption(f"{len(duplicates):,} listings share their title with at least one other listing.")
+        st.dataframe(duplicates[['sku', 'title', 'category', 'duplicate_titles']].head(MAX_PREVIEW_ROWS), hide_index=True)
+    with tab_terms:
+        col_words, col_pairs = st.columns(2)
+        with col_words:
+            st.subheader("Top Words")
+            st.dataframe(index.ngram_counts(1, 25), hide_index=True)
+        with col_pairs:
+            st.subheader("Top Word Pairs")
+            st.dataframe(index.ngram_counts(2, 25), hide_index=True)
 
 # ====================================================================
-# --- TAB 6: ADS MANAGER (Logic omitted for brevity) ---
+# --- TAB 6: ADS MANAGER ---
 # ====================================================================
-with tab6:
+@st.cache_data(show_spinner=False, max_entries=32)
+def _ads_cube(file_hash, file_name, platform, _uploaded_file):
+    """Day x campaign x ad group x keyword x search term cube of one ads report, built once per file content."""
+    from ecommsolutions.ads_manager import ads_cube
+
+    return ads_cube(_uploaded_file, None if platform == "Auto-detect" else platform, file_name)
+
+
+@st.cache_data(show_spinner=False, max_entries=64)
+def _ads_rollup(cube_key, filters, level, _view):
+    """
+    One level's rollup of the filtered cube. Cached per cube, filters and
+    level, so threshold changes and view switches never re-group the cube.
+    """
+    from ecommsolutions.ads_manager import ads_rollup
+
+    return ads_rollup(_view, level)
+
+
+@timed('page.ads_manager')
+def ads_manager_page():
+    from ecommsolutions.ads_manager import (
+        DEFAULT_MIN_CLICKS, DEFAULT_MIN_CTR, DEFAULT_MIN_IMPRESSIONS, DEFAULT_MIN_SPEND, DEFAULT_TARGET_ACOS, UNKNOWN,
+        ads_totals, ads_trend, combine_ads_cubes, filter_ads, tacos, wasteful_keywords,
+    )
+    from ecommsolutions.sales_analysis import combine_cubes, filter_cube
+
     st.header("📢 Ads Performance Manager")
-    st.write("This tab will allow you to analyze ACOS (Advertising Cost of Sales) and optimize campaigns.")
+    st.caption("ACOS, ROAS and CTR by campaign, ad group, keyword and search term from Amazon and Flipkart ads reports, "
+               "wasteful keywords by threshold rules and TACOS against your sales reports.")
+
+    col_ads_platform, col_ads_files = st.columns([1, 3])
+    with col_ads_platform:
+        ads_platform = st.selectbox("Platform", ["Auto-detect", "Amazon", "Flipkart"], key="ads_platform")
+    with col_ads_files:
+        ads_files = st.file_uploader("Upload search term / campaign / advertised product reports (Excel/CSV)",
+                                     type=['xlsx', 'csv'], accept_multiple_files=True, key="ads_files")
+
+    # The cube lives in the session (uploads do not survive a tab switch, the cube does)
+    if ads_files:
+        cube_key = (ads_platform,) + tuple(sorted(content_hash(f.getvalue()) for f in ads_files))
+        if st.session_state.get('ads_cube_key') != cube_key:
+            try:
+                with st.spinner("Building ads rollups..."):
+                    st.session_state['ads_cube'] = combine_ads_cubes(
+                        [_ads_cube(content_hash(f.getvalue()), f.name, ads_platform, f) for f in ads_files])
+            except Exception as e:
+                st.error(f"Error reading ads reports: {e}")
+                return
+            st.session_state['ads_cube_key'] = cube_key
+    elif 'ads_cube' in st.session_state:
+        st.caption("Using the ads reports uploaded earlier in this session.")
+    else:
+        st.info("Upload one or more ads reports to see ACOS, ROAS and wasteful keywords.")
+        return
+    cube = st.session_state['ads_cube']
+    cube_key = st.session_state['ads_cube_key']
+    if cube.empty:
+        st.warning("No dated ads rows found in the uploaded reports.")
+        return
+
+    # --- Filters (applied to the cube, not the raw reports) ---
+    col_dates, col_platforms, col_campaigns = st.columns([2, 2, 3])
+    with col_dates:
+        date_range = st.date_input("Date range", value=(cube['date'].min().date(), cube['date'].max().date()), key="ads_date_range")
+    with col_platforms:
+        chosen_platforms = st.multiselect("Platforms", sorted(cube['platform'].cat.categories), key="ads_platforms")
+    with col_campaigns:
+        chosen_campaigns = st.multiselect("Campaigns", sorted(cube['campaign'].cat.categories), key="ads_campaigns")
+
+    start, end = (date_range[0], date_range[-1]) if isinstance(date_range, (list, tuple)) and date_range else (None, None)
+    view = filter_ads(cube, start, end, chosen_platforms, chosen_campaigns)
+    filters = (start, end, tuple(chosen_platforms), tuple(chosen_campaigns))
+    overall = ads_totals(view)
+
+    def ratio(value, suffix='', prefix=''):
+        return "—" if pd.isna(value) else f"{prefix}{value:,.2f}{suffix}"
+
+    col1, col2, col3, col4, col5, col6 = st.columns(6)
+    col1.metric("Ad Spend", f"₹{overall['spend']:,.2f}")
+    col2.metric("Ad Sales", f"₹{overall['sales']:,.2f}")
+    col3.metric("ACOS", ratio(overall['acos'], '%'))
+    col4.metric("ROAS", ratio(overall['roas'], 'x'))
+    col5.metric("CTR", ratio(overall['ctr'], '%'))
+    col6.metric("CPC", ratio(overall['cpc'], prefix='₹'))
+
+    st.session_state.setdefault('ads_target_acos', DEFAULT_TARGET_ACOS)
+    st.session_state.setdefault('ads_min_clicks', DEFAULT_MIN_CLICKS)
+    st.session_state.setdefault('ads_min_spend', DEFAULT_MIN_SPEND)
+    st.session_state.setdefault('ads_min_impressions', DEFAULT_MIN_IMPRESSIONS)
+    st.session_state.setdefault('ads_min_ctr', DEFAULT_MIN_CTR)
+
+    # Only the open view builds its tables; switching views re-runs the page
+    tab_performance, tab_waste, tab_trend, tab_tacos = st.tabs(["Performance", "Wasteful Keywords", "Trend", "TACOS"],
+                                                              key="ads_view", on_change="rerun")
+
+    if tab_performance.open:
+        with tab_performance:
+            levels = {"Campaign": 'campaign', "Ad Group": 'ad_group', "Keyword": 'keyword', "Search Term": 'search_term', "SKU": 'sku'}
+            level_label = st.radio("Group by", list(levels), horizontal=True, key="ads_level")
+            rollup = _ads_rollup(cube_key, filters, levels[level_label], view)
+            st.caption(f"{len(rollup):,} rows, highest spend first.")
+            st.dataframe(rollup.head(MAX_PREVIEW_ROWS), hide_index=True)
+            st.download_button("📥 Download Rollup", **download_payload({level_label: rollup}, f"Ads_{levels[level_label]}"),
+                               on_click="ignore")
+
+    if tab_waste.open:
+        with tab_waste:
+            col_acos, col_clicks, col_spend, col_impressions, col_ctr = st.columns(5)
+            with col_acos:
+                target_acos = st.number_input("Target ACOS %", min_value=1.0, step=5.0, key="ads_target_acos")
+            with col_clicks:
+                min_clicks = st.number_input("Clicks without an order", min_value=1, key="ads_min_clicks")
+            with col_spend:
+                min_spend = st.number_input("Minimum spend (₹)", min_value=0.0, step=50.0, key="ads_min_spend")
+            with col_impressions:
+                min_impressions = st.number_input("Impressions for CTR", min_value=1, step=500, key="ads_min_impressions")
+            with col_ctr:
+                min_ctr = st.number_input("Minimum CTR %", min_value=0.0, step=0.05, key="ads_min_ctr")
+            waste_level = st.radio("Flag", ["Search Term", "Keyword"], horizontal=True, key="ads_waste_level")
+            rollup = _ads_rollup(cube_key, filters, 'search_term' if waste_level == "Search Term" else 'keyword', view)
+            flagged = wasteful_keywords(rollup, target_acos, min_clicks, min_spend, min_impressions, min_ctr)
+
+            col_count, col_wasted, col_share = st.columns(3)
+            col_count.metric("Flagged", f"{len(flagged):,}")
+            col_wasted.metric("Wasted Spend", f"₹{flagged['wasted_spend'].sum():,.2f}")
+            col_share.metric("Share of Spend", ratio(flagged['wasted_spend'].sum() / overall['spend'] * 100 if overall['spend'] else None, '%'))
+            st.dataframe(flagged.head(MAX_PREVIEW_ROWS), hide_index=True)
+            st.download_button("📥 Download Flagged Keywords", **download_payload({'wasteful_keywords': flagged}, "Ads_Wasteful_Keywords"),
+                               on_click="ignore")
+
+    if tab_trend.open:
+        with tab_trend:
+            import plotly.express as px
+
+            freq_label = st.radio("Granularity", ["Daily", "Weekly", "Monthly"], horizontal=True, key="ads_freq")
+            trend = ads_trend(view, {"Daily": 'D', "Weekly": 'W', "Monthly": 'MS'}[freq_label])
+            st.plotly_chart(px.line(trend, x='date', y=['spend', 'sales'], labels={'value': '₹', 'date': '', 'variable': ''}), use_container_width=True)
+            st.plotly_chart(px.line(trend, x='date', y='acos', labels={'acos': 'ACOS %', 'date': ''}), use_container_width=True)
+
+    if tab_tacos.open:
+        with tab_tacos:
+            st.caption("TACOS is ad spend over all revenue, so it shows how much of the business depends on ads. "
+                       "Upload sales reports here, or build them in the Sales Analysis tab first.")
+            tacos_files = st.file_uploader("Sales / order reports (Excel/CSV)", type=['xlsx', 'csv'], accept_multiple_files=True, key="ads_sales_files")
+            if tacos_files:
+                try:
+                    with st.spinner("Building sales rollups..."):
+                        sales = combine_cubes([_sales_cube(content_hash(f.getvalue()), f.name, "Auto-detect", f) for f in tacos_files])
+                except Exception as e:
+                    st.error(f"Error reading sales reports: {e}")
+                    sales = None
+            else:
+                sales = st.session_state.get('sales_cube')
+                if sales is not None:
+                    st.caption("Using the sales reports of the Sales Analysis tab.")
+
+            if sales is None or sales.empty:
+                st.info("No sales data yet for TACOS.")
+            else:
+                sales_view = filter_cube(sales, start, end, chosen_platforms)
+                by_label = st.radio("Join on", ["Date", "SKU"], horizontal=True, key="ads_tacos_by")
+                if by_label == "Date":
+                    freq_label = st.radio("Granularity", ["Daily", "Weekly", "Monthly"], horizontal=True, key="ads_tacos_freq")
+                    joined = tacos(view, sales_view, 'date', {"Daily": 'D', "Weekly": 'W', "Monthly": 'MS'}[freq_label])
+                else:
+                    joined = tacos(view, sales_view, 'sku')
+                    if not (view['sku'] != UNKNOWN).any():
+                        st.info("The ads reports name no SKUs; upload an advertised product report to join on SKU.")
+                total_revenue = float(sales_view['revenue'].sum())
+                col_revenue, col_tacos = st.columns(2)
+                col_revenue.metric("Total Revenue", f"₹{total_revenue:,.2f}")
+                col_tacos.metric("TACOS", ratio(overall['spend'] / total_revenue * 100 if total_revenue else None, '%'))
+                st.dataframe(joined.head(MAX_PREVIEW_ROWS), hide_index=True)
+
+
+# --- Render the open tab, and the pages that must keep their uploads ---
+# An undrawn file_uploader forgets its file, so GST Filing and Reconciliation,
+# whose uploads only turn into results when a run is started, are drawn on
+# every run. The other pages keep what they built from their uploads (cubes,
+# index, return history) in the session or on disk and only run when open.
+EAGER_PAGES = (gst_filing_page, reconciliation_page)
+for page_tab, page in ((tab1, gst_filing_page), (tab2, sales_analysis_page), (tab3, return_analysis_page),
+                       (tab4, reconciliation_page), (tab5, listing_optimization_page), (tab6, ads_manager_page)):
+    if page in EAGER_PAGES or page_tab.open:
+        with page_tab:
+            page()
+
+
+# ====================================================================
+# --- SIDEBAR: REPORT CACHE STATS ---
+# ====================================================================
+with st.sidebar.expander("🗄️ Report Cache", expanded=False):
+    stats = cache_stats()
+    if not stats['enabled']:
+        st.caption("Install `pyarrow` to enable the on-disk report cache.")
+    else:
+        st.caption(f"Parsed uploads are kept as Parquet in `{stats['directory']}`.")
+        col_size, col_entries = st.columns(2)
+        col_size.metric("Size", f"{stats['total_bytes'] / 1024 ** 2:,.1f} MB", delta=f"of {stats['max_bytes'] / 1024 ** 2:,.0f} MB", delta_color="off")
+        col_entries.metric("Reports", stats['entries'])
+        st.caption(f"Since server start: {stats['hits']} hits · {stats['misses']} misses · {stats['probe_hits']} header probes · {stats['evictions']} evictions")
+        if stats['entries']:
+            st.dataframe(stats['table'][['file_name', 'sheets', 'rows', 'bytes', 'last_used']], hide_index=True)
+            if st.button("Clear Report Cache", key="clear_report_cache"):
+                clear_cache()
+                st.rerun()
+
+
+# ====================================================================
+# --- SIDEBAR: PERFORMANCE (DEBUG) ---
+# ====================================================================
+with st.sidebar.expander("⏱️ Performance", expanded=False):
+    st.toggle("Record stage timings", key="perf_enabled",
+              help="Times parsing, aggregation, rendering and exports of this session's runs.")
+    st.toggle("Trace memory peaks (slower)", key="perf_memory", disabled=not st.session_state['perf_enabled'],
+              help="Slows this session's runs and jobs only. Stages that overlap another session's are shown without a peak.")
+    perf_records = recent_records(limit=200, session=job_session())
+    if perf_records:
+        perf_frame = pd.DataFrame(perf_records)
+        perf_columns = [column for column in ('stage', 'seconds', 'peak_mb', 'rows', 'file', 'platform', 'parent', 'run', 'error')
+                        if column in perf_frame]
+        st.dataframe(perf_frame[perf_columns], hide_index=True)
+        st.download_button("📥 Download JSON Log", data=lambda: "\n".join(json.dumps(record, default=str) for record in perf_records),
+                           file_name="stage_timings.jsonl", mime="application/json", on_click="ignore")
+        if st.button("Clear Timings", key="perf_clear"):
+            clear_records(session=job_session())
+            st.rerun()
+    elif st.session_state['perf_enabled']:
+        st.caption("Timings appear here after the next run.")
+    else:
+        st.caption("Switch recording on to see where the time of each run goes.")
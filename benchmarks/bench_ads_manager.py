@@ -0,0 +1,49 @@
+"""
+Benchmark for the Ads Manager cube.
+
+Generates a synthetic Amazon search-term report (default 1M rows) and times:
+  1. building the cube on the first upload (CSV parse + Parquet cache write)
+  2. rebuilding it from the report cache
+  3. every rollup level of the Ads Manager tables
+  4. the wasteful-keyword rules on the search-term rollup
+
+Run from the repository root:
+
+    python benchmarks/bench_ads_manager.py --rows 1000000
+"""
+import argparse
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from common import scratch_dir, time_step  # noqa: E402
+from synthetic import make_search_terms  # noqa: E402
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--rows', type=int, default=1_000_000, help='search-term rows to generate')
+    args = parser.parse_args()
+
+    with scratch_dir() as tmp:
+        from ecommsolutions.ads_manager import LEVELS, ads_cube, ads_rollup, ads_totals, wasteful_keywords
+
+        path = os.path.join(tmp, 'search_terms.csv')
+        make_search_terms(args.rows).to_csv(path, index=False)
+        print(f"Synthetic search-term report: {args.rows:,} rows")
+
+        time_step("build cube (first upload)", lambda: ads_cube(path))
+        cube = time_step("build cube (from the report cache)", lambda: ads_cube(path))
+        for level in LEVELS:
+            rollup = time_step(f"rollup by {level}", lambda: ads_rollup(cube, level))
+        flagged = time_step("wasteful-keyword rules (search terms)", lambda: wasteful_keywords(ads_rollup(cube, 'search_term')))
+
+        totals = ads_totals(cube)
+        print(f"Cube: {len(cube):,} cells, {cube.memory_usage(deep=True).sum() / 2**20:,.1f} MB, "
+              f"ACOS {totals['acos']:.1f}%, {len(flagged):,} flagged search terms, "
+              f"₹{flagged['wasted_spend'].sum():,.0f} wasted, {len(rollup):,} SKUs")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,56 @@
+"""
+Benchmark for the listing optimization keyword engine.
+
+Generates a synthetic catalogue (default 200k listings) and times:
+  1. reading the catalogue and building the inverted index
+  2. scoring every listing against the catalogue's own top terms
+  3. template rewrites of the 10k lowest-scoring listings
+  4. an incremental update of 100 changed listings, and the rescore after it
+
+Run from the repository root:
+
+    python benchmarks/bench_listing_optimization.py --rows 200000
+"""
+import argparse
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from common import scratch_dir, time_step  # noqa: E402
+from synthetic import make_catalogue  # noqa: E402
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--rows', type=int, default=200_000, help='listings to generate')
+    parser.add_argument('--changed', type=int, default=100, help='listings changed in the incremental update')
+    args = parser.parse_args()
+
+    with scratch_dir() as tmp:
+        from ecommsolutions.listing_optimization import (
+            build_index, catalogue_keywords, score_listings, suggest_rewrites,
+        )
+
+        catalogue = make_catalogue(args.rows)
+        path = os.path.join(tmp, 'catalogue.csv')
+        catalogue.to_csv(path, index=False)
+        print(f"Synthetic catalogue: {len(catalogue):,} listings")
+
+        index = time_step("read + index catalogue (first upload)", lambda: build_index(path))
+        keywords = catalogue_keywords(index)
+        scores = time_step(f"score against {len(keywords)} keywords", lambda: score_listings(index, keywords))
+        time_step("rewrite 10k lowest-scoring titles", lambda: suggest_rewrites(index, scores.nsmallest(10_000, 'score'), keywords))
+
+        changed = catalogue.sample(args.changed, random_state=2).rename(columns={
+            'Seller SKU ID': 'sku', 'Product Title': 'title', 'Brand': 'brand', 'Category': 'category'})
+        changed['title'] = changed['title'] + ' New Arrival'
+        time_step(f"incremental update of {args.changed} listings", lambda: index.update(changed))
+        scores = time_step("rescore after the update", lambda: score_listings(index, keywords))
+
+        print(f"Vocabulary: {len(index.vocabulary):,} words, average score {scores['score'].mean():.1f}%, "
+              f"{int((scores['duplicate_titles'] > 0).sum()):,} listings with duplicate titles")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,62 @@
+"""
+Benchmark for the Meesho GSTR-1 computation.
+
+Generates a synthetic high-volume month (default 500k sales lines, 10%
+returns, one invoice per line) and times:
+  1. the aggregation alone, from in-memory frames
+  2. the full pipeline from CSV files (parse + cache write)
+  3. the same files again, served from the Parquet report cache
+
+Run from the repository root:
+
+    python benchmarks/bench_meesho_gstr1.py --rows 500000
+"""
+import argparse
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from common import scratch_dir, time_step  # noqa: E402
+from synthetic import make_invoices, make_lines  # noqa: E402
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--rows', type=int, default=500_000, help='sales lines to generate')
+    parser.add_argument('--return-ratio', type=float, default=0.1, help='returns as a share of sales lines')
+    args = parser.parse_args()
+
+    with scratch_dir() as tmp:
+        from ecommsolutions.meesho_gstr1 import compute_meesho_gstr1, process_meesho_reports
+
+        return_rows = int(args.rows * args.return_ratio)
+        sales = make_lines(args.rows, seed=1)
+        returns = make_lines(return_rows, seed=2)
+        invoices = make_invoices(args.rows, return_rows)
+        print(f"Synthetic month: {len(sales):,} sales, {len(returns):,} returns, {len(invoices):,} documents")
+
+        canonical = {
+            'sub_order_num': 'order_id', 'hsn_code': 'hsn', 'quantity': 'quantity', 'gst_rate': 'rate',
+            'total_taxable_sale_value': 'taxable_value', 'tax_amount': 'tax',
+            'total_invoice_value': 'invoice_value', 'end_customer_state_new': 'state',
+        }
+        time_step("aggregation (in-memory frames)", lambda: compute_meesho_gstr1(
+            [sales.rename(columns=canonical)], [returns.rename(columns=canonical)],
+            [invoices.rename(columns={'Type': 'doc_type', 'Invoice No': 'invoice_no'})], '09ABCDE1234F1ZY',
+        ))
+
+        paths = [os.path.join(tmp, name) for name in ('tcs_sales.csv', 'tcs_sales_return.csv', 'Tax_invoice_details.csv')]
+        for frame, path in zip([sales, returns, invoices], paths):
+            frame.to_csv(path, index=False)
+
+        time_step("full pipeline from CSV (first upload)", lambda: process_meesho_reports(*paths, '09ABCDE1234F1ZY'))
+        result = time_step("full pipeline from CSV (Parquet cache hit)", lambda: process_meesho_reports(*paths, '09ABCDE1234F1ZY'))
+
+        summary = result['summary']
+        print(f"B2CS rows: {len(result['b2cs'])}, HSN rows: {len(result['hsn'])}, document series: {len(result['docs'])}")
+        print(f"Net taxable value: {summary['net_taxable_value']:,.2f}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,424 @@
+"""
+End-to-end benchmark suite for the report pipelines.
+
+For each platform, size and file format it generates a synthetic month
+(benchmarks/synthetic.py) and times every pipeline stage, recording wall
+time and the peak memory the stage added on top of what the process
+already held:
+
+  probe      header-only probe of the main report
+  ingest     first upload: parse every report and write the Parquet cache
+  ingest_hit the same reports again, served from the cache
+  validate   the validation pass over the GST reports on its own
+  gst        GSTR-1 validation and aggregation (Meesho, Flipkart, and Amazon
+             MTRs: 12 monthly B2C files plus one B2B file, parsed in parallel)
+  reconcile  sales vs settlement join (load_report + reconcile)
+  export     result workbook (GSTR-1 sections, or the reconciliation orders)
+
+Each dataset is measured in its own interpreter. 'peak_mb' is how far the
+stage pushed resident memory above what the process held before it; the
+'process' entry per dataset records the total time and the peak RSS of the
+whole run, which is the number to size servers by.
+
+Results are compared with benchmarks/baselines.json; a stage that got
+slower or hungrier than the baseline by more than the tolerance is reported
+as a regression and the run exits with status 1. Stages the baseline has no
+entry for are listed as unchecked. `--save-baseline` records the current run
+as the new baseline (merged into the existing entries).
+
+The committed baseline covers every platform at 10k, 100k and 1M rows as CSV
+and XLSX, and at 5M rows as CSV, recorded on a single-CPU Linux host (see its
+'host' entry). On other hardware, record a local baseline first.
+
+Run from the repository root:
+
+    python benchmarks/bench_pipeline.py --sizes 10k,100k --formats csv,xlsx
+    python benchmarks/bench_pipeline.py --sizes 1M,5M --formats csv --platforms flipkart
+
+XLSX datasets are limited to one worksheet (1,048,575 rows), so 5M runs as
+CSV only. Generated files are kept in --data-dir for later runs.
+"""
+import argparse
+import datetime
+import gc
+import json
+import os
+import platform as host_platform
+import shutil
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from synthetic import PLATFORMS, SELLER_GSTIN, dataset_paths, write_dataset  # noqa: E402
+
+BASELINE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'baselines.json')
+DEFAULT_DATA_DIR = os.path.join(os.path.expanduser('~'), '.cache', 'ecommsolutions', 'bench-data')
+SIZES = {'10k': 10_000, '100k': 100_000, '1M': 1_000_000, '5M': 5_000_000}
+FORMATS = ('csv', 'xlsx')
+
+# A stage regresses when it is this much slower/bigger than its baseline and
+# the difference is above the noise floor
+DEFAULT_TOLERANCE = 0.25
+MIN_SECONDS_DELTA = 0.1
+MIN_MB_DELTA = 20.0
+
+
+# --- Measuring ---
+
+def _rss_mb():
+    """Resident set size of this process in MB (Linux /proc; 0 where unavailable)."""
+    try:
+        with open('/proc/self/statm') as handle:
+            return int(handle.read().split()[1]) * os.sysconf('SC_PAGE_SIZE') / 2**20
+    except (OSError, ValueError, IndexError):
+        return 0.0
+
+
+class _PeakSampler:
+    """Samples RSS every few milliseconds on a side thread and keeps the maximum."""
+
+    def __init__(self, interval=0.005):
+        self.interval = interval
+        self.peak = _rss_mb()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    def _run(self):
+        while not self._stop.is_set():
+            self.peak = max(self.peak, _rss_mb())
+            self._stop.wait(self.interval)
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._stop.set()
+        self._thread.join()
+        self.peak = max(self.peak, _rss_mb())
+
+
+def measure(func):
+    """Runs func() once; returns (result, seconds, peak MB added during the call)."""
+    gc.collect()
+    before = _rss_mb()
+    with _PeakSampler() as sampler:
+        start = time.perf_counter()
+        result = func()
+        seconds = time.perf_counter() - start
+    return result, seconds, max(sampler.peak - before, 0.0)
+
+
+# --- Pipeline stages ---
+
+def _first_sheet(path):
+    """The sheet the app would select for a report (None for CSV), so every stage shares one cache entry."""
+    from ecommsolutions.file_probe import probe_file
+    return probe_file(path, os.path.basename(path), n_rows=0)['sheets'][0] if path.endswith('.xlsx') else None
+
+
+def _load(path, order_col, amount_col):
+    from ecommsolutions.reconciliation import load_report
+    return load_report(path, os.path.basename(path), _first_sheet(path), order_col, amount_col)
+
+
+def _consume_all(paths):
+    from ecommsolutions.ingestion import RowCounter, consume
+    from ecommsolutions.report_cache import iter_cached_report_chunks
+    return sum(consume(iter_cached_report_chunks(path, os.path.basename(path), sheet=_first_sheet(path)), RowCounter())
+               for path in paths.values())
+
+
+def _validate(paths, reports):
+    from ecommsolutions.batch import validate_detected
+    return [validate_detected(paths[name], report) for name, report in reports.items()]
+
+
+def _meesho_stages(paths, out_dir):
+    from ecommsolutions.export import export_sheets
+    from ecommsolutions.meesho_gstr1 import process_meesho_reports
+    from ecommsolutions.reconciliation import reconcile
+
+    state = {}
+
+    def gst():
+        state['gstr1'] = process_meesho_reports(paths['tcs_sales'], paths['tcs_sales_return'],
+                                                paths['Tax_invoice_details'], SELLER_GSTIN)
+        return state['gstr1']
+
+    def reconciliation():
+        sales = _load(paths['tcs_sales'], 'sub_order_num', 'total_invoice_value')
+        payments = _load(paths['meesho_payments'], 'Sub Order No', 'Final Settlement Amount')
+        return reconcile(sales, payments)
+
+    def export():
+        sections = {key: state['gstr1'][key] for key in ('b2cs', 'hsn', 'docs')}
+        return export_sheets(sections, os.path.join(out_dir, 'meesho_gstr1.xlsx'))
+
+    reports = {'tcs_sales': 'sales', 'tcs_sales_return': 'returns', 'Tax_invoice_details': 'invoices'}
+    return {'validate': lambda: _validate(paths, reports), 'gst': gst, 'reconcile': reconciliation, 'export': export}
+
+
+def _flipkart_stages(paths, out_dir):
+    from ecommsolutions.export import export_sheets
+    from ecommsolutions.flipkart_gstr1 import process_flipkart_sales_report
+    from ecommsolutions.reconciliation import reconcile
+
+    state = {}
+
+    def gst():
+        state['gstr1'] = process_flipkart_sales_report(paths['flipkart_sales_report'], SELLER_GSTIN)
+        return state['gstr1']
+
+    def reconciliation():
+        sales = _load(paths['flipkart_sales_report'], 'Order Item ID',
+                      'Final Invoice Amount (Price after discount+Shipping Charges)')
+        payments = _load(paths['flipkart_settlement'], 'Order item ID', 'Bank Settlement Value (Rs.) = SUM(J:R)')
+        return reconcile(sales, payments)
+
+    def export():
+        sections = {key: state['gstr1'][key] for key in ('b2b', 'cdnr', 'b2cs', 'hsn')}
+        return export_sheets(sections, os.path.join(out_dir, 'flipkart_gstr1.xlsx'))
+
+    reports = {'flipkart_sales_report': 'sales_report'}
+    return {'validate': lambda: _validate(paths, reports), 'gst': gst, 'reconcile': reconciliation, 'export': export}
+
+
+def _amazon_stages(paths, out_dir):
+    from ecommsolutions.export import export_sheets
+    from ecommsolutions.reconciliation import reconcile
+
+    state = {}
+
+    def reconciliation():
+        sales = _load(paths['amazon_orders'], 'amazon-order-id', 'item-price')
+        payments = _load(paths['amazon_settlement'], 'order-id', 'amount')
+        state['result'] = reconcile(sales, payments)
+        return state['result']
+
+    def export():
+        result = state['result']
+        return export_sheets({'orders': result['orders'], 'unmatched_payments': result['unmatched_payments']},
+                             os.path.join(out_dir, 'amazon_reconciliation'))
+
+    return {'reconcile': reconciliation, 'export': export}
+
+
+def _amazon_mtr_stages(paths, out_dir):
+    from ecommsolutions.amazon_gstr1 import process_amazon_mtr_reports
+    from ecommsolutions.export import export_sheets
+
+    state = {}
+
+    def gst():
+        state['gstr1'] = process_amazon_mtr_reports(sorted(paths.values()), SELLER_GSTIN)
+        return state['gstr1']
+
+    def export():
+        sections = {key: state['gstr1'][key] for key in ('b2b', 'cdnr', 'b2cs', 'hsn')}
+        return export_sheets(sections, os.path.join(out_dir, 'amazon_gstr1.xlsx'))
+
+    reports = {name: 'mtr' for name in paths}
+    return {'validate': lambda: _validate(paths, reports), 'gst': gst, 'export': export}
+
+
+STAGE_BUILDERS = {'meesho': _meesho_stages, 'flipkart': _flipkart_stages, 'amazon': _amazon_stages,
+                  'amazon_mtr': _amazon_mtr_stages}
+MAIN_REPORT = {'meesho': 'tcs_sales', 'flipkart': 'flipkart_sales_report', 'amazon': 'amazon_settlement',
+               'amazon_mtr': 'amazon_mtr_b2c_01'}
+
+
+def _warm_imports():
+    """Imports everything the stages use up front, so the first stage is not charged for it."""
+    import openpyxl  # noqa: F401
+    import pyarrow.parquet  # noqa: F401
+    import xlsxwriter  # noqa: F401
+    import ecommsolutions.amazon_gstr1  # noqa: F401
+    import ecommsolutions.flipkart_gstr1  # noqa: F401
+    import ecommsolutions.meesho_gstr1  # noqa: F401
+    import ecommsolutions.reconciliation  # noqa: F401
+    import ecommsolutions.report_cache  # noqa: F401
+
+
+def run_dataset(paths, platform, work_dir):
+    """
+    Times every stage of one written dataset in this process; returns
+    {stage: {'seconds': ..., 'peak_mb': ...}} plus a 'process' entry with the
+    total time and the process's peak RSS, the number to size servers by.
+    """
+    from ecommsolutions.file_probe import probe_file
+
+    _warm_imports()
+    out_dir = os.path.join(work_dir, 'out')
+    os.makedirs(out_dir, exist_ok=True)
+
+    main = paths[MAIN_REPORT[platform]]
+    stages = {
+        'probe': lambda: probe_file(main, os.path.basename(main)),
+        'ingest': lambda: _consume_all(paths),
+        'ingest_hit': lambda: _consume_all(paths),
+    }
+    stages.update(STAGE_BUILDERS[platform](paths, out_dir))
+
+    results = {}
+    # ru_maxrss would include the parent's high-water mark (it survives exec), so sample instead
+    with _PeakSampler() as process_sampler:
+        for stage, func in stages.items():
+            _, seconds, peak_mb = measure(func)
+            results[stage] = {'seconds': round(seconds, 4), 'peak_mb': round(peak_mb, 1)}
+            print(f"  {stage:<11} {seconds:9.3f} s {peak_mb:9.1f} MB", flush=True)
+    shutil.rmtree(out_dir, ignore_errors=True)
+
+    results['process'] = {'seconds': round(sum(stage['seconds'] for stage in results.values()), 4),
+                          'peak_mb': round(process_sampler.peak, 1)}
+    print(f"  {'process':<11} {results['process']['seconds']:9.3f} s {results['process']['peak_mb']:9.1f} MB max RSS",
+          flush=True)
+    return results
+
+
+def run_isolated(platform, rows, fmt, data_dir):
+    """
+    Generates (or reuses) a dataset, then measures it in a fresh interpreter
+    with its own empty report cache, so one dataset's memory and cache never
+    flatter the next one's numbers.
+    """
+    write_dataset(data_dir, platform, rows, fmt)
+    with tempfile.TemporaryDirectory() as tmp:
+        result_file = os.path.join(tmp, 'result.json')
+        env = dict(os.environ, ECOMM_REPORT_CACHE_DIR=os.path.join(tmp, 'cache'))
+        subprocess.run([sys.executable, os.path.abspath(__file__), '--dataset', f"{platform}:{rows}:{fmt}",
+                        '--data-dir', data_dir, '--result-file', result_file], env=env, check=True)
+        with open(result_file, encoding='utf-8') as handle:
+            return json.load(handle)
+
+
+def _dataset_child(spec, data_dir, result_file):
+    platform, rows, fmt = spec.split(':')
+    paths = dataset_paths(data_dir, platform, int(rows), fmt)
+    with tempfile.TemporaryDirectory() as tmp:
+        results = run_dataset(paths, platform, tmp)
+    with open(result_file, 'w', encoding='utf-8') as handle:
+        json.dump(results, handle)
+
+
+# --- Baselines ---
+
+def result_key(platform, rows, fmt, stage):
+    return f"{platform}/{fmt}/{rows}/{stage}"
+
+
+def load_baseline(path):
+    try:
+        with open(path, encoding='utf-8') as handle:
+            return json.load(handle)
+    except (OSError, ValueError):
+        return {'results': {}}
+
+
+def save_baseline(path, results, merge=True):
+    """Writes the run's results, keeping baseline entries this run did not measure."""
+    baseline = load_baseline(path) if merge else {'results': {}}
+    baseline['results'].update(results)
+    baseline['host'] = host_info()
+    baseline['recorded_at'] = datetime.datetime.now().isoformat(timespec='seconds')
+    with open(path, 'w', encoding='utf-8') as handle:
+        json.dump(baseline, handle, indent=1, sort_keys=True)
+        handle.write('\n')
+
+
+def host_info():
+    import pandas as pd
+    return {'python': host_platform.python_version(), 'pandas': pd.__version__, 'machine': host_platform.machine(),
+            'cpus': os.cpu_count(), 'system': host_platform.system()}
+
+
+def regressions(results, baseline, tolerance=DEFAULT_TOLERANCE):
+    """(key, metric, baseline value, current value) for every stage worse than its baseline."""
+    found = []
+    for key, current in results.items():
+        reference = baseline.get('results', {}).get(key)
+        if reference is None:
+            continue
+        for metric, floor in (('seconds', MIN_SECONDS_DELTA), ('peak_mb', MIN_MB_DELTA)):
+            if current[metric] > reference[metric] * (1 + tolerance) and current[metric] - reference[metric] > floor:
+                found.append((key, metric, reference[metric], current[metric]))
+    return found
+
+
+def unchecked(results, baseline):
+    """Keys of the run that the baseline has no entry for, so no regression check covers them."""
+    return sorted(key for key in results if key not in baseline.get('results', {}))
+
+
+def _csv_list(value, allowed):
+    items = [item.strip() for item in value.split(',') if item.strip()]
+    unknown = [item for item in items if item not in allowed]
+    if unknown:
+        raise argparse.ArgumentTypeError(f"unknown value(s) {', '.join(unknown)}; choose from {', '.join(allowed)}")
+    return items
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--sizes', type=lambda v: _csv_list(v, list(SIZES)), default=['10k', '100k'],
+                        help=f"comma-separated sizes ({', '.join(SIZES)})")
+    parser.add_argument('--formats', type=lambda v: _csv_list(v, FORMATS), default=['csv'],
+                        help='comma-separated file formats (csv, xlsx)')
+    parser.add_argument('--platforms', type=lambda v: _csv_list(v, PLATFORMS), default=list(PLATFORMS),
+                        help=f"comma-separated platforms ({', '.join(PLATFORMS)})")
+    parser.add_argument('--data-dir', default=DEFAULT_DATA_DIR, help='where generated reports are kept')
+    parser.add_argument('--baseline', default=BASELINE_PATH, help='baseline results file')
+    parser.add_argument('--save-baseline', action='store_true', help='record this run as the baseline')
+    parser.add_argument('--tolerance', type=float, default=DEFAULT_TOLERANCE,
+                        help='allowed slowdown / memory growth over the baseline (0.25 = 25%%)')
+    parser.add_argument('--output', help='also write this run\'s results as JSON')
+    # Internal: measure one dataset in this process (used by run_isolated)
+    parser.add_argument('--dataset', help=argparse.SUPPRESS)
+    parser.add_argument('--result-file', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.dataset:
+        _dataset_child(args.dataset, args.data_dir, args.result_file)
+        return 0
+
+    results = {}
+    for platform in args.platforms:
+        for size in args.sizes:
+            rows = SIZES[size]
+            for fmt in args.formats:
+                print(f"{platform} {size} {fmt}", flush=True)
+                try:
+                    stages = run_isolated(platform, rows, fmt, args.data_dir)
+                except ValueError as e:
+                    print(f"  skipped: {e}")
+                    continue
+                for stage, measured in stages.items():
+                    results[result_key(platform, rows, fmt, stage)] = measured
+
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as handle:
+            json.dump({'host': host_info(), 'results': results}, handle, indent=1, sort_keys=True)
+
+    if args.save_baseline:
+        save_baseline(args.baseline, results)
+        print(f"Baseline saved to {args.baseline}")
+        return 0
+
+    baseline = load_baseline(args.baseline)
+    missing = unchecked(results, baseline)
+    if missing:
+        print(f"No baseline for {len(missing)} stage(s), not checked: {', '.join(missing)}")
+    found = regressions(results, baseline, args.tolerance)
+    for key, metric, before, after in found:
+        print(f"REGRESSION {key} {metric}: {before} -> {after}")
+    if not found:
+        print("No regressions against the baseline.")
+    return 1 if found else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
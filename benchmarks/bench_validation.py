@@ -0,0 +1,77 @@
+"""
+Benchmark for the validation pass that runs before GSTR-1 aggregation.
+
+Generates a synthetic Meesho TCS Sales report and a Flipkart Sales Report
+(default 1M rows each), corrupts a sprinkling of rows (bad GSTINs, HSN codes,
+rates and amounts, repeated lines) and times:
+  1. validation on the first upload (CSV parse + Parquet cache write)
+  2. validation from the report cache, the case a bad file fails fast in
+  3. reading every field of the report for the aggregation, for scale
+
+Run from the repository root:
+
+    python benchmarks/bench_validation.py --rows 1000000
+"""
+import argparse
+import os
+import sys
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from common import scratch_dir, time_step  # noqa: E402
+from synthetic import flipkart_reports, meesho_reports  # noqa: E402
+
+# Share of rows corrupted per check
+BAD_SHARE = 0.001
+
+
+def corrupt(frame, columns, seed=1):
+    """Writes a bad value into BAD_SHARE of the rows of each {column: bad value} and repeats a few rows."""
+    rng = np.random.default_rng(seed)
+    frame = frame.astype({column: object for column in columns})
+    for column, value in columns.items():
+        frame.loc[rng.random(len(frame)) < BAD_SHARE, column] = value
+    return pd.concat([frame, frame.sample(frac=BAD_SHARE, random_state=seed)], ignore_index=True)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--rows', type=int, default=1_000_000, help='rows per report')
+    args = parser.parse_args()
+
+    with scratch_dir() as tmp:
+        from ecommsolutions import flipkart_gstr1, meesho_gstr1
+        from ecommsolutions.gst_common import iter_canonical_chunks
+        from ecommsolutions.validation import validate_report
+
+        meesho = corrupt(meesho_reports(args.rows)['tcs_sales'],
+                         {'hsn_code': '12AB', 'gst_rate': 13, 'total_taxable_sale_value': 'n/a'})
+        flipkart = corrupt(flipkart_reports(args.rows)['flipkart_sales_report'],
+                           {'Business GST Number': '29AAACB1234C1Z5', 'HSN Code': '12', 'IGST Rate': 0.13})
+        reports = [
+            ('Meesho TCS Sales', meesho, meesho_gstr1.LINE_ALIASES, meesho_gstr1.LINE_REQUIRED,
+             meesho_gstr1.LINE_SCHEMA, meesho_gstr1.LINE_CHECKS),
+            ('Flipkart Sales Report', flipkart, flipkart_gstr1.SALES_ALIASES, flipkart_gstr1.SALES_REQUIRED,
+             flipkart_gstr1.SALES_SCHEMA, flipkart_gstr1.SALES_CHECKS),
+        ]
+        for name, frame, aliases, required, schema, checks in reports:
+            path = os.path.join(tmp, f"{name.replace(' ', '_')}.csv")
+            frame.to_csv(path, index=False)
+            print(f"{name}: {len(frame):,} rows")
+
+            time_step("validate (first upload)", lambda: validate_report(path, aliases, required, schema, checks))
+            result = time_step("validate (from the report cache)",
+                               lambda: validate_report(path, aliases, required, schema, checks))
+            time_step("read + normalize every chunk (aggregation input)",
+                      lambda: sum(len(chunk) for chunk in iter_canonical_chunks(path, aliases, required, schema)))
+            issues = result['issues']
+            print(f"  {len(issues)} problems over {int(issues['Rows'].sum()):,} rows, "
+                  f"{len(result['samples'])} sample rows")
+            print(issues[['Check', 'Severity', 'Field', 'Rows']].to_string(index=False))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,36 @@
+"""
+Helpers shared by the single-engine benchmark scripts.
+
+time_step() runs one step and prints its wall time as an aligned row;
+scratch_dir() gives the script a temporary directory and points the report
+cache into it, so the benchmark's Parquet copies never land in (or get
+served from) the user's own cache. Import the ecommsolutions engines inside
+the `with scratch_dir()` block: the cache location is read at import time.
+"""
+import contextlib
+import os
+import tempfile
+import time
+
+
+def time_step(label, func):
+    """Runs `func()`, prints '<label> <seconds> s' and returns its result."""
+    start = time.perf_counter()
+    result = func()
+    print(f"{label:<45} {time.perf_counter() - start:8.2f} s")
+    return result
+
+
+@contextlib.contextmanager
+def scratch_dir():
+    """Temporary working directory with the report cache redirected into it."""
+    with tempfile.TemporaryDirectory() as tmp:
+        previous = os.environ.get('ECOMM_REPORT_CACHE_DIR')
+        os.environ['ECOMM_REPORT_CACHE_DIR'] = os.path.join(tmp, 'cache')
+        try:
+            yield tmp
+        finally:
+            if previous is None:
+                os.environ.pop('ECOMM_REPORT_CACHE_DIR', None)
+            else:
+                os.environ['ECOMM_REPORT_CACHE_DIR'] = previous
@@ -0,0 +1,349 @@
+"""
+Synthetic marketplace reports for the benchmarks.
+
+Each generator returns frames in the platform's own column layout, sized by
+the number of lines in the main report:
+
+  - meesho:   tcs_sales (n lines), tcs_sales_return (10%), Tax_invoice_details
+              and an Order Payments report for the reconciliation join
+  - flipkart: Sales Report (n lines, with returns and cancellations) and a
+              settlement report paying most of the sold items
+  - amazon:   settlement report (n lines, about three per order) and the
+              matching orders report
+  - amazon_mtr: twelve monthly MTR B2C files and an MTR B2B file, n lines
+              in total, with overlapping months
+
+make_catalogue() builds a catalogue export for the listing optimization
+benchmark and make_search_terms() an Amazon search-term report for the ads
+benchmark.
+
+write_dataset() writes a dataset as CSV or XLSX into a directory and reuses
+the files on later runs, since large workbooks take minutes to generate.
+"""
+import os
+
+import numpy as np
+import pandas as pd
+
+from ecommsolutions.export import XLSX_MAX_ROWS, write_xlsx
+
+SELLER_GSTIN = '09ABCDE1234F1ZY'
+STATES = ['UTTAR PRADESH', 'MAHARASHTRA', 'KARNATAKA', 'DELHI', 'TAMIL NADU', 'WEST BENGAL', 'BIHAR', 'GUJARAT',
+          'RAJASTHAN', 'TELANGANA', 'KERALA', 'ODISHA', 'ASSAM', 'PUNJAB', 'HARYANA', 'MADHYA PRADESH']
+RATES = [5, 12, 18]
+HSNS = ['6204', '6211', '6109', '7117', '4202', '6302', '9404', '3304']
+SKUS = [f"SKU-{i:04d}" for i in range(500)]
+
+PLATFORMS = ('meesho', 'flipkart', 'amazon', 'amazon_mtr')
+
+
+def _ids(prefix, rows, start=0):
+    return np.char.add(prefix, np.arange(start, start + rows).astype(str))
+
+
+# --- Meesho ---
+
+def make_lines(rows, seed):
+    """Synthetic tcs_sales / tcs_sales_return lines in Meesho's column layout."""
+    rng = np.random.default_rng(seed)
+    taxable = rng.uniform(80, 1500, rows).round(2)
+    rate = rng.choice(RATES, rows)
+    tax = (taxable * rate / 100).round(2)
+    return pd.DataFrame({
+        'identifier': 'GST',
+        'sub_order_num': _ids('SO', rows),
+        'order_date': '2025-04-15',
+        'hsn_code': rng.choice(HSNS, rows),
+        'quantity': rng.integers(1, 4, rows),
+        'gst_rate': rate,
+        'total_taxable_sale_value': taxable,
+        'tax_amount': tax,
+        'total_invoice_value': taxable + tax,
+        'end_customer_state_new': rng.choice(STATES, rows),
+    })
+
+
+def make_invoices(rows, returns):
+    """Synthetic Tax_invoice_details rows: one invoice per sale, one credit note per return."""
+    return pd.DataFrame({
+        'Type': ['INVOICE'] * rows + ['CREDIT NOTE'] * returns,
+        'Invoice No': [f"MSH25INV{i:07d}" for i in range(rows)] + [f"MSH25CN{i:07d}" for i in range(returns)],
+    })
+
+
+def meesho_reports(rows, seed=1):
+    sales = make_lines(rows, seed)
+    returns = make_lines(rows // 10, seed + 1)
+    rng = np.random.default_rng(seed + 2)
+    # 90% of sub-orders are settled, net of commission; a few payments match no order
+    paid = rng.random(rows) < 0.9
+    payments = pd.DataFrame({
+        'Sub Order No': np.concatenate([sales['sub_order_num'].to_numpy()[paid], _ids('SOX', rows // 100)]),
+        'Order Date': '2025-04-15',
+        'Live Order Status': 'Delivered',
+    })
+    payments['Final Settlement Amount'] = np.concatenate([
+        (sales['total_invoice_value'].to_numpy()[paid] * 0.82).round(2), rng.uniform(50, 500, rows // 100).round(2),
+    ])
+    return {
+        'tcs_sales': sales,
+        'tcs_sales_return': returns,
+        'Tax_invoice_details': make_invoices(rows, len(returns)),
+        'meesho_payments': payments,
+    }
+
+
+# --- Flipkart ---
+
+def flipkart_reports(rows, seed=1):
+    rng = np.random.default_rng(seed)
+    event = rng.choice(['Sale', 'Return', 'Cancellation'], rows, p=[0.85, 0.1, 0.05])
+    taxable = rng.uniform(100, 2000, rows).round(2)
+    state = rng.choice(STATES, rows)
+    intra = state == 'UTTAR PRADESH'
+    rate = rng.choice(RATES, rows)
+    item_ids = _ids('OI', rows)
+    sales = pd.DataFrame({
+        'Seller GSTIN': SELLER_GSTIN,
+        'Order ID': _ids('OD', rows),
+        'Order Item ID': item_ids,
+        'Product Title/Description': 'Cotton kurta with printed dupatta, pack of one',
+        'SKU': rng.choice(SKUS, rows),
+        'HSN Code': rng.choice(HSNS, rows),
+        'Event Type': event,
+        'Event Sub Type': event,
+        'Item Quantity': 1,
+        'Final Invoice Amount (Price after discount+Shipping Charges)': (taxable * (1 + rate / 100)).round(2),
+        'Taxable Value (Final Invoice Amount -Taxes)': taxable,
+        'IGST Rate': np.where(intra, 0, rate),
+        'IGST Amount': np.where(intra, 0, taxable * rate / 100).round(2),
+        'CGST Rate': np.where(intra, rate / 2, 0),
+        'CGST Amount': np.where(intra, taxable * rate / 200, 0).round(2),
+        'SGST Rate (or UTGST as applicable)': np.where(intra, rate / 2, 0),
+        'SGST Amount (Or UTGST as applicable)': np.where(intra, taxable * rate / 200, 0).round(2),
+        'Buyer Invoice ID': _ids('FAB', rows),
+        'Buyer Invoice Date': '2025-04-05',
+        "Customer's Delivery State": state,
+        'Business GST Number': np.where(rng.random(rows) < 0.02, '29AAACB1234C1ZB', ''),
+        'Business Name': '',
+    })
+    paid = (event == 'Sale') & (rng.random(rows) < 0.9)
+    settlement = pd.DataFrame({
+        'NEFT ID': np.char.add('NEFT', (np.flatnonzero(paid) // 5000).astype(str)),
+        'Payment Date': '2025-04-20',
+        'Order item ID': item_ids[paid],
+        'Bank Settlement Value (Rs.) = SUM(J:R)': (sales['Final Invoice Amount (Price after discount+Shipping Charges)']
+                                                   .to_numpy()[paid] * 0.85).round(2),
+    })
+    return {'flipkart_sales_report': sales, 'flipkart_settlement': settlement}
+
+
+# --- Amazon ---
+
+def amazon_reports(rows, seed=1):
+    rng = np.random.default_rng(seed)
+    # Principal, commission and a shipping fee per order
+    orders = -(-rows // 3)
+    order_ids = np.char.add('408-', (1_000_000 + np.arange(orders)).astype(str))
+    price = rng.uniform(150, 3000, orders).round(2)
+    lines = np.repeat(np.arange(orders), 3)[:rows]
+    amount_type = np.tile(['ItemPrice', 'ItemFees', 'ItemFees'], orders)[:rows]
+    description = np.tile(['Principal', 'Commission', 'FBA Pick & Pack Fee'], orders)[:rows]
+    amount = np.select(
+        [description == 'Principal', description == 'Commission'],
+        [price[lines], -(price[lines] * 0.12).round(2)],
+        default=-rng.uniform(20, 60, rows).round(2),
+    )
+    settlement = pd.DataFrame({
+        'settlement-id': np.char.add('1234', (lines // 20000).astype(str)),
+        'settlement-start-date': '2025-04-01',
+        'settlement-end-date': '2025-04-15',
+        'order-id': order_ids[lines],
+        'sku': rng.choice(SKUS, orders)[lines],
+        'amount-type': amount_type,
+        'amount-description': description,
+        'amount': amount,
+    })
+    orders_report = pd.DataFrame({
+        'amazon-order-id': order_ids,
+        'purchase-date': '2025-04-03T10:15:00+05:30',
+        'sku': settlement['sku'].to_numpy()[::3][:orders],
+        'quantity': 1,
+        'item-price': price,
+        'ship-state': rng.choice(STATES, orders),
+    })
+    return {'amazon_orders': orders_report, 'amazon_settlement': settlement}
+
+
+# --- Amazon MTR (Merchant Tax Report) ---
+
+MTR_MONTHS = 12
+
+
+def _mtr_lines(rows, rng, start, b2b):
+    """MTR lines: 90% shipments, 7% refunds, 3% cancellations; refunds carry negative amounts as Amazon writes them."""
+    transaction = rng.choice(['Shipment', 'Refund', 'Cancel'], rows, p=[0.9, 0.07, 0.03])
+    taxable = rng.uniform(100, 2500, rows).round(2)
+    rate = rng.choice(RATES, rows) / 100
+    state = rng.choice(STATES, rows)
+    intra = state == 'UTTAR PRADESH'
+    tax = (taxable * rate).round(2)
+    sign = np.where(transaction == 'Refund', -1, 1)
+    order_ids = np.char.add('171-', (3_000_000 + start + np.arange(rows)).astype(str))
+    frame = pd.DataFrame({
+        'Seller Gstin': SELLER_GSTIN,
+        'Invoice Number': np.where(transaction == 'Refund', _ids('CN-UP-', rows, start), _ids('IN-UP-', rows, start)),
+        'Invoice Date': '2025-04-12 10:20:00',
+        'Transaction Type': transaction,
+        'Order Id': order_ids,
+        'Shipment Id': _ids('S', rows, start),
+        'Shipment Item Id': _ids('SI', rows, start),
+        'Quantity': 1,
+        'Item Description': 'Cotton kurta with printed dupatta, pack of one',
+        'Hsn/sac': rng.choice(HSNS, rows),
+        'Sku': rng.choice(SKUS, rows),
+        'Ship To City': 'LUCKNOW',
+        'Ship To State': state,
+        'Ship To Country': 'IN',
+        'Invoice Amount': (taxable + tax) * sign,
+        'Tax Exclusive Gross': taxable * sign,
+        'Total Tax Amount': tax * sign,
+        'Cgst Rate': np.where(intra, rate / 2, 0),
+        'Sgst Rate': np.where(intra, rate / 2, 0),
+        'Utgst Rate': 0,
+        'Igst Rate': np.where(intra, 0, rate),
+        'Cgst Tax': np.where(intra, tax / 2, 0) * sign,
+        'Sgst Tax': np.where(intra, tax / 2, 0) * sign,
+        'Igst Tax': np.where(intra, 0, tax) * sign,
+        'Fulfillment Channel': rng.choice(['AFN', 'MFN'], rows),
+    })
+    if b2b:
+        frame['Customer Bill To Gstid'] = np.where(rng.random(rows) < 0.8, '29AAACB1234C1ZB', '')
+        frame['Buyer Name'] = 'Acme Retail Pvt Ltd'
+        frame['Credit Note No'] = np.where(transaction == 'Refund', frame['Invoice Number'], '')
+    return frame
+
+
+def amazon_mtr_reports(rows, seed=1):
+    """
+    Twelve monthly MTR B2C files plus one MTR B2B file, `rows` lines in total.
+    Each month repeats the last 2% of the previous one, as overlapping
+    downloads do, so the processor has duplicates to drop.
+    """
+    rng = np.random.default_rng(seed)
+    b2b_rows = max(rows // 20, 1)
+    per_month = max((rows - b2b_rows) // MTR_MONTHS, 1)
+    reports, previous = {}, None
+    for month in range(MTR_MONTHS):
+        lines = _mtr_lines(per_month, rng, month * per_month, b2b=False)
+        if previous is not None:
+            lines = pd.concat([previous.tail(max(per_month // 50, 1)), lines], ignore_index=True)
+        reports[f"amazon_mtr_b2c_{month + 1:02d}"] = previous = lines
+    reports['amazon_mtr_b2b'] = _mtr_lines(b2b_rows, rng, MTR_MONTHS * per_month, b2b=True)
+    return reports
+
+
+# --- Catalogue (listing optimization) ---
+
+CATALOGUE_WORDS = {
+    'Kurta': 'cotton kurta women printed straight anarkali rayon ethnic festive a-line embroidered',
+    'T-Shirt': 'cotton t-shirt men round neck slim fit printed casual polo oversized solid',
+    'Saree': 'silk saree banarasi georgette blouse piece woven zari party wear chiffon',
+    'Shoes': 'running shoes men sports lightweight sneakers mesh walking casual training',
+    'Bedsheet': 'double bedsheet cotton pillow covers floral king size 144 tc printed',
+}
+BRANDS = ['Urbanic', 'Rangmanch', 'Libas', 'Biba', 'HRX', 'Jaipur Kurti', '']
+
+
+def make_catalogue(rows, seed=1):
+    """Catalogue export: SKU, title (4-12 category words, about 1% duplicated), brand, category, colour and size."""
+    rng = np.random.default_rng(seed)
+    categories = rng.choice(list(CATALOGUE_WORDS), rows)
+    brands = rng.choice(BRANDS, rows)
+    titles = pd.Series(brands, dtype=object) + ' '
+    lengths = rng.integers(4, 13, rows)
+    for category, words in CATALOGUE_WORDS.items():
+        words = np.array(words.split())
+        rows_of = np.flatnonzero(categories == category)
+        picks = rng.choice(words, (len(rows_of), 12))
+        titles.iloc[rows_of] += [' '.join(pick[:length]) for pick, length in zip(picks, lengths[rows_of])]
+    duplicated = rng.random(rows) < 0.01
+    titles[duplicated] = titles.sample(int(duplicated.sum()), random_state=seed, replace=True).to_numpy()
+    return pd.DataFrame({
+        'Seller SKU ID': _ids('SKU', rows),
+        'Product Title': titles.str.strip().str.title(),
+        'Brand': brands,
+        'Category': categories,
+        'Colour': rng.choice(['Blue', 'Red', 'Black', 'White', 'Green'], rows),
+        'Size': rng.choice(['S', 'M', 'L', 'XL', 'Free Size'], rows),
+    })
+
+
+SEARCH_WORDS = ['kurti', 'cotton', 'women', 'printed', 'anarkali', 'rayon', 'set', 'dupatta', 'long', 'party',
+                'wear', 'straight', 'floral', 'combo', 'red', 'blue', 'xl', 'festive', 'ethnic', 'cheap']
+MATCH_TYPES = ['EXACT', 'PHRASE', 'BROAD', '-']
+
+
+def make_search_terms(rows, seed=1, days=90):
+    """Amazon Sponsored Products search-term report: 200 campaigns, 5 ad groups each, a few thousand targets."""
+    rng = np.random.default_rng(seed)
+    campaigns = rng.integers(0, 200, rows)
+    targets = rng.integers(0, 4000, rows)
+    words = np.array(SEARCH_WORDS)
+    terms = pd.Series(words[rng.integers(0, len(words), rows)], dtype=object)
+    for _ in range(2):
+        terms += ' ' + words[rng.integers(0, len(words), rows)]
+    impressions = rng.integers(1, 3000, rows)
+    clicks = rng.binomial(impressions, rng.uniform(0.001, 0.02, rows))
+    cpc = rng.uniform(2, 15, rows).round(2)
+    orders = rng.binomial(clicks, rng.uniform(0, 0.12, rows))
+    return pd.DataFrame({
+        'Date': (pd.Timestamp('2025-04-01') + pd.to_timedelta(rng.integers(0, days, rows), unit='D')).strftime('%b %d, %Y'),
+        'Campaign Name': np.char.add('SP - Campaign ', campaigns.astype(str)),
+        'Ad Group Name': np.char.add(np.char.add('AG ', campaigns.astype(str)), np.char.add('-', (targets % 5).astype(str))),
+        'Targeting': np.char.add('keyword ', targets.astype(str)),
+        'Match Type': rng.choice(MATCH_TYPES, rows),
+        'Customer Search Term': terms,
+        'Impressions': impressions,
+        'Clicks': clicks,
+        'Spend': (clicks * cpc).round(2),
+        '7 Day Total Sales ': (orders * rng.uniform(300, 1500, rows)).round(2),
+        '7 Day Total Orders (#)': orders,
+    })
+
+
+GENERATORS = {'meesho': meesho_reports, 'flipkart': flipkart_reports, 'amazon': amazon_reports,
+              'amazon_mtr': amazon_mtr_reports}
+# Sheet names the platforms use for their workbooks
+SHEET_NAMES = {'flipkart_sales_report': 'Sales Report', 'flipkart_settlement': 'Orders',
+               'meesho_payments': 'Order Payments'}
+
+
+def dataset_paths(data_dir, platform, rows, fmt):
+    """{report name: path} of a dataset, whether or not it has been written yet."""
+    names = GENERATORS[platform](10).keys()
+    folder = os.path.join(data_dir, f"{platform}_{rows}_{fmt}")
+    return {name: os.path.join(folder, f"{name}.{fmt}") for name in names}
+
+
+def write_dataset(data_dir, platform, rows, fmt):
+    """
+    Writes (or reuses) one platform's reports at `rows` lines as 'csv' or
+    'xlsx'. Returns {report name: path}. Raises ValueError for XLSX datasets
+    larger than a worksheet.
+    """
+    if fmt == 'xlsx' and rows > XLSX_MAX_ROWS:
+        raise ValueError(f"{rows:,} rows do not fit in one worksheet")
+    paths = dataset_paths(data_dir, platform, rows, fmt)
+    if all(os.path.exists(path) for path in paths.values()):
+        return paths
+
+    os.makedirs(os.path.dirname(next(iter(paths.values()))), exist_ok=True)
+    for name, frame in GENERATORS[platform](rows).items():
+        tmp_path = f"{paths[name]}.tmp"
+        if fmt == 'csv':
+            frame.to_csv(tmp_path, index=False)
+        else:
+            write_xlsx({SHEET_NAMES.get(name, 'Sheet1'): frame}, tmp_path)
+        os.replace(tmp_path, paths[name])
+    return paths
@@ -0,0 +1,10 @@
+"""
+Processing engines behind the E-Commerce Solutions Hub.
+
+Everything in this package is plain pandas/openpyxl code so it can be
+imported, tested and scheduled without a Streamlit session. Submodules are
+imported explicitly by callers to keep app startup cheap.
+
+`python -m ecommsolutions --help` lists the command-line entry points
+(GSTR-1 per platform, batch, reconciliation, cache) for scheduled runs.
+"""
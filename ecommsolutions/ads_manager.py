@@ -0,0 +1,287 @@
+"""
+Ads performance analytics (ACOS / ROAS / CTR) on a pre-aggregated cube.
+
+Amazon Sponsored Products / Brands search-term, targeting and advertised
+product reports and Flipkart PLA / PCA reports are streamed once and reduced
+to a cube of day x platform x campaign x ad group x keyword x match type x
+search term x SKU with impressions, clicks, spend, attributed sales and
+orders. Search-term reports repeat the same campaigns, ad groups and
+keywords on every row, so the keys are categorical and every rollup, filter
+and rule in the Ads Manager tab is a grouped sum over the cube's category
+codes; the raw report is never re-read.
+
+Ratios are always derived from summed counts (ACOS of a campaign is its
+total spend over its total sales), never averaged across rows. Ad spend is
+joined to the Sales Analysis cube by day or SKU for TACOS (spend over all
+revenue, not only the ad-attributed part).
+"""
+import numpy as np
+import pandas as pd
+
+from ecommsolutions.file_probe import probe_file
+from ecommsolutions.gst_common import iter_canonical_chunks, resolve_columns, source_name
+from ecommsolutions.ingestion import GroupTotals, consume, field_schema, parse_amounts, parse_dates
+from ecommsolutions.instrumentation import timed
+
+# Header names per field across Amazon and Flipkart ads reports
+ADS_ALIASES = {
+    'date': ['Date', 'Day', 'Start Date', 'Report Date'],
+    'campaign': ['Campaign Name', 'Campaign', 'Campaign ID'],
+    'ad_group': ['Ad Group Name', 'Ad Group', 'AdGroup Name', 'Ad Group ID'],
+    'keyword': ['Targeting', 'Keyword', 'Keyword Text', 'Target', 'Attributed Keyword'],
+    'match_type': ['Match Type', 'Keyword Match Type'],
+    'search_term': ['Customer Search Term', 'Search Term', 'Search Query', 'Query'],
+    'sku': ['Advertised SKU', 'SKU', 'Seller SKU'],
+    'impressions': ['Impressions', 'Views'],
+    'clicks': ['Clicks'],
+    'spend': ['Spend', 'Ad Spend', 'Spend (INR)', 'Cost', 'Total Spend'],
+    'sales': ['7 Day Total Sales', '7 Day Total Sales (₹)', '14 Day Total Sales', '14 Day Total Sales (₹)',
+              'Total Sales', 'Direct Revenue', 'Sales', 'Revenue'],
+    'orders': ['7 Day Total Orders (#)', '7 Day Total Orders', '14 Day Total Orders (#)', 'Total Orders',
+               'Units Sold (Direct)', 'Direct Units', 'Orders', 'Conversions'],
+    # Flipkart splits attributed revenue into direct (the advertised listing) and indirect (other listings)
+    'indirect_sales': ['Indirect Revenue'],
+    'indirect_orders': ['Units Sold (Indirect)', 'Indirect Units'],
+}
+ADS_REQUIRED = ['date', 'campaign', 'spend']
+ADS_SCHEMA = field_schema(ADS_ALIASES)
+
+# Headers only one platform's ads reports carry, for auto-detection
+PLATFORM_MARKERS = {
+    'Amazon': ['Customer Search Term', '7 Day Total Sales', '14 Day Total Sales', 'Advertised SKU',
+               'Advertised ASIN', 'Targeting'],
+    'Flipkart': ['Views', 'Direct Revenue', 'Indirect Revenue', 'Units Sold (Direct)', 'FSN ID'],
+}
+
+CUBE_KEYS = ['date', 'platform', 'campaign', 'ad_group', 'keyword', 'match_type', 'search_term', 'sku']
+CUBE_VALUES = ['impressions', 'clicks', 'spend', 'sales', 'orders']
+UNKNOWN = 'Unknown'
+
+# Rollup levels of the Ads Manager tables, coarsest first
+LEVELS = {
+    'campaign': ['platform', 'campaign'],
+    'ad_group': ['platform', 'campaign', 'ad_group'],
+    'keyword': ['platform', 'campaign', 'ad_group', 'keyword', 'match_type'],
+    'search_term': ['platform', 'campaign', 'ad_group', 'keyword', 'match_type', 'search_term'],
+    'sku': ['platform', 'sku'],
+}
+
+# Default wasteful-keyword thresholds
+DEFAULT_TARGET_ACOS = 40.0
+DEFAULT_MIN_CLICKS = 15
+DEFAULT_MIN_SPEND = 100.0
+DEFAULT_MIN_IMPRESSIONS = 1000
+DEFAULT_MIN_CTR = 0.1
+
+
+# --- Building the cube ---
+
+def detect_ads_platform(source, file_name=None):
+    """'Amazon' / 'Flipkart' from the report's headers, else 'Other'."""
+    header = probe_file(source, source_name(source, file_name), n_rows=0)
+    found = set(resolve_columns(header['columns'], PLATFORM_MARKERS, []).values())
+    return next((platform for platform in PLATFORM_MARKERS if platform in found), 'Other')
+
+
+def _labels(chunk, field):
+    """A key column as a categorical with missing / blank labels as UNKNOWN."""
+    if field not in chunk:
+        return pd.Categorical.from_codes(np.zeros(len(chunk), dtype=np.int8), categories=[UNKNOWN])
+    values = chunk[field]
+    if not isinstance(values.dtype, pd.CategoricalDtype):
+        values = values.astype('string').str.strip().astype('category')
+    if UNKNOWN not in values.cat.categories:
+        values = values.cat.add_categories([UNKNOWN])
+    values = values.fillna(UNKNOWN)
+    return values.where(values != '', UNKNOWN) if '' in values.cat.categories else values
+
+
+def _amounts(chunk, *fields):
+    total = np.zeros(len(chunk))
+    for field in fields:
+        if field in chunk:
+            total += parse_amounts(chunk[field]).to_numpy()
+    return total
+
+
+def cube_lines(chunk, platform):
+    """One chunk of canonical ads rows → rows keyed like the cube."""
+    return pd.DataFrame({
+        'date': parse_dates(chunk['date']).dt.normalize(),
+        'platform': pd.Categorical.from_codes(np.zeros(len(chunk), dtype=np.int8), categories=[platform]),
+        **{key: _labels(chunk, key) for key in CUBE_KEYS[2:]},
+        'impressions': _amounts(chunk, 'impressions'),
+        'clicks': _amounts(chunk, 'clicks'),
+        'spend': _amounts(chunk, 'spend'),
+        'sales': _amounts(chunk, 'sales', 'indirect_sales'),
+        'orders': _amounts(chunk, 'orders', 'indirect_orders'),
+    }, index=chunk.index)
+
+
+def _as_cube(frame):
+    """Categorical keys keep rollups and filters cheap on repeated queries."""
+    frame = frame.dropna(subset=['date'])
+    for key in CUBE_KEYS[1:]:
+        if not isinstance(frame[key].dtype, pd.CategoricalDtype):
+            frame[key] = frame[key].astype('string').astype('category')
+    return frame.reset_index(drop=True)
+
+
+def build_ads_cube(chunks, platform):
+    """Reduces canonical ads chunks (ADS_ALIASES field names) to the cube."""
+    totals = consume((cube_lines(chunk, platform) for chunk in chunks), GroupTotals(CUBE_KEYS, CUBE_VALUES))
+    return _as_cube(totals)
+
+
+@timed()
+def ads_cube(source, platform=None, file_name=None):
+    """Builds the cube from an uploaded/on-disk ads report; `platform=None` detects it from the headers."""
+    file_name = source_name(source, file_name)
+    platform = platform or detect_ads_platform(source, file_name)
+    chunks = iter_canonical_chunks(source, ADS_ALIASES, ADS_REQUIRED, ADS_SCHEMA, file_name=file_name)
+    return build_ads_cube(chunks, platform)
+
+
+def empty_ads_cube():
+    return _as_cube(pd.DataFrame({
+        'date': pd.Series(dtype='datetime64[ns]'),
+        **{key: pd.Series(dtype='string') for key in CUBE_KEYS[1:]},
+        **{value: pd.Series(dtype='float64') for value in CUBE_VALUES},
+    }))
+
+
+def combine_ads_cubes(cubes):
+    """Merges cubes from several uploads (overlapping report ranges are summed, like the reports themselves)."""
+    cubes = [cube for cube in cubes if len(cube)]
+    if not cubes:
+        return empty_ads_cube()
+    if len(cubes) == 1:
+        return cubes[0]
+    stacked = pd.concat([cube.astype({key: 'string' for key in CUBE_KEYS[1:]}) for cube in cubes], ignore_index=True)
+    return _as_cube(stacked.groupby(CUBE_KEYS, sort=False).sum().reset_index())
+
+
+# --- Queries on the cube ---
+
+def filter_ads(cube, start=None, end=None, platforms=None, campaigns=None):
+    """Rows of the cube inside the date range and matching the selected members (None/empty = all)."""
+    mask = np.ones(len(cube), dtype=bool)
+    if start is not None:
+        mask &= (cube['date'] >= pd.Timestamp(start)).to_numpy()
+    if end is not None:
+        mask &= (cube['date'] <= pd.Timestamp(end)).to_numpy()
+    for key, members in (('platform', platforms), ('campaign', campaigns)):
+        if members:
+            mask &= cube[key].isin(members).to_numpy()
+    return cube[mask]
+
+
+def _ratio(numerator, denominator, scale=1.0):
+    """numerator / denominator * scale, NaN where the denominator is 0."""
+    numerator = np.asarray(numerator, dtype='float64')
+    denominator = np.asarray(denominator, dtype='float64')
+    out = np.full(len(numerator), np.nan)
+    np.divide(numerator * scale, denominator, out=out, where=denominator != 0)
+    return out
+
+
+def with_metrics(frame):
+    """Adds CTR %, CPC, conversion rate %, ACOS % and ROAS computed from the summed counts."""
+    frame = frame.copy()
+    frame['ctr'] = _ratio(frame['clicks'], frame['impressions'], 100)
+    frame['cpc'] = _ratio(frame['spend'], frame['clicks'])
+    frame['cvr'] = _ratio(frame['orders'], frame['clicks'], 100)
+    frame['acos'] = _ratio(frame['spend'], frame['sales'], 100)
+    frame['roas'] = _ratio(frame['sales'], frame['spend'])
+    return frame
+
+
+def ads_totals(cube):
+    """Headline numbers of a (filtered) cube."""
+    totals = cube[CUBE_VALUES].sum()
+    metrics = with_metrics(totals.to_frame().T).iloc[0]
+    return {
+        'spend': round(float(totals['spend']), 2),
+        'sales': round(float(totals['sales']), 2),
+        'impressions': int(totals['impressions']),
+        'clicks': int(totals['clicks']),
+        'orders': int(totals['orders']),
+        **{name: float(metrics[name]) for name in ('ctr', 'cpc', 'cvr', 'acos', 'roas')},
+    }
+
+
+def ads_rollup(cube, level='campaign'):
+    """Counts and metrics per member of a LEVELS level, highest spend first."""
+    keys = LEVELS[level]
+    rolled = cube.groupby(keys, observed=True, sort=False)[CUBE_VALUES].sum().reset_index()
+    return with_metrics(rolled).sort_values('spend', ascending=False, ignore_index=True)
+
+
+def ads_trend(cube, freq='D'):
+    """Spend, attributed sales, ACOS and ROAS per period ('D', 'W', 'MS')."""
+    trend = cube.groupby(pd.Grouper(key='date', freq=freq))[CUBE_VALUES].sum().reset_index()
+    return with_metrics(trend)
+
+
+# --- Wasteful keywords ---
+
+def wasteful_keywords(rollup, target_acos=DEFAULT_TARGET_ACOS, min_clicks=DEFAULT_MIN_CLICKS,
+                      min_spend=DEFAULT_MIN_SPEND, min_impressions=DEFAULT_MIN_IMPRESSIONS, min_ctr=DEFAULT_MIN_CTR):
+    """
+    Rows of a keyword / search-term rollup that break a threshold rule:
+
+      - no orders after `min_clicks` clicks or `min_spend` spend
+        (negate the search term / pause the keyword; all spend is wasted)
+      - ACOS above `target_acos` with at least `min_spend` spend
+        (lower the bid; spend beyond target_acos x sales is wasted)
+      - CTR below `min_ctr` % after `min_impressions` impressions
+        (irrelevant placement; no spend is counted as wasted)
+
+    Returns the flagged rows with 'reason', 'action' and 'wasted_spend',
+    largest waste first.
+    """
+    spend = rollup['spend'].to_numpy()
+    no_sales = (rollup['orders'].to_numpy() <= 0) & ((rollup['clicks'].to_numpy() >= min_clicks) | (spend >= min_spend))
+    high_acos = ~no_sales & (spend >= min_spend) & (rollup['acos'].fillna(0).to_numpy() > target_acos)
+    low_ctr = (rollup['impressions'].to_numpy() >= min_impressions) & (rollup['ctr'].fillna(0).to_numpy() < min_ctr)
+
+    flagged = no_sales | high_acos | low_ctr
+    rows = rollup[flagged].copy()
+    no_sales, high_acos, low_ctr = no_sales[flagged], high_acos[flagged], low_ctr[flagged]
+
+    reasons = pd.Series('', index=rows.index, dtype=object)
+    reasons[no_sales] = 'No orders after spend'
+    reasons[high_acos] = 'ACOS above target'
+    reasons[low_ctr] = reasons[low_ctr].where(reasons[low_ctr] == '', reasons[low_ctr] + '; ') + 'Low CTR'
+    rows['reason'] = reasons
+    rows['action'] = np.select([no_sales, high_acos], ['Add negative keyword / pause', 'Lower bid'], 'Review relevance')
+    wasted = np.select([no_sales, high_acos], [rows['spend'], rows['spend'] - rows['sales'] * target_acos / 100], 0.0)
+    rows['wasted_spend'] = np.round(wasted, 2)
+    return rows.sort_values(['wasted_spend', 'spend'], ascending=False, ignore_index=True)
+
+
+# --- Joining ad spend to sales ---
+
+def tacos(ads, sales, by='date', freq='D'):
+    """
+    Ad spend against all revenue of a Sales Analysis cube, per period
+    (`by='date'`, resampled to `freq`) or per SKU (`by='sku'`, only SKUs the
+    ads reports name). TACOS is spend over total revenue; organic revenue is
+    total revenue minus the ad-attributed sales.
+    """
+    if by == 'date':
+        keys = [pd.Grouper(key='date', freq=freq)]
+        ad_totals = ads.groupby(keys)[['spend', 'sales']].sum()
+        revenue = sales.groupby(keys)[['revenue']].sum()
+        joined = ad_totals.join(revenue, how='outer').fillna(0.0).reset_index()
+    elif by == 'sku':
+        ads = ads[ads['sku'] != UNKNOWN]
+        ad_totals = ads.groupby(ads['sku'].astype('string'))[['spend', 'sales']].sum()
+        revenue = sales.groupby(sales['sku'].astype('string'))[['revenue']].sum()
+        joined = ad_totals.join(revenue, how='left').fillna(0.0).reset_index()
+    else:
+        raise ValueError(f"Unknown TACOS grouping '{by}'")
+    joined['organic_revenue'] = (joined['revenue'] - joined['sales']).clip(lower=0.0)
+    joined['tacos'] = _ratio(joined['spend'], joined['revenue'], 100)
+    joined['acos'] = _ratio(joined['spend'], joined['sales'], 100)
+    return joined.sort_values(by if by == 'date' else 'spend', ascending=by == 'date', ignore_index=True)
@@ -0,0 +1,312 @@
+"""
+Amazon MTR (Merchant Tax Report) → GSTR-1.
+
+Reads the B2C and B2B MTRs from Seller Central → Reports → Tax Document
+Library and produces the B2B, CDNR, B2CS and HSN sections. Sellers usually
+hold several of them for one return (one per month, marketplace or
+fulfilment channel, B2C and B2B separately), so the processor takes any
+number of files:
+
+  - Each file is parsed in its own worker process (ProcessPoolExecutor,
+    'spawn' like the batch runner) into compact signed lines; with one core
+    or one file it is parsed in-process, which avoids the worker start-up.
+  - Downloads with overlapping date ranges repeat lines, so lines are
+    deduplicated on (order, shipment, invoice) per shipment item and
+    transaction type before anything is added up. The key is hashed to one
+    64-bit integer per line in the workers.
+  - Shipments add, refunds and cancellations subtract (FreeReplacement
+    invoices count as shipments). Lines with a buyer GSTIN go to B2B, their
+    refunds to CDNR; everything else is netted per place of supply and rate
+    into B2CS.
+"""
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import numpy as np
+import pandas as pd
+
+from ecommsolutions.gst_common import (
+    build_b2cs, build_hsn, build_registered, gstin_state_code, is_gstin_like, iter_canonical_chunks, normalize_hsn,
+    normalize_rates, source_name, state_codes, with_tax_split,
+)
+from ecommsolutions.ingestion import ColumnCollector, GroupTotals, consume, field_schema, map_distinct, parse_amounts
+from ecommsolutions.instrumentation import stage, timed
+from ecommsolutions.validation import has_errors, settle_validations, validate_report, with_validation
+
+# Header names of the MTR B2C / B2B layouts per canonical field
+MTR_ALIASES = {
+    'seller_gstin': ['Seller Gstin', 'Seller GSTIN'],
+    'invoice_id': ['Invoice Number', 'Invoice No'],
+    'invoice_date': ['Invoice Date'],
+    'event_type': ['Transaction Type'],
+    'order_id': ['Order Id', 'Order ID'],
+    'shipment_id': ['Shipment Id', 'Shipment ID'],
+    'item_id': ['Shipment Item Id', 'Shipment Item ID', 'Order Item Id'],
+    'sku': ['Sku', 'SKU'],
+    'quantity': ['Quantity'],
+    'hsn': ['Hsn/sac', 'HSN/SAC', 'Hsn Sac', 'HSN'],
+    'delivery_state': ['Ship To State', 'Bill To State'],
+    'taxable_value': ['Tax Exclusive Gross', 'Taxable Value'],
+    'tax': ['Total Tax Amount'],
+    'invoice_value': ['Invoice Amount'],
+    'igst_rate': ['Igst Rate'],
+    'cgst_rate': ['Cgst Rate'],
+    'sgst_rate': ['Sgst Rate'],
+    'utgst_rate': ['Utgst Rate'],
+    'buyer_gstin': ['Customer Bill To Gstid', 'Customer Ship To Gstid', 'Buyer Gstin'],
+    'buyer_name': ['Buyer Name', 'Customer Name'],
+    'credit_note_id': ['Credit Note No', 'Credit Note Number'],
+    'credit_note_date': ['Credit Note Date'],
+}
+MTR_REQUIRED = ['event_type', 'order_id', 'invoice_id', 'hsn', 'taxable_value', 'delivery_state']
+MTR_SCHEMA = field_schema(MTR_ALIASES)
+# Refunds carry negative amounts, so only their format is checked
+MTR_CHECKS = {
+    'gstins': ['seller_gstin', 'buyer_gstin'],
+    'hsn': 'hsn',
+    'rates': ['igst_rate', 'cgst_rate', 'sgst_rate', 'utgst_rate'],
+    'amounts': ['taxable_value', 'tax', 'invoice_value'],
+    'unique': ['order_id', 'shipment_id', 'invoice_id', 'item_id', 'event_type'],
+}
+
+# Line kinds derived from 'Transaction Type'
+KIND_SHIPMENT = 'shipment'
+KIND_REFUND = 'refund'
+KIND_CANCEL = 'cancel'
+
+# Fields of a transaction line that identify it across files
+DEDUPE_KEYS = ['order_id', 'shipment_id', 'invoice_id', 'item_id', 'kind']
+
+GROUP_KEYS = ['state_code', 'rate', 'hsn', 'is_b2b']
+LINE_VALUES = ['quantity', 'taxable_value', 'tax', 'invoice_value']
+LINE_FIELDS = ['key', 'kind'] + GROUP_KEYS + LINE_VALUES
+B2B_FIELDS = ['key', 'buyer_gstin', 'buyer_name', 'invoice_id', 'invoice_date', 'state_code', 'rate', 'kind',
+              'taxable_value', 'tax', 'invoice_value']
+
+
+def _zeros(chunk):
+    return pd.Series(0.0, index=chunk.index)
+
+
+def _text(chunk, field):
+    """An optional text column, blank when the report does not have it."""
+    if field not in chunk:
+        return pd.Series('', index=chunk.index, dtype='string')
+    return chunk[field].astype('string').fillna('')
+
+
+def _transaction_kinds(types):
+    """Line kind per distinct transaction type ('Shipment', 'Refund', 'Cancel', 'FreeReplacement')."""
+    text = types.str.upper().str.replace(r'[^A-Z]', '', regex=True).fillna('')
+    kind = np.select(
+        [(text.str.contains('REFUND', regex=False) | text.str.contains('RETURN', regex=False)).to_numpy(dtype=bool),
+         text.str.startswith('CANCEL').to_numpy(dtype=bool)],
+        [KIND_REFUND, KIND_CANCEL],
+        default=KIND_SHIPMENT,
+    )
+    return pd.Series(kind, dtype=object)
+
+
+def prepare_lines(chunk, seller_gstin=None):
+    """
+    Converts one chunk of canonical MTR lines into signed numeric lines keyed
+    by place of supply, rate and HSN, each with its 64-bit dedupe key. Rows
+    of another seller GSTIN are dropped when `seller_gstin` is given.
+    """
+    if seller_gstin and 'seller_gstin' in chunk:
+        own = map_distinct(chunk['seller_gstin'], lambda gstins: gstins.fillna('').str.upper().isin([seller_gstin.upper(), '']))
+        chunk = chunk[own.to_numpy(dtype=bool)]
+
+    kind = map_distinct(chunk['event_type'].astype('string'), _transaction_kinds).to_numpy(dtype=object)
+    sign = np.where(kind == KIND_SHIPMENT, 1.0, -1.0)
+
+    rates = {field: normalize_rates(chunk[field]).fillna(0) if field in chunk else _zeros(chunk)
+             for field in ('igst_rate', 'cgst_rate', 'sgst_rate', 'utgst_rate')}
+    rate = rates['igst_rate'].where(rates['igst_rate'] > 0, rates['cgst_rate'] + rates['sgst_rate'] + rates['utgst_rate'])
+
+    # Refund rows carry negative amounts; the sign comes from the transaction type instead
+    taxable = parse_amounts(chunk['taxable_value']).abs()
+    reported_tax = parse_amounts(chunk['tax']).abs() if 'tax' in chunk else _zeros(chunk)
+    tax = reported_tax.where(reported_tax > 0, taxable * rate / 100)
+    invoice_value = parse_amounts(chunk['invoice_value']).abs() if 'invoice_value' in chunk else taxable + tax
+    quantity = parse_amounts(chunk['quantity']).abs() if 'quantity' in chunk else _zeros(chunk)
+
+    item = _text(chunk, 'item_id')
+    item = item.where(item != '', _text(chunk, 'sku'))
+    keys = pd.DataFrame({'order_id': _text(chunk, 'order_id'), 'shipment_id': _text(chunk, 'shipment_id'),
+                         'invoice_id': _text(chunk, 'invoice_id'), 'item_id': item, 'kind': kind})
+    buyer_gstin = _text(chunk, 'buyer_gstin').str.upper().str.strip()
+
+    # Refunds to registered buyers are reported under their credit note number when the MTR has one
+    note_id = _text(chunk, 'credit_note_id')
+    note_date = _text(chunk, 'credit_note_date')
+    use_note = (kind == KIND_REFUND) & (note_id != '').to_numpy(dtype=bool)
+    invoice_date = _text(chunk, 'invoice_date')
+    invoice_date = invoice_date.where(~(use_note & (note_date != '').to_numpy(dtype=bool)), note_date)
+
+    return pd.DataFrame({
+        'key': pd.util.hash_pandas_object(keys[DEDUPE_KEYS], index=False).to_numpy(),
+        'kind': kind,
+        'state_code': state_codes(chunk['delivery_state']).fillna(''),
+        'rate': rate.round(2),
+        'hsn': normalize_hsn(chunk['hsn']),
+        'is_b2b': is_gstin_like(buyer_gstin),
+        'quantity': quantity * sign,
+        'taxable_value': taxable * sign,
+        'tax': tax * sign,
+        'invoice_value': invoice_value * sign,
+        'buyer_gstin': buyer_gstin,
+        'buyer_name': _text(chunk, 'buyer_name'),
+        'invoice_id': keys['invoice_id'].where(~use_note, note_id),
+        'invoice_date': invoice_date,
+    })
+
+
+# --- Parsing files (runs in worker processes) ---
+
+class _MtrLines:
+    """Keeps the compact line fields of every chunk and, separately, the full B2B lines."""
+
+    def __init__(self):
+        self.lines = ColumnCollector(LINE_FIELDS)
+        self.b2b = ColumnCollector(B2B_FIELDS, where='is_b2b')
+
+    def update(self, chunk):
+        chunk = chunk.astype({'kind': 'category', 'state_code': 'category', 'hsn': 'category'})
+        self.lines.update(chunk)
+        self.b2b.update(chunk)
+
+    def result(self):
+        return self.lines.result(), self.b2b.result()
+
+
+def parse_mtr(source, file_name=None, seller_gstin=None, strict=True):
+    """
+    Validates and parses one MTR (a path, raw bytes with `file_name`, or an
+    upload) into {'file', 'validation', 'lines', 'b2b'}: the validation
+    result, the compact signed lines of the whole report and the B2B lines
+    with their buyer and invoice fields. With `strict` a file with validation
+    errors is not parsed ('lines' and 'b2b' are None). Errors name the file.
+    """
+    file_name = source_name(source, file_name)
+    try:
+        validation = validate_report(source, MTR_ALIASES, MTR_REQUIRED, MTR_SCHEMA, MTR_CHECKS, file_name=file_name)
+        if strict and has_errors(validation):
+            return {'file': os.path.basename(file_name), 'validation': validation, 'lines': None, 'b2b': None}
+        chunks = iter_canonical_chunks(source, MTR_ALIASES, MTR_REQUIRED, MTR_SCHEMA, file_name=file_name)
+        lines, b2b = consume((prepare_lines(chunk, seller_gstin) for chunk in chunks), _MtrLines())
+    except ValueError as e:
+        raise ValueError(f"{os.path.basename(file_name)}: {e}") from e
+    return {'file': os.path.basename(file_name), 'validation': validation, 'lines': lines, 'b2b': b2b}
+
+
+def _portable(source):
+    """(source, file name) a worker process can receive: uploads are passed as their bytes."""
+    file_name = source_name(source)
+    if hasattr(source, 'getvalue'):
+        return source.getvalue(), file_name
+    return source, file_name
+
+
+def parse_mtr_files(sources, seller_gstin=None, max_workers=None, progress=None, strict=True):
+    """
+    Parses several MTRs, in parallel worker processes when there is more than
+    one file and core. Returns the parse_mtr results in the order of `sources`;
+    `progress(done, total, message)` is called as files finish.
+    """
+    jobs = [_portable(source) for source in sources]
+    total = len(jobs)
+    workers = max(1, min(max_workers or os.cpu_count() or 1, total))
+    results = [None] * total
+    if workers == 1:
+        for done, (source, file_name) in enumerate(jobs, start=1):
+            results[done - 1] = parse_mtr(source, file_name, seller_gstin, strict)
+            if progress:
+                progress(done, total, f"parsed {os.path.basename(file_name)}")
+        return results
+
+    context = multiprocessing.get_context('spawn')
+    with ProcessPoolExecutor(max_workers=workers, mp_context=context) as executor:
+        futures = {executor.submit(parse_mtr, source, file_name, seller_gstin, strict): index
+                   for index, (source, file_name) in enumerate(jobs)}
+        for done, future in enumerate(as_completed(futures), start=1):
+            index = futures[future]
+            results[index] = future.result()
+            if progress:
+                progress(done, total, f"parsed {results[index]['file']}")
+    return results
+
+
+# --- GSTR-1 sections ---
+
+def _unique_lines(frames):
+    """Concatenates per-file line frames and drops repeated lines; returns (lines, duplicates)."""
+    lines = consume(frames, ColumnCollector())
+    if not len(lines):
+        return lines, 0
+    duplicated = lines['key'].duplicated().to_numpy()
+    return lines[~duplicated], int(duplicated.sum())
+
+
+@timed()
+def compute_amazon_gstr1(parsed, seller_gstin, ecommerce_gstin=None):
+    """
+    Computes the GSTR-1 tables from parse_mtr results (any number of files).
+    Returns a dict with 'b2b', 'cdnr', 'b2cs' and 'hsn' frames plus a 'summary' dict.
+    """
+    if not parsed:
+        raise ValueError("No MTR files to process")
+    seller_state = gstin_state_code(seller_gstin)
+    with stage('amazon.dedupe', files=len(parsed)):
+        lines, duplicates = _unique_lines(result['lines'] for result in parsed)
+        b2b_lines, _ = _unique_lines(result['b2b'] for result in parsed)
+
+    with stage('amazon.b2cs_hsn', lines=len(lines)):
+        totals = GroupTotals(GROUP_KEYS, LINE_VALUES)
+        if len(lines):
+            totals.update(lines)
+        net = with_tax_split(totals.result().astype({'state_code': 'string', 'hsn': 'string'}), seller_state)
+        b2cs = build_b2cs(net[~net['is_b2b'].astype(bool)], ecommerce_gstin)
+        hsn = build_hsn(net)
+
+    with stage('amazon.b2b_cdnr', lines=len(b2b_lines)):
+        b2b_lines = b2b_lines.astype({'state_code': 'string'})
+        b2b, cdnr = build_registered(b2b_lines, b2b_lines['kind'] == KIND_REFUND, seller_state, ecommerce_gstin)
+
+    by_kind = lines.groupby('kind', observed=True)['taxable_value'].agg(['size', 'sum'])
+    known_state = net['state_code'] != ''
+    summary = {
+        'files': len(parsed),
+        'shipment_lines': int(by_kind['size'].get(KIND_SHIPMENT, 0)),
+        'refund_lines': int(by_kind['size'].get(KIND_REFUND, 0)),
+        'cancellation_lines': int(by_kind['size'].get(KIND_CANCEL, 0)),
+        'duplicate_lines': duplicates,
+        'gross_taxable_value': round(float(by_kind['sum'].clip(lower=0).sum()), 2),
+        'returns_taxable_value': round(float(-by_kind['sum'].clip(upper=0).sum()), 2),
+        'net_taxable_value': round(float(net['taxable_value'].sum()), 2),
+        'igst': round(float(net['igst'].sum()), 2),
+        'cgst': round(float(net['cgst'].sum()), 2),
+        'sgst': round(float(net['sgst'].sum()), 2),
+        'unmapped_state_taxable_value': round(float(net.loc[~known_state, 'taxable_value'].sum()), 2),
+        'b2b_invoices': int(b2b['Invoice Number'].nunique()),
+        'credit_notes': int(cdnr['Note Number'].nunique()),
+    }
+    return {'b2b': b2b, 'cdnr': cdnr, 'b2cs': b2cs, 'hsn': hsn, 'summary': summary}
+
+
+@timed()
+def process_amazon_mtr_reports(reports, seller_gstin, ecommerce_gstin=None, max_workers=None, progress=None,
+                               strict=True):
+    """
+    Runs the full computation on any number of uploaded/on-disk MTRs (B2C and
+    B2B, one or more months or marketplaces). Each file is validated in its
+    worker before it is parsed; with `strict` validation errors in any file
+    raise ValidationError before the sections are built.
+    """
+    with stage('amazon.parse', files=len(reports)):
+        parsed = parse_mtr_files(reports, seller_gstin, max_workers, progress, strict)
+    validation = settle_validations([result['validation'] for result in parsed], strict)
+    if progress:
+        progress(len(reports), len(reports), "building GSTR-1 sections")
+    return with_validation(compute_amazon_gstr1(parsed, seller_gstin, ecommerce_gstin), validation)
@@ -0,0 +1,331 @@
+"""
+Multi-seller batch GSTR-1 processing.
+
+Takes a folder (or ZIP) holding the monthly reports of many GSTINs, works out
+what each file is, and produces one GSTR-1 workbook and JSON per GSTIN and
+filing period plus a consolidated status report.
+
+  - The platform and report type of every file are detected from its header
+    row (REPORT_SIGNATURES), not its name.
+  - GSTIN and filing period come from the file's path, e.g.
+    `09ABCDE1234F1ZY/2025-04/tcs_sales.xlsx`; a Flipkart Sales Report can
+    also supply the GSTIN from its 'Seller GSTIN' column.
+  - Each (GSTIN, period) is one job. Jobs are independent and only pass file
+    paths around, so they fan out to a ProcessPoolExecutor and scale with the
+    number of cores.
+
+Run headless with:
+
+    python -m ecommsolutions.batch <folder or zip> <output folder> [--workers N]
+"""
+import argparse
+import multiprocessing
+import os
+import re
+import sys
+import tempfile
+import time
+import zipfile
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from itertools import chain
+
+import pandas as pd
+
+from ecommsolutions.amazon_gstr1 import (
+    MTR_ALIASES, MTR_CHECKS, MTR_REQUIRED, MTR_SCHEMA, compute_amazon_gstr1, parse_mtr_files,
+)
+from ecommsolutions.export import export_format, export_sheets
+from ecommsolutions.file_probe import probe_excel_sheet, probe_file
+from ecommsolutions.flipkart_gstr1 import (
+    FLIPKART_GSTIN, SALES_ALIASES, SALES_CHECKS, SALES_REPORT_SHEETS, SALES_REQUIRED, SALES_SCHEMA,
+    compute_flipkart_gstr1,
+)
+from ecommsolutions.gst_common import iter_canonical_chunks, merge_gstr1, resolve_columns
+from ecommsolutions.gstr1_json import MONTHS, validate_totals, write_gstr1_json
+from ecommsolutions.meesho_gstr1 import (
+    INVOICE_ALIASES, INVOICE_CHECKS, INVOICE_SCHEMA, LINE_ALIASES, LINE_CHECKS, LINE_REQUIRED, LINE_SCHEMA,
+    compute_meesho_gstr1,
+)
+from ecommsolutions.validation import WARNING, raise_on_errors, validate_report, validation_message, with_validation
+
+REPORT_EXTENSIONS = ('.xlsx', '.csv')
+
+# Platform / report type per header signature, most specific first
+REPORT_SIGNATURES = [
+    ('Amazon', 'mtr', MTR_ALIASES, MTR_REQUIRED),
+    ('Flipkart', 'sales_report', SALES_ALIASES, SALES_REQUIRED),
+    ('Meesho', 'invoices', INVOICE_ALIASES, ['doc_type', 'invoice_no']),
+    ('Meesho', 'lines', LINE_ALIASES, LINE_REQUIRED),
+]
+
+# validate_report arguments per report type: aliases, required fields, schema, checks, preferred sheets
+REPORT_CHECKS = {
+    'mtr': (MTR_ALIASES, MTR_REQUIRED, MTR_SCHEMA, MTR_CHECKS, ()),
+    'sales_report': (SALES_ALIASES, SALES_REQUIRED, SALES_SCHEMA, SALES_CHECKS, SALES_REPORT_SHEETS),
+    'sales': (LINE_ALIASES, LINE_REQUIRED, LINE_SCHEMA, LINE_CHECKS, ()),
+    'returns': (LINE_ALIASES, LINE_REQUIRED, LINE_SCHEMA, LINE_CHECKS, ()),
+    'invoices': (INVOICE_ALIASES, ['invoice_no'], INVOICE_SCHEMA, INVOICE_CHECKS, ()),
+}
+
+GSTR1_SECTION_KEYS = ('b2b', 'cdnr', 'b2cs', 'hsn', 'docs')
+
+STATUS_OK = 'ok'
+STATUS_WARNING = 'warning'
+STATUS_ERROR = 'error'
+STATUS_SKIPPED = 'skipped'
+
+STATUS_COLUMNS = [
+    'gstin', 'period', 'status', 'message', 'platforms', 'files', 'net_taxable_value', 'igst', 'cgst', 'sgst',
+    'seconds', 'workbook', 'json',
+]
+
+_GSTIN_PATTERN = re.compile(r'(?<![0-9A-Z])([0-9]{2}[A-Z]{5}[0-9]{4}[A-Z][1-9A-Z]Z[0-9A-Z])(?![0-9A-Z])')
+_MONTH_NAMES = {name[:3].upper(): number for number, name in enumerate(MONTHS, start=1)}
+_PERIOD_PATTERNS = [
+    (re.compile(r'(?<!\d)(20\d\d)[-_. ]?(0[1-9]|1[0-2])(?!\d)'), lambda m: (m.group(2), m.group(1))),
+    (re.compile(r'(?<!\d)(0[1-9]|1[0-2])[-_. ]?(20\d\d)(?!\d)'), lambda m: (m.group(1), m.group(2))),
+    (re.compile(r'(JAN|FEB|MAR|APR|MAY|JUN|JUL|AUG|SEP|OCT|NOV|DEC)[A-Z]*[-_. ]*(20\d\d)'),
+     lambda m: (f"{_MONTH_NAMES[m.group(1)]:02d}", m.group(2))),
+]
+
+
+# --- Discovering and classifying files ---
+
+def path_hints(relative_path):
+    """
+    GSTIN and filing period ('MMYYYY') found in a file's relative path; either
+    is None when absent. The innermost match wins.
+    """
+    text = relative_path.replace('\\', '/').upper()
+    gstins = _GSTIN_PATTERN.findall(text)
+    period = None
+    for part in reversed(text.split('/')):
+        for pattern, parts in _PERIOD_PATTERNS:
+            match = pattern.search(part)
+            if match:
+                month, year = parts(match)
+                period = f"{month}{year}"
+                break
+        if period:
+            break
+    return (gstins[-1] if gstins else None), period
+
+
+def detect_report(path, file_name=None):
+    """
+    Returns {'platform', 'report', 'gstin'} for a marketplace report (a path,
+    or an upload with `file_name`), or None when the header matches no known
+    report. Meesho sales and return lines share a layout, so the file name
+    decides between them.
+    """
+    file_name = file_name or os.path.basename(path)
+    header = probe_file(path, file_name)
+    if file_name.endswith('.xlsx'):
+        wanted = {name.lower() for name in SALES_REPORT_SHEETS}
+        sheet = next((name for name in header['sheets'] if name.strip().lower() in wanted), None)
+        if sheet is not None and sheet != header['sheets'][0]:
+            header = probe_excel_sheet(path, sheet)
+
+    for platform, report, aliases, required in REPORT_SIGNATURES:
+        try:
+            mapping = resolve_columns(header['columns'], aliases, required)
+        except ValueError:
+            continue
+        if report == 'lines':
+            report = 'returns' if 'RETURN' in file_name.upper() else 'sales'
+        gstin = None
+        seller_column = next((column for column, field in mapping.items() if field == 'seller_gstin'), None)
+        if seller_column is not None:
+            values = header['preview'][seller_column].dropna().astype(str).str.strip().str.upper()
+            gstin = next((value for value in values if _GSTIN_PATTERN.fullmatch(value)), None)
+        return {'platform': platform, 'report': report, 'gstin': gstin}
+    return None
+
+
+def discover_reports(root):
+    """
+    Walks `root` and classifies every report file. Returns (jobs, skipped):
+    jobs maps (gstin, period) -> {platform: {report: [paths]}}; skipped is a
+    list of status rows for files that could not be placed.
+    """
+    jobs = {}
+    skipped = []
+    for directory, _, names in os.walk(root):
+        for name in sorted(names):
+            if name.startswith(('.', '~$')) or not name.lower().endswith(REPORT_EXTENSIONS):
+                continue
+            path = os.path.join(directory, name)
+            relative = os.path.relpath(path, root)
+            gstin, period = path_hints(relative)
+            try:
+                detected = detect_report(path)
+            except Exception as e:
+                detected, reason = None, f"unreadable: {e}"
+            else:
+                reason = 'not a recognised GST report'
+            if detected is None:
+                skipped.append(_skipped_row(gstin, period, relative, reason))
+                continue
+            gstin = gstin or detected['gstin']
+            if not gstin or not period:
+                missing = ' and '.join(label for label, value in (('GSTIN', gstin), ('period', period)) if not value)
+                skipped.append(_skipped_row(gstin, period, relative, f"{missing} not found in path"))
+                continue
+            reports = jobs.setdefault((gstin, period), {}).setdefault(detected['platform'], {})
+            reports.setdefault(detected['report'], []).append(path)
+    return jobs, skipped
+
+
+def _skipped_row(gstin, period, relative_path, reason):
+    return {'gstin': gstin or '', 'period': period or '', 'status': STATUS_SKIPPED, 'message': reason,
+            'platforms': '', 'files': relative_path}
+
+
+# --- Processing one GSTIN / period (runs in a worker process) ---
+
+def _chained(paths, aliases, required, schema, preferred_sheets=()):
+    return chain.from_iterable(
+        iter_canonical_chunks(path, aliases, required, schema, preferred_sheets=preferred_sheets) for path in paths
+    )
+
+
+def validate_detected(path, report, file_name=None):
+    """Validates a report of a detected type (see detect_report and REPORT_CHECKS)."""
+    aliases, required, schema, checks, preferred_sheets = REPORT_CHECKS[report]
+    return validate_report(path, aliases, required, schema, checks, file_name=file_name,
+                           preferred_sheets=preferred_sheets)
+
+
+def _compute_platform(platform, reports, gstin):
+    """GSTR-1 of one platform's reports; raises ValidationError before aggregating reports with errors."""
+    if platform == 'Amazon':
+        # Already inside a worker process, so the MTRs of one job are parsed in turn
+        parsed = parse_mtr_files(reports['mtr'], gstin, max_workers=1)
+        validation = raise_on_errors([result['validation'] for result in parsed])
+        return with_validation(compute_amazon_gstr1(parsed, gstin), validation)
+    if platform == 'Flipkart':
+        validation = raise_on_errors([validate_detected(path, 'sales_report') for path in reports['sales_report']])
+        chunks = _chained(reports['sales_report'], SALES_ALIASES, SALES_REQUIRED, SALES_SCHEMA, SALES_REPORT_SHEETS)
+        return with_validation(compute_flipkart_gstr1(chunks, gstin, FLIPKART_GSTIN), validation)
+    if 'sales' not in reports:
+        raise ValueError("Meesho TCS Sales report missing")
+    validation = raise_on_errors([validate_detected(path, report)
+                                  for report in ('sales', 'returns', 'invoices') for path in reports.get(report, [])])
+    gstr1 = compute_meesho_gstr1(
+        _chained(reports['sales'], LINE_ALIASES, LINE_REQUIRED, LINE_SCHEMA),
+        _chained(reports.get('returns', []), LINE_ALIASES, LINE_REQUIRED, LINE_SCHEMA),
+        _chained(reports.get('invoices', []), INVOICE_ALIASES, ['invoice_no'], INVOICE_SCHEMA),
+        gstin,
+    )
+    return with_validation(gstr1, validation)
+
+
+def write_gstr1_files(gstr1, gstin, fp, stem):
+    """
+    Writes the workbook (<stem>.xlsx, or .zip when very large) and the portal
+    JSON (<stem>.json). Returns (workbook path, JSON path, totals problems).
+    """
+    os.makedirs(os.path.dirname(stem) or '.', exist_ok=True)
+    sections = {key: gstr1[key] for key in GSTR1_SECTION_KEYS if key in gstr1}
+    workbook_path = f"{stem}.{export_format(sections)}"
+    export_sheets(sections, workbook_path)
+    json_path = f"{stem}.json"
+    with open(json_path, 'w', encoding='utf-8') as handle:
+        problems = validate_totals(write_gstr1_json(gstr1, gstin, fp, handle), gstr1)
+    return workbook_path, json_path, problems
+
+
+def process_job(gstin, period, platforms, output_dir):
+    """
+    Computes, merges and writes the GSTR-1 of one GSTIN and period. Never
+    raises; returns a status row (see STATUS_COLUMNS).
+    """
+    start = time.perf_counter()
+    files = sorted(path for reports in platforms.values() for paths in reports.values() for path in paths)
+    row = {'gstin': gstin, 'period': period, 'platforms': ', '.join(sorted(platforms)),
+           'files': '; '.join(os.path.basename(path) for path in files)}
+    try:
+        gstr1 = merge_gstr1([_compute_platform(platform, reports, gstin)
+                             for platform, reports in sorted(platforms.items())])
+        stem = os.path.join(output_dir, gstin, f"{gstin}_{period}_GSTR1")
+        workbook_path, json_path, problems = write_gstr1_files(gstr1, gstin, period, stem)
+
+        warnings = validation_message(gstr1['validation'], WARNING)
+        problems = problems + [warnings] if warnings else problems
+
+        summary = gstr1['summary']
+        row.update({
+            'status': STATUS_WARNING if problems else STATUS_OK,
+            'message': '; '.join(problems),
+            'net_taxable_value': summary['net_taxable_value'],
+            'igst': summary['igst'], 'cgst': summary['cgst'], 'sgst': summary['sgst'],
+            'workbook': os.path.relpath(workbook_path, output_dir),
+            'json': os.path.relpath(json_path, output_dir),
+        })
+    except Exception as e:
+        row.update({'status': STATUS_ERROR, 'message': str(e)})
+    row['seconds'] = round(time.perf_counter() - start, 2)
+    return row
+
+
+# --- Running a batch ---
+
+def _extract_zip(path, target_dir):
+    """zipfile strips absolute paths and '..' from member names, so this stays inside target_dir."""
+    with zipfile.ZipFile(path) as archive:
+        archive.extractall(target_dir)
+    return target_dir
+
+
+def run_batch(source, output_dir, max_workers=None, progress=None):
+    """
+    Processes every GSTIN / period found under `source` (a folder or .zip)
+    into `output_dir`, then writes batch_status.xlsx there. `progress` is
+    called as progress(done, total, status_row) as jobs finish. Returns the
+    status report as a DataFrame.
+    """
+    os.makedirs(output_dir, exist_ok=True)
+    with tempfile.TemporaryDirectory() as scratch:
+        root = _extract_zip(source, scratch) if str(source).lower().endswith('.zip') else source
+        jobs, rows = discover_reports(root)
+
+        total = len(jobs)
+        if jobs:
+            # 'spawn' keeps workers independent of the parent's threads (Streamlit runs scripts in threads)
+            context = multiprocessing.get_context('spawn')
+            workers = max(1, min(max_workers or os.cpu_count() or 1, total))
+            with ProcessPoolExecutor(max_workers=workers, mp_context=context) as executor:
+                futures = [executor.submit(process_job, gstin, period, platforms, output_dir)
+                           for (gstin, period), platforms in sorted(jobs.items())]
+                for done, future in enumerate(as_completed(futures), start=1):
+                    row = future.result()
+                    rows.append(row)
+                    if progress:
+                        progress(done, total, row)
+
+    status = pd.DataFrame(rows, columns=STATUS_COLUMNS).sort_values(['gstin', 'period'], ignore_index=True)
+    export_sheets({'status': status}, os.path.join(output_dir, 'batch_status.xlsx'), 'xlsx')
+    return status
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        prog='python -m ecommsolutions.batch',
+        description="Build GSTR-1 workbooks and JSON for every GSTIN / period in a folder or ZIP of reports.",
+    )
+    parser.add_argument('source', help="folder or .zip laid out as <GSTIN>/<period>/<reports>")
+    parser.add_argument('output', help="folder to write <GSTIN>/<GSTIN>_<MMYYYY>_GSTR1.* and batch_status.xlsx")
+    parser.add_argument('--workers', type=int, default=None, help="worker processes (default: one per core)")
+    args = parser.parse_args(argv)
+
+    def report(done, total, row):
+        print(f"[{done}/{total}] {row['gstin']} {row['period']}: {row['status']} {row.get('message') or ''}".rstrip())
+
+    status = run_batch(args.source, args.output, args.workers, report)
+    counts = status['status'].value_counts()
+    print(', '.join(f"{count} {name}" for name, count in counts.items()))
+    return 1 if counts.get(STATUS_ERROR, 0) else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
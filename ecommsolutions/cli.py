@@ -0,0 +1,366 @@
+"""
+Command-line entry point for scheduled / headless runs.
+
+Runs the same engines as the Streamlit app against files on disk:
+
+    python -m ecommsolutions meesho --sales tcs_sales.xlsx --returns tcs_sales_return.xlsx \\
+        --invoices Tax_invoice_details.xlsx --gstin 09ABCDE1234F1ZY --period 042025 --out out/meesho
+    python -m ecommsolutions flipkart --report sales_report.xlsx --gstin 09ABCDE1234F1ZY --period 042025 --out out/fk
+    python -m ecommsolutions amazon --mtr mtr_b2c_*.csv mtr_b2b.csv --gstin 09ABCDE1234F1ZY --period 042025 --out out/amz
+    python -m ecommsolutions custom --report myntra_sales.xlsx --mapping Myntra --gstin 09ABCDE1234F1ZY \\
+        --period 042025 --out out/myntra
+    python -m ecommsolutions batch reports.zip out/
+    python -m ecommsolutions reconcile --sales orders.csv --sales-order-col "Order ID" \\
+        --sales-amount-col "Order Value" --prev settlement_*.xlsx --out out/recon
+    python -m ecommsolutions ledger add --platform Meesho --kind prev_payments \\
+        --order-col "Sub Order No" --amount-col "Final Settlement Amount" --files settlement_week42.xlsx
+    python -m ecommsolutions ledger outstanding --platform Meesho
+    python -m ecommsolutions ledger remove --platform Meesho --file-hash 3f9a0c2e51d4
+    python -m ecommsolutions returns --sales tcs_sales_*.xlsx --returns tcs_sales_return_*.xlsx \\
+        --months 2025-04 2025-05 --out out/returns
+    python -m ecommsolutions ads --reports search_terms_*.xlsx --level keyword --target-acos 35 --out out/ads
+    python -m ecommsolutions cache stats
+
+The Sales Analysis and Listing Optimization tabs are interactive views with
+no file output of their own and have no command here. There is no installed
+console script either; run the package with `python -m ecommsolutions` (a
+packaging setup would point an `ecommsolutions` script at cli:main).
+
+Processing modules are imported inside each command, so `--help` and the
+cheap commands do not pay for pandas/openpyxl imports they never use.
+Exit status is 0 on success, 1 when the run finished with errors and 2 for
+usage errors.
+"""
+import argparse
+import os
+import sys
+
+
+def _print_summary(summary):
+    for name, value in summary.items():
+        if isinstance(value, dict):
+            value = ', '.join(f"{key}={count}" for key, count in value.items())
+        elif isinstance(value, float):
+            value = f"{value:,.2f}"
+        print(f"  {name:<32} {value}")
+
+
+def _print_validation(issues):
+    if len(issues):
+        print(issues.to_string(index=False), file=sys.stderr)
+
+
+def _write_gstr1(gstr1, gstin, period, out):
+    from ecommsolutions.batch import write_gstr1_files
+    from ecommsolutions.gstr1_json import return_period
+
+    workbook_path, json_path, problems = write_gstr1_files(gstr1, gstin, return_period(period), out)
+    _print_validation(gstr1['validation'])
+    _print_summary(gstr1['summary'])
+    print(f"Wrote {workbook_path} and {json_path}")
+    for problem in problems:
+        print(f"Totals mismatch: {problem}", file=sys.stderr)
+    return 1 if problems else 0
+
+
+# --- Commands ---
+
+def run_meesho(args):
+    from ecommsolutions.meesho_gstr1 import process_meesho_reports
+
+    gstr1 = process_meesho_reports(args.sales, args.returns, args.invoices, args.gstin, args.eco_gstin,
+                                   strict=not args.allow_invalid)
+    return _write_gstr1(gstr1, args.gstin, args.period, args.out)
+
+
+def run_flipkart(args):
+    from ecommsolutions.flipkart_gstr1 import FLIPKART_GSTIN, process_flipkart_sales_report
+
+    gstr1 = process_flipkart_sales_report(args.report, args.gstin, args.eco_gstin or FLIPKART_GSTIN,
+                                          strict=not args.allow_invalid)
+    return _write_gstr1(gstr1, args.gstin, args.period, args.out)
+
+
+def run_amazon(args):
+    from ecommsolutions.amazon_gstr1 import process_amazon_mtr_reports
+
+    gstr1 = process_amazon_mtr_reports(args.mtr, args.gstin, args.eco_gstin, args.workers,
+                                       strict=not args.allow_invalid)
+    return _write_gstr1(gstr1, args.gstin, args.period, args.out)
+
+
+def run_custom(args):
+    import json
+
+    from ecommsolutions.custom_mapping import process_custom_report, saved_plans
+
+    if args.mapping.endswith('.json') and os.path.exists(args.mapping):
+        with open(args.mapping, encoding='utf-8') as handle:
+            spec = json.load(handle)
+    else:
+        spec = saved_plans().get(args.mapping)
+        if spec is None:
+            print(f"No saved mapping named '{args.mapping}'", file=sys.stderr)
+            return 2
+    gstr1 = process_custom_report(args.report, spec, args.gstin, args.eco_gstin, strict=not args.allow_invalid)
+    return _write_gstr1(gstr1, args.gstin, args.period, args.out)
+
+
+def run_batch(args):
+    from ecommsolutions.batch import main as batch_main
+
+    argv = [args.source, args.output] + (['--workers', str(args.workers)] if args.workers else [])
+    return batch_main(argv)
+
+
+def _load_all(paths, sheet, order_col, amount_col):
+    from ecommsolutions.reconciliation import load_report
+
+    return [load_report(path, os.path.basename(path), sheet, order_col, amount_col) for path in paths]
+
+
+def run_reconcile(args):
+    from ecommsolutions.reconciliation import reconcile
+
+    sales = _load_all(args.sales, args.sheet, args.sales_order_col, args.sales_amount_col)
+    prev = _load_all(args.prev, args.sheet, args.payment_order_col, args.payment_amount_col)
+    upcoming = _load_all(args.upcoming, args.sheet, args.payment_order_col, args.payment_amount_col)
+    result = reconcile(sales, prev, upcoming, tolerance=args.tolerance)
+
+    _print_summary(result['summary'])
+    if args.out:
+        _write_sheets({'orders': result['orders'], 'unmatched_payments': result['unmatched_payments']}, args.out)
+    return 0
+
+
+def run_ledger(args):
+    from ecommsolutions import ledger
+    from ecommsolutions.report_cache import hash_source
+
+    if args.action == 'add':
+        if not args.order_col:
+            raise ValueError("--order-col is required to add files")
+        for path in args.files:
+            frame = _load_all([path], args.sheet, args.order_col, args.amount_col)[0]
+            added = ledger.add_file(frame, args.platform, args.kind or 'prev_payments', hash_source(path),
+                                    os.path.basename(path))
+            print(f"{path}: {added['status']} ({added['orders_updated']:,} orders updated)")
+    if args.action == 'files':
+        files = ledger.ledger_files(args.platform).drop(columns=['platform'])
+        files['file_hash'] = files['file_hash'].str[:12]
+        print(files.to_string(index=False) if len(files) else "No files in the ledger.")
+        return 0
+    if args.action == 'remove':
+        _remove_ledger_files(ledger, args.platform, [hash_source(path) for path in args.files] + args.file_hash,
+                             args.kind)
+    _print_summary(ledger.ledger_summary(args.platform))
+    if args.action == 'outstanding':
+        owed = ledger.outstanding(args.platform, limit=args.limit)
+        print(owed.to_string(index=False) if len(owed) else "No outstanding orders.")
+    return 0
+
+
+def _remove_ledger_files(ledger, platform, hashes, kind=None):
+    """
+    Removes the ledger files whose content hash starts with one of `hashes`
+    (as listed by 'ledger files'), only of `kind` when given.
+    """
+    if not hashes:
+        raise ValueError("name the files to remove with --files or --file-hash")
+    files = ledger.ledger_files(platform)
+    if kind is not None:
+        files = files[files['kind'] == kind]
+    for prefix in hashes:
+        matches = files[files['file_hash'].str.startswith(prefix)]
+        if len(matches) != 1:
+            found = "no" if matches.empty else "more than one"
+            raise ValueError(f"{found} {platform} ledger file matches '{prefix}' (see 'ledger files'; --kind narrows it)")
+        row = matches.iloc[0]
+        updated = ledger.remove_file(platform, row['kind'], row['file_hash'])
+        print(f"{row['file_name']} ({row['kind']}): removed ({updated:,} orders updated)")
+
+
+def _write_sheets(sheets, out):
+    from ecommsolutions.export import export_format, export_sheets
+
+    path = f"{out}.{export_format(sheets)}"
+    os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+    export_sheets(sheets, path)
+    print(f"Wrote {path}")
+
+
+def run_returns(args):
+    from ecommsolutions import return_analysis as ra
+
+    # Sales first, so returns in the same run find their orders directly
+    for paths, kind in ((args.sales, ra.KIND_SALES), (args.returns, ra.KIND_RETURNS)):
+        for path in paths:
+            added = ra.add_report(path, os.path.basename(path), kind)
+            repeated = added.get('repeated_orders', 0) + added.get('repeated_returns', 0)
+            print(f"{path}: {added['status']} ({added['sales_lines']:,} sale lines, {added['return_lines']:,} return lines"
+                  + (f", {repeated:,} orders/returns already added by an earlier file)" if repeated else ")"))
+
+    sold, returned, unmatched_returns = ra.load_partials(months=args.months)
+    if sold.empty:
+        print("No sales for these months in the return history." if args.months else "No sales in the return history yet.",
+              file=sys.stderr)
+        return 1
+    _print_summary(ra.return_summary(sold, returned, unmatched_returns))
+    sku_rates = ra.return_rates(sold, returned, 'sku', args.min_sold)
+    print(ra.top_rows(sku_rates, 'return_rate', args.top).to_string(index=False))
+    if args.out:
+        sheets = {'sku': sku_rates.sort_values('return_rate', ascending=False, ignore_index=True),
+                  'reason': ra.reason_breakdown(returned)}
+        for by in ('state', 'courier', 'month'):
+            sheets[by] = ra.return_rates(sold, returned, by)
+        _write_sheets(sheets, args.out)
+    return 0
+
+
+def run_ads(args):
+    from ecommsolutions.ads_manager import ads_cube, ads_rollup, ads_totals, combine_ads_cubes, wasteful_keywords
+
+    cube = combine_ads_cubes([ads_cube(path, args.platform) for path in args.reports])
+    if cube.empty:
+        print("No dated ads rows found in the reports.", file=sys.stderr)
+        return 1
+    _print_summary(ads_totals(cube))
+    rollup = ads_rollup(cube, args.level)
+    flagged = wasteful_keywords(ads_rollup(cube, args.waste_level), args.target_acos, args.min_clicks, args.min_spend,
+                                args.min_impressions, args.min_ctr)
+    print(f"  {'flagged ' + args.waste_level + 's':<32} {len(flagged):,} (₹{flagged['wasted_spend'].sum():,.2f} wasted)")
+    if args.out:
+        _write_sheets({args.level: rollup, 'wasteful_keywords': flagged}, args.out)
+    return 0
+
+
+def run_cache(args):
+    from ecommsolutions.report_cache import cache_stats, clear_cache
+
+    if args.action == 'clear':
+        clear_cache()
+        print("Report cache cleared.")
+        return 0
+    stats = cache_stats()
+    table = stats.pop('table')
+    _print_summary(stats)
+    if len(table):
+        print(table.to_string(index=False))
+    return 0
+
+
+# --- Argument parsing ---
+
+def build_parser():
+    parser = argparse.ArgumentParser(prog='python -m ecommsolutions', description="E-Commerce Solutions Hub engines.")
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    meesho = commands.add_parser('meesho', help="Meesho TCS reports -> GSTR-1 workbook + JSON")
+    meesho.add_argument('--sales', required=True, help="tcs_sales.xlsx/.csv")
+    meesho.add_argument('--returns', required=True, help="tcs_sales_return.xlsx/.csv")
+    meesho.add_argument('--invoices', required=True, help="Tax_invoice_details.xlsx/.csv")
+    meesho.add_argument('--eco-gstin', default=None, help="Meesho's GSTIN for the B2CS e-commerce column")
+    meesho.set_defaults(handler=run_meesho)
+
+    flipkart = commands.add_parser('flipkart', help="Flipkart Sales Report -> GSTR-1 workbook + JSON")
+    flipkart.add_argument('--report', required=True, help="Sales Report .xlsx/.csv")
+    flipkart.add_argument('--eco-gstin', default=None, help="Flipkart's GSTIN (default: FLIPKART_GSTIN)")
+    flipkart.set_defaults(handler=run_flipkart)
+
+    amazon = commands.add_parser('amazon', help="Amazon MTRs (B2C and B2B, any number of months) -> GSTR-1 workbook + JSON")
+    amazon.add_argument('--mtr', required=True, nargs='+', help="MTR B2C/B2B .xlsx/.csv files")
+    amazon.add_argument('--eco-gstin', default=None, help="Amazon's GSTIN for the B2CS e-commerce column")
+    amazon.add_argument('--workers', type=int, default=None, help="parser processes (default: one per core)")
+    amazon.set_defaults(handler=run_amazon)
+
+    custom = commands.add_parser('custom', help="any sales report through a saved column mapping -> GSTR-1 workbook + JSON")
+    custom.add_argument('--report', required=True, help="sales/return report .xlsx/.csv")
+    custom.add_argument('--mapping', required=True, help="name of a mapping saved in the app, or a mapping .json file")
+    custom.add_argument('--eco-gstin', default=None, help="e-commerce operator GSTIN for the B2CS column")
+    custom.set_defaults(handler=run_custom)
+
+    for command in (meesho, flipkart, amazon, custom):
+        command.add_argument('--gstin', required=True, help="seller GSTIN")
+        command.add_argument('--period', required=True, help="filing period, MMYYYY or 'April - 2025'")
+        command.add_argument('--out', required=True, help="output path without extension")
+        command.add_argument('--allow-invalid', action='store_true',
+                             help="build the return even when reports fail validation (invalid GSTIN/HSN/rate)")
+
+    batch = commands.add_parser('batch', help="every GSTIN / period in a folder or ZIP")
+    batch.add_argument('source', help="folder or .zip laid out as <GSTIN>/<period>/<reports>")
+    batch.add_argument('output', help="output folder")
+    batch.add_argument('--workers', type=int, default=None, help="worker processes (default: one per core)")
+    batch.set_defaults(handler=run_batch)
+
+    recon = commands.add_parser('reconcile', help="three-way sales vs. payments reconciliation")
+    recon.add_argument('--sales', nargs='+', required=True, help="sales/order report(s)")
+    recon.add_argument('--sales-order-col', required=True)
+    recon.add_argument('--sales-amount-col', required=True)
+    recon.add_argument('--prev', nargs='*', default=[], help="settlement / previous payment report(s)")
+    recon.add_argument('--upcoming', nargs='*', default=[], help="upcoming payment report(s)")
+    recon.add_argument('--payment-order-col', default='Order ID')
+    recon.add_argument('--payment-amount-col', default='Payment Received')
+    recon.add_argument('--sheet', default=None, help="sheet name for Excel reports (default: first sheet)")
+    recon.add_argument('--tolerance', type=float, default=1.0, help="rupee tolerance for paid vs. short paid")
+    recon.add_argument('--out', default=None, help="write orders/unmatched payments to <out>.xlsx")
+    recon.set_defaults(handler=run_reconcile)
+
+    ledger = commands.add_parser('ledger', help="rolling reconciliation ledger kept across runs")
+    ledger.add_argument('action', choices=['add', 'summary', 'outstanding', 'files', 'remove'])
+    ledger.add_argument('--files', nargs='+', default=[], help="reports to add or remove (actions 'add', 'remove')")
+    ledger.add_argument('--file-hash', nargs='+', default=[],
+                        help="files to remove by the hash shown by 'ledger files', e.g. a superseded upcoming list")
+    ledger.add_argument('--platform', required=True, help="ledger to use, e.g. Meesho")
+    ledger.add_argument('--kind', choices=['sales', 'prev_payments', 'upcoming_payments'], default=None,
+                        help="kind of the files added (default: prev_payments) or removed")
+    ledger.add_argument('--order-col', default=None)
+    ledger.add_argument('--amount-col', default=None)
+    ledger.add_argument('--sheet', default=None, help="sheet name for Excel reports (default: first sheet)")
+    ledger.add_argument('--limit', type=int, default=50, help="rows shown by 'outstanding'")
+    ledger.set_defaults(handler=run_ledger)
+
+    returns = commands.add_parser('returns', help="return rates by SKU, reason, state and courier (history kept across runs)")
+    returns.add_argument('--sales', nargs='*', default=[], help="sales / order reports to add to the history")
+    returns.add_argument('--returns', nargs='*', default=[], help="return reports to add to the history")
+    returns.add_argument('--months', nargs='+', default=None, help="sale months to report, e.g. 2025-04 (default: all)")
+    returns.add_argument('--min-sold', type=int, default=5,
+                         help="units a SKU must have sold to be ranked by return rate")
+    returns.add_argument('--top', type=int, default=10, help="SKUs shown by return rate")
+    returns.add_argument('--out', default=None, help="write the per-SKU/reason/state/courier/month tables to <out>.xlsx")
+    returns.set_defaults(handler=run_returns)
+
+    ads = commands.add_parser('ads', help="ads ACOS/ROAS rollup and wasteful keywords")
+    ads.add_argument('--reports', nargs='+', required=True, help="Amazon / Flipkart ads reports")
+    ads.add_argument('--platform', choices=['Amazon', 'Flipkart'], default=None, help="default: detected from the headers")
+    ads.add_argument('--level', choices=['campaign', 'ad_group', 'keyword', 'search_term', 'sku'], default='campaign',
+                     help="rollup written to --out")
+    ads.add_argument('--waste-level', choices=['search_term', 'keyword'], default='search_term',
+                     help="rollup the wasteful-keyword rules run on")
+    ads.add_argument('--target-acos', type=float, default=40.0, help="ACOS %% above which spend counts as wasted")
+    ads.add_argument('--min-clicks', type=int, default=15, help="clicks without an order that flag a keyword")
+    ads.add_argument('--min-spend', type=float, default=100.0, help="spend without an order that flags a keyword")
+    ads.add_argument('--min-impressions', type=int, default=1000, help="impressions before CTR is judged")
+    ads.add_argument('--min-ctr', type=float, default=0.1, help="CTR %% below which a keyword is flagged")
+    ads.add_argument('--out', default=None, help="write the rollup and flagged keywords to <out>.xlsx")
+    ads.set_defaults(handler=run_ads)
+
+    cache = commands.add_parser('cache', help="report cache statistics / cleanup")
+    cache.add_argument('action', choices=['stats', 'clear'])
+    cache.set_defaults(handler=run_cache)
+    return parser
+
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    try:
+        return args.handler(args)
+    except (OSError, ValueError) as e:
+        print(f"error: {e}", file=sys.stderr)
+        # Validation failures carry their issue summary
+        if hasattr(e, 'result'):
+            _print_validation(e.result['issues'])
+        return 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
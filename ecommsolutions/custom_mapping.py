@@ -0,0 +1,477 @@
+"""
+GSTR-1 from arbitrary sales Excel/CSV files through a saved column mapping.
+
+Channels without a dedicated engine (Myntra, a website, an offline ledger)
+are onboarded by mapping their columns to GSTR-1 line fields once. A mapping
+is a plain JSON-able spec:
+
+    {'name': 'Myntra', 'sheet': None,
+     'fields': {'invoice_id': {'column': 'Invoice No'},
+                'taxable_value': {'expr': '`Gross Amount` - `Discount`'},
+                'rate': {'lookup': {'column': 'Category', 'table': {'Apparel': 5}, 'default': 12}},
+                'state': {'column': 'Ship State'},
+                'hsn': {'value': '6109'}},
+     'returns': {'column': 'Type', 'values': ['Return', 'RTO']}}
+
+Every field comes from a column, an arithmetic expression over columns, a
+fixed value or a lookup table keyed by a column. `compile_plan` checks the
+spec against a header row once and turns it into a TransformPlan: the
+columns to read, their dtype schema and one vectorized step per field.
+Expressions are parsed with `ast` into Series arithmetic and lookups map
+only the distinct keys, so applying a plan costs a few column operations per
+chunk and no row-wise `apply`.
+
+Specs are stored under their name and the header hash of the file they were
+built on (ECOMM_CUSTOM_PLANS_PATH), so the next file of the same layout is
+processed without touching the mapping again.
+"""
+import ast
+import datetime
+import json
+import os
+import re
+import uuid
+
+import numpy as np
+import pandas as pd
+
+from ecommsolutions.file_probe import probe_excel_sheet, probe_file
+from ecommsolutions.fingerprint import header_hash
+from ecommsolutions.gst_common import (
+    build_b2cs, build_hsn, build_registered, gstin_state_code, is_gstin_like, normalize_hsn, normalize_rates,
+    source_name, state_codes, with_tax_split,
+)
+from ecommsolutions.ingestion import (
+    FIELD_KINDS, ColumnCollector, GroupTotals, consume, map_distinct, parse_amounts,
+)
+from ecommsolutions.instrumentation import stage, timed
+from ecommsolutions.report_cache import iter_cached_report_chunks
+from ecommsolutions.validation import settle_validations, validate_chunks, with_validation
+
+PLANS_PATH = os.environ.get(
+    'ECOMM_CUSTOM_PLANS_PATH',
+    os.path.join(os.path.expanduser('~'), '.cache', 'ecommsolutions', 'custom_plans.json'),
+)
+
+# GSTR-1 line fields a mapping can fill, with their labels in the app
+CUSTOM_FIELDS = {
+    'taxable_value': "Taxable Value",
+    'rate': "GST Rate (%)",
+    'state': "Customer State / Place of Supply",
+    'hsn': "HSN Code",
+    'quantity': "Quantity",
+    'tax': "Total Tax Amount",
+    'invoice_value': "Invoice Value",
+    'invoice_id': "Invoice / Credit Note Number",
+    'invoice_date': "Invoice Date",
+    'buyer_gstin': "Buyer GSTIN (B2B)",
+    'buyer_name': "Buyer Name",
+}
+CUSTOM_REQUIRED = ['taxable_value', 'rate', 'state']
+SOURCE_KINDS = ('column', 'expr', 'value', 'lookup')
+
+GROUP_KEYS = ['state_code', 'rate', 'hsn', 'is_b2b']
+LINE_VALUES = ['quantity', 'taxable_value', 'tax', 'invoice_value']
+B2B_FIELDS = ['buyer_gstin', 'buyer_name', 'invoice_id', 'invoice_date', 'state_code', 'rate', 'is_return',
+              'taxable_value', 'tax', 'invoice_value']
+
+# Invoice numbers repeat across the lines of an invoice, so mapped reports are not checked for duplicates
+CUSTOM_CHECKS = {
+    'gstins': ['buyer_gstin'],
+    'hsn': 'hsn',
+    'rates': ['rate'],
+    'amounts': ['taxable_value', 'tax', 'invoice_value'],
+}
+
+_NUMERIC_FIELDS = {'taxable_value', 'tax', 'invoice_value', 'quantity', 'rate'}
+_OPERATORS = {ast.Add: np.add, ast.Sub: np.subtract, ast.Mult: np.multiply, ast.Div: np.divide}
+_QUOTED = re.compile(r'`([^`]+)`')
+
+
+# --- Expressions ---
+
+def _compile_expression(text, columns):
+    """
+    Compiles '`Gross` - `Discount`' style arithmetic (+ - * /, unary minus,
+    parentheses, numbers) over report columns into func(frame) -> Series.
+    Names with spaces are written in backticks. Returns (func, columns used).
+    """
+    names = {}
+
+    def placeholder(match):
+        names[f"_c{len(names)}"] = match.group(1)
+        return f"_c{len(names) - 1}"
+
+    try:
+        tree = ast.parse(_QUOTED.sub(placeholder, text.strip()), mode='eval')
+    except SyntaxError:
+        raise ValueError(f"Cannot read expression '{text}'") from None
+    used = []
+
+    def build(node):
+        if isinstance(node, ast.Expression):
+            return build(node.body)
+        if isinstance(node, ast.Constant) and isinstance(node.value, (int, float)) and not isinstance(node.value, bool):
+            value = float(node.value)
+            return lambda frame: value
+        if isinstance(node, ast.Name):
+            column = names.get(node.id, node.id)
+            if column not in columns:
+                raise ValueError(f"Expression '{text}' uses unknown column '{column}'")
+            used.append(column)
+            return lambda frame: parse_amounts(frame[column])
+        if isinstance(node, ast.UnaryOp) and isinstance(node.op, (ast.USub, ast.UAdd)):
+            operand = build(node.operand)
+            if isinstance(node.op, ast.UAdd):
+                return operand
+            return lambda frame: -operand(frame)
+        if isinstance(node, ast.BinOp) and type(node.op) in _OPERATORS:
+            operator, left, right = _OPERATORS[type(node.op)], build(node.left), build(node.right)
+            return lambda frame: operator(left(frame), right(frame))
+        raise ValueError(f"Expression '{text}' may only combine columns and numbers with + - * /")
+
+    return build(tree), used
+
+
+# --- Compiling a spec ---
+
+class TransformPlan:
+    """
+    A spec compiled against one header row. `columns` and `schema` are what
+    to read; apply(chunk) turns a chunk of those columns into signed GSTR-1
+    lines (see LINE_VALUES, B2B_FIELDS and GROUP_KEYS). `amount_columns`
+    maps the amount fields taken straight from a column to that column.
+    """
+
+    def __init__(self, spec, steps, columns, schema, amount_columns=None):
+        self.spec = spec
+        self.steps = steps
+        self.columns = columns
+        self.schema = schema
+        self.amount_columns = amount_columns or {}
+
+    @property
+    def validation_schema(self):
+        """`schema` with amount columns left unconverted, so blanks and text are told apart from zeros."""
+        return {column: kind for column, kind in self.schema.items() if kind != 'amount'}
+
+    def _field(self, chunk, field):
+        step = self.steps.get(field)
+        return None if step is None else step(chunk)
+
+    def mapped(self, chunk):
+        """
+        The mapped fields of a chunk as the spec produces them, before defaults
+        and signs. Amounts mapped from a column are passed through as read.
+        """
+        values = {}
+        for field in CUSTOM_FIELDS:
+            column = self.amount_columns.get(field)
+            field_values = chunk[column] if column is not None else self._field(chunk, field)
+            if field_values is not None and not isinstance(field_values, pd.Series):
+                field_values = pd.Series(field_values, index=chunk.index)
+            if field_values is not None:
+                values[field] = field_values
+        return pd.DataFrame(values, index=chunk.index)
+
+    def apply(self, chunk):
+        index = chunk.index
+        zeros = pd.Series(0.0, index=index)
+        blank = pd.Series('', index=index, dtype='string')
+
+        def numeric(field):
+            values = self._field(chunk, field)
+            if values is None:
+                return None
+            values = values if isinstance(values, pd.Series) else pd.Series(values, index=index)
+            return values.astype('float64').fillna(0.0)
+
+        def text(field):
+            values = self._field(chunk, field)
+            if values is None:
+                return blank
+            values = values if isinstance(values, pd.Series) else pd.Series(values, index=index)
+            return values.astype('string').str.strip().fillna('')
+
+        rate = normalize_rates(numeric('rate')).fillna(0.0)
+        taxable = numeric('taxable_value')
+        tax = numeric('tax')
+        invoice_value = numeric('invoice_value')
+        quantity = numeric('quantity')
+
+        is_return = self.steps['returns'](chunk) if 'returns' in self.steps else (taxable < 0).to_numpy()
+        if 'returns' in self.steps:
+            # Return rows are marked by a column, so amounts are signed from it whatever their own sign
+            sign = np.where(is_return, -1.0, 1.0)
+            taxable = taxable.abs() * sign
+            tax = tax.abs() * sign if tax is not None else None
+            invoice_value = invoice_value.abs() * sign if invoice_value is not None else None
+            quantity = quantity.abs() * sign if quantity is not None else None
+        tax = tax if tax is not None else taxable * rate / 100
+        buyer_gstin = text('buyer_gstin').str.upper()
+
+        return pd.DataFrame({
+            'state_code': self.steps['state'](chunk).fillna(''),
+            'rate': rate.round(2),
+            'hsn': normalize_hsn(text('hsn')),
+            'is_b2b': is_gstin_like(buyer_gstin),
+            'is_return': is_return,
+            'quantity': quantity if quantity is not None else zeros,
+            'taxable_value': taxable,
+            'tax': tax,
+            'invoice_value': invoice_value if invoice_value is not None else taxable + tax,
+            'buyer_gstin': buyer_gstin,
+            'buyer_name': text('buyer_name'),
+            'invoice_id': text('invoice_id'),
+            'invoice_date': text('invoice_date'),
+        }, index=index)
+
+
+def _field_step(field, source, columns):
+    """Returns (func(chunk) -> Series or scalar, {column: kind} read by it) for one field's source."""
+    kind = next((key for key in SOURCE_KINDS if key in source), None)
+    numeric = field in _NUMERIC_FIELDS
+    if kind == 'column':
+        column = source['column']
+        if column not in columns:
+            raise ValueError(f"{CUSTOM_FIELDS[field]}: column '{column}' is not in the report")
+        if numeric:
+            return (lambda chunk: parse_amounts(chunk[column])), {column: 'amount' if field != 'rate' else 'rate'}
+        return (lambda chunk: chunk[column]), {column: FIELD_KINDS.get(field, 'text')}
+    if kind == 'expr':
+        if not numeric:
+            raise ValueError(f"{CUSTOM_FIELDS[field]}: expressions are only allowed for amounts, rates and quantities")
+        func, used = _compile_expression(str(source['expr']), columns)
+        return func, {column: 'amount' for column in used}
+    if kind == 'value':
+        value = source['value']
+        if numeric:
+            try:
+                value = float(value)
+            except (TypeError, ValueError):
+                raise ValueError(f"{CUSTOM_FIELDS[field]}: '{value}' is not a number") from None
+        return (lambda chunk: value), {}
+    if kind == 'lookup':
+        lookup = source['lookup']
+        column = lookup.get('column')
+        if column not in columns:
+            raise ValueError(f"{CUSTOM_FIELDS[field]}: lookup column '{column}' is not in the report")
+        table = {str(key).strip().upper(): value for key, value in lookup.get('table', {}).items()}
+        default = lookup.get('default')
+        if numeric:
+            try:
+                table = {key: float(value) for key, value in table.items()}
+                default = float(default) if default not in (None, '') else np.nan
+            except (TypeError, ValueError):
+                raise ValueError(f"{CUSTOM_FIELDS[field]}: lookup values must be numbers") from None
+
+        def look_up(keys):
+            mapped = keys.str.strip().str.upper().map(table)
+            if numeric:
+                return mapped.astype('float64').fillna(default)
+            mapped = mapped.astype('string')
+            return mapped if default in (None, '') else mapped.fillna(str(default))
+
+        return (lambda chunk: map_distinct(chunk[column], look_up)), {column: 'category'}
+    raise ValueError(f"{CUSTOM_FIELDS[field]}: a source needs one of {', '.join(SOURCE_KINDS)}")
+
+
+def compile_plan(spec, columns):
+    """
+    Validates a spec against a report's header row and compiles it into a
+    TransformPlan. Raises ValueError naming every problem (unknown columns,
+    unreadable expressions, required fields left unmapped).
+    """
+    columns = list(columns)
+    fields = spec.get('fields', {})
+    problems = [f"{CUSTOM_FIELDS[field]} is not mapped" for field in CUSTOM_REQUIRED if not fields.get(field)]
+    unknown = [field for field in fields if field not in CUSTOM_FIELDS]
+    if unknown:
+        problems.append(f"unknown field(s): {', '.join(unknown)}")
+
+    steps, schema, amount_columns = {}, {}, {}
+    for field, source in fields.items():
+        if field in unknown or not source:
+            continue
+        try:
+            steps[field], read = _field_step(field, source, columns)
+        except ValueError as e:
+            problems.append(str(e))
+            continue
+        for column, kind in read.items():
+            # A column read two ways (e.g. as a state and as a lookup key) is left as text
+            schema[column] = kind if schema.get(column, kind) == kind else 'text'
+        if 'column' in source and read.get(source['column']) == 'amount':
+            amount_columns[field] = source['column']
+
+    returns = spec.get('returns')
+    if returns and returns.get('column'):
+        column = returns['column']
+        if column not in columns:
+            problems.append(f"Returns: column '{column}' is not in the report")
+        else:
+            marks = {str(value).strip().upper() for value in returns.get('values', []) if str(value).strip()}
+            steps['returns'] = lambda chunk: map_distinct(
+                chunk[column], lambda values: values.str.strip().str.upper().isin(marks)).to_numpy(dtype=bool)
+            schema.setdefault(column, 'category')
+
+    if problems:
+        raise ValueError("; ".join(problems))
+
+    # States are always resolved to GST state codes, whichever source supplied them
+    state = steps['state']
+    steps['state'] = lambda chunk: _state_series(state(chunk), chunk.index)
+    return TransformPlan(spec, steps, list(schema), schema, amount_columns)
+
+
+def _state_series(values, index):
+    if not isinstance(values, pd.Series):
+        values = pd.Series(values, index=index, dtype='string')
+    return state_codes(values)
+
+
+# --- Saved plans ---
+
+def _read_plans():
+    try:
+        with open(PLANS_PATH, encoding='utf-8') as handle:
+            return json.load(handle)
+    except (OSError, ValueError):
+        return {}
+
+
+def _write_plans(plans):
+    try:
+        os.makedirs(os.path.dirname(PLANS_PATH), exist_ok=True)
+        tmp_path = f"{PLANS_PATH}.{uuid.uuid4().hex}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as handle:
+            json.dump(plans, handle, indent=1)
+        os.replace(tmp_path, PLANS_PATH)
+    except OSError:
+        pass
+
+
+def save_plan(spec, columns):
+    """Stores a spec under its name for files with the same header row; compile it first to validate."""
+    plans = _read_plans()
+    plans[spec['name']] = {**spec, 'header_hash': header_hash(columns),
+                           'saved_at': datetime.datetime.now().isoformat(timespec='seconds')}
+    _write_plans(plans)
+
+
+def delete_plan(name):
+    plans = _read_plans()
+    if plans.pop(name, None) is not None:
+        _write_plans(plans)
+
+
+def saved_plans():
+    """{name: spec} of every stored mapping."""
+    return _read_plans()
+
+
+def suggest_plan(columns):
+    """The stored spec built on this exact header row, else the newest one that compiles against it, or None."""
+    plans = sorted(_read_plans().values(), key=lambda plan: plan.get('saved_at', ''), reverse=True)
+    digest = header_hash(columns)
+    for plan in plans:
+        if plan.get('header_hash') == digest:
+            return plan
+    for plan in plans:
+        try:
+            compile_plan(plan, columns)
+        except ValueError:
+            continue
+        return plan
+    return None
+
+
+# --- GSTR-1 sections ---
+
+class _CustomLines:
+    """Group totals of every line plus the full lines billed to registered buyers."""
+
+    def __init__(self):
+        self.lines = 0
+        self.returns = 0
+        self.gross = 0.0
+        self.totals = GroupTotals(GROUP_KEYS, LINE_VALUES)
+        self.b2b = ColumnCollector(B2B_FIELDS, where='is_b2b')
+
+    def update(self, chunk):
+        self.lines += len(chunk)
+        self.returns += int(chunk['is_return'].sum())
+        self.gross += float(chunk.loc[~chunk['is_return'], 'taxable_value'].sum())
+        self.totals.update(chunk)
+        self.b2b.update(chunk)
+
+    def result(self):
+        return self
+
+
+@timed()
+def compute_custom_gstr1(chunks, plan, seller_gstin, ecommerce_gstin=None):
+    """
+    Computes the GSTR-1 tables from report chunks holding `plan.columns`.
+    Returns a dict with 'b2b', 'cdnr', 'b2cs' and 'hsn' frames plus a 'summary' dict.
+    """
+    seller_state = gstin_state_code(seller_gstin)
+    with stage('custom.lines'):
+        collected = consume((plan.apply(chunk) for chunk in chunks), _CustomLines())
+
+    with stage('custom.b2cs_hsn'):
+        totals = collected.totals.result()
+        totals = totals.astype({'state_code': 'string', 'hsn': 'string', 'rate': 'float64', 'is_b2b': bool})
+        net = with_tax_split(totals, seller_state)
+        b2cs = build_b2cs(net[~net['is_b2b']], ecommerce_gstin)
+        hsn = build_hsn(net)
+
+    with stage('custom.b2b_cdnr'):
+        b2b_lines = collected.b2b.result()
+        b2b, cdnr = build_registered(b2b_lines, b2b_lines['is_return'].astype(bool), seller_state, ecommerce_gstin)
+
+    known_state = net['state_code'] != ''
+    net_taxable = float(net['taxable_value'].sum())
+    summary = {
+        'mapping': plan.spec.get('name', ''),
+        'lines': collected.lines,
+        'return_lines': collected.returns,
+        'gross_taxable_value': round(collected.gross, 2),
+        'returns_taxable_value': round(collected.gross - net_taxable, 2),
+        'net_taxable_value': round(net_taxable, 2),
+        'igst': round(float(net['igst'].sum()), 2),
+        'cgst': round(float(net['cgst'].sum()), 2),
+        'sgst': round(float(net['sgst'].sum()), 2),
+        'unmapped_state_taxable_value': round(float(net.loc[~known_state, 'taxable_value'].sum()), 2),
+        'b2b_invoices': int(b2b['Invoice Number'].nunique()),
+        'credit_notes': int(cdnr['Note Number'].nunique()),
+    }
+    return {'b2b': b2b, 'cdnr': cdnr, 'b2cs': b2cs, 'hsn': hsn, 'summary': summary}
+
+
+def report_columns(source, file_name=None, sheet=None):
+    """Header row of the sheet a spec reads (the first sheet unless `sheet` is given)."""
+    file_name = source_name(source, file_name)
+    header = probe_file(source, file_name, n_rows=0)
+    if sheet and file_name.endswith('.xlsx') and sheet != header['sheets'][0]:
+        header = probe_excel_sheet(source, sheet, 0)
+    return header['columns']
+
+
+@timed()
+def process_custom_report(source, spec, seller_gstin, ecommerce_gstin=None, file_name=None, strict=True):
+    """
+    Compiles `spec` against an uploaded/on-disk report, validates the mapped
+    fields and runs the full computation (see process_meesho_reports for `strict`).
+    """
+    file_name = source_name(source, file_name)
+    sheet = spec.get('sheet')
+    plan = compile_plan(spec, report_columns(source, file_name, sheet))
+    with stage('custom.validate'):
+        chunks = iter_cached_report_chunks(source, file_name, sheet=sheet, usecols=plan.columns,
+                                           schema=plan.validation_schema)
+        validation = settle_validations([validate_chunks(
+            (plan.mapped(chunk) for chunk in chunks), os.path.basename(file_name), CUSTOM_CHECKS, labels=CUSTOM_FIELDS,
+        )], strict)
+    chunks = iter_cached_report_chunks(source, file_name, sheet=sheet, usecols=plan.columns, schema=plan.schema)
+    return with_validation(compute_custom_gstr1(chunks, plan, seller_gstin, ecommerce_gstin), validation)
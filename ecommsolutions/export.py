@@ -0,0 +1,159 @@
+"""
+Workbook export for GSTR-1 and reconciliation results.
+
+Every download goes through here instead of building a pandas ExcelWriter in
+a BytesIO on each rerun:
+
+  - XLSX is written with xlsxwriter in constant_memory mode, row batch by row
+    batch, so only one batch of Python values exists next to the frames and
+    finished rows are flushed to disk as they are written.
+  - Outputs too big for a worksheet (or for Excel to open comfortably) are
+    written as one CSV per sheet inside a ZIP instead.
+  - download_payload() hands Streamlit a callable, so the file is only
+    generated when the user clicks the download button, not on every rerun.
+"""
+import os
+import tempfile
+import zipfile
+from io import TextIOWrapper
+
+import pandas as pd
+
+from ecommsolutions.instrumentation import timed
+
+# One header row plus 1,048,575 data rows per worksheet
+XLSX_MAX_ROWS = 1_048_575
+# xlsxwriter manages roughly 100k cells a second; above this many cells the
+# CSV/ZIP form (about 7x faster) is used even when every sheet fits
+XLSX_MAX_CELLS = 2_000_000
+WRITE_BATCH_ROWS = 50_000
+
+XLSX_MIME = 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'
+ZIP_MIME = 'application/zip'
+
+
+def _sheet_name(name):
+    """Excel sheet names are limited to 31 characters and cannot contain []:*?/\\."""
+    cleaned = ''.join('_' if ch in '[]:*?/\\' else ch for ch in str(name))
+    return cleaned[:31] or 'Sheet'
+
+
+def export_format(sheets):
+    """'xlsx' when every sheet fits comfortably in a workbook, otherwise 'zip' (CSV per sheet)."""
+    cells = sum(len(frame) * max(len(frame.columns), 1) for frame in sheets.values())
+    if cells > XLSX_MAX_CELLS or any(len(frame) > XLSX_MAX_ROWS for frame in sheets.values()):
+        return 'zip'
+    return 'xlsx'
+
+
+def expected_format(rows, columns):
+    """export_format for sheets not loaded yet, from their expected size."""
+    return 'zip' if rows > XLSX_MAX_ROWS or rows * max(columns, 1) > XLSX_MAX_CELLS else 'xlsx'
+
+
+def _cell_values(batch):
+    """
+    Per-column Python lists for one row batch, with missing values as None
+    (written as empty cells) and datetimes as datetime objects.
+    """
+    columns = []
+    for column in batch.columns:
+        values = batch[column]
+        if pd.api.types.is_datetime64_any_dtype(values):
+            values = values.dt.tz_localize(None) if getattr(values.dt, 'tz', None) else values
+            columns.append([None if pd.isna(value) else value.to_pydatetime() for value in values])
+        else:
+            columns.append(values.astype(object).where(values.notna(), None).tolist())
+    return columns
+
+
+def write_xlsx(sheets, target):
+    """Writes {sheet name: frame} to an .xlsx path or binary file object."""
+    import xlsxwriter
+
+    workbook = xlsxwriter.Workbook(target, {
+        'constant_memory': True,
+        'strings_to_formulas': False,
+        'strings_to_urls': False,
+        'nan_inf_to_errors': True,
+        'default_date_format': 'dd-mm-yyyy',
+    })
+    try:
+        header_format = workbook.add_format({'bold': True})
+        for name, frame in sheets.items():
+            worksheet = workbook.add_worksheet(_sheet_name(name))
+            worksheet.write_row(0, 0, [str(column) for column in frame.columns], header_format)
+            row = 1
+            for start in range(0, len(frame), WRITE_BATCH_ROWS):
+                columns = _cell_values(frame.iloc[start:start + WRITE_BATCH_ROWS])
+                for values in zip(*columns):
+                    worksheet.write_row(row, 0, values)
+                    row += 1
+    finally:
+        workbook.close()
+
+
+def write_csv_zip(sheets, target):
+    """Writes {sheet name: frame} as one CSV per sheet inside a ZIP (path or binary file object)."""
+    with zipfile.ZipFile(target, 'w', compression=zipfile.ZIP_DEFLATED) as archive:
+        for name, frame in sheets.items():
+            with archive.open(f"{_sheet_name(name)}.csv", 'w', force_zip64=True) as raw:
+                stream = TextIOWrapper(raw, encoding='utf-8', newline='')
+                frame.iloc[:0].to_csv(stream, index=False)
+                for start in range(0, len(frame), WRITE_BATCH_ROWS):
+                    frame.iloc[start:start + WRITE_BATCH_ROWS].to_csv(stream, index=False, header=False)
+                stream.flush()
+                stream.detach()
+
+
+@timed()
+def export_sheets(sheets, target, fmt=None):
+    """Writes the sheets in `fmt` ('xlsx' / 'zip', chosen by size when None); returns the format used."""
+    fmt = fmt or export_format(sheets)
+    if fmt == 'zip':
+        write_csv_zip(sheets, target)
+    else:
+        write_xlsx(sheets, target)
+    return fmt
+
+
+def export_bytes(sheets, fmt=None):
+    """
+    Exports through an anonymous temporary file and returns its contents. The
+    rows are streamed to disk while writing, so the only full copy in memory
+    is the finished (compressed) file.
+    """
+    with tempfile.TemporaryFile() as handle:
+        export_sheets(sheets, handle, fmt)
+        handle.seek(0)
+        return handle.read()
+
+
+def zip_directory(directory):
+    """ZIP of every file under `directory` (paths relative to it), as bytes."""
+    with tempfile.TemporaryFile() as handle:
+        with zipfile.ZipFile(handle, 'w', compression=zipfile.ZIP_DEFLATED) as archive:
+            for root, _, names in os.walk(directory):
+                for name in sorted(names):
+                    path = os.path.join(root, name)
+                    archive.write(path, os.path.relpath(path, directory))
+        handle.seek(0)
+        return handle.read()
+
+
+def download_payload(sheets, file_stem, fmt=None):
+    """
+    Arguments for st.download_button: a dict with a zero-argument 'data'
+    callable (the export only runs when the button is clicked), 'file_name'
+    and 'mime'. `sheets` may itself be a zero-argument callable returning the
+    sheets (e.g. a database query), in which case `fmt` must be given.
+    """
+    lazy = callable(sheets)
+    if lazy and fmt is None:
+        raise ValueError("fmt is required when sheets are loaded lazily")
+    fmt = fmt or export_format(sheets)
+    return {
+        'data': lambda: export_bytes(sheets() if lazy else sheets, fmt),
+        'file_name': f"{file_stem}.{fmt}",
+        'mime': ZIP_MIME if fmt == 'zip' else XLSX_MIME,
+    }
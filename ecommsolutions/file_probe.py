@@ -0,0 +1,104 @@
+"""
+Header-only probing of uploaded report files.
+
+The mapping controls only need the sheet list and the column names of the
+first sheet, so we never parse the full workbook here. Excel files are opened
+once through a read-only (streaming) openpyxl workbook and CSV files are read
+with `nrows`.
+"""
+import hashlib
+import os
+from io import BytesIO
+
+import pandas as pd
+
+# Number of data rows read below the header row (enough for a preview)
+HEADER_PROBE_ROWS = 5
+
+
+def content_hash(data):
+    """Returns a short hex digest of the raw upload bytes, used as a cache key."""
+    return hashlib.blake2b(data, digest_size=16).hexdigest()
+
+
+def open_source(source):
+    """Accepts raw bytes, a path or a file-like object (e.g. a Streamlit UploadedFile)."""
+    if isinstance(source, (bytes, bytearray)):
+        return BytesIO(source)
+    if isinstance(source, (str, os.PathLike)):
+        return source
+    source.seek(0)
+    return source
+
+
+def dedupe_headers(raw_headers):
+    """
+    Names header cells the same way pd.read_excel does: blanks become
+    'Unnamed: <i>' and repeated names get '.1', '.2', ... suffixes. Names are
+    stripped so mappings match the normalized chunks of the ingestion layer.
+    """
+    headers = []
+    seen = {}
+    for i, value in enumerate(raw_headers):
+        name = f"Unnamed: {i}" if value is None or str(value).strip() == "" else str(value).strip()
+        if name in seen:
+            seen[name] += 1
+            name = f"{name}.{seen[name]}"
+        else:
+            seen[name] = 0
+        headers.append(name)
+    return headers
+
+
+def probe_excel(source, n_rows=HEADER_PROBE_ROWS):
+    """
+    Reads the sheet names and the header (plus `n_rows` rows) of the first
+    sheet of an XLSX file without loading the rest of the workbook.
+    """
+    return probe_excel_sheet(source, None, n_rows)
+
+
+def probe_excel_sheet(source, sheet, n_rows=HEADER_PROBE_ROWS):
+    """Like probe_excel, for a named sheet (None means the first sheet)."""
+    from openpyxl import load_workbook
+
+    workbook = load_workbook(open_source(source), read_only=True, data_only=True)
+    try:
+        sheet_names = workbook.sheetnames
+        worksheet = workbook[sheet if sheet is not None else sheet_names[0]]
+        rows = list(worksheet.iter_rows(min_row=1, max_row=n_rows + 1, values_only=True))
+    finally:
+        workbook.close()
+
+    if not rows:
+        return {'sheets': sheet_names, 'columns': [], 'preview': pd.DataFrame()}
+
+    # Read-only sheets can report trailing empty cells; drop them from the header
+    raw_headers = list(rows[0])
+    while raw_headers and raw_headers[-1] is None:
+        raw_headers.pop()
+    columns = dedupe_headers(raw_headers)
+
+    width = len(columns)
+    body = [list(row[:width]) + [None] * (width - len(row)) for row in rows[1:]]
+    preview = pd.DataFrame(body, columns=columns)
+    return {'sheets': sheet_names, 'columns': columns, 'preview': preview}
+
+
+def probe_csv(source, n_rows=HEADER_PROBE_ROWS):
+    """Reads only the header and the first `n_rows` rows of a CSV file."""
+    preview = pd.read_csv(open_source(source), nrows=n_rows)
+    preview = preview.rename(columns=lambda c: str(c).strip())
+    return {'sheets': ['Single Sheet'], 'columns': preview.columns.tolist(), 'preview': preview}
+
+
+def probe_file(source, file_name, n_rows=HEADER_PROBE_ROWS):
+    """
+    Dispatches on the file extension. Raises ValueError for unsupported files
+    so callers can show their own message.
+    """
+    if file_name.endswith('.xlsx'):
+        return probe_excel(source, n_rows)
+    if file_name.endswith('.csv'):
+        return probe_csv(source, n_rows)
+    raise ValueError(f"Unsupported file type: {file_name}")
@@ -0,0 +1,188 @@
+"""
+Report fingerprinting for the reconciliation column mappings.
+
+Marketplace reports keep the same header row month after month, so the
+header itself identifies the layout:
+
+1. A confirmed mapping is remembered under a hash of the (normalized) header
+   row and the report's role ('sales' or 'payments'). The next file with the
+   same header gets the same sheet/Order ID/amount columns without any
+   interaction.
+2. Failing that, the header is compared with the signatures of known Amazon,
+   Meesho and Flipkart layouts, which name the Order ID and amount columns.
+
+Confirmed mappings live in one small JSON file (ECOMM_MAPPINGS_PATH).
+"""
+import datetime
+import hashlib
+import json
+import os
+import re
+import uuid
+
+MAPPINGS_PATH = os.environ.get(
+    'ECOMM_MAPPINGS_PATH',
+    os.path.join(os.path.expanduser('~'), '.cache', 'ecommsolutions', 'mappings.json'),
+)
+
+ROLE_SALES = 'sales'
+ROLE_PAYMENTS = 'payments'
+
+# Known report layouts. 'signature' headers must all be present; column
+# candidates are tried in order, and a trailing '*' matches by prefix (Flipkart
+# appends formulas such as '= SUM(J:R)' to some headers).
+LAYOUTS = [
+    {
+        'name': "Flipkart Sales Report", 'platform': 'Flipkart', 'sheets': ['Sales Report'],
+        'signature': ['Order Item ID', 'Event Sub Type', 'Final Invoice Amount*'],
+        'order': ['Order Item ID'],
+        ROLE_SALES: ['Final Invoice Amount*'],
+    },
+    {
+        'name': "Flipkart Settlement Report", 'platform': 'Flipkart', 'sheets': ['Orders'],
+        'signature': ['NEFT ID', 'Order item ID', 'Bank Settlement Value*'],
+        'order': ['Order item ID'],
+        ROLE_PAYMENTS: ['Bank Settlement Value*'],
+    },
+    {
+        'name': "Meesho Payments Report", 'platform': 'Meesho', 'sheets': ['Order Payments'],
+        'signature': ['Sub Order No', 'Final Settlement Amount'],
+        'order': ['Sub Order No'],
+        ROLE_PAYMENTS: ['Final Settlement Amount'],
+    },
+    {
+        'name': "Meesho Orders Report", 'platform': 'Meesho', 'sheets': [],
+        'signature': ['Sub Order No', 'Reason for Credit Entry'],
+        'order': ['Sub Order No'],
+        ROLE_SALES: ['Supplier Discounted Price*', 'Supplier Listed Price*'],
+    },
+    {
+        'name': "Meesho TCS Sales Report", 'platform': 'Meesho', 'sheets': [],
+        'signature': ['sub_order_num', 'total_invoice_value'],
+        'order': ['sub_order_num'],
+        ROLE_SALES: ['total_invoice_value'],
+    },
+    {
+        'name': "Amazon Settlement Report", 'platform': 'Amazon', 'sheets': [],
+        'signature': ['settlement-id', 'order-id', 'amount-type', 'amount'],
+        'order': ['order-id'],
+        ROLE_PAYMENTS: ['amount'],
+    },
+    {
+        'name': "Amazon Transaction Report", 'platform': 'Amazon', 'sheets': [],
+        'signature': ['date/time', 'settlement id', 'order id', 'total'],
+        'order': ['order id'],
+        ROLE_PAYMENTS: ['total'],
+    },
+    {
+        'name': "Amazon Merchant Tax Report", 'platform': 'Amazon', 'sheets': [],
+        'signature': ['Order Id', 'Shipment Id', 'Invoice Amount'],
+        'order': ['Order Id'],
+        ROLE_SALES: ['Invoice Amount'],
+    },
+    {
+        'name': "Amazon Orders Report", 'platform': 'Amazon', 'sheets': [],
+        'signature': ['amazon-order-id', 'item-price'],
+        'order': ['amazon-order-id'],
+        ROLE_SALES: ['item-price'],
+    },
+]
+
+# Sheets worth probing when the first sheet of a workbook is not recognized
+KNOWN_SHEETS = {sheet.lower() for layout in LAYOUTS for sheet in layout['sheets']}
+
+
+def _normalize(name):
+    return re.sub(r'\s+', ' ', str(name)).strip().lower()
+
+
+def header_hash(columns):
+    """Order-sensitive hash of a header row (case and spacing ignored)."""
+    joined = '\x1f'.join(_normalize(column) for column in columns)
+    return hashlib.blake2b(joined.encode('utf-8'), digest_size=12).hexdigest()
+
+
+def _find(columns, candidates):
+    """The first column matching one of the candidates (exact, or by prefix for 'name*'), or None."""
+    normalized = {_normalize(column): column for column in reversed(columns)}
+    for candidate in candidates:
+        if candidate.endswith('*'):
+            prefix = _normalize(candidate[:-1])
+            for column in columns:
+                if _normalize(column).startswith(prefix):
+                    return column
+        elif _normalize(candidate) in normalized:
+            return normalized[_normalize(candidate)]
+    return None
+
+
+def identify_layout(columns):
+    """The known layout whose signature headers are all present, or None."""
+    for layout in LAYOUTS:
+        if all(_find(columns, [header]) is not None for header in layout['signature']):
+            return layout
+    return None
+
+
+# --- Confirmed mappings ---
+
+def _read_mappings():
+    try:
+        with open(MAPPINGS_PATH, encoding='utf-8') as handle:
+            return json.load(handle)
+    except (OSError, ValueError):
+        return {}
+
+
+def remember_mapping(columns_hash, role, sheet, order_col, amount_col=None):
+    """Stores a confirmed mapping for every later file with the same header row."""
+    mappings = _read_mappings()
+    mappings[f"{columns_hash}:{role}"] = {
+        'sheet': sheet, 'order_col': order_col, 'amount_col': amount_col,
+        'confirmed_at': datetime.datetime.now().isoformat(timespec='seconds'),
+    }
+    try:
+        os.makedirs(os.path.dirname(MAPPINGS_PATH), exist_ok=True)
+        tmp_path = f"{MAPPINGS_PATH}.{uuid.uuid4().hex}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as handle:
+            json.dump(mappings, handle, indent=1)
+        os.replace(tmp_path, MAPPINGS_PATH)
+    except OSError:
+        pass
+
+
+def suggest_mapping(columns, role, sheet=None):
+    """
+    Mapping for a header row: a remembered one first, else the known layout's
+    columns. Returns a dict with 'sheet', 'order_col', 'amount_col' and
+    'source' (the layout name or 'remembered'), or None. Remembered columns
+    that are no longer in the header are ignored.
+    """
+    saved = _read_mappings().get(f"{header_hash(columns)}:{role}")
+    if saved and saved['order_col'] in columns and saved['amount_col'] in (None, *columns):
+        return {'sheet': saved['sheet'] or sheet, 'order_col': saved['order_col'],
+                'amount_col': saved['amount_col'], 'source': 'remembered'}
+
+    layout = identify_layout(columns)
+    if layout is None:
+        return None
+    return {
+        'sheet': sheet,
+        'order_col': _find(columns, layout['order']),
+        'amount_col': _find(columns, layout.get(role, [])),
+        'source': layout['name'],
+    }
+
+
+def layout_sheet(sheets, probe_sheet):
+    """
+    For a workbook whose first sheet is not a known layout: probes the sheets
+    known layouts live on (via `probe_sheet(name) -> columns`) and returns
+    (sheet, columns) of the first recognized one, or None.
+    """
+    for sheet in sheets[1:]:
+        if sheet.strip().lower() in KNOWN_SHEETS:
+            columns = probe_sheet(sheet)
+            if identify_layout(columns) is not None:
+                return sheet, columns
+    return None
@@ -0,0 +1,221 @@
+"""
+Flipkart Sales Report → GSTR-1.
+
+Parses the Sales Report sheet from Flipkart Portal → Reports → Tax Reports
+and produces the B2B, CDNR (credit notes to registered buyers), B2CS and HSN
+sections. Each line is classified by its event (Sale, Return, Cancellation,
+Return Cancellation) and signed so returns and cancellations net off against
+sales; a cancellation whose sale is not in the report is filed as a credit
+note rather than a negative B2B invoice. Place of supply comes from the
+customer's delivery state through the precomputed state lookups in
+gst_common; supplies within the seller's state are split into CGST/SGST,
+everything else is IGST.
+
+The report is streamed chunk by chunk and reduced as it goes; only registered
+-buyer (B2B) lines are kept row-level, so a year of data fits comfortably in
+memory.
+"""
+import numpy as np
+import pandas as pd
+
+from ecommsolutions.gst_common import (
+    build_b2cs, build_hsn, build_registered, gstin_state_code, is_gstin_like, iter_canonical_chunks,
+    normalize_hsn, normalize_rates, state_codes, with_tax_split,
+)
+from ecommsolutions.ingestion import ColumnCollector, GroupTotals, consume, field_schema, map_distinct, parse_amounts
+from ecommsolutions.instrumentation import stage, timed
+from ecommsolutions.validation import settle_validations, validate_report, with_validation
+
+# Flipkart Internet Pvt. Ltd. (e-commerce operator collecting TCS)
+FLIPKART_GSTIN = '07AACCF0683K1CU'
+
+SALES_REPORT_SHEETS = ('Sales Report',)
+
+SALES_ALIASES = {
+    'seller_gstin': ['Seller GSTIN'],
+    'order_id': ['Order ID'],
+    'hsn': ['HSN Code', 'HSN'],
+    'event_type': ['Event Type'],
+    'event_sub_type': ['Event Sub Type'],
+    'quantity': ['Item Quantity', 'Quantity'],
+    'taxable_value': ['Taxable Value (Final Invoice Amount -Taxes)', 'Taxable Value'],
+    'invoice_value': ['Final Invoice Amount (Price after discount+Shipping Charges)', 'Final Invoice Amount',
+                      'Buyer Invoice Amount'],
+    'igst_rate': ['IGST Rate'],
+    'igst': ['IGST Amount'],
+    'cgst_rate': ['CGST Rate'],
+    'cgst': ['CGST Amount'],
+    'sgst_rate': ['SGST Rate (or UTGST as applicable)', 'SGST Rate'],
+    'sgst': ['SGST Amount (Or UTGST as applicable)', 'SGST Amount'],
+    'invoice_id': ['Buyer Invoice ID', 'Invoice ID'],
+    'invoice_date': ['Buyer Invoice Date', 'Invoice Date'],
+    'delivery_state': ["Customer's Delivery State", 'Delivery State'],
+    'buyer_gstin': ['Business GST Number', 'Buyer GSTIN', 'Customer GSTIN'],
+    'buyer_name': ['Business Name', 'Buyer Name'],
+}
+SALES_REQUIRED = ['event_type', 'hsn', 'taxable_value', 'delivery_state']
+SALES_SCHEMA = field_schema(SALES_ALIASES)
+# Returns and cancellations carry negative amounts, so only their format is checked
+SALES_CHECKS = {
+    'gstins': ['seller_gstin', 'buyer_gstin'],
+    'hsn': 'hsn',
+    'rates': ['igst_rate', 'cgst_rate', 'sgst_rate'],
+    'amounts': ['taxable_value', 'invoice_value', 'igst', 'cgst', 'sgst'],
+    'unique': ['order_id', 'invoice_id', 'event_type', 'event_sub_type'],
+}
+
+# Line kinds derived from the event columns
+KIND_SALE = 'sale'
+KIND_RETURN = 'return'
+KIND_CANCELLATION = 'cancellation'
+KIND_RETURN_CANCELLATION = 'return_cancellation'
+
+GROUP_KEYS = ['state_code', 'rate', 'hsn', 'is_b2b']
+LINE_VALUES = ['quantity', 'taxable_value', 'tax', 'invoice_value']
+B2B_FIELDS = ['buyer_gstin', 'buyer_name', 'invoice_id', 'invoice_date', 'state_code', 'rate', 'kind',
+              'taxable_value', 'tax', 'invoice_value']
+
+
+def _zeros(chunk):
+    return pd.Series(0.0, index=chunk.index)
+
+
+def _text(chunk, field):
+    """An optional text column, blank when the report does not have it."""
+    return chunk[field] if field in chunk else pd.Series('', index=chunk.index, dtype='string')
+
+
+def classify_events(chunk):
+    """
+    Returns (kind, sign) arrays for each line. The sub type is more specific
+    than the event type when both exist ('Return Cancellation' reverses a
+    return, so it counts as a sale again).
+    """
+    event = chunk['event_type'].astype('string')
+    if 'event_sub_type' in chunk:
+        event = chunk['event_sub_type'].astype('string').fillna(event)
+    kind = map_distinct(event, _event_kinds).to_numpy(dtype=object)
+    sign = np.where((kind == KIND_RETURN) | (kind == KIND_CANCELLATION), -1.0, 1.0)
+    return kind, sign
+
+
+def _event_kinds(events):
+    """Line kind per distinct event name."""
+    event = events.str.upper().fillna('')
+    is_return_cancel = event.str.contains('RETURN', regex=False) & event.str.contains('CANCEL', regex=False)
+    is_return = event.str.contains('RETURN', regex=False) & ~is_return_cancel
+    is_cancel = event.str.contains('CANCEL', regex=False) & ~is_return_cancel
+    kind = np.select(
+        [is_return_cancel.to_numpy(dtype=bool), is_return.to_numpy(dtype=bool), is_cancel.to_numpy(dtype=bool)],
+        [KIND_RETURN_CANCELLATION, KIND_RETURN, KIND_CANCELLATION],
+        default=KIND_SALE,
+    )
+    return pd.Series(kind, dtype=object)
+
+
+def prepare_lines(chunk, seller_gstin=None):
+    """
+    Converts one chunk of canonical Sales Report lines into signed numeric
+    lines keyed by place of supply, rate and HSN. Rows belonging to another
+    seller GSTIN (multi-GSTIN exports) are dropped when `seller_gstin` is given.
+    """
+    if seller_gstin and 'seller_gstin' in chunk:
+        own = map_distinct(chunk['seller_gstin'], lambda gstins: gstins.fillna('').str.upper().isin([seller_gstin.upper(), '']))
+        chunk = chunk[own.to_numpy(dtype=bool)]
+
+    kind, sign = classify_events(chunk)
+
+    igst_rate = normalize_rates(chunk['igst_rate']).fillna(0) if 'igst_rate' in chunk else _zeros(chunk)
+    cgst_rate = normalize_rates(chunk['cgst_rate']).fillna(0) if 'cgst_rate' in chunk else _zeros(chunk)
+    sgst_rate = normalize_rates(chunk['sgst_rate']).fillna(0) if 'sgst_rate' in chunk else _zeros(chunk)
+    rate = igst_rate.where(igst_rate > 0, cgst_rate + sgst_rate)
+
+    taxable = parse_amounts(chunk['taxable_value']).abs()
+    reported_tax = _zeros(chunk)
+    for column in ('igst', 'cgst', 'sgst'):
+        if column in chunk:
+            reported_tax = reported_tax + parse_amounts(chunk[column]).abs()
+    tax = reported_tax.where(reported_tax > 0, taxable * rate / 100)
+    if 'invoice_value' in chunk:
+        invoice_value = parse_amounts(chunk['invoice_value']).abs()
+    else:
+        invoice_value = taxable + tax
+    quantity = parse_amounts(chunk['quantity']).abs() if 'quantity' in chunk else _zeros(chunk)
+
+    buyer_gstin = _text(chunk, 'buyer_gstin').str.upper().str.strip()
+
+    return pd.DataFrame({
+        'state_code': state_codes(chunk['delivery_state']).fillna(''),
+        'rate': rate.round(2),
+        'hsn': normalize_hsn(chunk['hsn']),
+        'is_b2b': is_gstin_like(buyer_gstin),
+        'kind': kind,
+        'quantity': quantity * sign,
+        'taxable_value': taxable * sign,
+        'tax': tax * sign,
+        'invoice_value': invoice_value * sign,
+        'lines': 1,
+        'buyer_gstin': buyer_gstin,
+        'buyer_name': _text(chunk, 'buyer_name'),
+        'invoice_id': _text(chunk, 'invoice_id'),
+        'invoice_date': _text(chunk, 'invoice_date'),
+    })
+
+
+@timed()
+def compute_flipkart_gstr1(chunks, seller_gstin, ecommerce_gstin=FLIPKART_GSTIN):
+    """
+    Computes the GSTR-1 tables from canonical Sales Report chunks. Returns a
+    dict with 'b2b', 'cdnr', 'b2cs' and 'hsn' frames plus a 'summary' dict.
+    """
+    seller_state = gstin_state_code(seller_gstin)
+    with stage('flipkart.lines'):
+        prepared = (prepare_lines(chunk, seller_gstin) for chunk in chunks)
+        totals, by_kind, b2b_lines = consume(
+            prepared,
+            GroupTotals(GROUP_KEYS, LINE_VALUES),
+            GroupTotals(['kind'], ['lines', 'taxable_value']),
+            ColumnCollector(B2B_FIELDS, where='is_b2b'),
+        )
+
+    with stage('flipkart.b2cs_hsn'):
+        net = with_tax_split(totals, seller_state)
+        b2cs = build_b2cs(net[~net['is_b2b'].astype(bool)], ecommerce_gstin)
+        hsn = build_hsn(net)
+
+    with stage('flipkart.b2b_cdnr', lines=len(b2b_lines)):
+        b2b, cdnr = build_registered(b2b_lines, b2b_lines['kind'] == KIND_RETURN, seller_state, ecommerce_gstin)
+
+    lines_by_kind = by_kind.set_index('kind')['lines']
+    known_state = net['state_code'] != ''
+    summary = {
+        'sales_lines': int(lines_by_kind.get(KIND_SALE, 0) + lines_by_kind.get(KIND_RETURN_CANCELLATION, 0)),
+        'return_lines': int(lines_by_kind.get(KIND_RETURN, 0)),
+        'cancellation_lines': int(lines_by_kind.get(KIND_CANCELLATION, 0)),
+        'gross_taxable_value': round(float(by_kind['taxable_value'].clip(lower=0).sum()), 2),
+        'returns_taxable_value': round(float(-by_kind['taxable_value'].clip(upper=0).sum()), 2),
+        'net_taxable_value': round(float(net['taxable_value'].sum()), 2),
+        'igst': round(float(net['igst'].sum()), 2),
+        'cgst': round(float(net['cgst'].sum()), 2),
+        'sgst': round(float(net['sgst'].sum()), 2),
+        'unmapped_state_taxable_value': round(float(net.loc[~known_state, 'taxable_value'].sum()), 2),
+        'b2b_invoices': int(b2b['Invoice Number'].nunique()),
+        'credit_notes': int(cdnr['Note Number'].nunique()),
+    }
+    return {'b2b': b2b, 'cdnr': cdnr, 'b2cs': b2cs, 'hsn': hsn, 'summary': summary}
+
+
+@timed()
+def process_flipkart_sales_report(sales_report, seller_gstin, ecommerce_gstin=FLIPKART_GSTIN, strict=True):
+    """
+    Runs the full computation on an uploaded/on-disk Flipkart Sales Report,
+    validating it first (see process_meesho_reports for `strict`).
+    """
+    with stage('flipkart.validate'):
+        validation = settle_validations([validate_report(
+            sales_report, SALES_ALIASES, SALES_REQUIRED, SALES_SCHEMA, SALES_CHECKS,
+            preferred_sheets=SALES_REPORT_SHEETS,
+        )], strict)
+    chunks = iter_canonical_chunks(sales_report, SALES_ALIASES, SALES_REQUIRED, SALES_SCHEMA,
+                                   preferred_sheets=SALES_REPORT_SHEETS)
+    return with_validation(compute_flipkart_gstr1(chunks, seller_gstin, ecommerce_gstin), validation)
@@ -0,0 +1,462 @@
+"""
+Shared GST building blocks for the GSTR-1 processors.
+
+Holds the precomputed state lookup tables (state names, abbreviations and
+codes -> two-digit GST state code), place-of-supply labels, the IGST vs.
+CGST/SGST split and the header-alias resolution that lets every processor
+read marketplace reports whose column names drift between exports.
+"""
+import re
+
+import numpy as np
+import pandas as pd
+
+from ecommsolutions.file_probe import probe_excel_sheet, probe_file
+from ecommsolutions.ingestion import map_distinct, parse_dates
+from ecommsolutions.report_cache import iter_cached_report_chunks
+
+# GST state codes as used on the GST portal (Place of Supply)
+GST_STATES = {
+    '01': 'Jammu and Kashmir',
+    '02': 'Himachal Pradesh',
+    '03': 'Punjab',
+    '04': 'Chandigarh',
+    '05': 'Uttarakhand',
+    '06': 'Haryana',
+    '07': 'Delhi',
+    '08': 'Rajasthan',
+    '09': 'Uttar Pradesh',
+    '10': 'Bihar',
+    '11': 'Sikkim',
+    '12': 'Arunachal Pradesh',
+    '13': 'Nagaland',
+    '14': 'Manipur',
+    '15': 'Mizoram',
+    '16': 'Tripura',
+    '17': 'Meghalaya',
+    '18': 'Assam',
+    '19': 'West Bengal',
+    '20': 'Jharkhand',
+    '21': 'Odisha',
+    '22': 'Chhattisgarh',
+    '23': 'Madhya Pradesh',
+    '24': 'Gujarat',
+    '26': 'Dadra and Nagar Haveli and Daman and Diu',
+    '27': 'Maharashtra',
+    '29': 'Karnataka',
+    '30': 'Goa',
+    '31': 'Lakshadweep',
+    '32': 'Kerala',
+    '33': 'Tamil Nadu',
+    '34': 'Puducherry',
+    '35': 'Andaman and Nicobar Islands',
+    '36': 'Telangana',
+    '37': 'Andhra Pradesh',
+    '38': 'Ladakh',
+    '97': 'Other Territory',
+}
+
+# Alternate spellings and postal abbreviations seen in marketplace reports
+_STATE_ALIASES = {
+    '01': ['JAMMU KASHMIR', 'J&K', 'JK'],
+    '02': ['HP'],
+    '03': ['PB'],
+    '04': ['CH'],
+    '05': ['UTTARANCHAL', 'UK', 'UT'],
+    '06': ['HR'],
+    '07': ['NEW DELHI', 'NCT OF DELHI', 'DL'],
+    '08': ['RJ'],
+    '09': ['UP'],
+    '10': ['BR'],
+    '11': ['SK'],
+    '12': ['AR'],
+    '13': ['NL'],
+    '14': ['MN'],
+    '15': ['MZ'],
+    '16': ['TR'],
+    '17': ['ML'],
+    '18': ['AS'],
+    '19': ['WB'],
+    '20': ['JH'],
+    '21': ['ORISSA', 'OR', 'OD'],
+    '22': ['CHATTISGARH', 'CG', 'CT'],
+    '23': ['MP'],
+    '24': ['GJ'],
+    '26': ['DADRA AND NAGAR HAVELI', 'DAMAN AND DIU', 'DADRA NAGAR HAVELI', 'DN', 'DD'],
+    '27': ['MH'],
+    '29': ['KA'],
+    '30': ['GA'],
+    '31': ['LD'],
+    '32': ['KL'],
+    '33': ['TN'],
+    '34': ['PONDICHERRY', 'PY'],
+    '35': ['ANDAMAN AND NICOBAR', 'ANDAMAN NICOBAR ISLANDS', 'AN'],
+    '36': ['TELENGANA', 'TS', 'TG'],
+    '37': ['AP'],
+    '38': ['LA'],
+}
+
+# GST rates (in %) accepted on the GST portal for goods (the 40% slab applies from 22 September 2025)
+ALLOWED_GST_RATES = (0.0, 0.1, 0.25, 1.0, 1.5, 3.0, 5.0, 6.0, 7.5, 12.0, 18.0, 28.0, 40.0)
+
+
+def _state_key(value):
+    """Canonical lookup key: upper-case letters/digits only, '&' read as 'AND'."""
+    text = str(value).upper().replace('&', ' AND ')
+    return re.sub(r'[^A-Z0-9]', '', text)
+
+
+def _build_state_lookup():
+    lookup = {}
+    for code, name in GST_STATES.items():
+        lookup[_state_key(name)] = code
+        lookup[code] = code
+        lookup[str(int(code))] = code
+    for code, aliases in _STATE_ALIASES.items():
+        for alias in aliases:
+            lookup[_state_key(alias)] = code
+    return lookup
+
+
+# Precomputed once at import: every known spelling -> two-digit state code
+STATE_CODE_LOOKUP = _build_state_lookup()
+
+# '29' -> '29-Karnataka', the Place Of Supply label used by the GST offline tool
+PLACE_OF_SUPPLY = {code: f"{code}-{name}" for code, name in GST_STATES.items()}
+
+
+def state_codes(values):
+    """
+    Maps a Series of state names/abbreviations/codes to two-digit GST state
+    codes. Only the distinct values are looked up (reports repeat a few dozen
+    states millions of times); unknown states become <NA>.
+    """
+    codes, uniques = pd.factorize(values)
+    mapped = np.array([STATE_CODE_LOOKUP.get(_state_key(value)) for value in uniques] + [None], dtype=object)
+    return pd.Series(mapped[codes], index=values.index, dtype='string')
+
+
+def place_of_supply(codes):
+    """Maps two-digit state codes to '29-Karnataka' style labels."""
+    return codes.map(PLACE_OF_SUPPLY).astype('string')
+
+
+def gstin_state_code(gstin):
+    """The first two characters of a GSTIN are the registration state code."""
+    return str(gstin).strip()[:2]
+
+
+def normalize_rates(values):
+    """
+    Returns GST rates in percent. Some exports write 0.18 instead of 18, so
+    fractional rates are scaled up; values are rounded to two decimals.
+    Rates read as float32 are rounded first so 0.1% stays 0.1, not 0.100000001.
+    """
+    rates = pd.to_numeric(values, errors='coerce').astype('float64').round(6)
+    rates = rates.where(~((rates > 0) & (rates < 1) & ~rates.isin([0.1, 0.25])), rates * 100)
+    return rates.round(2)
+
+
+def split_tax(tax, pos_codes, seller_state_code):
+    """
+    Splits tax into (IGST, CGST, SGST) arrays: supplies within the seller's
+    state are intra-state (half CGST, half SGST), everything else is IGST.
+    """
+    tax = np.asarray(tax, dtype='float64')
+    intra = (pos_codes == seller_state_code).fillna(False).to_numpy(dtype=bool)
+    igst = np.where(intra, 0.0, tax)
+    cgst = np.where(intra, tax / 2, 0.0)
+    return igst, cgst, cgst.copy()
+
+
+def with_tax_split(frame, seller_state_code):
+    """Adds 'igst', 'cgst' and 'sgst' columns to a frame with 'tax' and 'state_code'."""
+    frame = frame.copy()
+    frame['igst'], frame['cgst'], frame['sgst'] = split_tax(frame['tax'], frame['state_code'], seller_state_code)
+    return frame
+
+
+def normalize_hsn(values):
+    """HSN codes as text without the '.0' Excel adds to numeric cells."""
+    return map_distinct(values, lambda codes: codes.str.strip().str.replace(r'\.0$', '', regex=True).fillna(''))
+
+
+# --- GSTR-1 section builders (GST offline tool column names) ---
+
+B2CS_COLUMNS = [
+    'Type', 'Place Of Supply', 'Rate', 'Applicable % of Tax Rate', 'Taxable Value', 'Cess Amount',
+    'E-Commerce GSTIN', 'Integrated Tax Amount', 'Central Tax Amount', 'State/UT Tax Amount',
+]
+HSN_COLUMNS = [
+    'HSN', 'Description', 'UQC', 'Total Quantity', 'Total Value', 'Rate', 'Taxable Value',
+    'Integrated Tax Amount', 'Central Tax Amount', 'State/UT Tax Amount', 'Cess Amount',
+]
+
+_TAX_COLUMNS = ['taxable_value', 'igst', 'cgst', 'sgst']
+
+
+def _nonzero(frame, columns):
+    """Drops rows where every listed amount nets to (rounded) zero."""
+    return frame[(frame[columns].abs() > 0.005).any(axis=1)]
+
+
+def build_b2cs(net, ecommerce_gstin=None):
+    """
+    B2C (small) section from net lines with 'state_code', 'rate' and the
+    taxable/IGST/CGST/SGST columns; lines with an unknown state are skipped.
+    """
+    known = net[net['state_code'] != '']
+    b2cs = _nonzero(known.groupby(['state_code', 'rate'])[_TAX_COLUMNS].sum().reset_index(), _TAX_COLUMNS)
+    return pd.DataFrame({
+        'Type': 'E' if ecommerce_gstin else 'OE',
+        'Place Of Supply': place_of_supply(b2cs['state_code']).to_numpy(),
+        'Rate': b2cs['rate'].to_numpy(),
+        'Applicable % of Tax Rate': '',
+        'Taxable Value': b2cs['taxable_value'].round(2).to_numpy(),
+        'Cess Amount': 0.0,
+        'E-Commerce GSTIN': ecommerce_gstin or '',
+        'Integrated Tax Amount': b2cs['igst'].round(2).to_numpy(),
+        'Central Tax Amount': b2cs['cgst'].round(2).to_numpy(),
+        'State/UT Tax Amount': b2cs['sgst'].round(2).to_numpy(),
+    }, columns=B2CS_COLUMNS)
+
+
+def build_hsn(net):
+    """HSN summary from net lines with 'hsn', 'rate', 'quantity', 'invoice_value' and tax columns."""
+    value_columns = ['quantity', 'invoice_value'] + _TAX_COLUMNS
+    hsn = _nonzero(net.groupby(['hsn', 'rate'])[value_columns].sum().reset_index(), value_columns)
+    return pd.DataFrame({
+        'HSN': hsn['hsn'].to_numpy(),
+        'Description': '',
+        'UQC': 'NOS-NUMBERS',
+        'Total Quantity': hsn['quantity'].round(3).to_numpy(),
+        'Total Value': hsn['invoice_value'].round(2).to_numpy(),
+        'Rate': hsn['rate'].to_numpy(),
+        'Taxable Value': hsn['taxable_value'].round(2).to_numpy(),
+        'Integrated Tax Amount': hsn['igst'].round(2).to_numpy(),
+        'Central Tax Amount': hsn['cgst'].round(2).to_numpy(),
+        'State/UT Tax Amount': hsn['sgst'].round(2).to_numpy(),
+        'Cess Amount': 0.0,
+    }, columns=HSN_COLUMNS)
+
+
+B2B_COLUMNS = [
+    'GSTIN/UIN of Recipient', 'Receiver Name', 'Invoice Number', 'Invoice date', 'Invoice Value',
+    'Place Of Supply', 'Reverse Charge', 'Applicable % of Tax Rate', 'Invoice Type', 'E-Commerce GSTIN',
+    'Rate', 'Taxable Value', 'Cess Amount', 'Integrated Tax Amount', 'Central Tax Amount', 'State/UT Tax Amount',
+]
+CDNR_COLUMNS = [
+    'GSTIN/UIN of Recipient', 'Receiver Name', 'Note Number', 'Note Date', 'Note Type', 'Place Of Supply',
+    'Reverse Charge', 'Note Supply Type', 'Note Value', 'Applicable % of Tax Rate', 'Rate', 'Taxable Value',
+    'Cess Amount', 'Integrated Tax Amount', 'Central Tax Amount', 'State/UT Tax Amount',
+]
+
+
+def _portal_dates(values):
+    """Dates in the dd-Mon-yyyy format the offline tool expects."""
+    return parse_dates(values).dt.strftime('%d-%b-%Y').fillna('')
+
+
+def _documents_by_rate(lines):
+    """
+    Collapses B2B lines to one row per (recipient, document, rate), with the
+    document value, recipient name, date and place of supply of the document.
+    """
+    keys = ['buyer_gstin', 'invoice_id', 'rate']
+    value_columns = ['invoice_value'] + _TAX_COLUMNS
+    docs = lines.groupby(keys, sort=False)[value_columns].sum().reset_index()
+    firsts = lines.groupby(['buyer_gstin', 'invoice_id'], sort=False)[['buyer_name', 'invoice_date', 'state_code']].first()
+    docs = docs.join(firsts, on=['buyer_gstin', 'invoice_id'])
+    docs['document_value'] = docs.groupby(['buyer_gstin', 'invoice_id'], sort=False)['invoice_value'].transform('sum')
+    return _nonzero(docs, _TAX_COLUMNS)
+
+
+def build_b2b(lines, ecommerce_gstin=None):
+    """
+    B2B invoices section from registered-buyer lines with 'buyer_gstin',
+    'buyer_name', 'invoice_id', 'invoice_date', 'state_code', 'rate',
+    'invoice_value' and the tax columns. Cancellation lines (negative) net off
+    against their invoice.
+    """
+    docs = _documents_by_rate(lines)
+    return pd.DataFrame({
+        'GSTIN/UIN of Recipient': docs['buyer_gstin'].to_numpy(),
+        'Receiver Name': docs['buyer_name'].fillna('').to_numpy(),
+        'Invoice Number': docs['invoice_id'].to_numpy(),
+        'Invoice date': _portal_dates(docs['invoice_date']).to_numpy(),
+        'Invoice Value': docs['document_value'].round(2).to_numpy(),
+        'Place Of Supply': place_of_supply(docs['state_code']).to_numpy(),
+        'Reverse Charge': 'N',
+        'Applicable % of Tax Rate': '',
+        'Invoice Type': 'Regular B2B',
+        'E-Commerce GSTIN': ecommerce_gstin or '',
+        'Rate': docs['rate'].to_numpy(),
+        'Taxable Value': docs['taxable_value'].round(2).to_numpy(),
+        'Cess Amount': 0.0,
+        'Integrated Tax Amount': docs['igst'].round(2).to_numpy(),
+        'Central Tax Amount': docs['cgst'].round(2).to_numpy(),
+        'State/UT Tax Amount': docs['sgst'].round(2).to_numpy(),
+    }, columns=B2B_COLUMNS)
+
+
+def build_cdnr(lines):
+    """
+    Credit notes to registered buyers from return lines (same columns as
+    build_b2b; 'invoice_id' is the credit note number). Amounts are reported
+    as positive note values.
+    """
+    docs = _documents_by_rate(lines)
+    return pd.DataFrame({
+        'GSTIN/UIN of Recipient': docs['buyer_gstin'].to_numpy(),
+        'Receiver Name': docs['buyer_name'].fillna('').to_numpy(),
+        'Note Number': docs['invoice_id'].to_numpy(),
+        'Note Date': _portal_dates(docs['invoice_date']).to_numpy(),
+        'Note Type': 'C',
+        'Place Of Supply': place_of_supply(docs['state_code']).to_numpy(),
+        'Reverse Charge': 'N',
+        'Note Supply Type': 'Regular B2B',
+        'Note Value': docs['document_value'].abs().round(2).to_numpy(),
+        'Applicable % of Tax Rate': '',
+        'Rate': docs['rate'].to_numpy(),
+        'Taxable Value': docs['taxable_value'].abs().round(2).to_numpy(),
+        'Cess Amount': 0.0,
+        'Integrated Tax Amount': docs['igst'].abs().round(2).to_numpy(),
+        'Central Tax Amount': docs['cgst'].abs().round(2).to_numpy(),
+        'State/UT Tax Amount': docs['sgst'].abs().round(2).to_numpy(),
+    }, columns=CDNR_COLUMNS)
+
+
+def build_registered(lines, is_note, seller_state_code, ecommerce_gstin=None):
+    """
+    (B2B, CDNR) sections from the lines billed to registered buyers (the
+    build_b2b columns, with 'tax' still unsplit); `is_note` marks the credit
+    note (return/refund) lines, everything else nets into its invoice. A
+    document (invoice x rate) left with a negative net value (a cancellation
+    whose sale was filed in an earlier period) is reported as a credit note
+    instead, since the offline tool rejects negative B2B invoices; the other
+    rates of the same invoice stay in B2B.
+    """
+    if not len(lines):
+        empty = pd.DataFrame(columns=['buyer_gstin', 'buyer_name', 'invoice_id', 'invoice_date', 'state_code', 'rate',
+                                      'invoice_value'] + _TAX_COLUMNS)
+        return build_b2b(empty, ecommerce_gstin), build_cdnr(empty)
+    lines = with_tax_split(lines, seller_state_code)
+    is_note = np.asarray(is_note, dtype=bool)
+    invoice_value = lines['invoice_value'].where(~is_note, 0.0)
+    net_value = invoice_value.groupby([lines['buyer_gstin'], lines['invoice_id'], lines['rate']],
+                                      sort=False).transform('sum')
+    is_note = is_note | (net_value.round(2) < 0).to_numpy(dtype=bool)
+    return build_b2b(lines[~is_note], ecommerce_gstin), build_cdnr(lines[is_note])
+
+
+def merge_gstr1(results):
+    """
+    Combines GSTR-1 results from several platforms for one GSTIN and period.
+    B2CS and HSN rows are re-aggregated (the same place of supply / HSN and
+    rate can come from more than one platform); invoice-level sections,
+    document series and validation issues are concatenated; numeric summary
+    values are added up.
+    """
+    if len(results) == 1:
+        return results[0]
+
+    def stacked(key):
+        frames = [result[key] for result in results if key in result]
+        return pd.concat(frames, ignore_index=True) if frames else None
+
+    merged = {}
+    b2cs = stacked('b2cs')
+    if b2cs is not None:
+        keys = ['Type', 'Place Of Supply', 'Rate', 'Applicable % of Tax Rate', 'E-Commerce GSTIN']
+        b2cs = b2cs.groupby(keys, sort=False, dropna=False).sum(numeric_only=True).reset_index()
+        merged['b2cs'] = b2cs[B2CS_COLUMNS]
+    hsn = stacked('hsn')
+    if hsn is not None:
+        keys = ['HSN', 'Description', 'UQC', 'Rate']
+        hsn = hsn.groupby(keys, sort=False, dropna=False).sum(numeric_only=True).reset_index()
+        merged['hsn'] = hsn[HSN_COLUMNS]
+    for key in ('b2b', 'cdnr', 'docs', 'validation', 'validation_samples'):
+        frame = stacked(key)
+        if frame is not None:
+            merged[key] = frame
+
+    summary = {}
+    for result in results:
+        for name, value in result['summary'].items():
+            summary[name] = round(summary.get(name, 0) + value, 2) if isinstance(value, float) else summary.get(name, 0) + value
+    merged['summary'] = summary
+    return merged
+
+
+def is_gstin_like(values):
+    """True where a value has the shape of a 15-character GSTIN (format only, no checksum)."""
+    return values.astype('string').str.fullmatch(r'[0-9]{2}[A-Z0-9]{13}').fillna(False).astype(bool)
+
+
+# --- Reading reports by canonical field names ---
+
+def resolve_columns(columns, aliases, required):
+    """
+    Finds the report column for each canonical field. `aliases` maps field ->
+    candidate header names (matched case-insensitively, ignoring spaces and
+    punctuation). Returns {report column: field}; raises ValueError naming
+    the required fields that could not be found.
+    """
+    by_key = {}
+    for column in columns:
+        by_key.setdefault(_state_key(column), column)
+
+    resolved = {}
+    for field, candidates in aliases.items():
+        for candidate in candidates:
+            column = by_key.get(_state_key(candidate))
+            if column is not None:
+                resolved[column] = field
+                break
+
+    missing = [field for field in required if field not in resolved.values()]
+    if missing:
+        raise ValueError(f"Missing required column(s): {', '.join(missing)}")
+    return resolved
+
+
+def source_name(source, file_name=None):
+    """File name of an upload or path (needed to pick the CSV/XLSX reader)."""
+    if file_name:
+        return file_name
+    if hasattr(source, 'name'):
+        return source.name
+    return str(source)
+
+
+def canonical_columns(source, aliases, required, file_name=None, sheet=None, preferred_sheets=()):
+    """
+    (sheet, {report column: field}) of the sheet a report is read from.
+    Without an explicit `sheet`, the first sheet whose name is in
+    `preferred_sheets` (case-insensitive) is used, else the first sheet.
+    """
+    file_name = source_name(source, file_name)
+    header = probe_file(source, file_name, n_rows=0)
+    if sheet is None and file_name.endswith('.xlsx'):
+        wanted = {name.strip().lower() for name in preferred_sheets}
+        sheet = next((name for name in header['sheets'] if name.strip().lower() in wanted), header['sheets'][0])
+        if sheet != header['sheets'][0]:
+            header = probe_excel_sheet(source, sheet)
+    return sheet, resolve_columns(header['columns'], aliases, required)
+
+
+def iter_canonical_chunks(source, aliases, required, schema=None, file_name=None, sheet=None, preferred_sheets=()):
+    """
+    Streams a report (through the Parquet cache) with only the aliased columns,
+    renamed to their canonical field names. `schema` is keyed by field name;
+    the sheet is picked as in canonical_columns.
+    """
+    file_name = source_name(source, file_name)
+    sheet, mapping = canonical_columns(source, aliases, required, file_name, sheet, preferred_sheets)
+
+    report_schema = {column: (schema or {}).get(field) for column, field in mapping.items()}
+    report_schema = {column: kind for column, kind in report_schema.items() if kind}
+
+    chunks = iter_cached_report_chunks(source, file_name, sheet=sheet, usecols=list(mapping), schema=report_schema)
+    for chunk in chunks:
+        yield chunk.rename(columns=mapping)
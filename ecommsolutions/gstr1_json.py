@@ -0,0 +1,307 @@
+"""
+GSTR-1 JSON export.
+
+Turns the computed GSTR-1 tables (the same frames that go into the Excel
+download) into the JSON accepted by the GST portal's offline tool / "Prepare
+Offline" upload: b2b, b2cs, cdnr, hsn and doc_issue.
+
+The file is serialized incrementally: records are encoded one at a time and
+written to the output stream as they are produced, so a month with hundreds of
+thousands of B2B invoices never exists as one nested dict in memory. While
+writing, the taxable value and tax of every section are totalled so the JSON
+can be checked against the tables before it is offered for download.
+"""
+import json
+from io import BytesIO, TextIOWrapper
+
+from ecommsolutions.ingestion import parse_dates
+from ecommsolutions.instrumentation import timed
+
+GSTR1_JSON_VERSION = 'GST3.1.6'
+
+MONTHS = ['January', 'February', 'March', 'April', 'May', 'June', 'July', 'August', 'September', 'October',
+          'November', 'December']
+
+# Table 13 document types (doc_num in doc_issue)
+DOC_TYPE_NUMBERS = {
+    'Invoices for outward supply': 1,
+    'Invoices for inward supply from unregistered person': 2,
+    'Revised Invoice': 3,
+    'Debit Note': 4,
+    'Credit Note': 5,
+}
+
+SUPPLY_TYPE_CODES = {'Regular B2B': 'R', 'SEZ supplies with payment': 'SEWP', 'SEZ supplies without payment': 'SEWOP',
+                     'Deemed Exp': 'DE'}
+
+# Excel column → JSON amount key, shared by every section
+AMOUNT_KEYS = {
+    'Taxable Value': 'txval',
+    'Integrated Tax Amount': 'iamt',
+    'Central Tax Amount': 'camt',
+    'State/UT Tax Amount': 'samt',
+    'Cess Amount': 'csamt',
+}
+TOTAL_KEYS = ['txval', 'iamt', 'camt', 'samt']
+
+DEFAULT_TOLERANCE = 1.0
+
+_SEPARATORS = (',', ':')
+
+
+def return_period(filing_period):
+    """'April - 2025' (the filing period selector) → '042025' (the portal's fp); '042025' is returned as is."""
+    if str(filing_period).isdigit() and len(str(filing_period)) == 6:
+        return str(filing_period)
+    month, _, year = str(filing_period).partition('-')
+    return f"{MONTHS.index(month.strip()) + 1:02d}{year.strip()}"
+
+
+def _number(value):
+    """Rounded to paise; whole numbers are written without a decimal part (rates)."""
+    value = round(float(value), 2)
+    return int(value) if value.is_integer() else value
+
+
+def _pos_codes(places):
+    """'29-Karnataka' → '29'."""
+    return places.astype('string').str.slice(0, 2).fillna('').tolist()
+
+
+def _json_dates(values):
+    """Offline-tool dates (dd-Mon-yyyy) → portal JSON dates (dd-mm-yyyy)."""
+    return parse_dates(values).dt.strftime('%d-%m-%Y').fillna('').tolist()
+
+
+def _amount_columns(frame):
+    return {key: frame[column].astype('float64').tolist() for column, key in AMOUNT_KEYS.items()}
+
+
+def _add_totals(section_totals, item):
+    for key in TOTAL_KEYS:
+        section_totals[key] += item[key]
+
+
+def _item(amounts, rate, i):
+    item = {'rt': _number(rate[i])}
+    for key, values in amounts.items():
+        item[key] = _number(values[i])
+    return item
+
+
+# --- Sections ---
+
+def _sorted_by_party(frame, number_column):
+    return frame.sort_values(['GSTIN/UIN of Recipient', number_column], kind='stable', ignore_index=True)
+
+
+def _comma_separated(records):
+    for n, record in enumerate(records):
+        yield record if n == 0 else ',' + record
+
+
+def _iter_party_documents(frame, number_column, number_key, list_key, document, section_totals):
+    """
+    Yields the JSON fragments of a b2b / cdnr list, [{'ctin', <documents>}],
+    from a frame sorted by recipient and document number. Rows of the same
+    document (one per tax rate) become its 'itms'; `document(i)` returns the
+    header fields of the document on row i. Each document is encoded as soon
+    as it is complete, so even one recipient with thousands of invoices is
+    never held as a whole.
+    """
+    ctins = frame['GSTIN/UIN of Recipient'].astype('string').fillna('').tolist()
+    numbers = frame[number_column].astype('string').fillna('').tolist()
+    amounts = _amount_columns(frame)
+    rates = frame['Rate'].astype('float64').tolist()
+
+    party, current = None, None
+    for i, (ctin, number) in enumerate(zip(ctins, numbers)):
+        if ctin != party or current[number_key] != number:
+            if current is not None:
+                yield json.dumps(current, separators=_SEPARATORS)
+            if ctin != party:
+                prefix = '' if party is None else ']},'
+                yield f'{prefix}{{"ctin":{json.dumps(ctin)},"{list_key}":['
+                party = ctin
+            else:
+                yield ','
+            current = {number_key: number, **document(i), 'itms': []}
+        item = _item(amounts, rates, i)
+        _add_totals(section_totals, item)
+        current['itms'].append({'num': len(current['itms']) + 1, 'itm_det': item})
+    if current is not None:
+        yield json.dumps(current, separators=_SEPARATORS) + ']}'
+
+
+def iter_b2b(b2b, section_totals):
+    b2b = _sorted_by_party(b2b, 'Invoice Number')
+    dates = _json_dates(b2b['Invoice date'])
+    values = b2b['Invoice Value'].astype('float64').tolist()
+    pos = _pos_codes(b2b['Place Of Supply'])
+    reverse_charge = b2b['Reverse Charge'].astype('string').fillna('N').tolist()
+    inv_types = b2b['Invoice Type'].map(SUPPLY_TYPE_CODES).fillna('R').tolist()
+    etins = b2b['E-Commerce GSTIN'].astype('string').fillna('').tolist()
+
+    def document(i):
+        header = {'idt': dates[i], 'val': _number(values[i]), 'pos': pos[i], 'rchrg': reverse_charge[i],
+                  'inv_typ': inv_types[i]}
+        if etins[i]:
+            header['etin'] = etins[i]
+        return header
+
+    return _iter_party_documents(b2b, 'Invoice Number', 'inum', 'inv', document, section_totals)
+
+
+def iter_cdnr(cdnr, section_totals):
+    cdnr = _sorted_by_party(cdnr, 'Note Number')
+    dates = _json_dates(cdnr['Note Date'])
+    values = cdnr['Note Value'].astype('float64').tolist()
+    pos = _pos_codes(cdnr['Place Of Supply'])
+    note_types = cdnr['Note Type'].astype('string').fillna('C').tolist()
+    reverse_charge = cdnr['Reverse Charge'].astype('string').fillna('N').tolist()
+    inv_types = cdnr['Note Supply Type'].map(SUPPLY_TYPE_CODES).fillna('R').tolist()
+
+    def document(i):
+        return {'ntty': note_types[i], 'nt_dt': dates[i], 'val': _number(values[i]), 'pos': pos[i],
+                'rchrg': reverse_charge[i], 'inv_typ': inv_types[i]}
+
+    return _iter_party_documents(cdnr, 'Note Number', 'nt_num', 'nt', document, section_totals)
+
+
+def iter_b2cs(b2cs, section_totals, seller_state_code):
+    pos = _pos_codes(b2cs['Place Of Supply'])
+    types = b2cs['Type'].astype('string').fillna('OE').tolist()
+    etins = b2cs['E-Commerce GSTIN'].astype('string').fillna('').tolist()
+    rates = b2cs['Rate'].astype('float64').tolist()
+    amounts = _amount_columns(b2cs)
+    for i in range(len(b2cs)):
+        record = {'sply_ty': 'INTRA' if pos[i] == seller_state_code else 'INTER', 'pos': pos[i], 'typ': types[i]}
+        if types[i] == 'E' and etins[i]:
+            record['etin'] = etins[i]
+        record.update(_item(amounts, rates, i))
+        _add_totals(section_totals, record)
+        yield json.dumps(record, separators=_SEPARATORS)
+
+
+def iter_hsn(hsn, section_totals):
+    codes = hsn['HSN'].astype('string').fillna('').tolist()
+    descriptions = hsn['Description'].astype('string').fillna('').tolist()
+    uqcs = hsn['UQC'].astype('string').str.split('-').str[0].fillna('OTH').tolist()
+    quantities = hsn['Total Quantity'].astype('float64').tolist()
+    values = hsn['Total Value'].astype('float64').tolist()
+    rates = hsn['Rate'].astype('float64').tolist()
+    amounts = _amount_columns(hsn)
+    for i in range(len(hsn)):
+        record = {'num': i + 1, 'hsn_sc': codes[i], 'desc': descriptions[i], 'uqc': uqcs[i],
+                  'qty': round(quantities[i], 3), 'val': _number(values[i])}
+        record.update(_item(amounts, rates, i))
+        _add_totals(section_totals, record)
+        yield json.dumps(record, separators=_SEPARATORS)
+
+
+def doc_issue_record(docs):
+    """Table 13 is a handful of rows, so it is built as one record."""
+    details = []
+    for nature, rows in docs.groupby('Nature of Document', sort=False):
+        details.append({
+            'doc_num': DOC_TYPE_NUMBERS.get(nature, 1),
+            'doc_typ': nature,
+            'docs': [
+                {'num': n + 1, 'from': str(row['Sr. No. From']), 'to': str(row['Sr. No. To']),
+                 'totnum': int(row['Total Number']), 'cancel': int(row['Cancelled']),
+                 'net_issue': int(row['Total Number']) - int(row['Cancelled'])}
+                for n, (_, row) in enumerate(rows.iterrows())
+            ],
+        })
+    return {'doc_det': details}
+
+
+# --- Writer ---
+
+def iter_gstr1_json(gstr1, gstin, fp, totals=None):
+    """
+    Yields the GSTR-1 JSON as text fragments. Sections missing from `gstr1`
+    (e.g. Meesho has no b2b) or empty are left out. When a `totals` dict is
+    given it is filled with the taxable value and tax written per section.
+    """
+    totals = {} if totals is None else totals
+    seller_state_code = str(gstin)[:2]
+    yield json.dumps({'gstin': gstin, 'fp': fp, 'version': GSTR1_JSON_VERSION, 'hash': 'hash'},
+                     separators=_SEPARATORS)[:-1]
+
+    sections = [
+        ('b2b', iter_b2b),
+        ('b2cs', lambda frame, section: _comma_separated(iter_b2cs(frame, section, seller_state_code))),
+        ('cdnr', iter_cdnr),
+    ]
+    for key, fragments in sections:
+        frame = gstr1.get(key)
+        if frame is None or frame.empty:
+            continue
+        section = totals.setdefault(key, dict.fromkeys(TOTAL_KEYS, 0.0))
+        yield f',"{key}":['
+        yield from fragments(frame, section)
+        yield ']'
+
+    hsn = gstr1.get('hsn')
+    if hsn is not None and not hsn.empty:
+        section = totals.setdefault('hsn', dict.fromkeys(TOTAL_KEYS, 0.0))
+        yield ',"hsn":{"data":['
+        yield from _comma_separated(iter_hsn(hsn, section))
+        yield ']}'
+
+    docs = gstr1.get('docs')
+    if docs is not None and not docs.empty:
+        yield ',"doc_issue":' + json.dumps(doc_issue_record(docs), separators=_SEPARATORS)
+    yield '}'
+
+
+def write_gstr1_json(gstr1, gstin, fp, stream):
+    """Writes the JSON to a text stream; returns the per-section totals written."""
+    totals = {}
+    for fragment in iter_gstr1_json(gstr1, gstin, fp, totals):
+        stream.write(fragment)
+    return totals
+
+
+def table_totals(gstr1):
+    """Per-section taxable value and tax of the GSTR-1 tables (the Excel sheets)."""
+    totals = {}
+    for key in ('b2b', 'b2cs', 'cdnr', 'hsn'):
+        frame = gstr1.get(key)
+        if frame is None or frame.empty:
+            continue
+        totals[key] = {json_key: round(float(frame[column].astype('float64').sum()), 2)
+                       for column, json_key in AMOUNT_KEYS.items() if json_key in TOTAL_KEYS}
+    return totals
+
+
+def validate_totals(written, gstr1, tolerance=DEFAULT_TOLERANCE):
+    """
+    Compares the totals written to the JSON with the tables. Returns a list of
+    mismatch messages; empty when every section agrees within `tolerance`
+    (per-item rounding to paise can drift by a few paise over many rows).
+    """
+    problems = []
+    expected = table_totals(gstr1)
+    for key, amounts in expected.items():
+        actual = written.get(key, dict.fromkeys(TOTAL_KEYS, 0.0))
+        for json_key, value in amounts.items():
+            if abs(actual[json_key] - value) > tolerance:
+                problems.append(f"{key}.{json_key}: JSON {actual[json_key]:,.2f} vs Excel {value:,.2f}")
+    return problems
+
+
+@timed()
+def gstr1_json_bytes(gstr1, gstin, fp):
+    """
+    Serializes to UTF-8 bytes for a download button. Returns (data, problems)
+    where `problems` is the validate_totals result.
+    """
+    buffer = BytesIO()
+    stream = TextIOWrapper(buffer, encoding='utf-8')
+    written = write_gstr1_json(gstr1, gstin, fp, stream)
+    stream.flush()
+    data = buffer.getvalue()
+    stream.detach()
+    return data, validate_totals(written, gstr1)
@@ -0,0 +1,389 @@
+"""
+Chunked ingestion of marketplace reports.
+
+CSV files are streamed with `pd.read_csv(chunksize=...)` and XLSX files row by
+row through a read-only openpyxl workbook, so only one chunk is materialized
+at a time. Every chunk is normalized and dtype-coerced by the same code and
+then handed to incremental aggregators (see `consume`), which keeps peak
+memory bounded by the chunk size rather than by the report size.
+
+Typical use:
+
+    chunks = iter_report_chunks(upload, upload.name, schema={'Order ID': 'text', 'Amount': 'amount'})
+    row_count, totals = consume(chunks, RowCounter(), GroupTotals(['Order ID'], ['Amount']))
+"""
+import numpy as np
+import pandas as pd
+
+from ecommsolutions.file_probe import dedupe_headers, open_source
+
+# Rows per chunk; ~100k rows of a typical marketplace report is a few tens of MB
+DEFAULT_CHUNK_ROWS = 100_000
+
+# Column kinds understood by normalize_chunk:
+#   text      identifiers and free text (order IDs, invoice numbers, SKUs)
+#   category  labels repeated across millions of rows (states, event types, couriers)
+#   amount    money, float64 (float32 would lose paise above ~₹1 lakh)
+#   rate      few-valued numbers (tax rates, quantities), parsed per distinct value, float32
+#   int, float, date
+COLUMN_KINDS = ('text', 'category', 'amount', 'rate', 'int', 'float', 'date')
+
+# Kind of every canonical field the engines use; schemas are derived from it
+# (field_schema) so a field is coerced the same way on every platform.
+FIELD_KINDS = {
+    'order_id': 'text', 'invoice_id': 'text', 'invoice_no': 'text', 'sku': 'text', 'buyer_gstin': 'text',
+    'buyer_name': 'text', 'date': 'text', 'invoice_date': 'text', 'shipment_id': 'text', 'item_id': 'text',
+    'credit_note_id': 'text', 'credit_note_date': 'text', 'title': 'text', 'description': 'text',
+    'seller_gstin': 'category', 'event_type': 'category', 'event_sub_type': 'category', 'state': 'category',
+    'delivery_state': 'category', 'hsn': 'category', 'doc_type': 'category', 'courier': 'category',
+    'reason': 'category', 'brand': 'category', 'category': 'category', 'color': 'category', 'size': 'category',
+    'material': 'category', 'campaign': 'category', 'ad_group': 'category', 'keyword': 'category',
+    'match_type': 'category', 'search_term': 'category',
+    'quantity': 'rate', 'rate': 'rate', 'igst_rate': 'rate', 'cgst_rate': 'rate', 'sgst_rate': 'rate',
+    'utgst_rate': 'rate',
+    'taxable_value': 'amount', 'invoice_value': 'amount', 'tax': 'amount', 'igst': 'amount', 'cgst': 'amount',
+    'sgst': 'amount', 'revenue': 'amount', 'impressions': 'amount', 'clicks': 'amount', 'spend': 'amount',
+    'sales': 'amount', 'orders': 'amount', 'indirect_sales': 'amount', 'indirect_orders': 'amount',
+}
+
+_AMOUNT_JUNK = r'[₹,\s]|^(?:RS\.?|INR)|^\(|\)$'
+
+
+def field_schema(aliases, **overrides):
+    """normalize_chunk schema keyed by canonical field for every field in `aliases`."""
+    return {field: overrides.get(field, FIELD_KINDS.get(field, 'text')) for field in aliases}
+
+
+def map_distinct(values, func):
+    """
+    Applies `func` (a string Series → Series) to the distinct values only and
+    broadcasts the result back to every row. Reports repeat the same few
+    states, rates and event types millions of times, so this turns a per-row
+    string operation into a per-value one. Missing values are passed to
+    `func` as <NA> like any other value.
+    """
+    codes, uniques = pd.factorize(values, use_na_sentinel=False)
+    mapped = func(pd.Series(uniques, dtype='string'))
+    return pd.Series(mapped.array.take(codes), index=values.index, name=values.name)
+
+
+def _arrow_strings(series):
+    return isinstance(series.dtype, pd.StringDtype) and series.dtype.storage == 'pyarrow'
+
+
+def parse_amounts(series, fill=0.0):
+    """
+    Converts amount columns to float64; blanks (and unparseable text) become
+    `fill`, or stay NaN with fill=None. Text amounts may carry '₹',
+    'Rs.'/'INR', thousands separators and accounting-style negatives
+    ('(1,234.50)'); all of it is cleaned with vectorized string ops.
+    """
+    if not pd.api.types.is_numeric_dtype(series):
+        try:
+            # Fast path: plain numeric text casts directly (Arrow strings with Arrow's own cast)
+            series = series.astype('float64[pyarrow]' if _arrow_strings(series) else 'float64')
+        except (TypeError, ValueError):
+            text = series.astype('string').str.strip().str.upper()
+            negative = text.str.startswith('(') & text.str.endswith(')')
+            cleaned = pd.to_numeric(text.str.replace(_AMOUNT_JUNK, '', regex=True), errors='coerce')
+            series = cleaned.where(~negative.fillna(False).to_numpy(dtype=bool), -cleaned)
+    series = series.astype('float64')
+    return series if fill is None else series.fillna(fill)
+
+
+def parse_numbers(series):
+    """Numbers from numeric or text columns (unparseable values become NaN)."""
+    if pd.api.types.is_numeric_dtype(series):
+        return series.astype('float64')
+    try:
+        return series.astype('float64')
+    except (TypeError, ValueError):
+        return pd.to_numeric(series.astype('string').str.strip(), errors='coerce').astype('float64')
+
+
+def _whole_numbers(numbers):
+    """True when every non-missing float is a whole number small enough for Int64 to hold exactly."""
+    numbers = numbers.dropna()
+    return bool(((numbers % 1 == 0) & (numbers.abs() < 2**53)).all())
+
+
+def numeric_text(values):
+    """
+    Text of an ID-like column. Whole numbers read as floats lose the '.0' Excel
+    and float columns add (1234.0 → '1234'); fractional numbers keep their
+    decimals and text is left as it is. Missing values stay missing.
+    """
+    if pd.api.types.is_float_dtype(values):
+        if _whole_numbers(values):
+            return values.astype('Int64').astype('string')
+        text = values.astype('string')
+        whole = ((values % 1 == 0) & (values.abs() < 2**53)).to_numpy(dtype=bool)
+        text[whole] = values[whole].astype('int64').astype('string').to_numpy()
+        return text
+    if values.dtype != object or pd.api.types.infer_dtype(values, skipna=True) in ('string', 'integer', 'empty'):
+        return values.astype('string')
+    # Excel columns mixing numbers and text come back as objects
+    is_float = values.map(lambda value: isinstance(value, float), na_action='ignore').fillna(False).to_numpy(dtype=bool)
+    text = values.astype('string')
+    if is_float.any():
+        text[is_float] = numeric_text(values[is_float].astype('float64')).to_numpy()
+    return text
+
+
+def as_category(values):
+    """Stripped labels as a categorical; the strip runs once per distinct label."""
+    codes, uniques = pd.factorize(values)
+    labels = pd.Series(uniques, dtype='string').str.strip()
+    label_codes, categories = pd.factorize(labels)
+    codes = np.where(codes >= 0, label_codes[np.maximum(codes, 0)], -1)
+    return pd.Series(pd.Categorical.from_codes(codes, categories=categories.astype('string')), index=values.index)
+
+
+def parse_dates(values):
+    """
+    Parses report dates: ISO timestamps first (so 2025-04-05 is never read
+    day-first), then Indian day-first formats such as 05/04/2025. Unparseable
+    values become NaT.
+    """
+    if pd.api.types.is_datetime64_any_dtype(values):
+        return values
+    iso = pd.to_datetime(values, format='ISO8601', errors='coerce')
+    if iso.notna().sum() == values.notna().sum():
+        return iso
+    return iso.fillna(pd.to_datetime(values, format='mixed', dayfirst=True, errors='coerce'))
+
+
+def normalize_chunk(df, schema=None):
+    """
+    Cleans one chunk in place of the whole report: strips header whitespace,
+    drops fully blank rows and coerces the columns named in `schema`
+    ({column: kind}, kinds from COLUMN_KINDS). Columns missing from the chunk
+    are ignored so optional report columns do not break ingestion.
+    """
+    df = df.rename(columns=lambda c: str(c).strip())
+    df = df.dropna(how='all')
+
+    for column, kind in (schema or {}).items():
+        if column not in df.columns:
+            continue
+        values = df[column]
+        if kind == 'text':
+            df[column] = numeric_text(values).str.strip()
+        elif kind == 'amount':
+            df[column] = parse_amounts(values)
+        elif kind == 'rate':
+            numbers = values if pd.api.types.is_numeric_dtype(values) else map_distinct(values, parse_numbers)
+            df[column] = numbers.astype('float32')
+        elif kind == 'int':
+            numbers = parse_numbers(values)
+            # A column with fractions stays float rather than failing the whole read
+            df[column] = numbers.astype('Int64') if _whole_numbers(numbers) else numbers
+        elif kind == 'float':
+            df[column] = parse_numbers(values)
+        elif kind == 'date':
+            df[column] = parse_dates(values)
+        elif kind == 'category':
+            df[column] = as_category(values)
+        else:
+            raise ValueError(f"Unknown column kind '{kind}' for column '{column}'")
+    return df
+
+
+def iter_csv_chunks(source, chunksize=DEFAULT_CHUNK_ROWS, usecols=None, text_columns=None):
+    """
+    Streams a CSV file as DataFrames of at most `chunksize` rows. Column names
+    are matched after stripping, the way the header probe reports them.
+    `text_columns=True` reads every column as text.
+    """
+    raw_columns = pd.read_csv(open_source(source), nrows=0).columns
+    by_name = {str(column).strip(): column for column in raw_columns}
+
+    selected = None if usecols is None else [by_name[c] for c in usecols if c in by_name]
+    if usecols is not None and len(selected) < len(usecols):
+        missing = [c for c in usecols if c not in by_name]
+        raise ValueError(f"Columns not found in CSV: {', '.join(missing)}")
+    if text_columns is True:
+        dtype = str
+    else:
+        dtype = {by_name[c]: str for c in (text_columns or []) if c in by_name}
+
+    with pd.read_csv(open_source(source), chunksize=chunksize, usecols=selected, dtype=dtype or None) as reader:
+        yield from reader
+
+
+def iter_excel_chunks(source, sheet=None, chunksize=DEFAULT_CHUNK_ROWS, usecols=None, text_columns=None):
+    """
+    Streams one sheet of an XLSX file through a read-only workbook, building a
+    DataFrame every `chunksize` rows. Only the `usecols` columns are kept.
+    """
+    from openpyxl import load_workbook
+
+    workbook = load_workbook(open_source(source), read_only=True, data_only=True)
+    try:
+        worksheet = workbook[sheet] if sheet else workbook[workbook.sheetnames[0]]
+        rows = worksheet.iter_rows(values_only=True)
+        header = next(rows, None)
+        if header is None:
+            return
+
+        raw_headers = list(header)
+        while raw_headers and raw_headers[-1] is None:
+            raw_headers.pop()
+        columns = [name.strip() for name in dedupe_headers(raw_headers)]
+
+        if usecols is None:
+            usecols = columns
+        missing = [column for column in usecols if column not in columns]
+        if missing:
+            raise ValueError(f"Columns not found in sheet '{worksheet.title}': {', '.join(missing)}")
+        positions = [columns.index(column) for column in usecols]
+
+        buffer = []
+        for row in rows:
+            width = len(row)
+            values = [row[i] if i < width else None for i in positions]
+            buffer.append(values)
+            if len(buffer) >= chunksize:
+                yield _excel_frame(buffer, usecols, text_columns)
+                buffer = []
+        if buffer:
+            yield _excel_frame(buffer, usecols, text_columns)
+    finally:
+        workbook.close()
+
+
+def _excel_frame(rows, columns, text_columns):
+    """
+    Builds a chunk from openpyxl row values. Text columns are cast straight
+    from the cell objects (like read_csv(dtype=str)) so integer IDs never pass
+    through float; the other columns get their dtypes inferred.
+    """
+    df = pd.DataFrame(rows, columns=columns, dtype=object)
+    text_columns = [column for column in (text_columns or []) if column in df.columns]
+    for column in text_columns:
+        df[column] = df[column].astype('string')
+    other_columns = [column for column in df.columns if column not in text_columns]
+    if other_columns:
+        df[other_columns] = df[other_columns].infer_objects()
+    return df
+
+
+def iter_report_chunks(source, file_name, sheet=None, chunksize=DEFAULT_CHUNK_ROWS, usecols=None, schema=None):
+    """
+    Streams any supported report (CSV/XLSX) as normalized chunks. `schema`
+    maps columns to kinds (see normalize_chunk); its text columns are read as
+    strings so long numeric IDs survive unchanged.
+    """
+    text_columns = [column for column, kind in (schema or {}).items() if kind == 'text']
+    if usecols is not None:
+        text_columns = [column for column in text_columns if column in usecols]
+
+    if file_name.endswith('.csv'):
+        chunks = iter_csv_chunks(source, chunksize, usecols, text_columns)
+    elif file_name.endswith('.xlsx'):
+        chunks = iter_excel_chunks(source, sheet, chunksize, usecols, text_columns)
+    else:
+        raise ValueError(f"Unsupported file type: {file_name}")
+
+    for chunk in chunks:
+        yield normalize_chunk(chunk, schema)
+
+
+# --- Incremental aggregators ---
+# Each aggregator sees one chunk at a time through update() and returns its
+# final value from result(), so no aggregator ever needs the whole report.
+
+class RowCounter:
+    """Counts ingested rows."""
+
+    def __init__(self):
+        self.rows = 0
+
+    def update(self, chunk):
+        self.rows += len(chunk)
+
+    def result(self):
+        return self.rows
+
+
+class ColumnNames:
+    """Records the column names of the report (from the first chunk)."""
+
+    def __init__(self):
+        self.columns = []
+
+    def update(self, chunk):
+        if not self.columns:
+            self.columns = chunk.columns.tolist()
+
+    def result(self):
+        return self.columns
+
+
+class GroupTotals:
+    """
+    Sums `values` columns by `keys` across chunks. Partial group sums are
+    compacted every `compact_every` chunks so memory tracks the number of
+    groups, not the number of rows.
+    """
+
+    def __init__(self, keys, values, compact_every=8):
+        self.keys = list(keys)
+        self.values = list(values)
+        self.compact_every = compact_every
+        self._partials = []
+
+    def update(self, chunk):
+        partial = chunk.groupby(self.keys, observed=True, sort=False, dropna=False)[self.values].sum()
+        self._partials.append(partial)
+        if len(self._partials) >= self.compact_every:
+            self._partials = [self._combine()]
+
+    def _combine(self):
+        combined = pd.concat(self._partials)
+        return combined.groupby(level=list(range(len(self.keys))), observed=True, sort=False, dropna=False).sum()
+
+    def result(self):
+        if not self._partials:
+            return pd.DataFrame(columns=self.keys + self.values)
+        return self._combine().reset_index()
+
+
+class ColumnCollector:
+    """
+    Keeps only the listed columns of every chunk (optionally only the rows
+    where the boolean column `where` is true) and concatenates them at the
+    end. Categorical columns are re-unified across chunks.
+    """
+
+    def __init__(self, columns=None, where=None):
+        self.columns = columns
+        self.where = where
+        self._chunks = []
+
+    def update(self, chunk):
+        if self.where is not None:
+            chunk = chunk[chunk[self.where]]
+        self._chunks.append(chunk if self.columns is None else chunk[self.columns])
+
+    def result(self):
+        if not self._chunks:
+            return pd.DataFrame(columns=self.columns or [])
+        categorical = [c for c in self._chunks[0].columns if isinstance(self._chunks[0][c].dtype, pd.CategoricalDtype)]
+        for column in categorical:
+            unified = pd.api.types.union_categoricals([chunk[column] for chunk in self._chunks])
+            for chunk in self._chunks:
+                chunk[column] = pd.Categorical(chunk[column], categories=unified.categories)
+        return pd.concat(self._chunks, ignore_index=True)
+
+
+def consume(chunks, *aggregators):
+    """
+    Feeds every chunk to every aggregator and returns their results, in the
+    order given (a single result is returned unwrapped).
+    """
+    for chunk in chunks:
+        for aggregator in aggregators:
+            aggregator.update(chunk)
+    results = tuple(aggregator.result() for aggregator in aggregators)
+    return results[0] if len(results) == 1 else results
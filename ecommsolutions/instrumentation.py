@@ -0,0 +1,278 @@
+"""
+Stage timing and memory instrumentation.
+
+Wrap hot paths in `stage('name')` (or decorate them with `@timed()`) and each
+run is recorded as one structured record: stage name, parent stage,
+wall-clock seconds, the tracemalloc peak while it ran (when memory tracing is
+on) and any fields passed in, such as file names or row counts.
+`timed_iter` does the same for the time a consumer spends waiting on a chunk
+generator, which separates parsing from the aggregation that consumes it.
+
+Records are kept in a bounded in-memory buffer for the app's debug panel and
+logged as one JSON object per line on the 'ecommsolutions.perf' logger (to
+ECOMM_PROFILE_LOG when that is set).
+
+Recording is off unless ECOMM_PROFILE=1 or `set_enabled(True)` was called
+for the current thread. Disabled, `stage` returns a shared no-op context
+manager after a single attribute lookup, so the instrumentation can stay in
+place permanently. tracemalloc (ECOMM_PROFILE_MEMORY=1 for the whole
+process, or `set_enabled(True, memory=True)` per thread) slows Python-heavy
+code noticeably, so it runs only while some live thread has asked for it and
+is stopped once none does. Its peak is process-wide, so a stage records
+'peak_mb' only when no other thread ran a memory-traced stage meanwhile.
+"""
+import contextlib
+import functools
+import json
+import logging
+import os
+import threading
+import time
+import tracemalloc
+from collections import deque
+
+MAX_RECORDS = 2000
+
+logger = logging.getLogger('ecommsolutions.perf')
+if os.environ.get('ECOMM_PROFILE_LOG'):
+    _handler = logging.FileHandler(os.environ['ECOMM_PROFILE_LOG'], encoding='utf-8')
+    _handler.setFormatter(logging.Formatter('%(message)s'))
+    logger.addHandler(_handler)
+    logger.setLevel(logging.INFO)
+
+PROFILE_ENABLED = os.environ.get('ECOMM_PROFILE', '') not in ('', '0')
+PROFILE_MEMORY = os.environ.get('ECOMM_PROFILE_MEMORY', '') not in ('', '0')
+
+
+class _ThreadState(threading.local):
+    # Class-level defaults keep the disabled check a plain attribute read
+    enabled = PROFILE_ENABLED
+    memory = PROFILE_MEMORY
+    context = {}
+    stack = None
+
+
+_local = _ThreadState()
+_records = deque(maxlen=MAX_RECORDS)
+_records_lock = threading.Lock()
+# Threads with memory tracing on; tracemalloc runs while this is non-empty
+_memory_threads = set()
+# Threads inside a memory-traced stage, and how many times one entered
+_measuring = set()
+_measure_entries = 0
+_memory_lock = threading.Lock()
+if PROFILE_MEMORY:
+    tracemalloc.start()
+# Shared no-op for disabled stages; fields written to its dict are discarded
+_NULL = contextlib.nullcontext({})
+
+
+# --- Switches and context ---
+
+def set_enabled(enabled, memory=False):
+    """Turns recording (and tracemalloc peaks) on or off for the current thread."""
+    _local.enabled = bool(enabled)
+    _local.memory = bool(enabled and memory)
+    _trace_memory(_local.memory)
+
+
+def _trace_memory(on):
+    """
+    Adds or removes the current thread from the memory-tracing threads,
+    forgetting threads that have ended, and starts or stops tracemalloc to
+    match (it stays on for the whole process with ECOMM_PROFILE_MEMORY).
+    """
+    global _memory_threads
+    thread = threading.current_thread()
+    with _memory_lock:
+        live = {other for other in _memory_threads if other.is_alive() and other is not thread}
+        if on:
+            live.add(thread)
+        _memory_threads = live
+        if live and not tracemalloc.is_tracing():
+            tracemalloc.start()
+        elif not live and tracemalloc.is_tracing() and not PROFILE_MEMORY:
+            tracemalloc.stop()
+
+
+def is_enabled():
+    return _local.enabled
+
+
+def _memory_enabled():
+    return _local.memory and tracemalloc.is_tracing()
+
+
+def _enter_measuring():
+    """Marks the current thread as inside a memory-traced stage; returns (alone, entries)."""
+    global _measure_entries
+    thread = threading.current_thread()
+    with _memory_lock:
+        if thread not in _measuring:
+            _measuring.add(thread)
+            _measure_entries += 1
+        return len(_measuring) == 1, _measure_entries
+
+
+def _leave_measuring():
+    with _memory_lock:
+        _measuring.discard(threading.current_thread())
+
+
+def bind(**fields):
+    """Fields (e.g. session) added to every record of the current thread from now on."""
+    _local.context = {**_local.context, **fields}
+
+
+def current_settings():
+    """(enabled, memory, context) of the current thread, to carry over to a worker thread."""
+    return _local.enabled, _local.memory, dict(_local.context)
+
+
+def apply_settings(settings):
+    enabled, memory, context = settings
+    set_enabled(enabled, memory)
+    _local.context = context
+
+
+# --- Recording ---
+
+def _emit(record):
+    record = {**_local.context, **record}
+    with _records_lock:
+        _records.append(record)
+    if logger.isEnabledFor(logging.INFO):
+        logger.info(json.dumps(record, default=str))
+
+
+def _stack():
+    stack = _local.stack
+    if stack is None:
+        stack = _local.stack = []
+    return stack
+
+
+@contextlib.contextmanager
+def _measured(name, fields):
+    stack = _stack()
+    traced = _memory_enabled()
+    alone, entries = _enter_measuring() if traced else (False, 0)
+    frame = {'name': name, 'memory': alone, 'seen': 0}
+    if frame['memory']:
+        current, peak = tracemalloc.get_traced_memory()
+        # Resetting the peak would hide the parent's, so the parent remembers it
+        if stack:
+            stack[-1]['seen'] = max(stack[-1]['seen'], peak)
+        tracemalloc.reset_peak()
+        frame['start'] = current
+    parent = stack[-1]['name'] if stack else None
+    stack.append(frame)
+    error = None
+    start = time.perf_counter()
+    try:
+        yield fields
+    except BaseException as e:
+        error = type(e).__name__
+        raise
+    finally:
+        seconds = time.perf_counter() - start
+        stack.pop()
+        if traced and not stack:
+            _leave_measuring()
+        record = {'ts': time.time(), 'stage': name, 'parent': parent, 'seconds': round(seconds, 6)}
+        # Another thread's traced stage meanwhile would have mixed its allocations into the peak
+        if frame['memory'] and _measure_entries == entries:
+            absolute = max(frame['seen'], tracemalloc.get_traced_memory()[1])
+            record['peak_mb'] = round(max(absolute - frame['start'], 0) / 2**20, 3)
+            if stack:
+                stack[-1]['seen'] = max(stack[-1]['seen'], absolute)
+        if error:
+            record['error'] = error
+        record.update(fields)
+        _emit(record)
+
+
+def stage(name, **fields):
+    """
+    Context manager timing the block as stage `name`. The yielded dict can be
+    updated with fields known only at the end (e.g. rows=len(frame)).
+    """
+    if not _local.enabled:
+        return _NULL
+    return _measured(name, fields)
+
+
+def timed(name=None):
+    """Decorator form of `stage`; the stage defaults to module.function."""
+    def decorate(func):
+        label = name or f"{func.__module__.rsplit('.', 1)[-1]}.{func.__name__}"
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            if not _local.enabled:
+                return func(*args, **kwargs)
+            with _measured(label, {}):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorate
+
+
+def timed_iter(name, iterable, **fields):
+    """
+    Yields from `iterable`, recording as stage `name` only the time spent
+    producing items (not the consumer's time between them) plus item and row
+    counts. Returns the iterable itself when recording is off.
+    """
+    if not _local.enabled:
+        return iterable
+    return _timed_iter(name, iterable, fields)
+
+
+def _timed_iter(name, iterable, fields):
+    iterator = iter(iterable)
+    stack = _stack()
+    parent = stack[-1]['name'] if stack else None
+    seconds, items, rows = 0.0, 0, 0
+    error = None
+    try:
+        while True:
+            start = time.perf_counter()
+            try:
+                item = next(iterator)
+            except StopIteration:
+                seconds += time.perf_counter() - start
+                break
+            seconds += time.perf_counter() - start
+            items += 1
+            rows += len(item) if hasattr(item, '__len__') else 0
+            yield item
+    except BaseException as e:
+        error = type(e).__name__
+        raise
+    finally:
+        record = {'ts': time.time(), 'stage': name, 'parent': parent, 'seconds': round(seconds, 6),
+                  'chunks': items, 'rows': rows}
+        if error and error != 'GeneratorExit':
+            record['error'] = error
+        record.update(fields)
+        _emit(record)
+
+
+# --- Reading records ---
+
+def recent_records(limit=None, **match):
+    """The newest records first, optionally only those whose fields equal `match` (e.g. session=...)."""
+    with _records_lock:
+        records = list(_records)
+    records = [record for record in reversed(records)
+               if all(record.get(key) == value for key, value in match.items())]
+    return records[:limit] if limit else records
+
+
+def clear_records(**match):
+    """Drops buffered records (only the matching ones when `match` is given)."""
+    with _records_lock:
+        kept = [record for record in _records
+                if match and not all(record.get(key) == value for key, value in match.items())]
+        _records.clear()
+        _records.extend(kept)
@@ -0,0 +1,150 @@
+"""
+Background jobs for the Streamlit app.
+
+Every widget interaction re-runs the whole Streamlit script, and work done
+inline in that run is abandoned when the next one starts. Long GSTR-1 and
+reconciliation runs are therefore submitted here instead:
+
+  - Jobs run on one process-wide thread pool (ECOMM_JOB_WORKERS threads), so
+    concurrent operators share a fixed number of workers rather than each
+    rerun starting its own heavy computation.
+  - A job is keyed by (session, name). Submitting a name that is still queued
+    or running returns the existing job, so double clicks and reruns never
+    start the same work twice; a finished job is replaced.
+  - Jobs report progress through a `progress(done, total, message)` callback
+    and the UI polls `job_status` until the job finishes, then reads the
+    result from the same snapshot. Finished jobs are dropped after
+    ECOMM_JOB_TTL seconds.
+
+Threads rather than processes because the inputs are uploaded files held in
+the session's memory; the batch runner fans out to its own process pool.
+"""
+import inspect
+import os
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+from ecommsolutions.instrumentation import apply_settings, current_settings, set_enabled
+
+JOB_WORKERS = int(os.environ.get('ECOMM_JOB_WORKERS', max(2, min(4, os.cpu_count() or 1))))
+JOB_TTL = float(os.environ.get('ECOMM_JOB_TTL', 3600))
+
+QUEUED = 'queued'
+RUNNING = 'running'
+DONE = 'done'
+FAILED = 'failed'
+ACTIVE_STATES = (QUEUED, RUNNING)
+
+_lock = threading.Lock()
+_jobs = {}
+_executor = None
+
+
+def _pool():
+    global _executor
+    with _lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(max_workers=JOB_WORKERS, thread_name_prefix='ecomm-job')
+        return _executor
+
+
+def _update(job, **fields):
+    with _lock:
+        job.update(fields)
+
+
+def _accepts_progress(func):
+    try:
+        return 'progress' in inspect.signature(func).parameters
+    except (TypeError, ValueError):
+        return False
+
+
+def _run(job, func, args, kwargs, settings):
+    # Stage timings inside the job are recorded like the submitting session's own
+    apply_settings(settings)
+    _update(job, status=RUNNING, started_at=time.time())
+
+    def progress(done, total=None, message=None):
+        _update(job, done=done, total=total, message=message if message is not None else job['message'])
+
+    if _accepts_progress(func):
+        kwargs = {**kwargs, 'progress': progress}
+    try:
+        result = func(*args, **kwargs)
+    except Exception as e:
+        # The exception itself is kept too, so the UI can show what it carries (e.g. validation results)
+        _update(job, status=FAILED, error=str(e) or type(e).__name__, exception=e, finished_at=time.time())
+    else:
+        _update(job, status=DONE, result=result, finished_at=time.time())
+    finally:
+        # Pool threads outlive the job, so they must not keep tracemalloc running
+        set_enabled(False)
+
+
+def _prune(now):
+    """Drops finished jobs older than JOB_TTL (caller holds the lock)."""
+    for key in [key for key, job in _jobs.items()
+                if job['status'] not in ACTIVE_STATES and now - (job['finished_at'] or now) > JOB_TTL]:
+        del _jobs[key]
+
+
+def submit(session, name, func, *args, **kwargs):
+    """
+    Runs func(*args, **kwargs) in the background as job `name` of `session`.
+    If func takes a `progress` keyword it is passed a progress(done, total,
+    message) callback. Returns the job's status snapshot.
+    """
+    now = time.time()
+    with _lock:
+        _prune(now)
+        job = _jobs.get((session, name))
+        if job is not None and job['status'] in ACTIVE_STATES:
+            return _snapshot(job)
+        job = {
+            'id': uuid.uuid4().hex, 'session': session, 'name': name, 'status': QUEUED,
+            'done': 0, 'total': None, 'message': None, 'result': None, 'error': None,
+            'exception': None, 'submitted_at': now, 'started_at': None, 'finished_at': None,
+        }
+        _jobs[(session, name)] = job
+    _pool().submit(_run, job, func, args, kwargs, current_settings())
+    return job_status(session, name)
+
+
+def _snapshot(job):
+    snapshot = dict(job)
+    end = job['finished_at'] or time.time()
+    snapshot['elapsed'] = end - job['started_at'] if job['started_at'] else 0.0
+    snapshot['fraction'] = min(job['done'] / job['total'], 1.0) if job['total'] else None
+    return snapshot
+
+
+def job_status(session, name):
+    """Snapshot of a job (status, done/total/fraction, message, elapsed, result or error), or None."""
+    with _lock:
+        job = _jobs.get((session, name))
+        return _snapshot(job) if job is not None else None
+
+
+def session_jobs(session):
+    """Snapshots of every job a session still holds, oldest first."""
+    with _lock:
+        jobs = [_snapshot(job) for (owner, _), job in _jobs.items() if owner == session]
+    return sorted(jobs, key=lambda job: job['submitted_at'])
+
+
+def discard_job(session, name):
+    """Forgets a finished job (its result is released). A queued or running job is left alone."""
+    with _lock:
+        job = _jobs.get((session, name))
+        if job is not None and job['status'] not in ACTIVE_STATES:
+            del _jobs[(session, name)]
+
+
+def queue_depth():
+    """(running, queued) job counts across all sessions."""
+    with _lock:
+        statuses = [job['status'] for job in _jobs.values()]
+    return statuses.count(RUNNING), statuses.count(QUEUED)
@@ -0,0 +1,338 @@
+"""
+Rolling reconciliation ledger persisted across sessions (SQLite).
+
+A one-off reconcile() needs the full sales and payment history every time.
+The ledger instead keeps, per platform:
+
+    files          every report added (by content hash), so nothing is added twice
+    contributions  one row per (file, order): the file's total and line count
+    orders         per-order settlement state: sale value, received, upcoming,
+                   variance and status, exactly as reconcile() computes them
+
+Adding a weekly settlement file inserts its contributions and recomputes only
+the orders it mentions; removing a file (a stale upcoming-payments list, say)
+recomputes only the orders it had touched. A small per-status totals table is
+adjusted by the same delta, so the summary reads a handful of rows, and
+outstanding-payment queries use the (platform, status, variance) index; both
+take milliseconds however long the history is.
+
+Orders seen only in payment files have status NULL; they are the ledger's
+unmatched payments until their sales file is added.
+"""
+import datetime
+import os
+import sqlite3
+from contextlib import closing, contextmanager
+
+import numpy as np
+import pandas as pd
+
+from ecommsolutions.ingestion import parse_amounts
+from ecommsolutions.instrumentation import timed
+from ecommsolutions.reconciliation import (
+    DEFAULT_TOLERANCE, STATUS_MISSING, STATUS_SHORT_PAID, STATUS_UPCOMING, STATUSES, _order_codes, _totals_by_code,
+    order_statuses,
+)
+
+LEDGER_PATH = os.environ.get(
+    'ECOMM_LEDGER_PATH',
+    os.path.join(os.path.expanduser('~'), '.cache', 'ecommsolutions', 'ledger.sqlite3'),
+)
+
+KIND_SALES = 'sales'
+KIND_PREV = 'prev_payments'
+KIND_UPCOMING = 'upcoming_payments'
+KINDS = [KIND_SALES, KIND_PREV, KIND_UPCOMING]
+
+# status_totals key of payment-only orders (NULL status in the orders table)
+UNMATCHED = 'unmatched'
+
+# Statuses where money is still owed to the seller
+OUTSTANDING_STATUSES = [STATUS_MISSING, STATUS_SHORT_PAID, STATUS_UPCOMING]
+
+ORDER_COLUMNS = ['order_id', 'sale_value', 'sales_lines', 'received', 'upcoming', 'variance', 'status', 'updated_at']
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS files (
+    file_hash TEXT NOT NULL,
+    platform TEXT NOT NULL,
+    kind TEXT NOT NULL,
+    file_name TEXT,
+    lines INTEGER NOT NULL,
+    orders INTEGER NOT NULL,
+    added_at TEXT NOT NULL,
+    PRIMARY KEY (platform, kind, file_hash)
+);
+CREATE TABLE IF NOT EXISTS contributions (
+    file_hash TEXT NOT NULL,
+    platform TEXT NOT NULL,
+    kind TEXT NOT NULL,
+    order_id TEXT NOT NULL,
+    amount REAL NOT NULL,
+    lines INTEGER NOT NULL
+);
+CREATE INDEX IF NOT EXISTS contributions_by_order ON contributions (platform, order_id);
+CREATE INDEX IF NOT EXISTS contributions_by_file ON contributions (platform, kind, file_hash);
+CREATE TABLE IF NOT EXISTS orders (
+    platform TEXT NOT NULL,
+    order_id TEXT NOT NULL,
+    sale_value REAL NOT NULL,
+    sales_lines INTEGER NOT NULL,
+    received REAL NOT NULL,
+    prev_lines INTEGER NOT NULL,
+    upcoming REAL NOT NULL,
+    upcoming_lines INTEGER NOT NULL,
+    variance REAL NOT NULL,
+    status TEXT,
+    updated_at TEXT NOT NULL,
+    PRIMARY KEY (platform, order_id)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS orders_by_status ON orders (platform, status, variance);
+CREATE TABLE IF NOT EXISTS status_totals (
+    platform TEXT NOT NULL,
+    status TEXT NOT NULL,
+    orders INTEGER NOT NULL,
+    sale_value REAL NOT NULL,
+    received REAL NOT NULL,
+    upcoming REAL NOT NULL,
+    PRIMARY KEY (platform, status)
+) WITHOUT ROWID;
+"""
+
+
+# --- Connection ---
+
+@contextmanager
+def _connect(path=None):
+    """One connection per call, committed on success (Streamlit reruns run on different threads)."""
+    path = path or LEDGER_PATH
+    os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+    with closing(sqlite3.connect(path)) as conn:
+        conn.execute('PRAGMA journal_mode=WAL')
+        conn.execute('PRAGMA synchronous=NORMAL')
+        conn.executescript(_SCHEMA)
+        with conn:
+            yield conn
+
+
+def _now():
+    return datetime.datetime.now().isoformat(timespec='seconds')
+
+
+# --- Recomputing order state ---
+
+def _mark_affected(conn, platform, kind, file_hash):
+    """Fills the temp table 'affected' with the orders one file contributes to."""
+    conn.execute('CREATE TEMP TABLE IF NOT EXISTS affected (order_id TEXT PRIMARY KEY)')
+    conn.execute('DELETE FROM affected')
+    conn.execute('INSERT OR IGNORE INTO affected SELECT order_id FROM contributions '
+                 'WHERE platform = ? AND kind = ? AND file_hash = ?', (platform, kind, file_hash))
+
+
+def _status_totals(frame, sign):
+    """Per-status order count and amounts of some orders rows, signed (+1 added / -1 replaced)."""
+    grouped = frame.assign(status=frame['status'].fillna(UNMATCHED), orders=1).groupby('status')
+    totals = grouped[['orders', 'sale_value', 'received', 'upcoming']].sum()
+    return [(status, sign * int(row.orders), sign * row.sale_value, sign * row.received, sign * row.upcoming)
+            for status, row in totals.iterrows()]
+
+
+def _apply_status_totals(conn, platform, rows):
+    conn.executemany(
+        """
+        INSERT INTO status_totals VALUES (?, ?, ?, ?, ?, ?)
+        ON CONFLICT (platform, status) DO UPDATE SET
+            orders = orders + excluded.orders, sale_value = sale_value + excluded.sale_value,
+            received = received + excluded.received, upcoming = upcoming + excluded.upcoming
+        """,
+        ((platform, *row) for row in rows),
+    )
+
+
+def _recompute(conn, platform, tolerance):
+    """
+    Rebuilds the orders rows of every order in the temp table 'affected' from
+    its contributions, and moves their amounts between the status totals.
+    """
+    previous = pd.read_sql_query(
+        'SELECT status, sale_value, received, upcoming FROM orders '
+        'WHERE platform = ? AND order_id IN (SELECT order_id FROM affected)',
+        conn, params=[platform],
+    )
+    totals = pd.read_sql_query(
+        """
+        SELECT c.order_id,
+               SUM(CASE WHEN c.kind = ? THEN c.amount ELSE 0 END) AS sale_value,
+               SUM(CASE WHEN c.kind = ? THEN c.lines ELSE 0 END) AS sales_lines,
+               SUM(CASE WHEN c.kind = ? THEN c.amount ELSE 0 END) AS received,
+               SUM(CASE WHEN c.kind = ? THEN c.lines ELSE 0 END) AS prev_lines,
+               SUM(CASE WHEN c.kind = ? THEN c.amount ELSE 0 END) AS upcoming,
+               SUM(CASE WHEN c.kind = ? THEN c.lines ELSE 0 END) AS upcoming_lines
+        FROM affected a JOIN contributions c ON c.platform = ? AND c.order_id = a.order_id
+        GROUP BY c.order_id
+        """,
+        conn,
+        params=[KIND_SALES, KIND_SALES, KIND_PREV, KIND_PREV, KIND_UPCOMING, KIND_UPCOMING, platform],
+    )
+    # Orders left without any contribution (their only file was removed)
+    conn.execute(
+        """
+        DELETE FROM orders WHERE platform = ? AND order_id IN (
+            SELECT a.order_id FROM affected a
+            WHERE NOT EXISTS (SELECT 1 FROM contributions c WHERE c.platform = ? AND c.order_id = a.order_id))
+        """,
+        (platform, platform),
+    )
+
+    sale_value = totals['sale_value'].to_numpy()
+    received = totals['received'].to_numpy()
+    upcoming = totals['upcoming'].to_numpy()
+    status = order_statuses(sale_value, received, upcoming, totals['prev_lines'].to_numpy() > 0,
+                            totals['upcoming_lines'].to_numpy() > 0, tolerance)
+    # Payment-only orders stay unmatched (NULL status) until their sale is added
+    totals['status'] = np.where(totals['sales_lines'].to_numpy() > 0, status, None)
+
+    updated_at = _now()
+    rows = zip(
+        totals['order_id'].tolist(), sale_value.tolist(), totals['sales_lines'].tolist(), received.tolist(),
+        totals['prev_lines'].tolist(), upcoming.tolist(), totals['upcoming_lines'].tolist(),
+        (sale_value - received - upcoming).tolist(), totals['status'].tolist(),
+    )
+    conn.executemany('INSERT OR REPLACE INTO orders VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)',
+                     ((platform, *row, updated_at) for row in rows))
+    _apply_status_totals(conn, platform, _status_totals(previous, -1) + _status_totals(totals, 1))
+    return len(totals)
+
+
+# --- Adding and removing files ---
+
+def per_order_totals(frame):
+    """'order_id'/'amount' lines (as from load_report) → one row per normalized order ID."""
+    (codes,), order_ids = _order_codes([frame['order_id']])
+    amounts = parse_amounts(frame['amount']).to_numpy(dtype='float64')
+    totals, lines = _totals_by_code(codes, amounts, len(order_ids))
+    return pd.DataFrame({'order_id': order_ids, 'amount': totals, 'lines': lines})
+
+
+@timed()
+def add_file(frame, platform, kind, file_hash, file_name=None, path=None, tolerance=DEFAULT_TOLERANCE):
+    """
+    Adds one report ('order_id'/'amount' frame) to the ledger and recomputes
+    the orders it mentions. A file already in the ledger for the same
+    platform and kind is skipped. Returns a dict with 'status' ('added' /
+    'already added'), 'lines' and 'orders_updated'.
+    """
+    if kind not in KINDS:
+        raise ValueError(f"Unknown ledger file kind {kind!r}; expected one of {', '.join(KINDS)}")
+    with _connect(path) as conn:
+        known = conn.execute('SELECT lines FROM files WHERE platform = ? AND kind = ? AND file_hash = ?',
+                             (platform, kind, file_hash)).fetchone()
+        if known:
+            return {'status': 'already added', 'lines': known[0], 'orders_updated': 0}
+
+        orders = per_order_totals(frame)
+        conn.executemany(
+            'INSERT INTO contributions VALUES (?, ?, ?, ?, ?, ?)',
+            ((file_hash, platform, kind, order_id, amount, lines) for order_id, amount, lines in
+             zip(orders['order_id'].tolist(), orders['amount'].tolist(), orders['lines'].tolist())),
+        )
+        conn.execute('INSERT INTO files VALUES (?, ?, ?, ?, ?, ?, ?)',
+                     (file_hash, platform, kind, file_name, int(len(frame)), int(len(orders)), _now()))
+        _mark_affected(conn, platform, kind, file_hash)
+        updated = _recompute(conn, platform, tolerance)
+    return {'status': 'added', 'lines': int(len(frame)), 'orders_updated': updated}
+
+
+def remove_file(platform, kind, file_hash, path=None, tolerance=DEFAULT_TOLERANCE):
+    """Takes one file out of the ledger (e.g. an upcoming-payments list that has since been settled)."""
+    with _connect(path) as conn:
+        _mark_affected(conn, platform, kind, file_hash)
+        conn.execute('DELETE FROM contributions WHERE platform = ? AND kind = ? AND file_hash = ?',
+                     (platform, kind, file_hash))
+        conn.execute('DELETE FROM files WHERE platform = ? AND kind = ? AND file_hash = ?',
+                     (platform, kind, file_hash))
+        return _recompute(conn, platform, tolerance)
+
+
+def clear_ledger(platform=None, path=None):
+    """Forgets the history of one platform (or every platform)."""
+    with _connect(path) as conn:
+        for table in ('files', 'contributions', 'orders', 'status_totals'):
+            if platform is None:
+                conn.execute(f'DELETE FROM {table}')
+            else:
+                conn.execute(f'DELETE FROM {table} WHERE platform = ?', (platform,))
+
+
+# --- Queries ---
+
+def ledger_files(platform=None, path=None):
+    """Files added so far, newest first."""
+    query = 'SELECT platform, kind, file_name, lines, orders, added_at, file_hash FROM files'
+    params = []
+    if platform is not None:
+        query += ' WHERE platform = ?'
+        params.append(platform)
+    with _connect(path) as conn:
+        return pd.read_sql_query(query + ' ORDER BY added_at DESC', conn, params=params)
+
+
+def ledger_summary(platform, path=None):
+    """The same headline numbers as reconcile()['summary'], read from the per-status totals."""
+    with _connect(path) as conn:
+        by_status = pd.read_sql_query(
+            'SELECT status, orders, sale_value, received, upcoming FROM status_totals WHERE platform = ?',
+            conn, params=[platform],
+        ).set_index('status')
+    matched = by_status.drop(UNMATCHED, errors='ignore')
+    unmatched = by_status.loc[by_status.index == UNMATCHED]
+    total_sales_value = round(float(matched['sale_value'].sum()), 2)
+    received_payment = round(float(matched['received'].sum()), 2)
+    upcoming_payment = round(float(matched['upcoming'].sum()), 2)
+    return {
+        'order_count': int(matched['orders'].sum()),
+        'total_sales_value': total_sales_value,
+        'received_payment': received_payment,
+        'upcoming_payment': upcoming_payment,
+        'variance': round(total_sales_value - received_payment - upcoming_payment, 2),
+        'status_counts': {name: int(matched['orders'].get(name, 0)) for name in STATUSES},
+        'unmatched_payment_count': int(unmatched['orders'].sum()),
+        'unmatched_payment_value': round(float((unmatched['received'] + unmatched['upcoming']).sum()), 2),
+    }
+
+
+def outstanding(platform, statuses=None, limit=None, path=None):
+    """
+    Orders still owed money (missing / short paid / upcoming by default),
+    largest balance first. Each status is read in index order, so a limited
+    query touches only `limit` rows per status.
+    """
+    query = f"SELECT {', '.join(ORDER_COLUMNS)} FROM orders WHERE platform = ? AND status = ? ORDER BY variance DESC"
+    if limit is not None:
+        query += f' LIMIT {int(limit)}'
+    with _connect(path) as conn:
+        frames = [pd.read_sql_query(query, conn, params=[platform, status])
+                  for status in (statuses or OUTSTANDING_STATUSES)]
+    owed = pd.concat(frames, ignore_index=True).sort_values('variance', ascending=False, ignore_index=True)
+    return owed if limit is None else owed.head(limit)
+
+
+def ledger_orders(platform, path=None):
+    """Every order with a sale in the ledger (for the downloadable workbook)."""
+    with _connect(path) as conn:
+        return pd.read_sql_query(
+            f"SELECT {', '.join(ORDER_COLUMNS)} FROM orders WHERE platform = ? AND status IS NOT NULL",
+            conn, params=[platform],
+        )
+
+
+def unmatched_payments(platform, path=None):
+    """Payments whose order is not in any sales file added so far."""
+    with _connect(path) as conn:
+        return pd.read_sql_query(
+            """
+            SELECT order_id, received, upcoming, updated_at FROM orders
+            WHERE platform = ? AND status IS NULL ORDER BY received + upcoming DESC
+            """,
+            conn, params=[platform],
+        )
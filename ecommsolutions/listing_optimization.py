@@ -0,0 +1,478 @@
+"""
+Offline keyword engine for catalogue titles.
+
+A catalogue export (SKU, title, brand, category, ...) is tokenized once into
+an inverted index:
+
+  - Titles are lower-cased and split on anything that is not a letter or a
+    digit, by one `str.split` over the joined titles; tokens get integer ids
+    from a vocabulary that only ever grows, and stopwords are dropped.
+  - Postings are sorted (term, listing) pairs with offsets per term, for
+    single words and for adjacent word pairs (bigrams), so "cotton kurta"
+    is a phrase lookup rather than two word lookups.
+
+Keyword sets (keyword, weight, optional category) are scored against every
+listing with one postings lookup per keyword: a listing's score is the share
+of its category's keyword weight its title covers, and the heaviest keywords
+it lacks are reported as missing terms. Duplicate titles are found on the
+normalized title text. Rewrites fill local templates ('{brand} {title}
+{missing}') column-wise, so no network or language model is involved.
+
+When a few listings change, `CatalogueIndex.update` tokenizes only those
+rows into a small delta segment and marks the old rows dead; the main
+segment is rebuilt from the stored integer pairs (never re-tokenized) once
+the delta grows past COMPACT_FRACTION of it.
+"""
+import string
+
+import numpy as np
+import pandas as pd
+
+from ecommsolutions.gst_common import iter_canonical_chunks
+from ecommsolutions.ingestion import ColumnCollector, consume, field_schema, parse_numbers
+from ecommsolutions.instrumentation import stage, timed
+
+CATALOGUE_ALIASES = {
+    'sku': ['Seller SKU', 'SKU', 'sku', 'Sku', 'Seller SKU ID', 'SKU ID', 'seller-sku', 'Supplier SKU', 'Product SKU',
+            'Style ID'],
+    'title': ['Product Title', 'Title', 'item-name', 'Item Name', 'Product Name', 'Listing Title', 'Name'],
+    'description': ['Description', 'Product Description', 'item-description', 'Bullet Points'],
+    'brand': ['Brand', 'Brand Name', 'brand_name'],
+    'category': ['Category', 'Product Category', 'Vertical', 'Sub Category', 'Product Type', 'item-type'],
+    'color': ['Color', 'Colour', 'color_name'],
+    'size': ['Size', 'size_name'],
+    'material': ['Material', 'Fabric', 'material_type'],
+}
+CATALOGUE_REQUIRED = ['sku', 'title']
+CATALOGUE_SCHEMA = field_schema(CATALOGUE_ALIASES)
+ATTRIBUTES = ['brand', 'category', 'color', 'size', 'material']
+
+KEYWORD_ALIASES = {
+    'keyword': ['Keyword', 'Keywords', 'Search Term', 'Customer Search Term', 'Search Query', 'Query'],
+    'weight': ['Weight', 'Search Volume', 'Volume', 'Searches', 'Impressions', 'Priority'],
+    'category': ['Category', 'Product Category', 'Vertical'],
+}
+KEYWORD_REQUIRED = ['keyword']
+KEYWORD_SCHEMA = field_schema(KEYWORD_ALIASES, weight='float')
+
+ALL_CATEGORIES = '*'
+STOPWORDS = frozenset({
+    'a', 'an', 'and', 'are', 'as', 'at', 'by', 'for', 'from', 'in', 'is', 'it', 'of', 'on', 'or', 'the', 'to',
+    'with', 'without', 'set', 'pack', 'pcs', 'pc',
+})
+
+MISSING_TERMS = 3
+MAX_TITLE_LENGTH = 150
+COMPACT_FRACTION = 0.1
+# Bigram keys pack two term ids into one int64
+_BIGRAM_SHIFT = np.int64(1 << 31)
+
+TITLE_TEMPLATES = {
+    "Brand first": "{brand} {title} {missing}",
+    "Keywords first": "{missing} {title} - {brand}",
+    "Marketplace style": "{brand} {title} {missing} - {color}, {size}",
+}
+DESCRIPTION_TEMPLATES = {
+    "Feature summary": "{brand} {title}. {category} in {color}, {material}. Ideal for {keywords}.",
+    "Short": "{title} by {brand}. {keywords}.",
+}
+
+
+# --- Tokenizing ---
+
+def normalize_titles(values):
+    """Lower-case words separated by single spaces; anything else becomes a separator."""
+    return (values.astype('string').str.lower().str.replace(r'[^a-z0-9]+', ' ', regex=True)
+            .str.strip().fillna(''))
+
+
+def _token_pairs(normalized):
+    """(row positions, token strings) of every word of every normalized title, in title order."""
+    counts = np.where(normalized == '', 0, normalized.str.count(' ') + 1).astype(np.int64)
+    words = ' '.join(normalized[counts > 0].to_numpy(dtype=object)).split(' ') if counts.any() else []
+    return np.repeat(np.arange(len(normalized)), counts), words
+
+
+class _Postings:
+    """Sorted (key, listing) pairs with the start offset of every distinct key."""
+
+    def __init__(self, keys, docs):
+        order = np.lexsort((docs, keys))
+        keys, docs = keys[order], docs[order]
+        # A word repeated in one title counts once
+        first = np.ones(len(keys), dtype=bool)
+        first[1:] = (keys[1:] != keys[:-1]) | (docs[1:] != docs[:-1])
+        self.keys, self.docs = keys[first], docs[first]
+        self.unique, self.starts = np.unique(self.keys, return_index=True)
+        self.ends = np.append(self.starts[1:], len(self.keys))
+
+    def __len__(self):
+        return len(self.keys)
+
+    def lookup(self, key):
+        position = np.searchsorted(self.unique, key)
+        if position == len(self.unique) or self.unique[position] != key:
+            return self.docs[:0]
+        return self.docs[self.starts[position]:self.ends[position]]
+
+    def document_counts(self, alive):
+        """Live listings per distinct key."""
+        if not len(self.keys):
+            return self.unique, np.zeros(0, dtype=np.int64)
+        return self.unique, np.add.reduceat(alive[self.docs].astype(np.int64), self.starts)
+
+
+_EMPTY = np.zeros(0, dtype=np.int64)
+
+
+class CatalogueIndex:
+    """
+    Inverted index over catalogue titles. `listings` holds one row per indexed
+    listing (dead rows stay until the next compaction); `alive` marks the
+    current version of each SKU. `version` changes with every update, so
+    callers can cache scores per version.
+    """
+
+    def __init__(self):
+        self.version = 0
+        self.vocabulary = {}
+        self.terms = []
+        self.listings = pd.DataFrame(columns=['sku', 'title', 'normalized'] + ATTRIBUTES)
+        self.alive = np.zeros(0, dtype=bool)
+        self._pairs = {'main': (_EMPTY, _EMPTY, _EMPTY, _EMPTY), 'delta': (_EMPTY, _EMPTY, _EMPTY, _EMPTY)}
+        self._segments = {}
+        self._rebuild('main')
+        self._rebuild('delta')
+
+    @classmethod
+    def from_catalogue(cls, catalogue):
+        # The first update is larger than the empty main segment, so it is compacted straight away
+        index = cls()
+        index.update(catalogue)
+        return index
+
+    # --- Building ---
+
+    def _term_ids(self, words):
+        """Global term ids of a list of words (new words extend the vocabulary); stopwords map to -1."""
+        codes, uniques = pd.factorize(pd.Series(words, dtype=object))
+        ids = np.array([-1 if word in STOPWORDS else self.vocabulary.setdefault(word, len(self.vocabulary))
+                        for word in uniques], dtype=np.int64)
+        self.terms.extend(list(self.vocabulary)[len(self.terms):])
+        return ids[codes] if len(codes) else _EMPTY
+
+    def _tokenize(self, normalized, first_doc):
+        """(unigram keys, unigram docs, bigram keys, bigram docs) of titles numbered from `first_doc`."""
+        rows, words = _token_pairs(normalized)
+        terms = self._term_ids(words)
+        keep = terms >= 0
+        docs, terms = rows[keep] + first_doc, terms[keep]
+        adjacent = docs[1:] == docs[:-1]
+        bigrams = terms[:-1][adjacent] * _BIGRAM_SHIFT + terms[1:][adjacent]
+        return terms, docs, bigrams, docs[1:][adjacent]
+
+    def _rebuild(self, segment):
+        unigram_keys, unigram_docs, bigram_keys, bigram_docs = self._pairs[segment]
+        self._segments[segment] = (_Postings(unigram_keys, unigram_docs), _Postings(bigram_keys, bigram_docs))
+
+    def update(self, catalogue):
+        """
+        Adds or replaces listings (a frame with at least 'sku' and 'title').
+        Only these rows are tokenized; earlier versions of their SKUs stop
+        matching immediately.
+        """
+        catalogue = catalogue.drop_duplicates('sku', keep='last')
+        rows = pd.DataFrame({
+            'sku': catalogue['sku'].astype('string').str.strip().to_numpy(),
+            'title': catalogue['title'].astype('string').fillna('').to_numpy(),
+            **{field: (catalogue[field].astype('string').str.strip().fillna('').to_numpy() if field in catalogue else '')
+               for field in ATTRIBUTES},
+        })
+        rows['normalized'] = normalize_titles(rows['title']).to_numpy()
+        self.remove(rows['sku'])
+
+        first_doc = len(self.listings)
+        new_pairs = self._tokenize(rows['normalized'], first_doc)
+        self._pairs['delta'] = tuple(np.concatenate([old, new]) for old, new in zip(self._pairs['delta'], new_pairs))
+        self.listings = pd.concat([self.listings, rows[self.listings.columns]], ignore_index=True) if first_doc else \
+            rows[self.listings.columns].reset_index(drop=True)
+        self.alive = np.concatenate([self.alive, np.ones(len(rows), dtype=bool)])
+        self.version += 1
+        if len(self._pairs['delta'][0]) > COMPACT_FRACTION * max(len(self._pairs['main'][0]), 1):
+            self.compact()
+        else:
+            self._rebuild('delta')
+        return len(rows)
+
+    def remove(self, skus):
+        """Stops the listed SKUs from matching (their rows are dropped at the next compaction)."""
+        if not len(self.listings):
+            return
+        dead = self.listings['sku'].isin(pd.Series(skus, dtype='string')).to_numpy() & self.alive
+        if dead.any():
+            self.alive = self.alive & ~dead
+            self.version += 1
+
+    def compact(self):
+        """Merges the delta into the main segment and drops dead listings, renumbering the rest."""
+        renumber = np.full(len(self.alive), -1, dtype=np.int64)
+        renumber[self.alive] = np.arange(int(self.alive.sum()))
+        merged = []
+        for keys, docs in ((0, 1), (2, 3)):
+            all_keys = np.concatenate([self._pairs['main'][keys], self._pairs['delta'][keys]])
+            all_docs = renumber[np.concatenate([self._pairs['main'][docs], self._pairs['delta'][docs]])]
+            kept = all_docs >= 0
+            merged += [all_keys[kept], all_docs[kept]]
+        self._pairs = {'main': tuple(merged), 'delta': (_EMPTY, _EMPTY, _EMPTY, _EMPTY)}
+        self.listings = self.listings[self.alive].reset_index(drop=True)
+        self.alive = np.ones(len(self.listings), dtype=bool)
+        self._rebuild('main')
+        self._rebuild('delta')
+
+    # --- Queries ---
+
+    def __len__(self):
+        return int(self.alive.sum())
+
+    def live_listings(self):
+        """Current listings, with their index row numbers as the frame index."""
+        return self.listings[self.alive]
+
+    def phrase_docs(self, phrase):
+        """Row numbers of live listings whose title contains the phrase's words in order (stopwords ignored)."""
+        words = [word for word in normalize_titles(pd.Series([phrase])).iloc[0].split(' ') if word and word not in STOPWORDS]
+        ids = [self.vocabulary.get(word, -1) for word in words]
+        if not ids or min(ids) < 0:
+            return _EMPTY
+        if len(ids) == 1:
+            lookups = [(0, ids[0])]
+        else:
+            lookups = [(1, left * _BIGRAM_SHIFT + right) for left, right in zip(ids[:-1], ids[1:])]
+        docs = None
+        for which, key in lookups:
+            found = np.concatenate([self._segments[segment][which].lookup(key) for segment in ('main', 'delta')])
+            docs = found if docs is None else np.intersect1d(docs, found, assume_unique=True)
+        return docs[self.alive[docs]]
+
+    def ngram_counts(self, n=1, top=50, category=None):
+        """The `top` words (n=1) or word pairs (n=2) by number of live listings using them, optionally in one category."""
+        alive = self.alive if category is None else self.alive & (self.listings['category'] == category).to_numpy()
+        which = 0 if n == 1 else 1
+        keys, counts = [], []
+        for segment in ('main', 'delta'):
+            segment_keys, segment_counts = self._segments[segment][which].document_counts(alive)
+            keys.append(segment_keys)
+            counts.append(segment_counts)
+        totals = pd.Series(np.concatenate(counts)).groupby(np.concatenate(keys)).sum()
+        totals = totals[totals > 0].nlargest(top)
+        keys = totals.index.to_numpy(dtype=np.int64)
+        if n == 1:
+            phrases = [self.terms[key] for key in keys]
+        else:
+            phrases = [f"{self.terms[key // _BIGRAM_SHIFT]} {self.terms[key % _BIGRAM_SHIFT]}" for key in keys]
+        return pd.DataFrame({'phrase': phrases, 'listings': totals.to_numpy()})
+
+
+# --- Reading files ---
+
+@timed()
+def read_catalogue(source, file_name=None):
+    """Catalogue export (Excel/CSV) → frame of the CATALOGUE_ALIASES fields that are present."""
+    chunks = iter_canonical_chunks(source, CATALOGUE_ALIASES, CATALOGUE_REQUIRED, CATALOGUE_SCHEMA, file_name=file_name)
+    catalogue = consume(chunks, ColumnCollector())
+    return catalogue[catalogue['sku'].fillna('') != '']
+
+
+@timed()
+def build_index(source, file_name=None):
+    with stage('listing.read'):
+        catalogue = read_catalogue(source, file_name)
+    with stage('listing.index', listings=len(catalogue)):
+        return CatalogueIndex.from_catalogue(catalogue)
+
+
+def read_keywords(source, file_name=None):
+    """Keyword file (keyword, optional weight / search volume, optional category) → keyword table."""
+    chunks = iter_canonical_chunks(source, KEYWORD_ALIASES, KEYWORD_REQUIRED, KEYWORD_SCHEMA, file_name=file_name)
+    return keyword_table(consume(chunks, ColumnCollector()))
+
+
+def parse_keywords(text):
+    """
+    Keywords typed one per line as 'keyword', 'keyword: weight' or
+    '[category] keyword: weight' → keyword table.
+    """
+    lines = pd.Series(text.splitlines(), dtype='string').str.strip()
+    parts = lines[lines != ''].str.extract(r'^(?:\[(?P<category>[^\]]*)\])?\s*(?P<keyword>[^:]+?)\s*(?::\s*(?P<weight>[\d.]+))?$')
+    return keyword_table(parts.dropna(subset=['keyword']))
+
+
+def keyword_table(frame):
+    """Keyword, weight (default 1) and category ('*' = every category), one row per keyword and category."""
+    keywords = pd.DataFrame({
+        'keyword': frame['keyword'].astype('string').str.strip().str.lower(),
+        'weight': parse_numbers(frame['weight']).fillna(1.0) if 'weight' in frame else 1.0,
+        'category': (frame['category'].astype('string').str.strip().replace('', pd.NA).fillna(ALL_CATEGORIES)
+                     if 'category' in frame else ALL_CATEGORIES),
+    })
+    keywords = keywords[keywords['keyword'].fillna('') != '']
+    keywords = keywords.groupby(['category', 'keyword'], as_index=False)['weight'].max()
+    return keywords.sort_values('weight', ascending=False, ignore_index=True)
+
+
+def catalogue_keywords(index, per_category=15):
+    """
+    Keyword table built from the catalogue itself: the most used word pairs
+    and words of every category, weighted by how many of its listings use
+    them. Useful when no keyword research file is at hand.
+    """
+    tables = []
+    categories = index.live_listings()['category']
+    for category in categories[categories != ''].unique():
+        bigrams = index.ngram_counts(2, per_category, category)
+        words = index.ngram_counts(1, per_category, category)
+        phrases = pd.concat([bigrams, words], ignore_index=True).nlargest(per_category, 'listings')
+        tables.append(pd.DataFrame({'keyword': phrases['phrase'], 'weight': phrases['listings'].astype('float64'),
+                                    'category': category}))
+    if not tables:
+        phrases = index.ngram_counts(1, per_category)
+        tables.append(pd.DataFrame({'keyword': phrases['phrase'], 'weight': phrases['listings'].astype('float64'),
+                                    'category': ALL_CATEGORIES}))
+    return keyword_table(pd.concat(tables, ignore_index=True))
+
+
+# --- Scoring ---
+
+@timed()
+def score_listings(index, keywords, max_length=MAX_TITLE_LENGTH, missing_terms=MISSING_TERMS):
+    """
+    Scores every live listing against the keyword table. Returns one row per
+    listing: score (% of its category's keyword weight present in the title),
+    matched keyword count, the heaviest missing keywords, title length and
+    duplicate-title flags.
+    """
+    rows = len(index.listings)
+    category = index.listings['category'].to_numpy(dtype=object)
+    covered = np.zeros(rows)
+    possible = np.zeros(rows)
+    matched = np.zeros(rows, dtype=np.int64)
+    # Slots for the heaviest missing keywords, filled in weight order
+    missing = np.full((rows, missing_terms), -1, dtype=np.int64)
+    filled = np.zeros(rows, dtype=np.int64)
+
+    with stage('listing.score', keywords=len(keywords), listings=len(index)):
+        applies_cache = {}
+        for position, (keyword, weight, scope) in enumerate(keywords[['keyword', 'weight', 'category']].itertuples(index=False)):
+            if scope not in applies_cache:
+                applies_cache[scope] = index.alive if scope == ALL_CATEGORIES else index.alive & (category == scope)
+            applies = applies_cache[scope]
+            present = np.zeros(rows, dtype=bool)
+            present[index.phrase_docs(keyword)] = True
+            present &= applies
+            covered[present] += weight
+            matched[present] += 1
+            possible[applies] += weight
+            lacking = np.flatnonzero(applies & ~present & (filled < missing_terms))
+            missing[lacking, filled[lacking]] = position
+            filled[lacking] += 1
+
+    listings = index.listings
+    # Slot -1 picks the appended blank; slots fill in order, so blanks only trail
+    names = np.append(keywords['keyword'].to_numpy(dtype=object), '')
+    missing_text = pd.Series(names[missing[:, 0]], dtype='string')
+    for slot in range(1, missing_terms):
+        missing_text = missing_text + ', ' + names[missing[:, slot]]
+    missing_text = missing_text.str.replace(r'(, )+$', '', regex=True)
+    duplicates = duplicate_titles(index)
+    scores = pd.DataFrame({
+        'sku': listings['sku'],
+        'title': listings['title'],
+        'category': listings['category'],
+        'score': np.round(np.divide(covered, possible, out=np.zeros(rows), where=possible > 0) * 100, 1),
+        'matched_keywords': matched,
+        'missing_keywords': missing_text.to_numpy(),
+        'title_length': listings['title'].str.len().fillna(0).astype('int64'),
+        'duplicate_titles': duplicates.reindex(listings.index, fill_value=0).to_numpy(),
+    })
+    scores['too_long'] = scores['title_length'] > max_length
+    return scores[index.alive].reset_index(drop=True)
+
+
+def duplicate_titles(index):
+    """Per live listing row, how many other live listings have the same normalized title (0 = unique)."""
+    live = index.live_listings()['normalized']
+    counts = live.map(live.value_counts()) - 1
+    return counts[live != ''].astype('int64')
+
+
+# --- Rewrites ---
+
+def render_template(template, fields):
+    """
+    Fills a '{brand} {title} {missing}' style template column-wise from a
+    frame of text fields; empty fields and the separators around them are
+    dropped.
+    """
+    rendered = pd.Series('', index=fields.index, dtype='string')
+    for literal, field, _, _ in string.Formatter().parse(template):
+        rendered = rendered + literal
+        if field:
+            if field not in fields:
+                raise ValueError(f"Unknown template field '{{{field}}}'; use one of {', '.join(fields.columns)}")
+            rendered = rendered + fields[field].astype('string').fillna('')
+    return (rendered.str.replace(r'\s+', ' ', regex=True)
+            .str.replace(r'(?:\s*[,.|-])+\s*([,.|-])', r'\1', regex=True)
+            .str.replace(r'\s+([,.])', r'\1', regex=True)
+            .str.replace(r'^[\s,.|-]+|[\s,|-]+$', '', regex=True))
+
+
+def _without_brand(titles, brands):
+    """Titles with a leading brand name removed (handled per distinct brand, not per row)."""
+    titles = titles.astype('string').fillna('')
+    for brand in brands[brands != ''].unique():
+        rows = (brands == brand) & titles.str.lower().str.startswith(brand.lower())
+        titles = titles.where(~rows, titles[rows].str.slice(len(brand)).str.lstrip(' -|,'))
+    return titles
+
+
+def _top_keywords(keywords, categories, n=3):
+    """The n heaviest keywords of each listing's category (or of the catalogue-wide set), comma-separated."""
+    top = keywords.groupby('category', sort=False).head(n).groupby('category')['keyword'].agg(', '.join)
+    fallback = top.get(ALL_CATEGORIES, '')
+    return categories.astype('string').map(top).fillna(fallback)
+
+
+def _truncate(texts, max_length):
+    """Cuts texts longer than `max_length` at the last whole word."""
+    long = texts.str.len() > max_length
+    cut = texts[long].str.slice(0, max_length + 1).str.replace(r'\s+\S*$', '', regex=True).str.rstrip(' ,-|')
+    return texts.where(~long, cut)
+
+
+@timed()
+def suggest_rewrites(index, scores, keywords, template=TITLE_TEMPLATES["Brand first"], max_length=MAX_TITLE_LENGTH,
+                     description_template=None):
+    """
+    Suggested titles (and descriptions when a template is given) for the
+    scored listings in `scores`: the template is filled with the listing's
+    attributes, its title without a leading brand as {title}, the missing
+    keywords as {missing} and its category's top keywords as {keywords}.
+    """
+    listings = index.live_listings().set_index('sku').reindex(scores['sku'])
+    brands = listings['brand'].fillna('')
+    missing = scores['missing_keywords'].fillna('').str.replace(',', '', regex=False).str.title()
+    fields = pd.DataFrame({
+        'title': _without_brand(listings['title'], brands).to_numpy(),
+        'missing': missing.to_numpy(),
+        'keywords': _top_keywords(keywords, listings['category']).to_numpy(),
+        **{field: listings[field].fillna('').to_numpy() for field in ATTRIBUTES},
+    }, index=scores.index)
+    suggestions = pd.DataFrame({
+        'sku': scores['sku'],
+        'title': scores['title'],
+        'score': scores['score'],
+        'suggested_title': _truncate(render_template(template, fields), max_length),
+    })
+    if description_template:
+        suggestions['suggested_description'] = render_template(description_template, fields)
+    return suggestions
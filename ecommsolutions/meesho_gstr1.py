@@ -0,0 +1,205 @@
+"""
+Meesho GSTR-1 computation.
+
+Combines the three reports from Meesho Panel → Payments:
+  - TCS Sales (tcs_sales.xlsx)
+  - TCS Sales Return (tcs_sales_return.xlsx)
+  - Tax Invoice Details (Tax_invoice_details.xlsx)
+into the B2CS (Table 7), HSN summary (Table 12) and document summary
+(Table 13) sections of GSTR-1.
+
+Sales and returns are streamed chunk by chunk and reduced with groupby sums
+over (place of supply, rate, HSN); returns are netted off as negative lines.
+Nothing iterates per row, so a ~500k line month finishes in seconds
+(see benchmarks/bench_meesho_gstr1.py).
+"""
+import numpy as np
+import pandas as pd
+
+from ecommsolutions.gst_common import (
+    build_b2cs, build_hsn, gstin_state_code, iter_canonical_chunks, normalize_hsn, normalize_rates, state_codes,
+    with_tax_split,
+)
+from ecommsolutions.ingestion import ColumnCollector, GroupTotals, RowCounter, consume, field_schema, parse_amounts
+from ecommsolutions.instrumentation import stage, timed
+from ecommsolutions.validation import settle_validations, validate_report, with_validation
+
+# Header names used by Meesho exports (older and newer layouts) per canonical field
+LINE_ALIASES = {
+    'order_id': ['sub_order_num', 'Sub Order No', 'sub_order_no', 'suborder_number'],
+    'hsn': ['hsn_code', 'HSN', 'HSN Code'],
+    'quantity': ['quantity', 'Qty'],
+    'rate': ['gst_rate', 'GST Rate', 'tax_rate'],
+    'taxable_value': ['total_taxable_sale_value', 'taxable_value', 'Taxable Value'],
+    'tax': ['tax_amount', 'Tax Amount', 'total_tax'],
+    'invoice_value': ['total_invoice_value', 'Invoice Value'],
+    'state': ['end_customer_state_new', 'end_customer_state', 'Customer State', 'state'],
+}
+LINE_REQUIRED = ['hsn', 'rate', 'taxable_value', 'state']
+LINE_SCHEMA = field_schema(LINE_ALIASES)
+# Returns are listed with positive amounts too (the engine negates them)
+LINE_CHECKS = {
+    'hsn': 'hsn',
+    'rates': ['rate'],
+    'amounts': ['taxable_value', 'tax', 'invoice_value'],
+    'non_negative': ['taxable_value', 'tax', 'invoice_value'],
+    'unique': ['order_id'],
+}
+
+INVOICE_ALIASES = {
+    'doc_type': ['Type', 'Document Type', 'doc_type'],
+    'invoice_no': ['Invoice No', 'Invoice No.', 'invoice_no', 'Invoice Number'],
+}
+INVOICE_REQUIRED = ['invoice_no']
+INVOICE_SCHEMA = field_schema(INVOICE_ALIASES)
+INVOICE_CHECKS = {'unique': ['doc_type', 'invoice_no']}
+
+GROUP_KEYS = ['state_code', 'rate', 'hsn']
+LINE_VALUES = ['quantity', 'taxable_value', 'tax', 'invoice_value']
+
+# Document summary natures (Table 13)
+DOC_INVOICE = 'Invoices for outward supply'
+DOC_CREDIT_NOTE = 'Credit Note'
+DOC_DEBIT_NOTE = 'Debit Note'
+
+DOCS_COLUMNS = ['Nature of Document', 'Sr. No. From', 'Sr. No. To', 'Total Number', 'Cancelled']
+
+
+def prepare_lines(chunk, sign=1):
+    """
+    Turns one chunk of canonical sales/return lines into the numeric frame
+    the aggregation works on. Returns are passed with sign=-1 so they net off.
+    Tax is taken from the report when present, otherwise derived from the rate.
+    """
+    rate = normalize_rates(chunk['rate'])
+    taxable = parse_amounts(chunk['taxable_value'])
+    if 'tax' in chunk:
+        tax = parse_amounts(chunk['tax'])
+    else:
+        tax = taxable * rate.fillna(0) / 100
+    if 'invoice_value' in chunk:
+        invoice_value = parse_amounts(chunk['invoice_value'])
+    else:
+        invoice_value = taxable + tax
+    quantity = parse_amounts(chunk['quantity']) if 'quantity' in chunk else pd.Series(0.0, index=chunk.index)
+
+    return pd.DataFrame({
+        'state_code': state_codes(chunk['state']).fillna(''),
+        'rate': rate.fillna(0.0),
+        'hsn': normalize_hsn(chunk['hsn']),
+        'quantity': quantity * sign,
+        'taxable_value': taxable * sign,
+        'tax': tax * sign,
+        'invoice_value': invoice_value * sign,
+    })
+
+
+def _line_totals(chunks, sign):
+    """Streams lines into (state, rate, HSN) totals; returns (totals, row count)."""
+    prepared = (prepare_lines(chunk, sign) for chunk in chunks)
+    rows, totals = consume(prepared, RowCounter(), GroupTotals(GROUP_KEYS, LINE_VALUES))
+    return totals, rows
+
+
+def document_summary(invoices):
+    """
+    Builds Table 13 from the invoice list: one row per document nature and
+    invoice series (prefix before the running number) with the first/last
+    number and the count of distinct documents.
+    """
+    if invoices.empty:
+        return pd.DataFrame(columns=DOCS_COLUMNS)
+
+    numbers = invoices['invoice_no'].astype('string').str.strip()
+    doc_type = invoices['doc_type'].astype('string').str.upper() if 'doc_type' in invoices else pd.Series('', index=invoices.index, dtype='string')
+    nature = np.select(
+        [doc_type.str.contains('CREDIT', na=False).to_numpy(), doc_type.str.contains('DEBIT', na=False).to_numpy()],
+        [DOC_CREDIT_NOTE, DOC_DEBIT_NOTE],
+        default=DOC_INVOICE,
+    )
+
+    # Series = invoice number without its running number; within a series,
+    # ordering by (length, text) is numeric order of the running number
+    docs = pd.DataFrame({
+        'nature': nature,
+        'series': numbers.str.replace(r'\d+$', '', regex=True),
+        'length': numbers.str.len(),
+        'invoice_no': numbers,
+    }).dropna(subset=['invoice_no'])
+    docs = docs.drop_duplicates(['nature', 'invoice_no'])
+    docs = docs.sort_values(['nature', 'series', 'length', 'invoice_no'], kind='stable')
+
+    grouped = docs.groupby(['nature', 'series'], sort=False)['invoice_no']
+    summary = pd.DataFrame({
+        'Nature of Document': grouped.first().index.get_level_values('nature'),
+        'Sr. No. From': grouped.first().to_numpy(),
+        'Sr. No. To': grouped.last().to_numpy(),
+        'Total Number': grouped.size().to_numpy(),
+        'Cancelled': 0,
+    })
+    return summary
+
+
+@timed()
+def compute_meesho_gstr1(sales_chunks, return_chunks, invoice_chunks, seller_gstin, ecommerce_gstin=None):
+    """
+    Computes the GSTR-1 tables from iterables of canonical chunks (frames with
+    the LINE_ALIASES / INVOICE_ALIASES field names; a list holding one frame
+    works too). Returns a dict with 'b2cs', 'hsn' and 'docs' frames (offline
+    tool column names) and a 'summary' dict of totals.
+    """
+    seller_state = gstin_state_code(seller_gstin)
+
+    with stage('meesho.sales_lines'):
+        sales_totals, sales_rows = _line_totals(sales_chunks, 1)
+    with stage('meesho.return_lines'):
+        return_totals, return_rows = _line_totals(return_chunks, -1)
+    with stage('meesho.documents'):
+        invoices = consume(invoice_chunks, ColumnCollector())
+        docs = document_summary(invoices)
+
+    # Net returns off sales per (place of supply, rate, HSN)
+    with stage('meesho.net'):
+        net = pd.concat([sales_totals, return_totals], ignore_index=True)
+        net = net.groupby(GROUP_KEYS, sort=False)[LINE_VALUES].sum().reset_index()
+        net = with_tax_split(net, seller_state)
+    known_state = net['state_code'] != ''
+
+    summary = {
+        'sales_lines': int(sales_rows),
+        'return_lines': int(return_rows),
+        'gross_taxable_value': round(float(sales_totals['taxable_value'].sum()), 2) if len(sales_totals) else 0.0,
+        'returns_taxable_value': round(float(-return_totals['taxable_value'].sum()), 2) if len(return_totals) else 0.0,
+        'net_taxable_value': round(float(net['taxable_value'].sum()), 2),
+        'igst': round(float(net['igst'].sum()), 2),
+        'cgst': round(float(net['cgst'].sum()), 2),
+        'sgst': round(float(net['sgst'].sum()), 2),
+        'unmapped_state_taxable_value': round(float(net.loc[~known_state, 'taxable_value'].sum()), 2),
+        'documents': int(docs['Total Number'].sum()),
+    }
+    return {'b2cs': build_b2cs(net, ecommerce_gstin), 'hsn': build_hsn(net), 'docs': docs, 'summary': summary}
+
+
+@timed()
+def process_meesho_reports(tcs_sales, tcs_sales_return, tax_invoice_details, seller_gstin, ecommerce_gstin=None,
+                           strict=True):
+    """
+    Runs the full computation on the three uploaded files (Streamlit uploads,
+    paths or anything iter_canonical_chunks accepts). The files are validated
+    first; with `strict` validation errors raise ValidationError, otherwise
+    they are returned with the warnings under 'validation'.
+    """
+    with stage('meesho.validate'):
+        validation = settle_validations([
+            validate_report(tcs_sales, LINE_ALIASES, LINE_REQUIRED, LINE_SCHEMA, LINE_CHECKS),
+            validate_report(tcs_sales_return, LINE_ALIASES, LINE_REQUIRED, LINE_SCHEMA, LINE_CHECKS),
+            validate_report(tax_invoice_details, INVOICE_ALIASES, INVOICE_REQUIRED, INVOICE_SCHEMA, INVOICE_CHECKS),
+        ], strict)
+    gstr1 = compute_meesho_gstr1(
+        iter_canonical_chunks(tcs_sales, LINE_ALIASES, LINE_REQUIRED, LINE_SCHEMA),
+        iter_canonical_chunks(tcs_sales_return, LINE_ALIASES, LINE_REQUIRED, LINE_SCHEMA),
+        iter_canonical_chunks(tax_invoice_details, INVOICE_ALIASES, INVOICE_REQUIRED, INVOICE_SCHEMA),
+        seller_gstin,
+        ecommerce_gstin,
+    )
+    return with_validation(gstr1, validation)
@@ -0,0 +1,337 @@
+"""
+Persistent columnar cache for uploaded reports.
+
+The first read of a report sheet streams it through the ingestion layer and,
+chunk by chunk, writes a Parquet copy keyed by the content hash of the upload.
+Later reads of the same file (in any session) come straight from that copy,
+skipping the slow openpyxl/CSV parse, and only load the requested columns.
+
+Layout on disk:
+
+    <cache dir>/<content hash>/meta.json         original name, sheets, probe
+    <cache dir>/<content hash>/<sheet id>.parquet
+
+Entries are evicted least-recently-used first once the cache grows past its
+size limit. pyarrow is optional; without it the cache is simply bypassed.
+"""
+import hashlib
+import json
+import os
+import shutil
+import time
+import uuid
+
+import pandas as pd
+
+from ecommsolutions.file_probe import content_hash
+from ecommsolutions.instrumentation import timed_iter
+from ecommsolutions.ingestion import (
+    DEFAULT_CHUNK_ROWS, iter_csv_chunks, iter_excel_chunks, iter_report_chunks, normalize_chunk,
+)
+
+# Cache location and size limit can be overridden from the environment
+CACHE_DIR = os.environ.get(
+    'ECOMM_REPORT_CACHE_DIR',
+    os.path.join(os.path.expanduser('~'), '.cache', 'ecommsolutions', 'reports'),
+)
+CACHE_MAX_BYTES = int(float(os.environ.get('ECOMM_REPORT_CACHE_MB', '2048')) * 1024 * 1024)
+
+# Per-process counters shown in the cache-stats view
+_counters = {'hits': 0, 'misses': 0, 'probe_hits': 0, 'writes': 0, 'evictions': 0}
+
+_HASH_BLOCK_BYTES = 1024 * 1024
+
+
+def cache_available():
+    """The cache needs pyarrow for Parquet; without it every read is uncached."""
+    try:
+        import pyarrow.parquet  # noqa: F401
+    except ImportError:
+        return False
+    return True
+
+
+def hash_source(source):
+    """Content hash of raw bytes, a path or a file-like object (read in blocks)."""
+    if isinstance(source, (bytes, bytearray)):
+        return content_hash(source)
+    if hasattr(source, 'getvalue'):
+        return content_hash(source.getvalue())
+
+    digest = hashlib.blake2b(digest_size=16)
+    handle = open(source, 'rb') if isinstance(source, (str, os.PathLike)) else source
+    try:
+        handle.seek(0)
+        for block in iter(lambda: handle.read(_HASH_BLOCK_BYTES), b''):
+            digest.update(block)
+    finally:
+        if handle is not source:
+            handle.close()
+        else:
+            source.seek(0)
+    return digest.hexdigest()
+
+
+# --- Entry metadata ---
+
+def _entry_dir(file_hash):
+    return os.path.join(CACHE_DIR, file_hash)
+
+
+def _sheet_file(file_hash, sheet):
+    """Sheet names can contain anything, so the Parquet file is named by a hash of it."""
+    sheet_id = hashlib.blake2b(str(sheet).encode('utf-8'), digest_size=6).hexdigest()
+    return os.path.join(_entry_dir(file_hash), f"sheet_{sheet_id}.parquet")
+
+
+def _read_meta(file_hash):
+    try:
+        with open(os.path.join(_entry_dir(file_hash), 'meta.json'), encoding='utf-8') as handle:
+            return json.load(handle)
+    except (OSError, ValueError):
+        return None
+
+
+def _write_meta(file_hash, meta):
+    os.makedirs(_entry_dir(file_hash), exist_ok=True)
+    path = os.path.join(_entry_dir(file_hash), 'meta.json')
+    tmp_path = f"{path}.{uuid.uuid4().hex}.tmp"
+    with open(tmp_path, 'w', encoding='utf-8') as handle:
+        json.dump(meta, handle)
+    os.replace(tmp_path, path)
+
+
+def _update_meta(file_hash, file_name, **fields):
+    meta = _read_meta(file_hash) or {'file_name': file_name, 'created': time.time(), 'sheets': {}}
+    meta.update(fields)
+    _write_meta(file_hash, meta)
+    return meta
+
+
+def _touch(file_hash):
+    """Marks an entry as recently used (directory mtime drives LRU eviction)."""
+    try:
+        os.utime(_entry_dir(file_hash))
+    except OSError:
+        pass
+
+
+# --- Header probe cache (used by get_file_metadata; counted apart from sheet reads) ---
+
+def get_probe(file_hash):
+    """
+    Returns the cached {'sheets', 'columns'} header probe for a file (plus
+    'default_sheet' when the columns are not those of the first sheet), or None.
+    """
+    meta = _read_meta(file_hash)
+    if not meta or 'probe' not in meta:
+        return None
+    _touch(file_hash)
+    _counters['probe_hits'] += 1
+    return meta['probe']
+
+
+def store_probe(file_hash, file_name, sheets, columns, default_sheet=None):
+    """Remembers a header probe so the workbook is not reopened in later sessions."""
+    probe = {'sheets': list(sheets), 'columns': list(columns)}
+    if default_sheet is not None:
+        probe['default_sheet'] = default_sheet
+    try:
+        _update_meta(file_hash, file_name, probe=probe)
+    except OSError:
+        pass
+
+
+# --- Cached chunk iteration ---
+
+def _cacheable(chunk):
+    """
+    Gives every column a Parquet-friendly type that stays stable across
+    chunks: numbers become float64, dates stay datetime64 and everything else
+    (including mixed object columns) becomes string.
+    """
+    chunk = chunk.rename(columns=lambda c: str(c).strip())
+    for column in chunk.columns:
+        values = chunk[column]
+        if pd.api.types.is_bool_dtype(values) or pd.api.types.is_numeric_dtype(values):
+            chunk[column] = values.astype('float64')
+        elif not pd.api.types.is_datetime64_any_dtype(values):
+            chunk[column] = values.astype('string')
+    return chunk
+
+
+def _select(chunk, usecols, schema):
+    """Applies the caller's column selection and schema to a full cached chunk."""
+    chunk = chunk.rename(columns=lambda c: str(c).strip())
+    if usecols is not None:
+        missing = [column for column in usecols if column not in chunk.columns]
+        if missing:
+            raise ValueError(f"Columns not found in report: {', '.join(missing)}")
+        chunk = chunk[list(usecols)]
+    return normalize_chunk(chunk, schema)
+
+
+def _iter_from_cache(path, chunksize, usecols, schema):
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    # Label columns are read dictionary-encoded, so they arrive as categoricals
+    # without materializing one string per row
+    file_schema = pq.read_schema(path)
+    labels = [column for column, kind in (schema or {}).items()
+              if kind == 'category' and column in file_schema.names and pa.types.is_string(file_schema.field(column).type)]
+    parquet_file = pq.ParquetFile(path, read_dictionary=labels)
+    available = file_schema.names
+    if usecols is not None:
+        missing = [column for column in usecols if column not in available]
+        if missing:
+            raise ValueError(f"Columns not found in report: {', '.join(missing)}")
+    for batch in parquet_file.iter_batches(batch_size=chunksize, columns=list(usecols) if usecols else None):
+        yield normalize_chunk(batch.to_pandas(), schema)
+
+
+def _iter_and_store(source, file_name, sheet, file_hash, chunksize, usecols, schema):
+    """
+    Streams the full sheet once, appending each chunk to a Parquet file while
+    yielding the caller's view of it. If the chunks cannot be written with one
+    consistent schema, caching is abandoned and streaming simply continues.
+    """
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    if file_name.endswith('.csv'):
+        raw_chunks = iter_csv_chunks(source, chunksize, text_columns=True)
+    else:
+        raw_chunks = iter_excel_chunks(source, sheet, chunksize)
+
+    path = _sheet_file(file_hash, sheet)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_path = f"{path}.{uuid.uuid4().hex}.tmp"
+    writer = None
+    caching = True
+    rows = 0
+    completed = False
+    try:
+        for chunk in raw_chunks:
+            chunk = _cacheable(chunk)
+            if caching:
+                try:
+                    table = pa.Table.from_pandas(chunk, preserve_index=False)
+                    if writer is None:
+                        writer = pq.ParquetWriter(tmp_path, table.schema)
+                    else:
+                        table = table.cast(writer.schema)
+                    writer.write_table(table)
+                    rows += len(chunk)
+                except (pa.ArrowException, ValueError):
+                    caching = False
+            yield _select(chunk, usecols, schema)
+        completed = True
+    finally:
+        if writer is not None:
+            writer.close()
+        if completed and caching and writer is not None:
+            os.replace(tmp_path, path)
+            meta = _read_meta(file_hash) or {}
+            sheets = dict(meta.get('sheets', {}))
+            sheets[str(sheet)] = {'file': os.path.basename(path), 'rows': rows}
+            _update_meta(file_hash, file_name, sheets=sheets)
+            _counters['writes'] += 1
+            evict()
+        elif os.path.exists(tmp_path):
+            os.remove(tmp_path)
+
+
+def iter_cached_report_chunks(source, file_name, sheet=None, chunksize=DEFAULT_CHUNK_ROWS,
+                              usecols=None, schema=None, file_hash=None):
+    """
+    Drop-in replacement for ingestion.iter_report_chunks that serves repeat
+    reads of the same upload from the Parquet cache. Pass `file_hash` when the
+    caller has already hashed the upload.
+    """
+    if not cache_available():
+        yield from timed_iter('ingest.parse', iter_report_chunks(source, file_name, sheet, chunksize, usecols, schema),
+                              file=file_name)
+        return
+    if not (file_name.endswith('.csv') or file_name.endswith('.xlsx')):
+        raise ValueError(f"Unsupported file type: {file_name}")
+
+    file_hash = file_hash or hash_source(source)
+    sheet_key = None if file_name.endswith('.csv') else sheet
+    path = _sheet_file(file_hash, sheet_key)
+
+    if os.path.exists(path):
+        _counters['hits'] += 1
+        _touch(file_hash)
+        yield from timed_iter('ingest.cache_read', _iter_from_cache(path, chunksize, usecols, schema), file=file_name)
+    else:
+        _counters['misses'] += 1
+        yield from timed_iter('ingest.parse', _iter_and_store(source, file_name, sheet_key, file_hash, chunksize,
+                                                              usecols, schema), file=file_name)
+
+
+# --- Eviction and stats ---
+
+def _entries():
+    """Lists cache entries as dicts with hash, size, last-used time and metadata."""
+    if not os.path.isdir(CACHE_DIR):
+        return []
+    entries = []
+    for file_hash in os.listdir(CACHE_DIR):
+        entry_dir = _entry_dir(file_hash)
+        if not os.path.isdir(entry_dir):
+            continue
+        size = 0
+        for name in os.listdir(entry_dir):
+            try:
+                size += os.path.getsize(os.path.join(entry_dir, name))
+            except OSError:
+                pass
+        meta = _read_meta(file_hash) or {}
+        entries.append({
+            'hash': file_hash,
+            'file_name': meta.get('file_name', ''),
+            'sheets': len(meta.get('sheets', {})),
+            'rows': sum(sheet.get('rows', 0) for sheet in meta.get('sheets', {}).values()),
+            'bytes': size,
+            'last_used': os.path.getmtime(entry_dir),
+        })
+    return entries
+
+
+def evict(max_bytes=None):
+    """Removes least-recently-used entries until the cache fits in `max_bytes`."""
+    max_bytes = CACHE_MAX_BYTES if max_bytes is None else max_bytes
+    entries = sorted(_entries(), key=lambda entry: entry['last_used'])
+    total = sum(entry['bytes'] for entry in entries)
+    for entry in entries:
+        if total <= max_bytes:
+            break
+        shutil.rmtree(_entry_dir(entry['hash']), ignore_errors=True)
+        total -= entry['bytes']
+        _counters['evictions'] += 1
+
+
+def clear_cache():
+    """Deletes every cached report."""
+    shutil.rmtree(CACHE_DIR, ignore_errors=True)
+
+
+def cache_stats():
+    """
+    Summary for the cache-stats view: directory, size vs. limit, entry count,
+    per-process hit/miss/header-probe-hit/write/eviction counters and one row per entry.
+    """
+    entries = _entries()
+    table = pd.DataFrame(entries, columns=['hash', 'file_name', 'sheets', 'rows', 'bytes', 'last_used'])
+    table['last_used'] = pd.to_datetime(table['last_used'], unit='s')
+    table = table.sort_values('last_used', ascending=False, ignore_index=True)
+    return {
+        'enabled': cache_available(),
+        'directory': CACHE_DIR,
+        'entries': len(entries),
+        'total_bytes': int(table['bytes'].sum()),
+        'max_bytes': CACHE_MAX_BYTES,
+        **_counters,
+        'table': table,
+    }
@@ -0,0 +1,407 @@
+"""
+Return analysis: return rates by SKU, reason, state and courier.
+
+Sales lines and return lines are joined on the normalized (sub-)order ID, so
+a return picks up the SKU, state, courier and sale month of the order it
+belongs to even when the return report itself lacks them (Meesho's
+tcs_sales_return has no SKU, for example). Return rates are returned units
+over sold units of the same sale month, so a May return of an April order
+counts against April.
+
+History is kept as per-file partial aggregates in a small on-disk store:
+
+    <store>/meta.json                  files already added (by content hash)
+    <store>/orders_<hash>.parquet      order facts of a sales file (join index)
+    <store>/sold_<hash>.parquet        sold units per month x SKU x state x courier
+    <store>/returned_<hash>.parquet    matched returns per month x SKU x state x courier x reason
+    <store>/unmatched_<hash>.parquet   returns whose order has not been seen yet
+    <store>/return_ids_<hash>.parquet  order IDs of the returns a file added
+
+Adding a month therefore only parses the new files: a new returns file is
+joined against the stored order facts, a new sales file only re-tries the
+returns still waiting for their order. Orders and returns already added by
+an earlier file are skipped, so re-exported or overlapping reports (last
+30 days, then last 60) are counted once. Queries concatenate the small
+partials. Top-N lists use partial selection (np.argpartition), never a full
+sort of a 100k+ SKU catalogue.
+"""
+import json
+import os
+import shutil
+import uuid
+
+import numpy as np
+import pandas as pd
+
+from ecommsolutions.gst_common import GST_STATES, iter_canonical_chunks, state_codes
+from ecommsolutions.ingestion import ColumnCollector, consume, field_schema, parse_amounts, parse_dates
+from ecommsolutions.instrumentation import timed
+from ecommsolutions.reconciliation import normalize_order_ids
+from ecommsolutions.report_cache import hash_source
+
+RETURNS_DIR = os.environ.get(
+    'ECOMM_RETURNS_DIR',
+    os.path.join(os.path.expanduser('~'), '.cache', 'ecommsolutions', 'returns'),
+)
+
+_ORDER_ID = ['Order Item ID', 'Sub Order No', 'sub_order_num', 'Suborder Number', 'Sub Order Number',
+             'order-item-id', 'Order ID', 'Order Id', 'order_id', 'amazon-order-id', 'order-id']
+_SKU = ['SKU', 'Seller SKU', 'sku', 'Sku', 'supplier_sku', 'Supplier SKU', 'Product SKU']
+_COURIER = ['Courier', 'Courier Partner', 'Courier Name', 'courier_partner', 'Logistics Partner',
+            'Shipping Provider', 'Forward Courier', 'carrier']
+_QUANTITY = ['Item Quantity', 'Quantity', 'quantity', 'Qty', 'Return Quantity', 'quantity-purchased']
+
+SALES_ALIASES = {
+    'order_id': _ORDER_ID,
+    'sku': _SKU,
+    'state': ["Customer's Delivery State", 'end_customer_state_new', 'end_customer_state', 'Ship To State',
+              'ship-state', 'Delivery State', 'Customer State', 'State'],
+    'date': ['Order Date', 'order_date', 'Buyer Invoice Date', 'Invoice Date', 'Purchase Date', 'purchase-date',
+             'Date'],
+    'quantity': _QUANTITY,
+    'courier': _COURIER,
+    'event_type': ['Event Sub Type', 'Event Type', 'Transaction Type'],
+    'reason': ['Return Reason', 'return_reason', 'Reason'],
+}
+RETURN_ALIASES = {
+    'order_id': _ORDER_ID,
+    'sku': _SKU,
+    'quantity': _QUANTITY,
+    'courier': ['Return Courier', 'Reverse Courier'] + _COURIER,
+    'reason': ['Return Reason', 'return_reason', 'Reason', 'Detailed Return Reason', 'Return Type'],
+}
+REQUIRED = ['order_id']
+SCHEMA = field_schema({**SALES_ALIASES, **RETURN_ALIASES})
+
+KIND_SALES = 'sales'
+KIND_RETURNS = 'returns'
+
+FACT_KEYS = ['month', 'sku', 'state', 'courier']
+MATCHED_COLUMNS = FACT_KEYS + ['reason', 'quantity']
+DIMENSIONS = {'sku': 'SKU', 'reason': 'Reason', 'state': 'State', 'courier': 'Courier', 'month': 'Month'}
+UNKNOWN = 'Unknown'
+NO_REASON = 'Not specified'
+
+DEFAULT_MIN_SOLD = 5
+
+
+# --- Store ---
+
+def _store(store_dir):
+    return store_dir or RETURNS_DIR
+
+
+def _read_meta(store_dir):
+    try:
+        with open(os.path.join(_store(store_dir), 'meta.json'), encoding='utf-8') as handle:
+            return json.load(handle)
+    except (OSError, ValueError):
+        return {'files': {}}
+
+
+def _write_meta(store_dir, meta):
+    os.makedirs(_store(store_dir), exist_ok=True)
+    path = os.path.join(_store(store_dir), 'meta.json')
+    tmp_path = f"{path}.{uuid.uuid4().hex}.tmp"
+    with open(tmp_path, 'w', encoding='utf-8') as handle:
+        json.dump(meta, handle)
+    os.replace(tmp_path, path)
+
+
+def _part_path(store_dir, part, file_hash):
+    return os.path.join(_store(store_dir), f"{part}_{file_hash}.parquet")
+
+
+def _write_part(store_dir, part, file_hash, frame):
+    os.makedirs(_store(store_dir), exist_ok=True)
+    path = _part_path(store_dir, part, file_hash)
+    tmp_path = f"{path}.{uuid.uuid4().hex}.tmp"
+    frame.to_parquet(tmp_path, index=False)
+    os.replace(tmp_path, path)
+
+
+def _read_parts(store_dir, part, columns=None):
+    """Every stored partial of one kind, concatenated (None when there are none)."""
+    meta = _read_meta(store_dir)
+    frames = []
+    for file_hash in meta['files']:
+        path = _part_path(store_dir, part, file_hash)
+        if os.path.exists(path):
+            frames.append(pd.read_parquet(path, columns=columns))
+    return pd.concat(frames, ignore_index=True) if frames else None
+
+
+def clear_history(store_dir=None):
+    """Forgets every file added to the return-analysis history."""
+    shutil.rmtree(_store(store_dir), ignore_errors=True)
+
+
+def history(store_dir=None):
+    """Files added so far, one row each."""
+    files = _read_meta(store_dir)['files']
+    return pd.DataFrame([{'file_name': info['file_name'], 'kind': info['kind'], 'sales_lines': info['sales_lines'],
+                          'return_lines': info['return_lines'], 'months': ', '.join(info['months'])}
+                         for info in files.values()],
+                        columns=['file_name', 'kind', 'sales_lines', 'return_lines', 'months'])
+
+
+# --- Turning report lines into facts ---
+
+def _normalized_ids(values):
+    """normalize_order_ids on the distinct values only, mapped back to every row."""
+    codes, uniques = pd.factorize(values.astype('string'))
+    normalized = normalize_order_ids(pd.Series(uniques, dtype='string')).to_numpy(dtype=object)
+    return pd.Series(np.where(codes >= 0, normalized[np.maximum(codes, 0)], None), index=values.index,
+                     dtype='string')
+
+
+def _text(frame, field, default):
+    if field not in frame:
+        return pd.Series(default, index=frame.index, dtype='string')
+    values = frame[field].astype('string').str.strip()
+    return values.mask(values == '').fillna(default)
+
+
+def _quantity(frame):
+    if 'quantity' not in frame:
+        return pd.Series(1.0, index=frame.index)
+    return parse_amounts(frame['quantity']).abs().fillna(1.0)
+
+
+def _is_return_event(frame):
+    """Return rows inside a combined sales report (Flipkart 'Return' events, Amazon 'Refund')."""
+    if 'event_type' not in frame:
+        return np.zeros(len(frame), dtype=bool)
+    event = frame['event_type'].astype('string').str.upper().fillna('')
+    is_return = event.str.contains('RETURN|REFUND', regex=True) & ~event.str.contains('CANCEL', regex=False)
+    return is_return.to_numpy(dtype=bool)
+
+
+def _is_cancellation(frame):
+    if 'event_type' not in frame:
+        return np.zeros(len(frame), dtype=bool)
+    event = frame['event_type'].astype('string').str.upper().fillna('')
+    return (event.str.contains('CANCEL', regex=False) & ~event.str.contains('RETURN', regex=False)).to_numpy(dtype=bool)
+
+
+def order_facts(lines):
+    """Sale lines → one row per order: order_id, month, sku, state, courier, quantity."""
+    codes = state_codes(lines['state']) if 'state' in lines else pd.Series(pd.NA, index=lines.index, dtype='string')
+    dates = parse_dates(lines['date']) if 'date' in lines else pd.Series(pd.NaT, index=lines.index)
+    orders = pd.DataFrame({
+        'order_id': _normalized_ids(lines['order_id']),
+        'month': dates.dt.strftime('%Y-%m').fillna(UNKNOWN),
+        'sku': _text(lines, 'sku', UNKNOWN),
+        'state': codes.map(GST_STATES).fillna(UNKNOWN),
+        'courier': _text(lines, 'courier', UNKNOWN),
+        'quantity': _quantity(lines),
+    }).dropna(subset=['order_id'])
+    first = orders.drop_duplicates('order_id')
+    units = orders.groupby('order_id', sort=False)['quantity'].sum()
+    return first.assign(quantity=units.reindex(first['order_id']).to_numpy()).reset_index(drop=True)
+
+
+def return_facts(lines):
+    """Return lines → order_id, sku, courier, reason, quantity (sku/courier may be Unknown until joined)."""
+    return pd.DataFrame({
+        'order_id': _normalized_ids(lines['order_id']),
+        'sku': _text(lines, 'sku', UNKNOWN),
+        'courier': _text(lines, 'courier', UNKNOWN),
+        'reason': _text(lines, 'reason', NO_REASON),
+        'quantity': _quantity(lines),
+    }).dropna(subset=['order_id']).reset_index(drop=True)
+
+
+def _categorical(frame, columns):
+    return frame.astype({column: 'category' for column in columns if column in frame})
+
+
+def join_returns(returns, orders):
+    """
+    Attaches sale month, SKU, state and courier to return facts through a hash
+    index on order ID. Returns (matched, unmatched); details from the return
+    report win over the order's when the order lacks them.
+    """
+    if orders is None or orders.empty:
+        return pd.DataFrame({column: pd.Series(dtype='float64' if column == 'quantity' else 'string')
+                             for column in MATCHED_COLUMNS}), returns
+    orders = orders.drop_duplicates('order_id', keep='last')
+    position = pd.Index(orders['order_id']).get_indexer(returns['order_id'])
+    found = position >= 0
+    matched = returns[found]
+    source = orders.iloc[position[found]]
+    sku = source['sku'].astype('string').to_numpy()
+    courier = source['courier'].astype('string').to_numpy()
+    matched = pd.DataFrame({
+        'month': source['month'].astype('string').to_numpy(),
+        'sku': np.where(sku == UNKNOWN, matched['sku'].to_numpy(), sku),
+        'state': source['state'].astype('string').to_numpy(),
+        'courier': np.where(courier == UNKNOWN, matched['courier'].to_numpy(), courier),
+        'reason': matched['reason'].to_numpy(),
+        'quantity': matched['quantity'].to_numpy(),
+    })
+    return matched, returns[~found]
+
+
+def _returned_partial(matched):
+    partial = matched.assign(returns=1).groupby(FACT_KEYS + ['reason'], sort=False)[['quantity', 'returns']].sum()
+    return _categorical(partial.reset_index(), FACT_KEYS + ['reason'])
+
+
+def _sold_partial(orders):
+    partial = orders.assign(orders=1).groupby(FACT_KEYS, sort=False)[['quantity', 'orders']].sum()
+    return _categorical(partial.reset_index(), FACT_KEYS)
+
+
+# --- Adding files ---
+
+def _read_lines(source, file_name, kind):
+    aliases = SALES_ALIASES if kind == KIND_SALES else RETURN_ALIASES
+    chunks = iter_canonical_chunks(source, aliases, REQUIRED, SCHEMA, file_name=file_name,
+                                   preferred_sheets=('Sales Report',))
+    return consume(chunks, ColumnCollector())
+
+
+@timed()
+def add_report(source, file_name, kind, store_dir=None, file_hash=None):
+    """
+    Adds one sales or returns report to the history. Files already added (same
+    content) are skipped, so re-uploading last month costs only a hash, and
+    so are the orders and returns of a file that an earlier file already
+    added. Return rows inside a combined sales report are treated as returns.
+    Returns the file's meta entry with 'status' 'added' or 'already added'.
+    """
+    file_hash = file_hash or hash_source(source)
+    meta = _read_meta(store_dir)
+    if file_hash in meta['files']:
+        return {**meta['files'][file_hash], 'status': 'already added'}
+
+    lines = _read_lines(source, file_name, kind)
+    if kind == KIND_SALES:
+        is_return = _is_return_event(lines)
+        sales_lines, return_lines = lines[~is_return & ~_is_cancellation(lines)], lines[is_return]
+    else:
+        sales_lines, return_lines = lines.iloc[:0], lines
+
+    known_orders = _read_parts(store_dir, 'orders', ['order_id'] + FACT_KEYS)
+    orders = order_facts(sales_lines) if len(sales_lines) else None
+    repeated_orders = repeated_returns = 0
+    if orders is not None:
+        if known_orders is not None:
+            repeated = orders['order_id'].isin(known_orders['order_id'].astype('string'))
+            repeated_orders = int(repeated.sum())
+            orders = orders[~repeated]
+        _write_part(store_dir, 'orders', file_hash, _categorical(orders, FACT_KEYS))
+        _write_part(store_dir, 'sold', file_hash, _sold_partial(orders))
+        _retry_unmatched(store_dir, meta, orders)
+
+    if len(return_lines):
+        returns = return_facts(return_lines)
+        known_returns = _read_parts(store_dir, 'return_ids')
+        if known_returns is not None:
+            repeated = returns['order_id'].isin(known_returns['order_id'])
+            repeated_returns = int(repeated.sum())
+            returns = returns[~repeated]
+        if orders is not None:
+            known_orders = pd.concat([known_orders, orders], ignore_index=True) if known_orders is not None else orders
+        matched, unmatched = join_returns(returns, known_orders)
+        _write_part(store_dir, 'returned', file_hash, _returned_partial(matched))
+        _write_part(store_dir, 'unmatched', file_hash, unmatched)
+        _write_part(store_dir, 'return_ids', file_hash, returns[['order_id']].drop_duplicates())
+
+    entry = {
+        'file_name': file_name,
+        'kind': kind,
+        'sales_lines': int(len(sales_lines)),
+        'return_lines': int(len(return_lines)),
+        'repeated_orders': repeated_orders,
+        'repeated_returns': repeated_returns,
+        'months': sorted(orders['month'].unique().tolist()) if orders is not None else [],
+    }
+    meta = _read_meta(store_dir)
+    meta['files'][file_hash] = entry
+    _write_meta(store_dir, meta)
+    return {**entry, 'status': 'added'}
+
+
+def _retry_unmatched(store_dir, meta, orders):
+    """Returns that arrived before their sales file: join them against the new orders only."""
+    for file_hash in meta['files']:
+        path = _part_path(store_dir, 'unmatched', file_hash)
+        if not os.path.exists(path):
+            continue
+        waiting = pd.read_parquet(path)
+        if waiting.empty:
+            continue
+        matched, still_waiting = join_returns(waiting, orders)
+        if matched.empty:
+            continue
+        previous = pd.read_parquet(_part_path(store_dir, 'returned', file_hash))
+        combined = pd.concat([previous.astype({key: 'string' for key in FACT_KEYS + ['reason']}), matched],
+                             ignore_index=True)
+        combined = combined.groupby(FACT_KEYS + ['reason'], sort=False)[['quantity', 'returns']].sum().reset_index()
+        _write_part(store_dir, 'returned', file_hash, _categorical(combined, FACT_KEYS + ['reason']))
+        _write_part(store_dir, 'unmatched', file_hash, still_waiting)
+
+
+# --- Analysis ---
+
+def load_partials(store_dir=None, months=None):
+    """
+    The stored partial aggregates as (sold, returned, unmatched_returns),
+    optionally restricted to sale months in `months`.
+    """
+    sold = _read_parts(store_dir, 'sold')
+    returned = _read_parts(store_dir, 'returned')
+    unmatched = _read_parts(store_dir, 'unmatched', ['quantity'])
+    sold = sold if sold is not None else pd.DataFrame(columns=FACT_KEYS + ['quantity', 'orders'])
+    returned = returned if returned is not None else pd.DataFrame(columns=FACT_KEYS + ['reason', 'quantity', 'returns'])
+    if months:
+        sold = sold[sold['month'].isin(months)]
+        returned = returned[returned['month'].isin(months)]
+    return sold, returned, int(len(unmatched)) if unmatched is not None else 0
+
+
+def return_rates(sold, returned, by, min_sold=0):
+    """
+    Sold units, returned units and return rate (%) per `by` ('sku', 'state',
+    'courier' or 'month'). Members with fewer than `min_sold` sold units are
+    left out so one-off sales do not top the rankings at 100%.
+    """
+    sold_units = sold.groupby(by, observed=True)['quantity'].sum()
+    returned_units = returned.groupby(by, observed=True)['quantity'].sum()
+    rates = pd.DataFrame({'sold_units': sold_units}).join(returned_units.rename('returned_units'), how='outer')
+    rates = rates.fillna(0.0)
+    rates = rates[rates['sold_units'] >= max(min_sold, 1e-9)]
+    rates['return_rate'] = (rates['returned_units'] / rates['sold_units'] * 100).round(2)
+    return rates.reset_index().rename(columns={'index': by})
+
+
+def reason_breakdown(returned):
+    """Returned units per reason and their share of all returns (%)."""
+    reasons = returned.groupby('reason', observed=True)['quantity'].sum()
+    total = reasons.sum()
+    frame = pd.DataFrame({'returned_units': reasons, 'share': (reasons / total * 100).round(2) if total else 0.0})
+    return frame.reset_index().sort_values('returned_units', ascending=False, ignore_index=True)
+
+
+def top_rows(frame, column, n=10):
+    """The n rows with the largest `column`, by partial selection (O(len) instead of a full sort)."""
+    if len(frame) <= n:
+        return frame.sort_values(column, ascending=False, ignore_index=True)
+    values = frame[column].to_numpy()
+    picked = np.argpartition(-values, n - 1)[:n]
+    picked = picked[np.argsort(-values[picked], kind='stable')]
+    return frame.iloc[picked].reset_index(drop=True)
+
+
+def return_summary(sold, returned, unmatched_returns=0):
+    sold_units = float(sold['quantity'].sum())
+    returned_units = float(returned['quantity'].sum())
+    return {
+        'sold_units': round(sold_units, 2),
+        'returned_units': round(returned_units, 2),
+        'return_rate': round(returned_units / sold_units * 100, 2) if sold_units else 0.0,
+        'unmatched_returns': unmatched_returns,
+        'months': sorted(sold['month'].astype('string').unique().tolist()),
+    }
@@ -0,0 +1,198 @@
+"""
+Sales analytics on a pre-aggregated rollup cube.
+
+Each uploaded sales report is streamed once and reduced to a cube of
+day x SKU x state x platform with units, revenue and line counts. The cube
+is tiny next to the raw report (a year of a busy seller is typically tens of
+thousands of cells), so chart filters and drill-downs in the Sales Analysis
+tab query the cube and never re-group the raw rows.
+
+Long series are downsampled with Largest-Triangle-Three-Buckets (LTTB)
+before they reach Plotly, so charts stay responsive while peaks and troughs
+are preserved.
+"""
+import numpy as np
+import pandas as pd
+
+from ecommsolutions.gst_common import GST_STATES, iter_canonical_chunks, state_codes
+from ecommsolutions.ingestion import GroupTotals, consume, field_schema, parse_amounts, parse_dates
+from ecommsolutions.instrumentation import timed
+
+# Header names per field across Flipkart, Meesho and Amazon sales/order reports
+SALES_ALIASES = {
+    'date': ['Order Date', 'order_date', 'Buyer Invoice Date', 'Invoice Date', 'Order Approval Date',
+             'Purchase Date', 'purchase-date', 'Shipment Date', 'Date'],
+    'sku': ['SKU', 'Seller SKU', 'sku', 'Sku', 'supplier_sku', 'Product SKU', 'Supplier SKU'],
+    'state': ["Customer's Delivery State", 'end_customer_state_new', 'end_customer_state', 'Ship To State',
+              'ship-state', 'Delivery State', 'Customer State', 'State'],
+    'quantity': ['Item Quantity', 'quantity', 'Quantity', 'Qty', 'quantity-purchased'],
+    'revenue': ['Final Invoice Amount (Price after discount+Shipping Charges)', 'Final Invoice Amount',
+                'total_invoice_value', 'Invoice Amount', 'Invoice Value', 'Buyer Invoice Amount',
+                'item-price', 'Sale Amount', 'Order Value',
+                # Taxable value as a last resort when the report has no invoice amount
+                'Taxable Value (Final Invoice Amount -Taxes)', 'total_taxable_sale_value', 'Taxable Value'],
+    'event_type': ['Event Sub Type', 'Event Type', 'Transaction Type'],
+}
+SALES_REQUIRED = ['date', 'revenue']
+SALES_SCHEMA = field_schema(SALES_ALIASES)
+
+CUBE_KEYS = ['date', 'sku', 'state', 'platform']
+CUBE_VALUES = ['quantity', 'revenue', 'lines']
+UNKNOWN = 'Unknown'
+
+MAX_CHART_POINTS = 1500
+
+
+# --- Building the cube ---
+
+def _signs(chunk):
+    """Returns, refunds and cancellations subtract; 'Return Cancellation' reverses a return and counts as a sale."""
+    if 'event_type' not in chunk:
+        return np.ones(len(chunk))
+    event = chunk['event_type'].astype('string').str.upper().fillna('')
+    reverses = event.str.contains('RETURN|REFUND|CANCEL', regex=True)
+    reverses &= ~(event.str.contains('RETURN', regex=False) & event.str.contains('CANCEL', regex=False))
+    return np.where(reverses.to_numpy(dtype=bool), -1.0, 1.0)
+
+
+def cube_lines(chunk, platform):
+    """One chunk of canonical sales lines → signed rows keyed like the cube."""
+    sign = _signs(chunk)
+    codes = state_codes(chunk['state']) if 'state' in chunk else pd.Series(pd.NA, index=chunk.index, dtype='string')
+    sku = chunk['sku'].astype('string').str.strip() if 'sku' in chunk else None
+    quantity = parse_amounts(chunk['quantity']).abs() if 'quantity' in chunk else pd.Series(1.0, index=chunk.index)
+    return pd.DataFrame({
+        'date': parse_dates(chunk['date']).dt.normalize(),
+        'sku': sku.fillna(UNKNOWN).replace('', UNKNOWN) if sku is not None else UNKNOWN,
+        'state': codes.map(GST_STATES).fillna(UNKNOWN),
+        'platform': platform,
+        'quantity': quantity * sign,
+        'revenue': parse_amounts(chunk['revenue']).abs() * sign,
+        'lines': sign,
+    })
+
+
+def _as_cube(frame):
+    """Categorical keys keep filters and drill-downs cheap on repeated queries."""
+    frame = frame.dropna(subset=['date'])
+    for key in ('sku', 'state', 'platform'):
+        frame[key] = frame[key].astype('category')
+    frame['lines'] = frame['lines'].astype('int64')
+    return frame.reset_index(drop=True)
+
+
+def build_cube(chunks, platform):
+    """Reduces canonical sales chunks (SALES_ALIASES field names) to the rollup cube."""
+    totals = consume((cube_lines(chunk, platform) for chunk in chunks), GroupTotals(CUBE_KEYS, CUBE_VALUES))
+    return _as_cube(totals)
+
+
+@timed()
+def sales_cube(source, platform, file_name=None):
+    """Builds the cube from an uploaded/on-disk sales report."""
+    chunks = iter_canonical_chunks(source, SALES_ALIASES, SALES_REQUIRED, SALES_SCHEMA, file_name=file_name,
+                                   preferred_sheets=('Sales Report',))
+    return build_cube(chunks, platform)
+
+
+def empty_cube():
+    return _as_cube(pd.DataFrame({
+        'date': pd.Series(dtype='datetime64[ns]'),
+        **{key: pd.Series(dtype='string') for key in CUBE_KEYS[1:]},
+        **{value: pd.Series(dtype='float64') for value in CUBE_VALUES},
+    }))
+
+
+def combine_cubes(cubes):
+    """Merges cubes from several uploads (the same day/SKU/state/platform may appear in more than one)."""
+    cubes = [cube for cube in cubes if len(cube)]
+    if not cubes:
+        return empty_cube()
+    if len(cubes) == 1:
+        return cubes[0]
+    stacked = pd.concat([cube.astype({key: 'string' for key in CUBE_KEYS[1:]}) for cube in cubes], ignore_index=True)
+    return _as_cube(stacked.groupby(CUBE_KEYS, sort=False).sum().reset_index())
+
+
+# --- Queries on the cube ---
+
+def filter_cube(cube, start=None, end=None, platforms=None, states=None, skus=None):
+    """Rows of the cube inside the date range and matching the selected members (None/empty = all)."""
+    mask = np.ones(len(cube), dtype=bool)
+    if start is not None:
+        mask &= (cube['date'] >= pd.Timestamp(start)).to_numpy()
+    if end is not None:
+        mask &= (cube['date'] <= pd.Timestamp(end)).to_numpy()
+    for key, members in (('platform', platforms), ('state', states), ('sku', skus)):
+        if members:
+            mask &= cube[key].isin(members).to_numpy()
+    return cube[mask]
+
+
+def cube_totals(cube):
+    """Headline numbers of a (filtered) cube."""
+    return {
+        'revenue': round(float(cube['revenue'].sum()), 2),
+        'units': round(float(cube['quantity'].sum()), 2),
+        'orders': int(cube['lines'].sum()),
+        'skus': int(cube.loc[cube['lines'] > 0, 'sku'].nunique()),
+    }
+
+
+def revenue_trend(cube, freq='D', by=None):
+    """Revenue and units per period ('D', 'W', 'MS'), optionally split by 'platform' / 'state' / 'sku'."""
+    keys = [pd.Grouper(key='date', freq=freq)] + ([by] if by else [])
+    trend = cube.groupby(keys, observed=True)[['revenue', 'quantity']].sum().reset_index()
+    return trend.sort_values('date', ignore_index=True)
+
+
+def top_members(cube, key='sku', n=10, value='revenue'):
+    """The n largest SKUs / states / platforms by `value`."""
+    ranked = cube.groupby(key, observed=True)[['revenue', 'quantity', 'lines']].sum()
+    return ranked.nlargest(n, value).reset_index()
+
+
+# --- Downsampling for charts ---
+
+def lttb_indices(x, y, threshold):
+    """
+    Largest-Triangle-Three-Buckets: positions of `threshold` points of (x, y)
+    that preserve the visual shape of the series. Always keeps the first and
+    last point; returns every position when the series is already short.
+    """
+    n = len(y)
+    if threshold >= n or threshold < 3:
+        return np.arange(n)
+    x = np.asarray(x, dtype='float64')
+    y = np.asarray(y, dtype='float64')
+
+    # Interior points are split into threshold-2 buckets
+    edges = np.linspace(1, n - 1, threshold - 1).astype(np.int64)
+    selected = np.empty(threshold, dtype=np.int64)
+    selected[0], selected[-1] = 0, n - 1
+    previous = 0
+    for bucket in range(threshold - 2):
+        start, end = edges[bucket], edges[bucket + 1]
+        next_start, next_end = end, (edges[bucket + 2] if bucket + 2 < len(edges) else n)
+        avg_x = x[next_start:next_end].mean()
+        avg_y = y[next_start:next_end].mean()
+        # Triangle area between the last kept point, each candidate and the next bucket's average
+        areas = np.abs((x[previous] - avg_x) * (y[start:end] - y[previous])
+                       - (x[previous] - x[start:end]) * (avg_y - y[previous]))
+        previous = start + int(np.argmax(areas))
+        selected[bucket + 1] = previous
+    return selected
+
+
+def downsample(frame, x='date', y='revenue', by=None, max_points=MAX_CHART_POINTS):
+    """LTTB-downsamples a chart frame (per `by` series) to about `max_points` points in total."""
+    if len(frame) <= max_points:
+        return frame
+    groups = [frame] if by is None else [group for _, group in frame.groupby(by, observed=True)]
+    per_series = max(3, max_points // max(len(groups), 1))
+    parts = []
+    for group in groups:
+        xs = group[x].to_numpy()
+        xs = xs.astype('datetime64[ns]').astype('int64') if np.issubdtype(xs.dtype, np.datetime64) else xs
+        parts.append(group.iloc[lttb_indices(xs, group[y].to_numpy(), per_series)])
+    return pd.concat(parts)
@@ -0,0 +1,368 @@
+"""
+Validation of GST reports before they are aggregated.
+
+Every GST engine runs `validate_report` over its reports first (the custom
+mapping engine runs `validate_chunks` over its mapped fields, with amounts
+mapped from a column passed through unconverted). The pass
+reads only the checked columns (from the Parquet report cache, which the
+same pass fills on a first upload) and checks each chunk with vectorized
+operations:
+
+  - GSTINs: format (2-digit state code, PAN, entity code, 'Z', check
+    character) and the check character itself (GSTN's mod-36 checksum)
+  - HSN / SAC codes: 4, 6 or 8 digits
+  - GST rates: one of ALLOWED_GST_RATES (a rate split into CGST + SGST is
+    combined the way the engines combine it)
+  - amounts: blank, not a number, or negative where the report should only
+    hold positive values
+  - duplicate lines: the same invoice / order line key more than once
+
+GSTINs, HSN codes and rates repeat a few hundred distinct values across a
+million rows, so those checks run per distinct value (map_distinct).
+Duplicates are found once at the end over the key columns of every chunk
+(only those columns are kept).
+
+The result is a compact summary (one row per check and field with a count
+and a few example values) plus up to SAMPLE_ROWS offending rows per check,
+never the full frame. Errors stop the filing (ValidationError) before the
+aggregation runs unless the engine is called with strict=False; warnings
+(and errors when not strict) are returned alongside the GSTR-1 tables.
+"""
+import os
+
+import numpy as np
+import pandas as pd
+from pandas.api.types import union_categoricals
+
+from ecommsolutions.gst_common import (
+    ALLOWED_GST_RATES, canonical_columns, iter_canonical_chunks, normalize_hsn, normalize_rates, source_name,
+)
+from ecommsolutions.ingestion import consume, map_distinct, parse_amounts
+from ecommsolutions.instrumentation import timed
+
+ERROR = 'error'
+WARNING = 'warning'
+
+# State code, PAN, entity number, 'Z' ('C' for e-commerce operators collecting TCS), check character;
+# TDS deductors register on their TAN with 'D'
+GSTIN_PATTERN = r'[0-9]{2}(?:[A-Z]{5}[0-9]{4}[A-Z][1-9A-Z][ZC]|[A-Z]{4}[0-9]{5}[A-Z][1-9A-Z]D)[0-9A-Z]'
+HSN_PATTERN = r'[0-9]{4}(?:[0-9]{2}){0,2}'
+
+CHECK_GSTIN = 'Invalid GSTIN'
+CHECK_HSN = 'Invalid HSN code'
+CHECK_HSN_MISSING = 'HSN code missing'
+CHECK_RATE = 'GST rate not allowed'
+CHECK_AMOUNT = 'Amount is not a number'
+CHECK_AMOUNT_MISSING = 'Amount missing'
+CHECK_NEGATIVE = 'Negative amount'
+CHECK_DUPLICATE = 'Duplicate line'
+
+SEVERITIES = {
+    CHECK_GSTIN: ERROR, CHECK_HSN: ERROR, CHECK_RATE: ERROR, CHECK_AMOUNT: ERROR,
+    CHECK_HSN_MISSING: WARNING, CHECK_AMOUNT_MISSING: WARNING, CHECK_NEGATIVE: WARNING, CHECK_DUPLICATE: WARNING,
+}
+
+ISSUE_COLUMNS = ['File', 'Check', 'Severity', 'Field', 'Rows', 'Examples']
+SAMPLE_ROWS = 5
+EXAMPLE_VALUES = 3
+
+_GSTIN_FACTORS = np.resize(np.array([1, 2], dtype=np.int64), 14)
+
+
+# --- GSTINs ---
+
+def _checksums_valid(gstins):
+    """
+    GSTN check character test for an array of GSTINs already matching
+    GSTIN_PATTERN: characters count 0-9 then A-Z as 10-35, alternate ones are
+    doubled, each product adds its base-36 digits, and the 15th character is
+    the mod-36 complement of the sum.
+    """
+    if not len(gstins):
+        return np.zeros(0, dtype=bool)
+    codes = np.frombuffer(''.join(gstins).encode('ascii'), dtype=np.uint8).reshape(-1, 15).astype(np.int64)
+    values = np.where(codes <= ord('9'), codes - ord('0'), codes - ord('A') + 10)
+    products = values[:, :14] * _GSTIN_FACTORS
+    total = (products // 36 + products % 36).sum(axis=1)
+    return (36 - total % 36) % 36 == values[:, 14]
+
+
+def _valid_gstin_values(gstins, allow_blank=False):
+    gstins = gstins.str.strip().str.upper()
+    shaped = gstins.str.fullmatch(GSTIN_PATTERN).fillna(False).to_numpy(dtype=bool)
+    valid = np.zeros(len(gstins), dtype=bool)
+    valid[shaped] = _checksums_valid(gstins[shaped].tolist())
+    if allow_blank:
+        valid |= gstins.fillna('').to_numpy(dtype=object) == ''
+    return pd.Series(valid, index=gstins.index)
+
+
+def valid_gstins(values, allow_blank=False):
+    """
+    True where a value is a well-formed GSTIN with a correct check character
+    (or blank, with `allow_blank`); checked per distinct value.
+    """
+    return map_distinct(values, lambda gstins: _valid_gstin_values(gstins, allow_blank)).astype(bool)
+
+
+def gstin_problem(gstin):
+    """Why a single GSTIN (e.g. the firm's own) is invalid, or None when it is valid."""
+    gstin = (gstin or '').strip().upper()
+    if len(gstin) != 15:
+        return f"A GSTIN has 15 characters ({len(gstin)} entered)."
+    if not pd.Series([gstin]).str.fullmatch(GSTIN_PATTERN).iloc[0]:
+        return "The GSTIN does not have the GSTIN format (state code, PAN, entity number, 'Z', check character)."
+    if not _checksums_valid([gstin])[0]:
+        return "The GSTIN's check character (last character) does not match; check it for typing errors."
+    return None
+
+
+# --- Checking chunks ---
+
+def _blank(values):
+    if pd.api.types.is_numeric_dtype(values):
+        return values.isna().to_numpy()
+    text = values.astype('string').str.strip()
+    return (text.isna() | (text == '')).to_numpy(dtype=bool)
+
+
+def _stacked(columns):
+    """One column from per-chunk pieces; categorical pieces are recoded onto shared categories, not cast."""
+    if all(isinstance(column.dtype, pd.CategoricalDtype) for column in columns):
+        return pd.Series(union_categoricals(columns))
+    return pd.concat([column.astype('string') for column in columns], ignore_index=True)
+
+
+def _rates(chunk, fields):
+    """The line's GST rate: the first field (IGST) when positive, else the sum of the rest (CGST + SGST / UTGST)."""
+    if len(fields) == 1:
+        return normalize_rates(chunk[fields[0]])
+    parts = [normalize_rates(chunk[field]).fillna(0.0) if field in chunk else pd.Series(0.0, index=chunk.index)
+             for field in fields]
+    return parts[0].where(parts[0] > 0, sum(parts[1:]))
+
+
+class ReportValidator:
+    """
+    Checks canonical chunks of one report and collects a summary and sample
+    rows per (check, field). Fields missing from the report are skipped.
+
+      gstins        GSTIN fields; blank values are allowed (B2C lines)
+      hsn           HSN / SAC field
+      rates         rate field, or IGST, CGST, SGST[, UTGST] rate fields
+      amounts       amount fields (read unconverted, so blanks and text show)
+      non_negative  amount fields that should never be negative
+      unique        fields that together identify a line
+      labels        {field: name shown to the user}, e.g. the report column
+    """
+
+    def __init__(self, file_name, gstins=(), hsn=None, rates=(), amounts=(), non_negative=(), unique=(), labels=None):
+        self.file_name = file_name
+        self.gstins = list(gstins)
+        self.hsn = hsn
+        self.rates = list(rates)
+        self.amounts = list(amounts)
+        self.non_negative = set(non_negative)
+        self.unique = list(unique)
+        self.labels = labels or {}
+        self.rows = 0
+        self._counts = {}
+        self._examples = {}
+        self._samples = []
+        self._sampled = {}
+        self._keys = []
+
+    def _label(self, field):
+        return ' + '.join(self.labels.get(part, part) for part in field.split(' + '))
+
+    def fields(self):
+        return list(dict.fromkeys(self.gstins + ([self.hsn] if self.hsn else []) + self.rates + self.amounts + self.unique))
+
+    def _record(self, check, field, bad, chunk, rows, values):
+        count = int(bad.sum())
+        if not count:
+            return
+        key = (check, field)
+        self._counts[key] = self._counts.get(key, 0) + count
+        examples = self._examples.setdefault(key, [])
+        if len(examples) < EXAMPLE_VALUES:
+            for value in pd.unique(np.asarray(values[bad][:50])):
+                if len(examples) < EXAMPLE_VALUES and not pd.isna(value) and str(value) not in examples:
+                    examples.append(str(value))
+        wanted = SAMPLE_ROWS - self._sampled.get(key, 0)
+        if wanted > 0:
+            positions = np.flatnonzero(bad)[:wanted]
+            sample = chunk.iloc[positions][[field for field in self.fields() if field in chunk]]
+            sample = sample.rename(columns=self.labels).astype('string')
+            sample.insert(0, 'Row', rows[positions])
+            sample.insert(0, 'Field', self._label(field))
+            sample.insert(0, 'Check', check)
+            sample.insert(0, 'File', self.file_name)
+            self._samples.append(sample)
+            self._sampled[key] = self._sampled.get(key, 0) + len(positions)
+
+    def update(self, chunk):
+        # Sheet row numbers, the header being row 1
+        rows = np.arange(self.rows, self.rows + len(chunk)) + 2
+        self.rows += len(chunk)
+
+        for field in self.gstins:
+            if field in chunk:
+                bad = ~valid_gstins(chunk[field], allow_blank=True).to_numpy()
+                self._record(CHECK_GSTIN, field, bad, chunk, rows, chunk[field])
+
+        if self.hsn in chunk:
+            hsn = normalize_hsn(chunk[self.hsn].astype('string'))
+            missing = (hsn == '').to_numpy(dtype=bool)
+            shaped = map_distinct(hsn, lambda codes: codes.str.fullmatch(HSN_PATTERN).fillna(False)).to_numpy(dtype=bool)
+            self._record(CHECK_HSN_MISSING, self.hsn, missing, chunk, rows, hsn)
+            self._record(CHECK_HSN, self.hsn, ~missing & ~shaped, chunk, rows, hsn)
+
+        if self.rates and self.rates[0] in chunk:
+            rate = _rates(chunk, self.rates).round(2)
+            bad = ~rate.isin(ALLOWED_GST_RATES).to_numpy(dtype=bool)
+            self._record(CHECK_RATE, self.rates[0], bad, chunk, rows, rate)
+
+        for field in self.amounts:
+            if field not in chunk:
+                continue
+            raw = chunk[field]
+            amounts = parse_amounts(raw, fill=None).to_numpy()
+            unparsed = np.isnan(amounts)
+            # Only the few values that did not parse are told apart into blanks and text
+            blank = np.zeros(len(chunk), dtype=bool)
+            blank[unparsed] = _blank(raw[unparsed])
+            self._record(CHECK_AMOUNT_MISSING, field, blank, chunk, rows, raw)
+            self._record(CHECK_AMOUNT, field, unparsed & ~blank, chunk, rows, raw)
+            if field in self.non_negative:
+                self._record(CHECK_NEGATIVE, field, amounts < 0, chunk, rows, raw)
+
+        keys = [field for field in self.unique if field in chunk]
+        if keys:
+            self._keys.append(chunk[keys])
+
+    def _check_duplicates(self):
+        """One duplicated() over the key columns of all chunks (factorizing beats hashing strings per chunk)."""
+        if not self._keys:
+            return
+        keys = pd.DataFrame({field: _stacked([chunk[field] for chunk in self._keys]) for field in self._keys[0]})
+        self._keys = []
+        repeated = keys.duplicated().to_numpy()
+        if repeated.any():
+            # Example labels are only built for the repeated rows
+            fields = list(keys.columns)
+            key_values = keys[repeated].astype('string').fillna('')
+            labels = np.full(len(keys), '', dtype=object)
+            labels[repeated] = key_values[fields[0]].str.cat(key_values[fields[1:]], sep=' / ').to_numpy(dtype=object)
+            self._record(CHECK_DUPLICATE, ' + '.join(fields), repeated, keys, np.arange(len(keys)) + 2, labels)
+
+    def result(self):
+        self._check_duplicates()
+        issues = pd.DataFrame([
+            {'File': self.file_name, 'Check': check, 'Severity': SEVERITIES[check],
+             'Field': self._label(field),
+             'Rows': count, 'Examples': ', '.join(self._examples.get((check, field), []))}
+            for (check, field), count in self._counts.items()
+        ], columns=ISSUE_COLUMNS)
+        samples = pd.concat(self._samples, ignore_index=True) if self._samples else empty_validation()['samples']
+        return {'file': self.file_name, 'rows': self.rows, 'issues': _ordered(issues), 'samples': samples}
+
+
+def _ordered(issues):
+    """Errors first, then the most frequent problems."""
+    order = (issues['Severity'] != ERROR).astype(int)
+    issues = issues.assign(_order=order).sort_values(['_order', 'Rows'], ascending=[True, False])
+    return issues.drop(columns='_order').reset_index(drop=True)
+
+
+# --- Validating reports ---
+
+def empty_validation():
+    return {'file': None, 'rows': 0, 'issues': pd.DataFrame(columns=ISSUE_COLUMNS),
+            'samples': pd.DataFrame(columns=['File', 'Check', 'Field', 'Row'])}
+
+
+def combine_validations(results):
+    """One validation result for several files (issues and samples stacked)."""
+    results = [result for result in results if result is not None]
+    if not results:
+        return empty_validation()
+    issues = [result['issues'] for result in results if len(result['issues'])]
+    samples = [result['samples'] for result in results if len(result['samples'])]
+    return {
+        'file': ', '.join(str(result['file']) for result in results if result['file']),
+        'rows': sum(result['rows'] for result in results),
+        'issues': _ordered(pd.concat(issues, ignore_index=True)) if issues else empty_validation()['issues'],
+        'samples': pd.concat(samples, ignore_index=True) if samples else empty_validation()['samples'],
+    }
+
+
+def has_errors(result):
+    return bool((result['issues']['Severity'] == ERROR).any())
+
+
+def validation_message(issues, severity=ERROR, limit=5):
+    """'tcs_sales.xlsx: 12 rows Invalid HSN code (hsn_code); ...' for the issues of one severity."""
+    issues = issues[issues['Severity'] == severity]
+    parts = [f"{row.File}: {row.Rows:,} rows {row.Check} ({row.Field})" for row in issues.head(limit).itertuples()]
+    if len(issues) > limit:
+        parts.append(f"{len(issues) - limit} more")
+    return '; '.join(parts)
+
+
+class ValidationError(ValueError):
+    """Raised when reports fail validation; carries the validation result (summary and sample rows)."""
+
+    def __init__(self, result):
+        super().__init__(f"Reports failed validation: {validation_message(result['issues'])}")
+        self.result = result
+
+    def __reduce__(self):
+        # Rebuilt from the result when raised in a worker process
+        return ValidationError, (self.result,)
+
+
+def raise_on_errors(results):
+    """Combines per-file results and raises ValidationError if any has errors; returns the combined result."""
+    combined = combine_validations(results)
+    if has_errors(combined):
+        raise ValidationError(combined)
+    return combined
+
+
+def settle_validations(results, strict=True):
+    """
+    The combined result of per-file validations; with `strict` a result with
+    errors raises ValidationError so the aggregation never starts.
+    """
+    return raise_on_errors(results) if strict else combine_validations(results)
+
+
+def with_validation(gstr1, result):
+    """Adds a validation result's issues and sample rows to a GSTR-1 result dict."""
+    gstr1['validation'] = result['issues']
+    gstr1['validation_samples'] = result['samples']
+    return gstr1
+
+
+def validate_chunks(chunks, file_name, checks, labels=None):
+    """Runs a ReportValidator (`checks` are its keyword arguments) over canonical chunks."""
+    return consume(chunks, ReportValidator(file_name, labels=labels, **checks))
+
+
+@timed()
+def validate_report(source, aliases, required, schema, checks, file_name=None, sheet=None, preferred_sheets=()):
+    """
+    Validates one report read like iter_canonical_chunks, loading only the
+    checked fields. Amount fields are read unconverted so blanks and text
+    are told apart from zeros. Issues name the report's own column headers.
+    """
+    file_name = source_name(source, file_name)
+    validator = ReportValidator(os.path.basename(file_name), **checks)
+    fields = set(validator.fields()) | set(required)
+    aliases = {field: names for field, names in aliases.items() if field in fields}
+    sheet, mapping = canonical_columns(source, aliases, required, file_name, sheet, preferred_sheets)
+    validator.labels = {field: column for column, field in mapping.items()}
+    schema = {field: kind for field, kind in (schema or {}).items() if field not in validator.amounts}
+    chunks = iter_canonical_chunks(source, aliases, required, schema, file_name=file_name, sheet=sheet)
+    return consume(chunks, validator)
@@ -0,0 +1,85 @@
+import pandas as pd
+import pytest
+
+from ecommsolutions.amazon_gstr1 import process_amazon_mtr_reports
+
+SELLER_GSTIN = '09ABCDE1234F1ZY'
+BUYER_GSTIN = '29AAACB1234C1ZB'
+
+MTR_COLUMNS = ['Transaction Type', 'Order Id', 'Shipment Id', 'Invoice Number', 'Shipment Item Id', 'Ship To State',
+               'Hsn/sac', 'Quantity', 'Tax Exclusive Gross', 'Total Tax Amount', 'Invoice Amount', 'Igst Rate',
+               'Cgst Rate', 'Sgst Rate']
+
+
+@pytest.fixture(autouse=True)
+def report_cache(tmp_path, monkeypatch):
+    monkeypatch.setattr('ecommsolutions.report_cache.CACHE_DIR', str(tmp_path / 'cache'))
+
+
+def _mtr(tmp_path, name, rows, **extra):
+    """An MTR CSV from MTR_COLUMNS rows (rates written as fractions, as the MTRs do)."""
+    frame = pd.DataFrame(rows, columns=MTR_COLUMNS).assign(**{'Seller Gstin': SELLER_GSTIN, 'Invoice Date': '2025-04-10'},
+                                                            **extra)
+    path = tmp_path / name
+    frame.to_csv(path, index=False)
+    return str(path)
+
+
+def _reports(tmp_path):
+    shipment_up = ('Shipment', 'O1', 'S1', 'I1', 'item1', 'UTTAR PRADESH', '6109', 1, 1000.0, 50.0, 1050.0, 0, 0.025, 0.025)
+    april = _mtr(tmp_path, 'mtr_b2c_april.csv', [
+        shipment_up,
+        ('Shipment', 'O2', 'S2', 'I2', 'item2', 'MAHARASHTRA', '6109', 2, 500.0, 25.0, 525.0, 0.05, 0, 0),
+        ('Refund', 'O2', 'S2', 'I2', 'item2', 'MAHARASHTRA', '6109', 1, -250.0, -12.5, -262.5, 0.05, 0, 0),
+        ('FreeReplacement', 'O3', 'S3', 'I3', 'item3', 'MAHARASHTRA', '6204', 1, 200.0, 24.0, 224.0, 0.12, 0, 0),
+    ])
+    # An overlapping download repeats the first shipment
+    overlap = _mtr(tmp_path, 'mtr_b2c_overlap.csv', [
+        shipment_up,
+        ('Cancel', 'O4', 'S4', 'I4', 'item4', 'DELHI', '6204', 1, 300.0, 36.0, 336.0, 0.12, 0, 0),
+    ])
+    b2b = _mtr(tmp_path, 'mtr_b2b.csv', [
+        ('Shipment', 'O5', 'S5', 'INVB1', 'item5', 'KARNATAKA', '6109', 1, 2000.0, 360.0, 2360.0, 0.18, 0, 0),
+        ('Refund', 'O5', 'S5', 'INVB1', 'item5', 'KARNATAKA', '6109', 1, -500.0, -90.0, -590.0, 0.18, 0, 0),
+    ], **{'Customer Bill To Gstid': BUYER_GSTIN, 'Buyer Name': 'Buyer Pvt Ltd',
+          'Credit Note No': ['', 'CN-1'], 'Credit Note Date': ['', '2025-04-20']})
+    return [april, overlap, b2b]
+
+
+def test_b2cs_and_hsn_from_several_mtrs(tmp_path):
+    gstr1 = process_amazon_mtr_reports(_reports(tmp_path), SELLER_GSTIN, max_workers=1)
+
+    b2cs = gstr1['b2cs']
+    assert b2cs[['Place Of Supply', 'Rate', 'Taxable Value', 'Integrated Tax Amount', 'Central Tax Amount']].values.tolist() == [
+        ['07-Delhi', 12.0, -300.0, -36.0, 0.0],
+        ['09-Uttar Pradesh', 5.0, 1000.0, 0.0, 25.0],
+        ['27-Maharashtra', 5.0, 250.0, 12.5, 0.0],
+        ['27-Maharashtra', 12.0, 200.0, 24.0, 0.0],
+    ]
+
+    hsn = gstr1['hsn']
+    assert hsn[['HSN', 'Rate', 'Total Quantity', 'Total Value', 'Taxable Value', 'Integrated Tax Amount']].values.tolist() == [
+        ['6109', 5.0, 2.0, 1312.5, 1250.0, 12.5],
+        ['6109', 18.0, 0.0, 1770.0, 1500.0, 270.0],
+        ['6204', 12.0, 0.0, -112.0, -100.0, -12.0],
+    ]
+
+
+def test_b2b_refunds_use_their_credit_note_number(tmp_path):
+    gstr1 = process_amazon_mtr_reports(_reports(tmp_path), SELLER_GSTIN, max_workers=1)
+
+    assert gstr1['b2b'][['Invoice Number', 'Rate', 'Taxable Value', 'Integrated Tax Amount', 'Invoice Value']].values.tolist() == [
+        ['INVB1', 18.0, 2000.0, 360.0, 2360.0]]
+    cdnr = gstr1['cdnr']
+    assert cdnr[['Note Number', 'Note Date', 'Rate', 'Taxable Value', 'Integrated Tax Amount', 'Note Value']].values.tolist() == [
+        ['CN-1', '20-Apr-2025', 18.0, 500.0, 90.0, 590.0]]
+
+
+def test_summary_counts_repeated_lines_once(tmp_path):
+    summary = process_amazon_mtr_reports(_reports(tmp_path), SELLER_GSTIN, max_workers=1)['summary']
+    assert (summary['files'], summary['duplicate_lines']) == (3, 1)
+    assert (summary['shipment_lines'], summary['refund_lines'], summary['cancellation_lines']) == (4, 2, 1)
+    assert (summary['gross_taxable_value'], summary['returns_taxable_value'], summary['net_taxable_value']) == (
+        3700.0, 1050.0, 2650.0)
+    assert (summary['igst'], summary['cgst'], summary['sgst']) == (270.5, 25.0, 25.0)
+    assert (summary['b2b_invoices'], summary['credit_notes']) == (1, 1)
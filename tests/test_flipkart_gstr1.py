@@ -0,0 +1,68 @@
+import pandas as pd
+
+from ecommsolutions.flipkart_gstr1 import FLIPKART_GSTIN, compute_flipkart_gstr1
+
+SELLER_GSTIN = '09ABCDE1234F1ZY'
+BUYER_GSTIN = '29AAACB1234C1ZB'
+
+COLUMNS = ['seller_gstin', 'event_type', 'event_sub_type', 'delivery_state', 'hsn', 'quantity', 'taxable_value',
+           'invoice_value', 'igst_rate', 'igst', 'cgst_rate', 'cgst', 'sgst_rate', 'sgst', 'buyer_gstin',
+           'invoice_id']
+
+
+def _report():
+    """One Sales Report month: B2C sales, a return and a reversed return, B2B sales, a B2B return and a
+    cancellation of an earlier period's B2B sale, plus a line of another seller GSTIN."""
+    report = pd.DataFrame([
+        (SELLER_GSTIN, 'Sale', None, 'Delhi', '6109', 1, 100.0, 118.0, 18, 18.0, 0, 0.0, 0, 0.0, '', 'FK1'),
+        (SELLER_GSTIN, 'Return', None, 'Delhi', '6109', -1, -100.0, -118.0, 18, -18.0, 0, 0.0, 0, 0.0, '', 'FK1'),
+        (SELLER_GSTIN, 'Sale', None, 'Uttar Pradesh', '6204', 2, 400.0, 420.0, 0, 0.0, 2.5, 10.0, 2.5, 10.0, '', 'FK2'),
+        (SELLER_GSTIN, 'Return', 'Return Cancellation', 'Uttar Pradesh', '6204', 1, 200.0, 210.0, 0, 0.0, 2.5, 5.0,
+         2.5, 5.0, '', 'FK3'),
+        (SELLER_GSTIN, 'Sale', None, 'Karnataka', '6109', 1, 1000.0, 1120.0, 12, 120.0, 0, 0.0, 0, 0.0, BUYER_GSTIN,
+         'FKB1'),
+        (SELLER_GSTIN, 'Return', None, 'Karnataka', '6109', 1, 250.0, 280.0, 12, 30.0, 0, 0.0, 0, 0.0, BUYER_GSTIN,
+         'FKCN1'),
+        (SELLER_GSTIN, 'Cancellation', None, 'Karnataka', '6109', 1, 300.0, 315.0, 5, 15.0, 0, 0.0, 0, 0.0,
+         BUYER_GSTIN, 'FKB0'),
+        ('27AAAAA0000A1Z5', 'Sale', None, 'Delhi', '6109', 5, 5000.0, 5900.0, 18, 900.0, 0, 0.0, 0, 0.0, '', 'X1'),
+    ], columns=COLUMNS)
+    return report.assign(buyer_name='Buyer Pvt Ltd', invoice_date='2025-04-10')
+
+
+def test_b2cs_and_hsn_net_returns_and_cancellations():
+    gstr1 = compute_flipkart_gstr1([_report()], SELLER_GSTIN)
+
+    b2cs = gstr1['b2cs']
+    assert b2cs[['Place Of Supply', 'Rate', 'Taxable Value', 'Central Tax Amount', 'State/UT Tax Amount']].values.tolist() == [
+        ['09-Uttar Pradesh', 5.0, 600.0, 15.0, 15.0]]
+    assert set(b2cs['E-Commerce GSTIN']) == {FLIPKART_GSTIN}
+
+    hsn = gstr1['hsn']
+    assert hsn[['HSN', 'Rate', 'Total Quantity', 'Total Value', 'Taxable Value', 'Integrated Tax Amount']].values.tolist() == [
+        ['6109', 5.0, -1.0, -315.0, -300.0, -15.0],
+        ['6109', 12.0, 0.0, 840.0, 750.0, 90.0],
+        ['6204', 5.0, 3.0, 630.0, 600.0, 0.0],
+    ]
+
+
+def test_registered_buyers_get_invoices_and_credit_notes():
+    gstr1 = compute_flipkart_gstr1([_report()], SELLER_GSTIN)
+
+    b2b = gstr1['b2b']
+    assert b2b[['GSTIN/UIN of Recipient', 'Invoice Number', 'Rate', 'Taxable Value', 'Integrated Tax Amount',
+                'Invoice Value', 'Place Of Supply']].values.tolist() == [
+        [BUYER_GSTIN, 'FKB1', 12.0, 1000.0, 120.0, 1120.0, '29-Karnataka']]
+    # The return is a credit note; the cancellation's sale was filed earlier, so it is one too
+    cdnr = gstr1['cdnr']
+    assert cdnr[['Note Number', 'Rate', 'Taxable Value', 'Integrated Tax Amount', 'Note Value']].values.tolist() == [
+        ['FKCN1', 12.0, 250.0, 30.0, 280.0], ['FKB0', 5.0, 300.0, 15.0, 315.0]]
+
+
+def test_summary_totals():
+    summary = compute_flipkart_gstr1([_report()], SELLER_GSTIN)['summary']
+    assert (summary['sales_lines'], summary['return_lines'], summary['cancellation_lines']) == (4, 2, 1)
+    assert (summary['gross_taxable_value'], summary['returns_taxable_value'], summary['net_taxable_value']) == (
+        1700.0, 650.0, 1050.0)
+    assert (summary['igst'], summary['cgst'], summary['sgst']) == (75.0, 15.0, 15.0)
+    assert (summary['b2b_invoices'], summary['credit_notes']) == (1, 2)
@@ -0,0 +1,42 @@
+import numpy as np
+import pandas as pd
+
+from ecommsolutions.gst_common import build_registered, normalize_rates
+
+BUYER_GSTIN = '29AAACB1234C1ZB'
+
+
+def _registered_lines(rows):
+    """Registered-buyer lines from (invoice, rate, taxable value) tuples, billed inter-state to Karnataka."""
+    lines = pd.DataFrame(rows, columns=['invoice_id', 'rate', 'taxable_value'])
+    lines['tax'] = lines['taxable_value'] * lines['rate'] / 100
+    lines['invoice_value'] = lines['taxable_value'] + lines['tax']
+    return lines.assign(buyer_gstin=BUYER_GSTIN, buyer_name='Buyer', invoice_date=pd.Timestamp('2025-04-10'),
+                        state_code='29')
+
+
+def test_negative_rate_of_a_mixed_invoice_becomes_a_credit_note():
+    lines = _registered_lines([('INV1', 5.0, 100.0), ('INV1', 12.0, -300.0), ('INV2', 18.0, 50.0)])
+    b2b, cdnr = build_registered(lines, [False, False, False], '09')
+
+    assert b2b[['Invoice Number', 'Rate', 'Taxable Value']].values.tolist() == [['INV1', 5.0, 100.0],
+                                                                                ['INV2', 18.0, 50.0]]
+    assert b2b['Integrated Tax Amount'].tolist() == [5.0, 9.0]
+    assert cdnr[['Note Number', 'Rate', 'Taxable Value', 'Integrated Tax Amount', 'Note Value']].values.tolist() == [
+        ['INV1', 12.0, 300.0, 36.0, 336.0]]
+
+
+def test_returns_are_credit_notes_and_cancellations_net_off():
+    lines = _registered_lines([('INV1', 18.0, 200.0), ('INV1', 18.0, -50.0), ('CN1', 18.0, -100.0)])
+    b2b, cdnr = build_registered(lines, [False, False, True], '09')
+
+    assert b2b[['Invoice Number', 'Taxable Value', 'Invoice Value']].values.tolist() == [['INV1', 150.0, 177.0]]
+    assert cdnr[['Note Number', 'Taxable Value', 'Integrated Tax Amount']].values.tolist() == [['CN1', 100.0, 18.0]]
+
+
+def test_normalize_rates_scales_fractions_but_keeps_small_slabs():
+    rates = pd.Series([0.18, 0.05, 0.1, 0.25, 18, '12', 'n/a'])
+    assert normalize_rates(rates).tolist()[:6] == [18.0, 5.0, 0.1, 0.25, 18.0, 12.0]
+    assert pd.isna(normalize_rates(rates).iloc[6])
+    # float32 cells (e.g. Parquet/Excel readers) hold 0.1 as 0.100000001
+    assert normalize_rates(pd.Series([0.1, 0.25, 0.18], dtype=np.float32)).tolist() == [0.1, 0.25, 18.0]
@@ -0,0 +1,86 @@
+import json
+
+import pandas as pd
+
+from ecommsolutions.gst_common import B2B_COLUMNS, B2CS_COLUMNS, CDNR_COLUMNS, HSN_COLUMNS
+from ecommsolutions.gstr1_json import gstr1_json_bytes, return_period, validate_totals, write_gstr1_json
+
+SELLER_GSTIN = '09ABCDE1234F1ZY'
+BUYER_GSTIN = '29AAACB1234C1ZB'
+ECO_GSTIN = '07AACCF0683K1CU'
+
+
+def _gstr1():
+    """GSTR-1 tables as the engines return them (offline-tool column names)."""
+    b2b = pd.DataFrame([
+        # Out of order on purpose: the JSON lists documents by recipient and number
+        [BUYER_GSTIN, 'Buyer', 'INV2', '12-Apr-2025', 1617.0, '29-Karnataka', 'N', '', 'Regular B2B', ECO_GSTIN,
+         12.0, 500.0, 0.0, 60.0, 0.0, 0.0],
+        [BUYER_GSTIN, 'Buyer', 'INV1', '10-Apr-2025', 1180.0, '29-Karnataka', 'N', '', 'Regular B2B', ECO_GSTIN,
+         18.0, 1000.0, 0.0, 180.0, 0.0, 0.0],
+        [BUYER_GSTIN, 'Buyer', 'INV2', '12-Apr-2025', 1617.0, '29-Karnataka', 'N', '', 'Regular B2B', ECO_GSTIN,
+         5.0, 1007.0, 0.0, 50.35, 0.0, 0.0],
+    ], columns=B2B_COLUMNS)
+    cdnr = pd.DataFrame([
+        [BUYER_GSTIN, 'Buyer', 'CN1', '20-Apr-2025', 'C', '29-Karnataka', 'N', 'Regular B2B', 280.0, '', 12.0, 250.0,
+         0.0, 30.0, 0.0, 0.0],
+    ], columns=CDNR_COLUMNS)
+    b2cs = pd.DataFrame([
+        ['E', '09-Uttar Pradesh', 5.0, '', 1000.0, 0.0, ECO_GSTIN, 0.0, 25.0, 25.0],
+        ['E', '07-Delhi', 18.0, '', 200.0, 0.0, ECO_GSTIN, 36.0, 0.0, 0.0],
+    ], columns=B2CS_COLUMNS)
+    hsn = pd.DataFrame([
+        ['6109', '', 'NOS-NUMBERS', 3.0, 2416.0, 18.0, 1200.0, 216.0, 0.0, 0.0, 0.0],
+    ], columns=HSN_COLUMNS)
+    docs = pd.DataFrame({'Nature of Document': ['Invoices for outward supply', 'Credit Note'],
+                         'Sr. No. From': ['INV1', 'CN1'], 'Sr. No. To': ['INV2', 'CN1'],
+                         'Total Number': [2, 1], 'Cancelled': [0, 0]})
+    return {'b2b': b2b, 'cdnr': cdnr, 'b2cs': b2cs, 'hsn': hsn, 'docs': docs}
+
+
+def test_return_period():
+    assert return_period('April - 2025') == '042025'
+    assert return_period('December - 2024') == '122024'
+    assert return_period('042025') == '042025'
+
+
+def test_sections_in_portal_layout():
+    data, problems = gstr1_json_bytes(_gstr1(), SELLER_GSTIN, '042025')
+    assert problems == []
+    payload = json.loads(data)
+    assert (payload['gstin'], payload['fp']) == (SELLER_GSTIN, '042025')
+
+    [party] = payload['b2b']
+    assert party['ctin'] == BUYER_GSTIN
+    assert [invoice['inum'] for invoice in party['inv']] == ['INV1', 'INV2']
+    inv2 = party['inv'][1]
+    assert (inv2['idt'], inv2['val'], inv2['pos'], inv2['inv_typ'], inv2['etin']) == (
+        '12-04-2025', 1617, '29', 'R', ECO_GSTIN)
+    assert [item['itm_det'] for item in inv2['itms']] == [
+        {'rt': 12, 'txval': 500, 'iamt': 60, 'camt': 0, 'samt': 0, 'csamt': 0},
+        {'rt': 5, 'txval': 1007, 'iamt': 50.35, 'camt': 0, 'samt': 0, 'csamt': 0},
+    ]
+
+    [note] = payload['cdnr'][0]['nt']
+    assert (note['nt_num'], note['ntty'], note['nt_dt'], note['val']) == ('CN1', 'C', '20-04-2025', 280)
+    assert [(row['sply_ty'], row['pos'], row['rt'], row['txval']) for row in payload['b2cs']] == [
+        ('INTRA', '09', 5, 1000), ('INTER', '07', 18, 200)]
+    [hsn] = payload['hsn']['data']
+    assert (hsn['hsn_sc'], hsn['uqc'], hsn['qty'], hsn['val'], hsn['iamt']) == ('6109', 'NOS', 3.0, 2416, 216)
+    assert [(detail['doc_num'], detail['docs'][0]['net_issue']) for detail in payload['doc_issue']['doc_det']] == [
+        (1, 2), (5, 1)]
+
+
+def test_written_totals_are_checked_against_the_tables():
+    gstr1 = _gstr1()
+    written = write_gstr1_json(gstr1, SELLER_GSTIN, '042025', _Discard())
+    assert written['b2b'] == {'txval': 2507.0, 'iamt': 290.35, 'camt': 0.0, 'samt': 0.0}
+    assert validate_totals(written, gstr1) == []
+
+    written['b2cs']['txval'] += 5
+    assert validate_totals(written, gstr1) == ["b2cs.txval: JSON 1,205.00 vs Excel 1,200.00"]
+
+
+class _Discard:
+    def write(self, text):
+        pass
@@ -0,0 +1,63 @@
+import pandas as pd
+
+from ecommsolutions.meesho_gstr1 import DOC_CREDIT_NOTE, DOC_INVOICE, compute_meesho_gstr1, document_summary
+
+SELLER_GSTIN = '09ABCDE1234F1ZY'
+MEESHO_GSTIN = '09AAKCF1234Q1ZX'
+
+
+def _lines(rows):
+    return pd.DataFrame(rows, columns=['state', 'rate', 'hsn', 'quantity', 'taxable_value', 'tax', 'invoice_value'])
+
+
+def _gstr1():
+    sales = _lines([
+        ('Uttar Pradesh', 5, '6109', 2, 1000.0, 50.0, 1050.0),
+        ('Delhi', 12, '6204', 1, 500.0, 60.0, 560.0),
+        ('Delhi', 0.05, '6109.0', 1, 200.0, 10.0, 210.0),
+        ('Atlantis', 5, '6109', 1, 100.0, 5.0, 105.0),
+    ])
+    returns = _lines([('Delhi', 12, '6204', 1, 500.0, 60.0, 560.0)])
+    invoices = pd.DataFrame({'doc_type': ['Invoice', 'Invoice', 'Credit Note'], 'invoice_no': ['MSH9', 'MSH10', 'CN1']})
+    return compute_meesho_gstr1([sales], [returns], [invoices], SELLER_GSTIN, MEESHO_GSTIN)
+
+
+def test_b2cs_nets_returns_and_splits_tax_by_place_of_supply():
+    b2cs = _gstr1()['b2cs']
+    # Delhi 12% nets to zero and is dropped; the unknown state stays out of B2CS
+    assert b2cs[['Place Of Supply', 'Rate', 'Taxable Value']].values.tolist() == [
+        ['07-Delhi', 5.0, 200.0], ['09-Uttar Pradesh', 5.0, 1000.0]]
+    assert b2cs['Integrated Tax Amount'].tolist() == [10.0, 0.0]
+    assert b2cs['Central Tax Amount'].tolist() == [0.0, 25.0]
+    assert b2cs['State/UT Tax Amount'].tolist() == [0.0, 25.0]
+    assert set(b2cs['Type']) == {'E'} and set(b2cs['E-Commerce GSTIN']) == {MEESHO_GSTIN}
+
+
+def test_hsn_summary_and_totals():
+    gstr1 = _gstr1()
+    hsn = gstr1['hsn']
+    assert hsn[['HSN', 'Rate', 'Total Quantity', 'Total Value', 'Taxable Value']].values.tolist() == [
+        ['6109', 5.0, 4.0, 1365.0, 1300.0]]
+    assert hsn[['Integrated Tax Amount', 'Central Tax Amount', 'State/UT Tax Amount']].values.tolist() == [
+        [15.0, 25.0, 25.0]]
+
+    summary = gstr1['summary']
+    assert (summary['gross_taxable_value'], summary['returns_taxable_value'], summary['net_taxable_value']) == (
+        1800.0, 500.0, 1300.0)
+    assert (summary['igst'], summary['cgst'], summary['sgst']) == (15.0, 25.0, 25.0)
+    assert summary['unmapped_state_taxable_value'] == 100.0
+    assert (summary['sales_lines'], summary['return_lines'], summary['documents']) == (4, 1, 3)
+
+
+def test_document_summary_series():
+    invoices = pd.DataFrame({
+        'doc_type': ['Invoice', 'Invoice', 'Invoice', 'Credit Note', 'Invoice', 'Invoice'],
+        'invoice_no': ['MSH10', 'MSH9', 'MSH11', 'CN1', 'MSH9', 'ABC100'],
+    })
+    docs = document_summary(invoices)
+    assert docs[['Nature of Document', 'Sr. No. From', 'Sr. No. To', 'Total Number']].values.tolist() == [
+        [DOC_CREDIT_NOTE, 'CN1', 'CN1', 1],
+        [DOC_INVOICE, 'ABC100', 'ABC100', 1],
+        [DOC_INVOICE, 'MSH9', 'MSH11', 3],
+    ]
+    assert document_summary(invoices.iloc[:0]).empty
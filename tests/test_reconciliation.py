@@ -0,0 +1,95 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from ecommsolutions import reconciliation
+from ecommsolutions.ingestion import normalize_chunk
+from ecommsolutions.reconciliation import load_report, normalize_order_ids, reconcile
+
+
+def _frame(order_ids, amounts):
+    return pd.DataFrame({'order_id': order_ids, 'amount': amounts})
+
+
+def _statuses(result):
+    return dict(zip(result['orders']['order_id'], result['orders']['status'].astype(str)))
+
+
+def test_statuses():
+    sales = _frame(['PAID', 'UPCOMING', 'MISSING', 'OVER', 'SHORT', 'PART'], [100, 200, 300, 50, 100, 100])
+    prev = _frame(['PAID', 'OVER', 'SHORT', 'PART'], [100, 40, 40, 60])
+    upcoming = _frame(['UPCOMING', 'OVER', 'PART'], [200, 30, 40])
+    result = reconcile(sales, prev, upcoming)
+    assert _statuses(result) == {
+        'PAID': reconciliation.STATUS_PAID,
+        'UPCOMING': reconciliation.STATUS_UPCOMING,
+        'MISSING': reconciliation.STATUS_MISSING,
+        'OVER': reconciliation.STATUS_OVERPAID,
+        'SHORT': reconciliation.STATUS_SHORT_PAID,
+        'PART': reconciliation.STATUS_UPCOMING,
+    }
+    summary = result['summary']
+    assert summary['total_sales_value'] == 850
+    assert summary['received_payment'] == 240
+    assert summary['upcoming_payment'] == 270
+    assert summary['variance'] == 340
+
+
+def test_duplicate_when_settled_order_is_listed_again():
+    result = reconcile(_frame(['A1', 'B2'], [100, 100]), _frame(['A1', 'B2'], [100, 30]), _frame(['A1', 'B2'], [100, 70]))
+    assert _statuses(result) == {'A1': reconciliation.STATUS_DUPLICATE, 'B2': reconciliation.STATUS_UPCOMING}
+
+
+def test_lines_and_files_add_up_per_order():
+    sales = [_frame(['A1', 'A1'], [60, 40]), _frame(['B2'], [80])]
+    prev = [_frame(['A1'], [70]), _frame(['A1', 'B2'], [30, 79.5])]
+    orders = reconcile(sales, prev)['orders'].set_index('order_id')
+    assert orders.loc['A1', 'sales_lines'] == 2
+    assert orders.loc['A1', 'received'] == 100
+    # Within the rounding tolerance
+    assert orders.loc['B2', 'status'] == reconciliation.STATUS_PAID
+
+
+def test_unmatched_payments_and_missing_ids():
+    result = reconcile(_frame(['A1', None, ''], [100, 5, 5]), _frame(['A1', 'ZZ'], [100, 25]), _frame(['YY'], [10]))
+    unmatched = result['unmatched_payments'].set_index('order_id')
+    assert unmatched.loc['ZZ', 'source'] == 'prev_payments'
+    assert unmatched.loc['YY', 'source'] == 'upcoming_payments'
+    assert result['summary']['rows_without_order_id'] == 2
+    assert result['summary']['unmatched_payment_value'] == 35
+
+
+def test_order_ids_match_across_formats():
+    # Excel float IDs, integer IDs, quoted and lower-case text all meet on one order
+    sales = _frame(pd.Series([1001.0, 1002.0, np.nan]), [100, 100, 100])
+    prev = _frame(pd.Series([1001, 1002]), [100, 50])
+    upcoming = _frame(pd.Series(["'1002' "]), [50])
+    result = reconcile(sales, prev, upcoming)
+    assert _statuses(result) == {'1001': reconciliation.STATUS_PAID, '1002': reconciliation.STATUS_UPCOMING}
+    assert result['summary']['rows_without_order_id'] == 1
+
+
+def test_fractional_and_text_ids_are_kept():
+    assert normalize_order_ids(pd.Series([1.0, 2.5, np.nan])).tolist() == ['1', '2.5', pd.NA]
+    assert normalize_order_ids(pd.Series([' a.0 ', 'OD123.0', ''])).tolist() == ['A.0', 'OD123.0', pd.NA]
+    assert normalize_order_ids(pd.Series([1234.0, 'A.0', None], dtype=object)).tolist() == ['1234', 'A.0', pd.NA]
+    result = reconcile(_frame(pd.Series([1.0, 2.5]), [10, 20]), _frame(pd.Series(['1', '2.5']), [10, 20]))
+    assert _statuses(result) == {'1': reconciliation.STATUS_PAID, '2.5': reconciliation.STATUS_PAID}
+
+
+@pytest.mark.parametrize('values, expected', [
+    ([1.0, 2.5], ['1', '2.5']),
+    ([171.0, np.nan], ['171', pd.NA]),
+])
+def test_text_columns_read_from_floats(values, expected):
+    chunk = normalize_chunk(pd.DataFrame({'Order ID': values, 'Amount': 1.0}), {'Order ID': 'text'})
+    assert chunk['Order ID'].tolist() == expected
+
+
+def test_load_report_reads_ids_as_text(tmp_path, monkeypatch):
+    monkeypatch.setattr('ecommsolutions.report_cache.CACHE_DIR', str(tmp_path / 'cache'))
+    path = tmp_path / 'payments.csv'
+    pd.DataFrame({'Order Id': ['0012345678901234567', 'A.0'], 'Settlement': ['₹1,200.50', '(30)']}).to_csv(path, index=False)
+    report = load_report(str(path), 'payments.csv', None, 'Order Id', 'Settlement')
+    assert report['order_id'].tolist() == ['0012345678901234567', 'A.0']
+    assert report['amount'].tolist() == [1200.5, -30.0]
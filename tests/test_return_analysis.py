@@ -0,0 +1,92 @@
+import pandas as pd
+
+from ecommsolutions import return_analysis
+
+
+def _write(path, frame):
+    frame.to_csv(path, index=False)
+    return str(path)
+
+
+def _sales(tmp_path):
+    return _write(tmp_path / 'sales.csv', pd.DataFrame({
+        'Sub Order No': ['101_1', '102_1', '103_1', '104_1'],
+        'SKU': ['KURTA-RED', 'KURTA-RED', 'SAREE-BLUE', 'SAREE-BLUE'],
+        'end_customer_state_new': ['Delhi', 'Delhi', 'Maharashtra', 'Uttar Pradesh'],
+        'order_date': ['2025-04-03', '2025-04-09', '2025-04-15', '2025-05-02'],
+        'quantity': [1, 1, 2, 1],
+        'Courier': ['Delhivery', 'Delhivery', 'Xpressbees', 'Ecom'],
+    }))
+
+
+def _returns(tmp_path):
+    return _write(tmp_path / 'returns.csv', pd.DataFrame({
+        'sub_order_num': ['101_1', '103_1', '999_1'],
+        'return_reason': ['Size issue', 'Damaged', 'Wrong item'],
+        'quantity': [1, 2, 1],
+    }))
+
+
+def test_returns_join_their_orders(tmp_path):
+    store = str(tmp_path / 'store')
+    return_analysis.add_report(_sales(tmp_path), 'sales.csv', return_analysis.KIND_SALES, store)
+    return_analysis.add_report(_returns(tmp_path), 'returns.csv', return_analysis.KIND_RETURNS, store)
+
+    sold, returned, unmatched = return_analysis.load_partials(store)
+    summary = return_analysis.return_summary(sold, returned, unmatched)
+    assert summary['sold_units'] == 5
+    assert summary['returned_units'] == 3
+    assert summary['unmatched_returns'] == 1
+    rates = return_analysis.return_rates(sold, returned, 'sku').set_index('sku')
+    assert rates.loc['KURTA-RED', 'return_rate'] == 50.0
+    assert rates.loc['SAREE-BLUE', 'return_rate'] == 66.67
+
+
+def test_returns_before_their_sales_file(tmp_path):
+    store = str(tmp_path / 'store')
+    added = return_analysis.add_report(_returns(tmp_path), 'returns.csv', return_analysis.KIND_RETURNS, store)
+    assert added['status'] == 'added'
+    sold, returned, unmatched = return_analysis.load_partials(store)
+    assert returned.empty
+    assert unmatched == 3
+
+    return_analysis.add_report(_sales(tmp_path), 'sales.csv', return_analysis.KIND_SALES, store)
+    sold, returned, unmatched = return_analysis.load_partials(store)
+    assert unmatched == 1
+    assert returned['quantity'].sum() == 3
+    by_month = return_analysis.return_rates(sold, returned, 'month').set_index('month')
+    assert by_month.loc['2025-04', 'returned_units'] == 3
+    reasons = set(return_analysis.reason_breakdown(returned)['reason'])
+    assert reasons == {'Size issue', 'Damaged'}
+
+
+def test_readding_a_file_is_skipped(tmp_path):
+    store = str(tmp_path / 'store')
+    sales = _sales(tmp_path)
+    return_analysis.add_report(sales, 'sales.csv', return_analysis.KIND_SALES, store)
+    again = return_analysis.add_report(sales, 'sales.csv', return_analysis.KIND_SALES, store)
+    assert again['status'] == 'already added'
+    assert len(return_analysis.history(store)) == 1
+
+
+def test_overlapping_reports_count_each_order_once(tmp_path):
+    store = str(tmp_path / 'store')
+    orders = pd.DataFrame({'Sub Order No': ['A1', 'A2', 'A3'], 'SKU': 'KURTA-RED', 'order_date': '2025-04-03',
+                           'quantity': 1})
+    first = _write(tmp_path / 's1.csv', orders.iloc[:2])
+    second = _write(tmp_path / 's2.csv', orders)
+    returns = pd.DataFrame({'sub_order_num': ['A1', 'A3'], 'return_reason': 'Size issue', 'quantity': 1})
+    return_analysis.add_report(first, 's1.csv', return_analysis.KIND_SALES, store)
+    return_analysis.add_report(_write(tmp_path / 'r1.csv', returns.iloc[:1]), 'r1.csv',
+                               return_analysis.KIND_RETURNS, store)
+
+    added = return_analysis.add_report(second, 's2.csv', return_analysis.KIND_SALES, store)
+    assert added['repeated_orders'] == 2
+    added = return_analysis.add_report(_write(tmp_path / 'r2.csv', returns), 'r2.csv',
+                                       return_analysis.KIND_RETURNS, store)
+    assert added['repeated_returns'] == 1
+
+    summary = return_analysis.return_summary(*return_analysis.load_partials(store))
+    assert summary['sold_units'] == 3
+    assert summary['returned_units'] == 2
+    assert summary['return_rate'] == 66.67
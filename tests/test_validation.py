@@ -0,0 +1,68 @@
+import pandas as pd
+import pytest
+
+from ecommsolutions.custom_mapping import process_custom_report
+from ecommsolutions.validation import ValidationError, gstin_problem, valid_gstins
+
+SELLER_GSTIN = '09ABCDE1234F1ZY'
+SPEC = {'name': 'Shop', 'fields': {
+    'invoice_id': {'column': 'Invoice'},
+    'taxable_value': {'column': 'Amount'},
+    'rate': {'column': 'GST'},
+    'state': {'column': 'State'},
+    'hsn': {'column': 'HSN'},
+}}
+
+
+@pytest.fixture(autouse=True)
+def report_cache(tmp_path, monkeypatch):
+    monkeypatch.setattr('ecommsolutions.report_cache.CACHE_DIR', str(tmp_path / 'cache'))
+
+
+def _report(tmp_path, amounts, rates):
+    path = tmp_path / 'shop.csv'
+    pd.DataFrame({
+        'Invoice': [f"INV{i}" for i in range(len(amounts))],
+        'Amount': amounts,
+        'GST': rates,
+        'State': 'Delhi',
+        'HSN': '6109',
+    }).to_csv(path, index=False)
+    return str(path)
+
+
+def test_gstin_checksum():
+    assert gstin_problem(SELLER_GSTIN) is None
+    assert gstin_problem('09ABCDE1234F1Z5') is not None
+    assert valid_gstins(pd.Series([SELLER_GSTIN, '29AAACB1234C1ZB', '09ABCDE1234F1Z5'])).tolist() == [True, True, False]
+
+
+def test_every_gst_slab_is_allowed(tmp_path):
+    rates = [0, 0.1, 0.25, 1, 1.5, 3, 5, 6, 7.5, 12, 18, 28, 40]
+    result = process_custom_report(_report(tmp_path, [100] * len(rates), rates), SPEC, SELLER_GSTIN)
+    assert result['validation'].empty
+
+
+def test_40_percent_slab_passes_and_off_slab_rates_are_flagged(tmp_path):
+    result = process_custom_report(_report(tmp_path, [100, 100], [40, 0.4]), SPEC, SELLER_GSTIN)
+    assert result['validation'].empty
+    assert result['b2cs']['Rate'].tolist() == [40.0]
+
+    with pytest.raises(ValidationError) as raised:
+        process_custom_report(_report(tmp_path, [100, 100, 100], [40, 41, 0.4]), SPEC, SELLER_GSTIN)
+    issues = raised.value.result['issues'].set_index('Check')
+    assert issues.loc['GST rate not allowed', 'Rows'] == 1
+
+
+def test_mapped_amounts_are_checked_as_read(tmp_path):
+    source = _report(tmp_path, ['100', '2.5.1', '', '250'], [18, 18, 5, 13])
+    with pytest.raises(ValidationError) as raised:
+        process_custom_report(source, SPEC, SELLER_GSTIN)
+    issues = raised.value.result['issues'].set_index('Check')
+    assert issues.loc['Amount is not a number', 'Rows'] == 1
+    assert issues.loc['Amount missing', 'Rows'] == 1
+    assert issues.loc['GST rate not allowed', 'Rows'] == 1
+
+    result = process_custom_report(source, SPEC, SELLER_GSTIN, strict=False)
+    assert len(result['validation']) == 3
+    assert result['summary']['net_taxable_value'] == 350.0